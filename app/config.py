@@ -43,6 +43,8 @@ SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
 SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90"))  # 0.93→0.90 เพิ่ม hit rate ~2x (ยังปลอดภัย: plant match ป้องกัน false hit)
 SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "7200"))  # 30min→2hr (ข้อมูลสินค้าไม่เปลี่ยนบ่อย)
 SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))  # 200→500 entries
+SEMANTIC_CACHE_IVF_MIN_ENTRIES = int(os.getenv("SEMANTIC_CACHE_IVF_MIN_ENTRIES", "4096"))  # partition ใหญ่กว่านี้ → ใช้ IVF index
+SEMANTIC_CACHE_IVF_NPROBE = int(os.getenv("SEMANTIC_CACHE_IVF_NPROBE", "8"))  # จำนวน cluster ที่ probe ต่อ lookup
 
 # Rate limiting per user
 USER_RATE_LIMIT = 20  # requests per minute
@@ -52,6 +54,23 @@ USER_RATE_WINDOW = 60  # seconds
 MAX_CONCURRENT_TASKS = int(os.getenv("MAX_CONCURRENT_TASKS", "100"))
 MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "50"))
 
+# Durable webhook queue (SQLite WAL) — events ถูกเขียนลงดิสก์ก่อนตอบ 200, redeliver เมื่อ worker ตาย
+WEBHOOK_QUEUE_PATH = os.getenv("WEBHOOK_QUEUE_PATH", "data/webhook_queue.db")  # ว่าง = ปิด (in-memory dispatch)
+WEBHOOK_QUEUE_LEASE = float(os.getenv("WEBHOOK_QUEUE_LEASE", "300"))  # seconds — ยังไม่ ack เกินนี้ = redeliver
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "3"))  # เกิน = dead-letter (log + ลบ)
+WEBHOOK_QUEUE_SWEEP_INTERVAL = float(os.getenv("WEBHOOK_QUEUE_SWEEP_INTERVAL", "15"))  # seconds
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))  # เก็บ webhookEventId ที่เห็นแล้ว (seconds)
+
+# Request-scoped DB loader — dedupe / memoize / batch Supabase reads ภายใน 1 ข้อความ
+REQUEST_LOADER_ENABLED = os.getenv("REQUEST_LOADER_ENABLED", "1") == "1"
+POSTGREST_ASYNC = os.getenv("POSTGREST_ASYNC", "1") == "1"  # Supabase queries ผ่าน pooled httpx.AsyncClient (0 = asyncio.to_thread แบบเดิม)
+
+# Single-flight RAG — คำถามเหมือนกัน (response cache key เดียวกัน) ที่เข้ามาพร้อมกัน รัน pipeline ครั้งเดียว
+RAG_SINGLE_FLIGHT_ENABLED = os.getenv("RAG_SINGLE_FLIGHT_ENABLED", "1") == "1"
+RAG_SINGLE_FLIGHT_REDIS = os.getenv("RAG_SINGLE_FLIGHT_REDIS", "1") == "1"  # ข้าม worker ผ่าน Redis lock (ถ้ามี Redis)
+RAG_SINGLE_FLIGHT_WAIT = float(os.getenv("RAG_SINGLE_FLIGHT_WAIT", "45"))  # follower รอ leader สูงสุด (seconds) → เกินแล้วคำนวณเอง
+RAG_SINGLE_FLIGHT_POLL_MS = float(os.getenv("RAG_SINGLE_FLIGHT_POLL_MS", "200"))  # ความถี่ poll ผลจาก worker อื่น
+
 # Image diagnosis feature toggle
 # Set to "1" to enable image-based disease diagnosis, "0" to disable (default)
 ENABLE_IMAGE_DIAGNOSIS = os.getenv("ENABLE_IMAGE_DIAGNOSIS", "0") == "1"
@@ -59,6 +78,7 @@ ENABLE_IMAGE_DIAGNOSIS = os.getenv("ENABLE_IMAGE_DIAGNOSIS", "0") == "1"
 # Image analysis throttling
 IMAGE_COOLDOWN = int(os.getenv("IMAGE_COOLDOWN", "10"))  # seconds between image requests per user
 MAX_CONCURRENT_ANALYSIS = int(os.getenv("MAX_CONCURRENT_ANALYSIS", "10"))  # max concurrent image analyses
+ANALYSIS_SLOT_LEASE = int(os.getenv("ANALYSIS_SLOT_LEASE", "300"))  # seconds — analysis slot หมด lease เองถ้า worker ไม่ release
 
 # Redis configuration (for scale-out support)
 # Set REDIS_URL or UPSTASH_REDIS_REST_URL + UPSTASH_REDIS_REST_TOKEN
@@ -73,12 +93,53 @@ MEMORY_CONTEXT_WINDOW = 10  # Use last 10 messages for context
 MEMORY_CONTENT_PREVIEW = 800  # Characters to show in context preview (เพิ่มจาก 300 เพื่อให้ชื่อสินค้าไม่ถูกตัด)
 MEMORY_SESSION_TIMEOUT_HOURS = int(os.getenv("MEMORY_SESSION_TIMEOUT_HOURS", "6"))  # ถ้า user หายไปเกิน 6 ชม. → ไม่ส่ง context เก่าให้ LLM
 MEMORY_TTL_DAYS = int(os.getenv("MEMORY_TTL_DAYS", "7"))  # ลบ memory เก่ากว่า 7 วัน
+# Write-behind memory buffer — add_to_memory ไม่รอ DB, flush แบบ bulk insert
+MEMORY_FLUSH_INTERVAL_MS = float(os.getenv("MEMORY_FLUSH_INTERVAL_MS", "500"))  # flush หลังข้อความแรกใน batch
+MEMORY_FLUSH_MAX_ROWS = int(os.getenv("MEMORY_FLUSH_MAX_ROWS", "50"))  # flush ทันทีเมื่อ pending ครบ
+MEMORY_BUFFER_PER_USER = int(os.getenv("MEMORY_BUFFER_PER_USER", "20"))  # ring buffer ต่อ user (สำหรับ reader)
+MEMORY_BUFFER_MAX_USERS = int(os.getenv("MEMORY_BUFFER_MAX_USERS", "5000"))  # LRU จำนวน users ที่เก็บ ring
+MEMORY_BUFFER_MAX_PENDING = int(os.getenv("MEMORY_BUFFER_MAX_PENDING", "5000"))  # กัน memory โตตอน DB ล่ม
+MEMORY_TRIM_INTERVAL = int(os.getenv("MEMORY_TRIM_INTERVAL", "300"))  # seconds — TTL/MAX_MEMORY_MESSAGES trim แบบ batch
+# Per-user conversation context cache (pre-parsed messages) — L1 + Redis
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "21600"))  # seconds (= session timeout 6 ชม.)
+CONTEXT_CACHE_MAX_USERS = int(os.getenv("CONTEXT_CACHE_MAX_USERS", "5000"))  # L1 LRU
+CONTEXT_CACHE_LOCAL_TTL = int(os.getenv("CONTEXT_CACHE_LOCAL_TTL", "5"))  # seconds — L1 อย่างเดียว (ไม่มี Redis): ใช้ซ้ำแค่ใน turn เดียว
+# User profile / display-name cache — L1 + Redis, ชื่อ fallback ถูกแก้ใน background (bulk UPSERT)
+USER_PROFILE_CACHE_TTL = int(os.getenv("USER_PROFILE_CACHE_TTL", "86400"))  # seconds — user ที่รู้จักแล้วไม่ต้องเช็ค DB/API
+USER_PROFILE_NEGATIVE_TTL = int(os.getenv("USER_PROFILE_NEGATIVE_TTL", "3600"))  # ดึง profile ไม่ได้ → ไม่ลองใหม่ 1 ชม.
+USER_PROFILE_CACHE_MAX_USERS = int(os.getenv("USER_PROFILE_CACHE_MAX_USERS", "10000"))  # L1 LRU
+USER_PROFILE_REFRESH_DELAY_MS = float(os.getenv("USER_PROFILE_REFRESH_DELAY_MS", "2000"))  # รวม refresh เป็น batch
+USER_PROFILE_REFRESH_CONCURRENCY = int(os.getenv("USER_PROFILE_REFRESH_CONCURRENCY", "5"))  # profile API calls พร้อมกัน
+USER_PROFILE_REFRESH_BATCH = int(os.getenv("USER_PROFILE_REFRESH_BATCH", "50"))  # users ต่อ batch (ที่เหลือรอบถัดไป)
+
+# Analytics event pipeline — track_* แค่ enqueue, background flusher ทำ multi-row insert
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "100"))  # flush ทันทีเมื่อครบ N events
+ANALYTICS_FLUSH_INTERVAL_MS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_MS", "2000"))  # หรือทุก M ms
+ANALYTICS_QUEUE_MAX = int(os.getenv("ANALYTICS_QUEUE_MAX", "10000"))  # queue เต็ม → drop event (ไม่ block reply)
+ANALYTICS_ROLLUP_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_FLUSH_INTERVAL", "30"))  # seconds — upsert rollup buckets
+ANALYTICS_ROLLUP_MINUTE_RETENTION_HOURS = float(os.getenv("ANALYTICS_ROLLUP_MINUTE_RETENTION_HOURS", "48"))  # ลบ minute rows เก่ากว่านี้
+
+# Outbound HTTP (LINE / Facebook) — pooled keep-alive clients ต่อ host
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))  # ต่อ host
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))  # idle connections ที่เก็บไว้ต่อ host
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))  # retry เมื่อ 429 / 5xx / connect error
+HTTP_BACKOFF_BASE_MS = float(os.getenv("HTTP_BACKOFF_BASE_MS", "200"))  # exponential backoff + jitter
+# Supabase PostgREST (POSTGREST_ASYNC) — pool แยกของ host DB, ไม่ใช้ limit เดียวกับ LINE / Facebook
+POSTGREST_MAX_CONNECTIONS = int(os.getenv("POSTGREST_MAX_CONNECTIONS", "100"))  # ต่อ worker (เดิม to_thread = THREAD_POOL_SIZE)
+POSTGREST_MAX_KEEPALIVE = int(os.getenv("POSTGREST_MAX_KEEPALIVE", "50"))
 
 # ============================================================================#
 # PRODUCT TABLE — switch between products2 (backup) and products3 (new Excel)
 # ============================================================================#
 PRODUCT_TABLE = os.getenv("PRODUCT_TABLE", "products3")
 PRODUCT_RPC = os.getenv("PRODUCT_RPC", "hybrid_search_products3")
+# "rpc" = hybrid search ผ่าน Supabase RPC (1 call ต่อ expanded query)
+# "local" = LocalProductSearch ใน process (embedding matrix + BM25 trigram, batch ทุก query ใน matmul เดียว)
+PRODUCT_SEARCH_BACKEND = os.getenv("PRODUCT_SEARCH_BACKEND", "rpc").lower()
+# fallback ที่มีเงื่อนไข (keyword / supplementary / weed / pest column / disease) เริ่มล่วงหน้าพร้อม multi_source
+# catalog โหลดแล้ว = อ่านจาก memory → เริ่มล่วงหน้าเสมอ; ไม่มี catalog = DB query → เริ่มเมื่อเงื่อนไขจริงเท่านั้น (1 = เริ่มล่วงหน้าเสมอ)
+RETRIEVAL_SPECULATIVE_FALLBACKS = os.getenv("RETRIEVAL_SPECULATIVE_FALLBACKS", "0") == "1"
 
 # ============================================================================#
 # MEMORY TABLE — แยก conversation memory ระหว่าง project
@@ -98,8 +159,20 @@ USE_AGENTIC_RAG = os.getenv("USE_AGENTIC_RAG", "1") == "1"
 LLM_MODEL_GENERAL_CHAT = os.getenv("LLM_MODEL_GENERAL_CHAT", "gpt-4o")
 LLM_MODEL_QUERY_UNDERSTANDING = os.getenv("LLM_MODEL_QUERY_UNDERSTANDING", "gpt-4o-mini")
 LLM_MODEL_RERANKING = os.getenv("LLM_MODEL_RERANKING", "gpt-4o-mini")
+# "llm" = gpt-4o-mini จัดอันดับทุกครั้ง
+# "local" = LocalReranker (feature-based, CPU) → เรียก LLM เฉพาะเมื่อ margin อันดับ 1 vs 2 ต่ำกว่า RERANK_LOCAL_MIN_MARGIN
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "llm").lower()
+RERANK_LOCAL_MIN_MARGIN = float(os.getenv("RERANK_LOCAL_MIN_MARGIN", "0.25"))
+RERANK_LOCAL_WEIGHTS_PATH = os.getenv("RERANK_LOCAL_WEIGHTS_PATH", "data/reranker_weights.json")  # จาก scripts/train_local_reranker.py
+RERANK_LOG_PATH = os.getenv("RERANK_LOG_PATH", "")  # append ผล LLM rerank เป็น JSONL (training data) — ว่าง = ปิด
 LLM_MODEL_RESPONSE_GEN = os.getenv("LLM_MODEL_RESPONSE_GEN", "gpt-4o")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))  # รวม embedding requests ที่มาภายใน window เป็น API call เดียว
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "64"))  # flush ทันทีเมื่อ batch เต็ม
+EMBEDDING_CACHE_MAX = int(os.getenv("EMBEDDING_CACHE_MAX", "2000"))  # L1 LRU entries ต่อ worker (~6KB/entry)
+EMBEDDING_CACHE_REDIS_TTL = int(os.getenv("EMBEDDING_CACHE_REDIS_TTL", str(30 * 86400)))  # embedding ไม่เปลี่ยนตาม model → เก็บได้นาน
+EMBEDDING_CACHE_DISK_PATH = os.getenv("EMBEDDING_CACHE_DISK_PATH", "")  # เช่น /data/embedding_cache.bin — ว่าง = ปิด warm start
+EMBEDDING_CACHE_DISK_MAX = int(os.getenv("EMBEDDING_CACHE_DISK_MAX", "20000"))
 
 AGENTIC_RAG_CONFIG = {
     # Vector search threshold (lowered to 0.25 for better recall)
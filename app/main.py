@@ -18,11 +18,18 @@ from app.config import (
     FB_PAGE_ACCESS_TOKEN,
     OPENAI_API_KEY,
     SECRET_KEY,
+    PRODUCT_SEARCH_BACKEND,
 )
 from app.dependencies import openai_client, supabase_client, analytics_tracker
 from app.services.cache import cleanup_expired_cache, clear_all_caches
-from app.services.redis_cache import is_redis_available
+from app.services.redis_cache import is_redis_available, close_async_redis
+from app.utils.http_clients import close_http_clients
+from app.services.durable_queue import webhook_queue
 from app.services.product.registry import ProductRegistry
+from app.services.product.catalog import ProductCatalog
+from app.services.product.local_search import LocalProductSearch
+from app.services.embedding_cache import load_embedding_cache_from_disk, save_embedding_cache_to_disk
+from app.services.memory import flush_memory_buffer
 from app.utils.rate_limiter import cleanup_rate_limit_data
 
 # Routers
@@ -57,7 +64,7 @@ async def periodic_cleanup():
 
 @asynccontextmanager
 async def lifespan(app_instance: FastAPI):
-    # Startup — increase thread pool for asyncio.to_thread() (Supabase sync calls)
+    # Startup — increase thread pool for asyncio.to_thread() (Supabase calls outside postgrest_async, file I/O)
     loop = asyncio.get_event_loop()
     _thread_pool_size = int(os.getenv("THREAD_POOL_SIZE", "50"))
     loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=_thread_pool_size))
@@ -78,6 +85,20 @@ async def lifespan(app_instance: FastAPI):
     await registry.load_from_db(supabase_client)
     logger.info(f"ProductRegistry: {'✓' if registry.loaded else '✗'} ({len(registry.get_canonical_list())} products)")
 
+    # Load in-memory product catalog (retrieval fallbacks read it instead of querying DB)
+    catalog = ProductCatalog.get_instance()
+    await catalog.load_from_db(supabase_client)
+    logger.info(f"ProductCatalog: {'✓' if catalog.loaded else '✗'} ({len(catalog)} rows)")
+
+    # Local hybrid search replaces the per-query RPC when PRODUCT_SEARCH_BACKEND=local
+    if PRODUCT_SEARCH_BACKEND == "local":
+        local_search = LocalProductSearch.get_instance()
+        await local_search.sync(supabase_client, catalog)
+        logger.info(f"LocalProductSearch: {'✓' if local_search.loaded else '✗ (falling back to RPC)'}")
+
+    # Warm start: memory-map embeddings saved by the previous process (EMBEDDING_CACHE_DISK_PATH)
+    load_embedding_cache_from_disk()
+
     # Start background tasks only when explicitly enabled (not recommended on serverless)
     RUN_BACKGROUND_TASKS = os.getenv("RUN_BACKGROUND_TASKS", "0") == "1"
     cleanup_task = None
@@ -87,6 +108,9 @@ async def lifespan(app_instance: FastAPI):
     else:
         logger.info("RUN_BACKGROUND_TASKS not set or false — skipping background tasks (serverless mode)")
 
+    # Durable webhook queue: sweep ทันทีตอน start → events ที่ worker ก่อนหน้าค้างไว้ถูกประมวลผลต่อ
+    queue_sweeper = asyncio.create_task(webhook_queue.run_sweeper()) if webhook_queue else None
+
     yield
 
     # Shutdown
@@ -97,11 +121,27 @@ async def lifespan(app_instance: FastAPI):
             await cleanup_task
         except asyncio.CancelledError:
             pass
+    if queue_sweeper:
+        queue_sweeper.cancel()
+        try:
+            await queue_sweeper
+        except asyncio.CancelledError:
+            pass
+
+    save_embedding_cache_to_disk()
+    await flush_memory_buffer()
+    if analytics_tracker:
+        await analytics_tracker.flush()
 
     # Clear all caches
     await clear_all_caches()
     logger.info("All caches cleared")
 
+    await close_async_redis()
+    await close_http_clients()
+    if webhook_queue:
+        webhook_queue.close()
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -18,7 +18,9 @@ from slowapi.util import get_remote_address
 from app.dependencies import supabase_client, handoff_manager
 from app.config import MEMORY_TABLE
 from app.services.memory import add_to_memory
-from app.services.user_service import refresh_display_name, get_facebook_profile
+from app.services.admin_inbox import get_admin_inbox, decode_cursor
+from app.services.user_service import refresh_display_name, get_facebook_profile, profile_cache
+from app.services.user_profile_cache import fallback_display_name, is_fallback_name
 from app.utils.line.helpers import push_line
 from app.utils.facebook.helpers import send_facebook_message, split_message
 from app.utils.async_db import aexecute
@@ -29,6 +31,8 @@ router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 limiter = Limiter(key_func=get_remote_address)
 
+CONVERSATIONS_PAGE_MAX = 200  # handoffs ทั้งหมด (หน้าแรก) / recent สูงสุดต่อหน้า
+
 
 def _require_auth(request: Request):
     """Check admin session"""
@@ -56,132 +60,163 @@ async def admin_chat_page(request: Request):
 
 @router.get("/api/admin/conversations")
 @limiter.limit("120/minute")
-async def get_conversations(request: Request):
-    """ดึงรายการแชทจาก user_ladda เป็นหลัก + ดึง preview จาก conversation_memory"""
+async def get_conversations(request: Request, cursor: Optional[str] = None, limit: int = 50):
+    """
+    รายการแชทจาก admin_inbox ทีละหน้า (handoffs ทั้งหมดในหน้าแรก + recent ตาม cursor)
+    ตาราง admin_inbox ยังไม่มี / อ่านไม่ได้ → scan user_ladda + memory แบบเดิม (หน้าเดียว)
+    """
     _require_auth(request)
     if not supabase_client:
         raise HTTPException(status_code=503, detail="Database not available")
 
+    limit = max(1, min(limit, CONVERSATIONS_PAGE_MAX))
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    inbox = get_admin_inbox()
+    if inbox:
+        try:
+            return await _inbox_conversations(inbox, cursor, limit)
+        except Exception as e:
+            logger.warning(f"Admin inbox read failed, scanning users instead: {e}")
+
     try:
-        # Step 1: ดึง ALL registered users จาก user_ladda (แหล่งหลัก)
+        return await _scan_conversations()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get conversations: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _display_name(uid: str, raw_name: str) -> str:
+    # Clean up ugly fallback names like "User_fb:33879..."
+    if raw_name.startswith("User_fb:") or raw_name.startswith("User_fb%"):
+        return fallback_display_name(uid)
+    return raw_name or uid[:14]
+
+
+async def _inbox_conversations(inbox, cursor: Optional[str], limit: int) -> dict:
+    """1 query ต่อหน้า (+ handoffs ในหน้าแรก) + ชื่อเฉพาะ user ในหน้านั้น"""
+    handoff_convos = []
+    if not cursor:
+        handoff_convos, _ = await inbox.page(has_handoff=True, limit=CONVERSATIONS_PAGE_MAX)
+    recent, next_cursor = await inbox.page(has_handoff=False, cursor=cursor, limit=limit)
+
+    sessions = handoff_convos + recent
+    names = {}
+    if sessions:
         users_result = await aexecute(
             supabase_client.table("user_ladda(LINE,FACE)")
-            .select("line_user_id, display_name, updated_at")
-            .order("updated_at", desc=True)
+            .select("line_user_id, display_name")
+            .in_("line_user_id", [s["user_id"] for s in sessions])
         )
-        all_users = users_result.data or []
-
-        # Step 2: สร้าง sessions จาก user_ladda (ทุกคนที่ลงทะเบียน)
-        sessions = {}
-        for u in all_users:
-            uid = u["line_user_id"]
-            raw_name = u.get("display_name") or ""
-            # Clean up ugly fallback names like "User_fb:33879..."
-            if raw_name.startswith("User_fb:") or raw_name.startswith("User_fb%"):
-                display_name = f"FB User #{uid[-4:]}"
-            else:
-                display_name = raw_name or uid[:14]
-            sessions[uid] = {
-                "user_id": uid,
-                "display_name": display_name,
-                "platform": "facebook" if uid.startswith("fb:") else "line",
-                "last_message": "",
-                "last_role": "",
-                "last_activity": u.get("updated_at", ""),
-                "message_count": 0,
-                "has_handoff": False,
-                "handoff_id": None,
-            }
+        names = {u["line_user_id"]: u.get("display_name") or "" for u in users_result.data or []}
 
-        # Step 3: ดึง recent messages (7 วัน) เพื่อ preview + sort
-        cutoff = (
-            datetime.now(timezone.utc) - timedelta(days=7)
-        ).isoformat()
-        msg_result = await aexecute(
-            supabase_client.table(MEMORY_TABLE)
-            .select("user_id, content, role, created_at")
-            .gte("created_at", cutoff)
-            .order("created_at", desc=True)
-            .limit(3000)
-        )
+    # ชื่อ fallback ของ user ในหน้านี้ → background refresher (profile API + 1 bulk UPSERT)
+    profile_cache.schedule_refresh_many(
+        (s["user_id"], names[s["user_id"]]) for s in sessions
+        if s["user_id"] in names and is_fallback_name(names[s["user_id"]])
+    )
+    for s in sessions:
+        s["display_name"] = _display_name(s["user_id"], names.get(s["user_id"], ""))
+
+    return {"handoffs": handoff_convos, "recent": recent, "next_cursor": next_cursor}
 
-        for msg in msg_result.data or []:
-            uid = msg["user_id"]
+
+async def _scan_conversations() -> dict:
+    """Legacy path: ดึงทุก user จาก user_ladda + preview จาก memory 7 วัน แล้วรวมใน Python"""
+    # Step 1: ดึง ALL registered users จาก user_ladda (แหล่งหลัก)
+    users_result = await aexecute(
+        supabase_client.table("user_ladda(LINE,FACE)")
+        .select("line_user_id, display_name, updated_at")
+        .order("updated_at", desc=True)
+    )
+    all_users = users_result.data or []
+
+    # Step 2: สร้าง sessions จาก user_ladda (ทุกคนที่ลงทะเบียน)
+    sessions = {}
+    fallback_users = []  # (uid, stored name) — ชื่อ fallback → background refresher
+    for u in all_users:
+        uid = u["line_user_id"]
+        raw_name = u.get("display_name") or ""
+        if is_fallback_name(raw_name):
+            fallback_users.append((uid, raw_name))
+        sessions[uid] = {
+            "user_id": uid,
+            "display_name": _display_name(uid, raw_name),
+            "platform": "facebook" if uid.startswith("fb:") else "line",
+            "last_message": "",
+            "last_role": "",
+            "last_activity": u.get("updated_at", ""),
+            "message_count": 0,
+            "has_handoff": False,
+            "handoff_id": None,
+        }
+
+    # Step 3: ดึง recent messages (7 วัน) เพื่อ preview + sort
+    cutoff = (
+        datetime.now(timezone.utc) - timedelta(days=7)
+    ).isoformat()
+    msg_result = await aexecute(
+        supabase_client.table(MEMORY_TABLE)
+        .select("user_id, content, role, created_at")
+        .gte("created_at", cutoff)
+        .order("created_at", desc=True)
+        .limit(3000)
+    )
+
+    for msg in msg_result.data or []:
+        uid = msg["user_id"]
+        if uid in sessions:
+            sessions[uid]["message_count"] += 1
+            # อัพเดท last_message/last_activity ถ้ายังว่าง (เอาอันล่าสุด)
+            if not sessions[uid]["last_message"]:
+                sessions[uid]["last_message"] = (msg["content"] or "")[:100]
+                sessions[uid]["last_role"] = msg["role"]
+                sessions[uid]["last_activity"] = msg["created_at"]
+
+    # Step 4: Fallback display names → background refresher (profile API + 1 bulk UPSERT)
+    # ไม่รอใน request; negative cache กันเรียก API ซ้ำสำหรับคนที่ดึงไม่ได้ (FB ไม่มี permission)
+    # ชื่อ "User_fb:..." ถูกแก้เป็น "FB User #xxxx" ใน DB โดย refresher เช่นกัน
+    profile_cache.schedule_refresh_many(fallback_users)
+
+    # Step 5: Mark handoffs
+    handoff_convos = []
+    if handoff_manager:
+        handoffs = await handoff_manager.get_handoffs(status="pending")
+        for h in handoffs:
+            uid = h["user_id"]
             if uid in sessions:
-                sessions[uid]["message_count"] += 1
-                # อัพเดท last_message/last_activity ถ้ายังว่าง (เอาอันล่าสุด)
-                if not sessions[uid]["last_message"]:
-                    sessions[uid]["last_message"] = (msg["content"] or "")[:100]
-                    sessions[uid]["last_role"] = msg["role"]
-                    sessions[uid]["last_activity"] = msg["created_at"]
-
-        # Step 4: Auto-refresh fallback display names (LINE users only)
-        # FB users: skip API refresh (requires pages_read_engagement permission)
-        # Instead, fix ugly "User_fb:..." names to "FB User #xxxx" in DB
-        refresh_count = 0
-        for uid, sess in sessions.items():
-            dn = sess["display_name"]
-            if uid.startswith("fb:") and (dn.startswith("User_fb:") or dn.startswith("User_fb%")):
-                # Fix ugly DB name without calling FB API
-                clean_name = f"FB User #{uid[-4:]}"
-                sess["display_name"] = clean_name
-                try:
-                    if supabase_client:
-                        await aexecute(supabase_client.table("user_ladda(LINE,FACE)") \
-                            .update({"display_name": clean_name}) \
-                            .eq("line_user_id", uid))
-                except Exception:
-                    pass
-            elif dn.startswith("User_") and not uid.startswith("fb:") and refresh_count < 5:
-                # LINE user — try API refresh
-                try:
-                    new_name = await refresh_display_name(uid)
-                    if new_name:
-                        sess["display_name"] = new_name
-                        logger.info(f"Auto-refreshed name: {uid[:12]}... → {new_name}")
-                    refresh_count += 1
-                except Exception as e:
-                    logger.error(f"Auto-refresh failed for {uid[:12]}...: {e}")
-                    refresh_count += 1
-
-        # Step 5: Mark handoffs
-        handoff_convos = []
-        if handoff_manager:
-            handoffs = await handoff_manager.get_handoffs(status="pending")
-            for h in handoffs:
-                uid = h["user_id"]
-                if uid in sessions:
-                    sessions[uid]["has_handoff"] = True
-                    sessions[uid]["handoff_id"] = h["id"]
-
-            handoff_convos = sorted(
-                [s for s in sessions.values() if s["has_handoff"]],
-                key=lambda x: x["last_activity"],
-                reverse=True,
-            )
+                sessions[uid]["has_handoff"] = True
+                sessions[uid]["handoff_id"] = h["id"]
 
-        # Step 6: Sort — active users first (มี messages ใน 7 วัน), inactive ตามหลัง
-        active = sorted(
-            [s for s in sessions.values() if s["message_count"] > 0 and not s["has_handoff"]],
-            key=lambda x: x["last_activity"],
-            reverse=True,
-        )
-        inactive = sorted(
-            [s for s in sessions.values() if s["message_count"] == 0 and not s["has_handoff"]],
+        handoff_convos = sorted(
+            [s for s in sessions.values() if s["has_handoff"]],
             key=lambda x: x["last_activity"],
             reverse=True,
         )
 
-        return {
-            "handoffs": handoff_convos,
-            "recent": active + inactive,
-        }
+    # Step 6: Sort — active users first (มี messages ใน 7 วัน), inactive ตามหลัง
+    active = sorted(
+        [s for s in sessions.values() if s["message_count"] > 0 and not s["has_handoff"]],
+        key=lambda x: x["last_activity"],
+        reverse=True,
+    )
+    inactive = sorted(
+        [s for s in sessions.values() if s["message_count"] == 0 and not s["has_handoff"]],
+        key=lambda x: x["last_activity"],
+        reverse=True,
+    )
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Failed to get conversations: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "handoffs": handoff_convos,
+        "recent": active + inactive,
+        "next_cursor": None,
+    }
 
 
 @router.get("/api/admin/conversations/{user_id:path}/messages")
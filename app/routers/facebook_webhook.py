@@ -16,6 +16,8 @@ from app.services.memory import clear_memory, add_to_memory
 from app.utils.rate_limiter import check_user_rate_limit
 from app.config import MAX_CONCURRENT_TASKS
 from app.dependencies import handoff_manager
+from app.services.durable_queue import webhook_queue
+from app.utils.async_db import request_scope
 
 logger = logging.getLogger(__name__)
 
@@ -81,19 +83,43 @@ async def receive(request: Request):
         return Response(content="Not a page event", status_code=404)
 
     # Return 200 immediately (Facebook requires response within 20s)
-    # Process messages in background
+    # Persist to the durable queue first (dedup by message mid), then process in background
     entries = data.get("entry", [])
-    for entry in entries:
-        for messaging_event in entry.get("messaging", []):
-            asyncio.create_task(_guarded_process_fb_message(messaging_event))
+    messaging_events = [
+        messaging_event
+        for entry in entries
+        for messaging_event in entry.get("messaging", [])
+    ]
+    await _accept_fb_events(messaging_events)
 
     return {"status": "ok"}
 
 
-async def _guarded_process_fb_message(event: dict):
+async def _accept_fb_events(events: list):
+    """Durable queue write → background task per event; disk failure → in-memory only"""
+    jobs = [(None, event, False) for event in events]
+    if webhook_queue and events:
+        items = [
+            (event.get("sender", {}).get("id") or "", event.get("message", {}).get("mid"), event)
+            for event in events
+        ]
+        try:
+            jobs = await webhook_queue.enqueue("facebook", items)
+        except Exception as e:
+            logger.error(f"Webhook queue write failed — processing FB events in memory only: {e}")
+    for job in jobs:
+        await _start_fb_job(job)
+
+
+async def _start_fb_job(job: tuple):
+    job_id, event, _ = job
+    asyncio.create_task(_guarded_process_fb_message(event, job_id))
+
+
+async def _guarded_process_fb_message(event: dict, job_id: int = None):
     """Acquire semaphore before processing — limits concurrent background tasks."""
     try:
-        async with _task_semaphore:
+        async with _task_semaphore, request_scope("facebook"):
             await _process_fb_message(event)
     except Exception as e:
         logger.error(f"Guarded FB webhook error: {e}", exc_info=True)
@@ -103,6 +129,8 @@ async def _guarded_process_fb_message(event: dict):
                 await send_facebook_message(psid, "ขออภัยค่ะ ระบบกำลังยุ่งอยู่ กรุณารอสักครู่แล้วลองใหม่นะคะ")
             except Exception:
                 pass
+    if webhook_queue:
+        await webhook_queue.ack(job_id)
 
 
 async def _process_fb_message(event: dict) -> None:
@@ -172,3 +200,7 @@ async def _process_fb_message(event: dict) -> None:
             await send_facebook_message(psid, "ขออภัยค่ะ เกิดข้อผิดพลาด กรุณาลองใหม่อีกครั้งนะคะ")
         except Exception:
             pass
+
+
+if webhook_queue:
+    webhook_queue.register("facebook", _start_fb_job)
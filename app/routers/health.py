@@ -1,8 +1,18 @@
 import logging
 from fastapi import APIRouter
 
-from app.dependencies import openai_client, supabase_client
+from app.dependencies import openai_client, supabase_client, analytics_tracker
 from app.services.cache import get_cache_stats, clear_all_caches
+from app.services.embedding_batcher import get_embedding_batcher_stats
+from app.services.embedding_cache import get_embedding_cache_stats
+from app.services.memory import get_context_cache_stats, get_memory_buffer_stats
+from app.utils.http_clients import get_http_client_stats
+from app.utils.async_db import get_request_loader_stats
+from app.routers.webhook import get_line_dispatch_stats
+from app.services.durable_queue import get_webhook_queue_stats
+from app.services.single_flight import get_rag_single_flight_stats
+from app.services.user_service import get_user_profile_cache_stats
+from app.services.admin_inbox import get_admin_inbox_stats
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +41,18 @@ async def health_check():
         "status": "healthy",
         "version": "2.7.0",
         "cache_stats": await get_cache_stats(),
+        "embedding_batcher": get_embedding_batcher_stats(),
+        "embedding_cache": get_embedding_cache_stats(),
+        "memory_buffer": get_memory_buffer_stats(),
+        "context_cache": get_context_cache_stats(),
+        "analytics_pipeline": analytics_tracker.get_pipeline_stats() if analytics_tracker else None,
+        "http_clients": get_http_client_stats(),
+        "line_dispatch": get_line_dispatch_stats(),
+        "webhook_queue": get_webhook_queue_stats(),
+        "db_loader": get_request_loader_stats(),
+        "rag_single_flight": get_rag_single_flight_stats(),
+        "user_profile_cache": get_user_profile_cache_stats(),
+        "admin_inbox": get_admin_inbox_stats(),
         "services": {
             "openai": bool(openai_client),
             "supabase": bool(supabase_client)
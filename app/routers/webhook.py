@@ -50,9 +50,13 @@ from app.utils.line.helpers import (
     get_image_content_from_line,
     reply_line,
     push_line,
-    show_loading
+    show_loading,
+    reply_fallback_user
 )
 from app.utils.rate_limiter import check_user_rate_limit
+from app.services.event_dispatcher import KeyedEventDispatcher
+from app.services.durable_queue import webhook_queue
+from app.utils.async_db import request_scope
 from app.config import MAX_CONCURRENT_TASKS, MAX_QUEUE_DEPTH
 
 logger = logging.getLogger(__name__)
@@ -75,16 +79,12 @@ def _is_no_data_answer(answer: str) -> bool:
 
 router = APIRouter()
 
-# Semaphore to limit concurrent background tasks (prevents memory exhaustion)
-_task_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
-_queue_depth = 0
-
 
 @router.post("/webhook")
 async def callback(request: Request, x_line_signature: str = Header(None)):
     """
     LINE Webhook endpoint - returns 200 immediately to prevent timeout.
-    Actual processing happens in background via asyncio.create_task.
+    Actual processing happens in background via the per-user event dispatcher.
     """
     if not x_line_signature:
         raise HTTPException(status_code=400, detail="Missing X-Line-Signature header")
@@ -119,466 +119,524 @@ async def callback(request: Request, x_line_signature: str = Header(None)):
 
     # FIX: Return 200 IMMEDIATELY to prevent LINE timeout (499)
     # Process events in background - reply_token valid for ~30 seconds
+    # durable queue: เขียนลง SQLite ก่อนตอบ 200 (dedup webhookEventId) แล้วค่อย dispatch
+    # dispatcher: MAX_CONCURRENT_TASKS / MAX_QUEUE_DEPTH ต่อ event, ลำดับต่อ user คงเดิม
     if events:
-        asyncio.create_task(_guarded_process_webhook(events))
+        await _accept_webhook_events(events)
 
     return JSONResponse(content={"status": "success"})
 
 
-async def _guarded_process_webhook(events: list):
-    """Acquire semaphore before processing — limits concurrent background tasks."""
-    global _queue_depth
-    try:
-        # Try to acquire without blocking
-        try:
-            await asyncio.wait_for(_task_semaphore.acquire(), timeout=0.01)
-        except asyncio.TimeoutError:
-            # All slots busy — check queue depth
-            _QUEUE_FULL_REPLY = "ขณะนี้ ไอ ซี พี ลัดดา กำลังตรวจสอบข้อมูลให้คุณลูกค้าค่ะ\n\nแอดมินแจ้งให้ทราบอีกครั้งนะคะ ต้องขออภัยในความล่าช้าด้วยค่ะ 🙏🙏"
-            if _queue_depth >= MAX_QUEUE_DEPTH:
-                # REJECT — queue full → handoff-style reply
-                reply_token = next((e.get("replyToken") for e in events if e.get("replyToken")), None)
-                if reply_token:
-                    try:
-                        await reply_line(reply_token, _QUEUE_FULL_REPLY)
-                    except Exception:
-                        pass
-                logger.warning(f"Queue full ({MAX_QUEUE_DEPTH}) — replied with handoff message")
-                return
+_REPLY_TOKEN_TTL = 30  # seconds — LINE reply token lifetime
 
-            # QUEUE — wait with 30s timeout (reply_token lifetime)
-            _queue_depth += 1
-            logger.warning(f"Semaphore full — queuing ({_queue_depth}/{MAX_QUEUE_DEPTH})")
-            try:
-                await asyncio.wait_for(_task_semaphore.acquire(), timeout=30)
-            except asyncio.TimeoutError:
-                # Timeout → handoff-style reply instead of silent drop
-                reply_token = next((e.get("replyToken") for e in events if e.get("replyToken")), None)
-                if reply_token:
-                    try:
-                        await reply_line(reply_token, _QUEUE_FULL_REPLY)
-                    except Exception:
-                        pass
-                logger.error(f"Queue timeout 30s — replied with handoff message")
-                return
-            finally:
-                _queue_depth -= 1
 
-        try:
-            await _process_webhook_events(events)
-        finally:
-            _task_semaphore.release()
+def _reply_token_expired(event: dict) -> bool:
+    """Event older than the reply token (LINE timestamp, ms) — e.g. queued behind a slow reply of the same user."""
+    ts = event.get("timestamp")
+    return isinstance(ts, (int, float)) and time.time() - ts / 1000 > _REPLY_TOKEN_TTL
+
+
+_QUEUE_FULL_REPLY = "ขณะนี้ ไอ ซี พี ลัดดา กำลังตรวจสอบข้อมูลให้คุณลูกค้าค่ะ\n\nแอดมินแจ้งให้ทราบอีกครั้งนะคะ ต้องขออภัยในความล่าช้าด้วยค่ะ 🙏🙏"
+
+
+async def _reply_queue_full(event: dict, reason: str):
+    """Queue full / waited past reply-token lifetime → handoff-style reply instead of silent drop"""
+    reply_token = event.get("replyToken")
+    if reply_token:
+        await reply_line(reply_token, _QUEUE_FULL_REPLY)
+    logger.warning(f"Webhook event rejected ({reason}) — replied with handoff message")
+
+
+def _dispatch_webhook_events(events: list):
+    """Fan events out per user: concurrent across users, in order within a user"""
+    for event in events:
+        user_id = event.get("source", {}).get("userId")
+        if not event.get("replyToken") or not user_id:
+            continue
+        _dispatcher.submit(user_id, event)
+
+
+def _submit_line_job(job: tuple):
+    job_id, event, redelivered = job
+    _dispatcher.submit(event["source"]["userId"], {**event, "_queue_id": job_id, "_redelivered": redelivered})
+
+
+async def _accept_webhook_events(events: list):
+    """Persist the batch (durable queue) then dispatch; disk failure → in-memory dispatch"""
+    if not webhook_queue:
+        _dispatch_webhook_events(events)
+        return
+    items = [
+        (e["source"]["userId"], e.get("webhookEventId"), e)
+        for e in events
+        if e.get("replyToken") and e.get("source", {}).get("userId")
+    ]
+    try:
+        jobs = await webhook_queue.enqueue("line", items)
     except Exception as e:
-        logger.error(f"Guarded webhook error: {e}", exc_info=True)
+        logger.error(f"Webhook queue write failed — dispatching in memory only: {e}")
+        _dispatch_webhook_events(events)
+        return
+    for job in jobs:
+        _submit_line_job(job)
+
+
+async def _redeliver_line_job(job: tuple):
+    _submit_line_job(job)
 
 
-async def _process_webhook_events(events: list):
-    """Process webhook events in background task (per-event error isolation)"""
+def _set_push_fallback(event: dict):
+    """Redelivered / stale event → reply token likely dead: failed reply falls back to push (ไม่เงียบ)"""
+    if event.get("_redelivered") or _reply_token_expired(event):
+        return reply_fallback_user.set(event["source"]["userId"])
+    return None
+
+
+async def _handle_line_job(event: dict):
+    """Dispatcher handler: process, then ack the durable queue row (not on cancel → redelivered)"""
+    fallback = _set_push_fallback(event)
+    try:
+        async with request_scope("line"):
+            await _process_webhook_event(event)
+    finally:
+        if fallback is not None:
+            reply_fallback_user.reset(fallback)
+    if webhook_queue:
+        await webhook_queue.ack(event.get("_queue_id"))
+
+
+async def _reject_line_job(event: dict, reason: str):
+    fallback = _set_push_fallback(event)
+    try:
+        await _reply_queue_full(event, reason)
+    finally:
+        if fallback is not None:
+            reply_fallback_user.reset(fallback)
+        if webhook_queue:
+            await webhook_queue.ack(event.get("_queue_id"))
+
+
+def get_line_dispatch_stats() -> dict:
+    return _dispatcher.get_stats()
+
+
+async def _process_webhook_event(event: dict):
+    """Process one webhook event (run by the dispatcher — per-event error isolation)"""
     start_time = time.time()
+    reply_token = event.get("replyToken")
     try:
-        for event in events:
-            event_type = event.get("type")
-            reply_token = event.get("replyToken")
-            user_id = event.get("source", {}).get("userId")
-
-            if not reply_token or not user_id:
-                continue
-
-            # Check rate limit
-            if not await check_user_rate_limit(user_id):
-                await reply_line(reply_token, "ขออภัยค่ะ คุณส่งข้อความเร็วเกินไป กรุณารอสักครู่นะคะ ⏳")
-                continue
-
-            # Ensure user exists in user_ladda(LINE,FACE)
-            from app.services.user_service import ensure_user_exists
-            await ensure_user_exists(user_id)
-
-            # 1. Handle Follow Event (Welcome Message)
-            if event_type == "follow":
-                logger.info(f"User {user_id} followed the bot")
-                welcome_text = get_welcome_message()
-                await reply_line(reply_token, welcome_text)
-                continue
-
-            # 2. Handle Image Message (Interactive Diagnosis)
-            if event_type == "message" and event.get("message", {}).get("type") == "image":
-                from app.config import ENABLE_IMAGE_DIAGNOSIS
-                if not ENABLE_IMAGE_DIAGNOSIS:
-                    await reply_line(reply_token, "ขณะนี้ ไอ ซี พี ลัดดา กำลังตรวจสอบข้อมูลให้คุณลูกค้าค่ะ\n\nแอดมินแจ้งให้ทราบอีกครั้งนะคะ ต้องขออภัยในความล่าช้าด้วยค่ะ 🙏🙏")
-                    continue
-
-                message_id = event["message"]["id"]
-                logger.info(f"Received image from {user_id}")
-
-                try:
-                    # === NEW: ตรวจว่ามี context เดิมอยู่ไหม (user ส่งรูปใหม่ระหว่าง flow) ===
-                    existing_ctx = await get_pending_context(user_id)
-                    # เช็คทุก state ที่ user อาจส่งรูปใหม่ระหว่าง flow (2-step flow)
-                    active_states = [
-                        "awaiting_plant_type",   # Step 1: รอเลือกชนิดพืช
-                        "awaiting_other_plant",  # Step 1.5: รอพิมพ์ชื่อพืชอื่น
-                        "awaiting_growth_stage"  # Step 2: รอเลือกระยะปลูก
-                    ]
-                    if existing_ctx and existing_ctx.get("state") in active_states:
-                        # ถาม user ว่าจะใช้รูปใหม่หรือรูปเดิม
-                        handled = await handle_new_image_during_flow(user_id, message_id, existing_ctx, reply_token)
-                        if handled:
-                            continue
-
-                    # FIX: Reply IMMEDIATELY to prevent reply token expiration (30 sec limit)
-                    # Step 1: Ask for plant type (2-step flow)
-                    questions_text = get_initial_questions_text()
-                    await reply_line(reply_token, questions_text)
-                    logger.info(f"Replied immediately to user {user_id} - asking plant type (Step 1/2)")
-
-                    # FIX: Store only message_id (50 bytes) instead of image_bytes (5-7 MB)
-                    # This reduces cache save time from 55 seconds to < 1 second
-                    await save_pending_context(user_id, {
-                        "message_id": message_id,
-                        "timestamp": asyncio.get_event_loop().time(),
-                        "state": "awaiting_plant_type",  # Step 1: รอเลือกชนิดพืช
-                        "plant_type": None,
-                        "position": None,
-                        "symptom": None
-                    })
+        event_type = event.get("type")
+        user_id = event.get("source", {}).get("userId")
+
+        if not reply_token or not user_id:
+            return
+
+        # Check rate limit
+        if not await check_user_rate_limit(user_id):
+            await reply_line(reply_token, "ขออภัยค่ะ คุณส่งข้อความเร็วเกินไป กรุณารอสักครู่นะคะ ⏳")
+            return
+
+        # Ensure user exists in user_ladda(LINE,FACE)
+        from app.services.user_service import ensure_user_exists
+        await ensure_user_exists(user_id)
+
+        # 1. Handle Follow Event (Welcome Message)
+        if event_type == "follow":
+            logger.info(f"User {user_id} followed the bot")
+            welcome_text = get_welcome_message()
+            await reply_line(reply_token, welcome_text)
+            return
+
+        # 2. Handle Image Message (Interactive Diagnosis)
+        if event_type == "message" and event.get("message", {}).get("type") == "image":
+            from app.config import ENABLE_IMAGE_DIAGNOSIS
+            if not ENABLE_IMAGE_DIAGNOSIS:
+                await reply_line(reply_token, "ขณะนี้ ไอ ซี พี ลัดดา กำลังตรวจสอบข้อมูลให้คุณลูกค้าค่ะ\n\nแอดมินแจ้งให้ทราบอีกครั้งนะคะ ต้องขออภัยในความล่าช้าด้วยค่ะ 🙏🙏")
+                return
 
-                    # Add to memory
-                    await add_to_memory(user_id, "user", "[ส่งรูปภาพพืช]")
-                    await add_to_memory(user_id, "assistant", "[ถามชนิดพืช - ขั้นตอน 1/2]")
-
-                    logger.info(f"Asked plant type for user {user_id}, waiting for selection")
-
-                except Exception as e:
-                    logger.error(f"Error processing image: {e}")
-                    await reply_line(reply_token, "ขออภัยค่ะ เกิดข้อผิดพลาดในการรับรูปภาพ โปรดลองใหม่อีกครั้ง 😢")
-
-            # 3. Handle Text Message
-            elif event_type == "message" and event.get("message", {}).get("type") == "text":
-                text = event["message"]["text"].strip()
-                logger.info(f"Received text from {user_id}: {text}")
-
-                # WebSocket: notify admin dashboard of new message
-                try:
-                    from app.routers.ws import emit_new_message
-                    asyncio.create_task(emit_new_message(user_id, user_id, "LINE", text))
-                except Exception:
-                    pass
-
-                # Check if this is a response to image questions
-                # Check pending context from DB
-                ctx = await get_pending_context(user_id)
-
-                # ============================================================================#
-                # Quick Commands
-                # ============================================================================#
-                import uuid as _uuid
-                _req_id = _uuid.uuid4().hex[:8]
-                logger.info(f"🟢 [{_req_id}] Processing text: '{text}' user={user_id[:12]}")
-
-                # 0. Check for usage guide request
-                if text in ["วิธีใช้งาน", "วิธีใช้", "ช่วยเหลือ", "help"]:
-                    logger.info(f"🟢 User {user_id} requested usage guide")
-                    usage_guide = get_usage_guide()
-                    await reply_line(reply_token, usage_guide)
-                    continue
-
-                # 0.1 Check for product catalog request
-                if text in ["ดูผลิตภัณฑ์", "ผลิตภัณฑ์", "สินค้า", "products"]:
-                    logger.info(f"🟢 User {user_id} requested product catalog")
-                    catalog = get_product_catalog_message()
-                    await reply_line(reply_token, catalog)
-                    continue
-
-
-                # ============================================================================#
-
-                # Show loading animation early — before any path branching
-                await show_loading(user_id)
-
-                if ctx:
-                    # === ถ้าปิด image diagnosis แล้วมี pending context ค้าง → ลบทิ้งแล้วไป normal flow ===
-                    from app.config import ENABLE_IMAGE_DIAGNOSIS
-                    if not ENABLE_IMAGE_DIAGNOSIS:
-                        await delete_pending_context(user_id)
-                        answer = await handle_natural_conversation(user_id, text)
-                        if answer is not None and not _is_no_data_answer(answer):
-                            await reply_line(reply_token, answer)
-                        else:
-                            logger.info(f"⏭️ No data for {user_id} — notifying admin + alert")
-                            await fire_no_data_alert(
-                                user_id=user_id, platform="line", question=text,
-                            )
-                            # Silent: ไม่ตอบ user — admin จะเห็นใน dashboard
-                        continue
-
-                    # === NEW: ตรวจจับ interrupt ก่อนประมวลผล ===
-                    was_handled, new_ctx = await handle_context_interrupt(user_id, text, ctx, reply_token)
-                    if was_handled:
-                        # Context handler จัดการแล้ว ไปทำ event ถัดไป
-                        continue
-
-                    # ถ้ามี new_ctx ให้ใช้แทน ctx เดิม
-                    if new_ctx:
-                        ctx = new_ctx
-                    if ctx.get("state") == "awaiting_plant_type":
-                        logger.info(f"Step 1/2: User {user_id} selecting plant type: {text}")
-
-                        # Valid plant types
-                        valid_plants = ["ข้าว", "ทุเรียน", "ข้าวโพด", "มันสำปะหลัง", "อ้อย",]
-
-                        if text == "อื่นๆ":
-                            # User wants to type custom plant name
-                            await reply_line(reply_token, get_other_plant_prompt_text())
-
-                            # Update state to await custom plant name
-                            await save_pending_context(user_id, {
-                                **ctx,
-                                "state": "awaiting_other_plant"
-                            })
-                            logger.info(f"Asking user {user_id} to type custom plant name")
-
-                        elif text in valid_plants:
-                            # Valid plant selected - go directly to Step 2 (growth stage)
-                            await reply_line(reply_token, get_growth_stage_question_text(text))
-
-                            # Update context with plant type - skip position/symptom
-                            await save_pending_context(user_id, {
-                                **ctx,
-                                "state": "awaiting_growth_stage",
-                                "plant_type": text
-                            })
-                            logger.info(f"Plant type '{text}' selected, asking growth stage (Step 2/2)")
+            message_id = event["message"]["id"]
+            logger.info(f"Received image from {user_id}")
 
-                        else:
-                            # Invalid response - ask again
-                            await reply_line(reply_token, get_plant_type_retry_text())
-                            logger.info(f"Invalid plant type response: {text}, asking again")
+            try:
+                # === NEW: ตรวจว่ามี context เดิมอยู่ไหม (user ส่งรูปใหม่ระหว่าง flow) ===
+                existing_ctx = await get_pending_context(user_id)
+                # เช็คทุก state ที่ user อาจส่งรูปใหม่ระหว่าง flow (2-step flow)
+                active_states = [
+                    "awaiting_plant_type",   # Step 1: รอเลือกชนิดพืช
+                    "awaiting_other_plant",  # Step 1.5: รอพิมพ์ชื่อพืชอื่น
+                    "awaiting_growth_stage"  # Step 2: รอเลือกระยะปลูก
+                ]
+                if existing_ctx and existing_ctx.get("state") in active_states:
+                    # ถาม user ว่าจะใช้รูปใหม่หรือรูปเดิม
+                    handled = await handle_new_image_during_flow(user_id, message_id, existing_ctx, reply_token)
+                    if handled:
+                        return
+
+                # FIX: Reply IMMEDIATELY to prevent reply token expiration (30 sec limit)
+                # Step 1: Ask for plant type (2-step flow)
+                questions_text = get_initial_questions_text()
+                await reply_line(reply_token, questions_text)
+                logger.info(f"Replied immediately to user {user_id} - asking plant type (Step 1/2)")
+
+                # FIX: Store only message_id (50 bytes) instead of image_bytes (5-7 MB)
+                # This reduces cache save time from 55 seconds to < 1 second
+                await save_pending_context(user_id, {
+                    "message_id": message_id,
+                    "timestamp": asyncio.get_event_loop().time(),
+                    "state": "awaiting_plant_type",  # Step 1: รอเลือกชนิดพืช
+                    "plant_type": None,
+                    "position": None,
+                    "symptom": None
+                })
+
+                # Add to memory
+                await add_to_memory(user_id, "user", "[ส่งรูปภาพพืช]")
+                await add_to_memory(user_id, "assistant", "[ถามชนิดพืช - ขั้นตอน 1/2]")
+
+                logger.info(f"Asked plant type for user {user_id}, waiting for selection")
+
+            except Exception as e:
+                logger.error(f"Error processing image: {e}")
+                await reply_line(reply_token, "ขออภัยค่ะ เกิดข้อผิดพลาดในการรับรูปภาพ โปรดลองใหม่อีกครั้ง 😢")
+
+        # 3. Handle Text Message
+        elif event_type == "message" and event.get("message", {}).get("type") == "text":
+            text = event["message"]["text"].strip()
+            logger.info(f"Received text from {user_id}: {text}")
+
+            # WebSocket: notify admin dashboard of new message
+            try:
+                from app.routers.ws import emit_new_message
+                asyncio.create_task(emit_new_message(user_id, user_id, "LINE", text))
+            except Exception:
+                pass
+
+            # Check if this is a response to image questions
+            # Check pending context from DB
+            ctx = await get_pending_context(user_id)
+
+            # ============================================================================#
+            # Quick Commands
+            # ============================================================================#
+            import uuid as _uuid
+            _req_id = _uuid.uuid4().hex[:8]
+            logger.info(f"🟢 [{_req_id}] Processing text: '{text}' user={user_id[:12]}")
+
+            # 0. Check for usage guide request
+            if text in ["วิธีใช้งาน", "วิธีใช้", "ช่วยเหลือ", "help"]:
+                logger.info(f"🟢 User {user_id} requested usage guide")
+                usage_guide = get_usage_guide()
+                await reply_line(reply_token, usage_guide)
+                return
 
-                    # ==========================================================================
-                    # STEP 1.5: Awaiting Custom Plant Name (when "อื่นๆ" selected)
-                    # ==========================================================================
-                    elif ctx.get("state") == "awaiting_other_plant":
-                        logger.info(f"Step 1.5: User {user_id} typing custom plant: {text}")
+            # 0.1 Check for product catalog request
+            if text in ["ดูผลิตภัณฑ์", "ผลิตภัณฑ์", "สินค้า", "products"]:
+                logger.info(f"🟢 User {user_id} requested product catalog")
+                catalog = get_product_catalog_message()
+                await reply_line(reply_token, catalog)
+                return
+
+
+            # ============================================================================#
+
+            # Show loading animation early — before any path branching
+            await show_loading(user_id)
+
+            if ctx:
+                # === ถ้าปิด image diagnosis แล้วมี pending context ค้าง → ลบทิ้งแล้วไป normal flow ===
+                from app.config import ENABLE_IMAGE_DIAGNOSIS
+                if not ENABLE_IMAGE_DIAGNOSIS:
+                    await delete_pending_context(user_id)
+                    answer = await handle_natural_conversation(user_id, text)
+                    if answer is not None and not _is_no_data_answer(answer):
+                        await reply_line(reply_token, answer)
+                    else:
+                        logger.info(f"⏭️ No data for {user_id} — notifying admin + alert")
+                        await fire_no_data_alert(
+                            user_id=user_id, platform="line", question=text,
+                        )
+                        # Silent: ไม่ตอบ user — admin จะเห็นใน dashboard
+                    return
+
+                # === NEW: ตรวจจับ interrupt ก่อนประมวลผล ===
+                was_handled, new_ctx = await handle_context_interrupt(user_id, text, ctx, reply_token)
+                if was_handled:
+                    # Context handler จัดการแล้ว ไปทำ event ถัดไป
+                    return
+
+                # ถ้ามี new_ctx ให้ใช้แทน ctx เดิม
+                if new_ctx:
+                    ctx = new_ctx
+                if ctx.get("state") == "awaiting_plant_type":
+                    logger.info(f"Step 1/2: User {user_id} selecting plant type: {text}")
+
+                    # Valid plant types
+                    valid_plants = ["ข้าว", "ทุเรียน", "ข้าวโพด", "มันสำปะหลัง", "อ้อย",]
+
+                    if text == "อื่นๆ":
+                        # User wants to type custom plant name
+                        await reply_line(reply_token, get_other_plant_prompt_text())
+
+                        # Update state to await custom plant name
+                        await save_pending_context(user_id, {
+                            **ctx,
+                            "state": "awaiting_other_plant"
+                        })
+                        logger.info(f"Asking user {user_id} to type custom plant name")
 
-                        # Accept any text as plant name, go directly to Step 2 (growth stage)
+                    elif text in valid_plants:
+                        # Valid plant selected - go directly to Step 2 (growth stage)
                         await reply_line(reply_token, get_growth_stage_question_text(text))
 
-                        # Update context with custom plant type - skip position/symptom
+                        # Update context with plant type - skip position/symptom
                         await save_pending_context(user_id, {
                             **ctx,
                             "state": "awaiting_growth_stage",
                             "plant_type": text
                         })
-                        logger.info(f"Custom plant '{text}' accepted, asking growth stage (Step 2/2)")
+                        logger.info(f"Plant type '{text}' selected, asking growth stage (Step 2/2)")
 
-                    elif ctx.get("state") == "awaiting_growth_stage":
-                        # Step 2/2: User selected growth stage - analyze image and recommend products
-                        logger.info(f"Step 2/2: User {user_id} selected growth stage: {text}")
+                    else:
+                        # Invalid response - ask again
+                        await reply_line(reply_token, get_plant_type_retry_text())
+                        logger.info(f"Invalid plant type response: {text}, asking again")
 
-                        plant_type = ctx.get("plant_type", "")
-                        growth_stage = text
+                # ==========================================================================
+                # STEP 1.5: Awaiting Custom Plant Name (when "อื่นๆ" selected)
+                # ==========================================================================
+                elif ctx.get("state") == "awaiting_other_plant":
+                    logger.info(f"Step 1.5: User {user_id} typing custom plant: {text}")
 
-                        # Build extra_user_info for AI analysis
-                        extra_user_info = f"พืช: {plant_type}" if plant_type else None
+                    # Accept any text as plant name, go directly to Step 2 (growth stage)
+                    await reply_line(reply_token, get_growth_stage_question_text(text))
 
-                        # 1. Download image
-                        try:
-                            message_id_from_ctx = ctx["message_id"]
-                            logger.info(f"Downloading image for analysis: {message_id_from_ctx}")
-                            image_bytes = await get_image_content_from_line(message_id_from_ctx)
-                        except Exception as e:
-                            logger.error(f"Failed to download image: {e}")
-                            await reply_line(reply_token, "ขออภัยค่ะ ไม่สามารถดาวน์โหลดรูปภาพได้ กรุณาส่งรูปใหม่อีกครั้ง 😢")
-                            await delete_pending_context(user_id)
-                            continue
+                    # Update context with custom plant type - skip position/symptom
+                    await save_pending_context(user_id, {
+                        **ctx,
+                        "state": "awaiting_growth_stage",
+                        "plant_type": text
+                    })
+                    logger.info(f"Custom plant '{text}' accepted, asking growth stage (Step 2/2)")
 
-                        try:
-                            # Send analyzing message
-                            analyzing_text = get_analyzing_text(with_info=bool(extra_user_info))
-                            await reply_line(reply_token, analyzing_text)
-
-                            # 2. Run disease detection (no position/symptom)
-                            detection_result = await smart_detect_disease(image_bytes, extra_user_info=extra_user_info)
-
-                            # Override plant_type if user specified
-                            if plant_type and not detection_result.plant_type:
-                                detection_result.plant_type = plant_type
-
-                            # Check if we should recommend products
-                            skip_keywords = [
-                                "ไม่พบ", "ไม่ทราบ", "ปกติ", "ไม่ชัดเจน",
-                                "ขาดธาตุ", "ขาดไนโตรเจน", "ขาดฟอสฟอรัส", "ขาดโพแทสเซียม",
-                                "ขาดแมกนีเซียม", "ขาดเหล็ก", "ขาดแคลเซียม", "ขาดโบรอน",
-                                "Deficiency", "deficiency",
-                                "ใบเหลือง", "ใบซีด",
-                                "สุขภาพดี", "healthy", "Healthy",
-                                "Technical Error", "ไม่สามารถระบุได้", "Error", "error",
-                                "ไม่ใช่ภาพ", "ไม่ใช่รูป", "Not Found"
-                            ]
-                            should_recommend = True
-                            disease_name_lower = detection_result.disease_name.lower()
-
-                            try:
-                                conf_value = float(detection_result.confidence) if detection_result.confidence is not None else None
-                                if conf_value is not None and conf_value < 10:
-                                    should_recommend = False
-                                    logger.info(f"⏭️ Skipping product recommendation - confidence too low: {conf_value}%")
-                            except (ValueError, TypeError):
-                                pass
-
-                            for kw in skip_keywords:
-                                if kw.lower() in disease_name_lower:
-                                    _, pest_name, _ = get_search_query_for_disease(detection_result.disease_name)
-                                    if pest_name:
-                                        logger.info(f"🐛 โรคมีพาหะ '{pest_name}' → ยังแนะนำยาฆ่าแมลงได้")
-                                    else:
-                                        should_recommend = False
-                                        logger.info(f"⏭️ Skipping product recommendation - matched skip keyword: {kw}")
-                                    break
-
-                            # Extract pest_type from raw_analysis
-                            pest_type = "ศัตรูพืช"
-                            if detection_result.raw_analysis:
-                                parts = detection_result.raw_analysis.split(":")
-                                if len(parts) > 0:
-                                    pest_type = parts[0].strip()
-
-                            if should_recommend:
-                                # 3. Get product recommendations with matching score
-                                recommendations = await retrieve_products_with_matching_score(
-                                    detection_result=detection_result,
-                                    plant_type=plant_type,
-                                    growth_stage=growth_stage
-                                )
+                elif ctx.get("state") == "awaiting_growth_stage":
+                    # Step 2/2: User selected growth stage - analyze image and recommend products
+                    logger.info(f"Step 2/2: User {user_id} selected growth stage: {text}")
+
+                    plant_type = ctx.get("plant_type", "")
+                    growth_stage = text
+
+                    # Build extra_user_info for AI analysis
+                    extra_user_info = f"พืช: {plant_type}" if plant_type else None
 
-                                # Track product recommendations
-                                if analytics_tracker and recommendations:
-                                    product_names = [p.product_name for p in recommendations]
-                                    await analytics_tracker.track_product_recommendation(
-                                        user_id=user_id,
-                                        source="ImageDiagnosis",
-                                        products=product_names
-                                    )
-
-                                # 4. Send combined results (diagnosis + products)
-                                # First send diagnosis
-                                text_messages = await generate_text_response(detection_result, [], extra_user_info=extra_user_info)
-                                await push_line(user_id, text_messages)
-
-                                # Then send product recommendations if any
-                                if recommendations:
-                                    product_list = []
-                                    for p in recommendations[:5]:
-                                        from app.utils.pest_columns import get_pest_text
-                                        _pest_text = get_pest_text({
-                                            'fungicides': p.fungicides, 'insecticides': p.insecticides,
-                                            'herbicides': p.herbicides, 'biostimulant': p.biostimulant,
-                                            'pgr_hormones': p.pgr_hormones,
-                                        }) or "-"
-                                        product_list.append({
-                                            "product_name": (p.product_name or "ไม่ระบุ")[:100],
-                                            "active_ingredient": (p.active_ingredient or "-")[:100],
-                                            "target_pest": _pest_text[:200],
-                                            "applicable_crops": (p.applicable_crops or "-")[:150],
-                                            "usage_period": (p.usage_period or "-")[:100],
-                                            "how_to_use": (p.how_to_use or "-")[:200],
-                                            "usage_rate": (p.usage_rate or "-")[:100],
-                                            "link_product": (p.link_product or "")[:500] if p.link_product and str(p.link_product).startswith("http") else "",
-                                            "image_url": (p.image_url or "") if hasattr(p, 'image_url') else "",
-                                            "similarity": p.score if hasattr(p, 'score') else 0.8
-                                        })
-
-                                    product_text = format_product_list_text(product_list)
-
-                                    # Send header text + product list
-                                    header_text = f"💊 ผลิตภัณฑ์แนะนำสำหรับ {plant_type} {growth_stage}:"
-
-                                    await push_line(user_id, [
-                                        header_text,
-                                        product_text
-                                    ])
-
-                                    # Save recommended products to memory
-                                    await save_recommended_products(
-                                        user_id,
-                                        recommendations,
-                                        disease_name=detection_result.disease_name
-                                    )
+                    # 1. Download image
+                    try:
+                        message_id_from_ctx = ctx["message_id"]
+                        logger.info(f"Downloading image for analysis: {message_id_from_ctx}")
+                        image_bytes = await get_image_content_from_line(message_id_from_ctx)
+                    except Exception as e:
+                        logger.error(f"Failed to download image: {e}")
+                        await reply_line(reply_token, "ขออภัยค่ะ ไม่สามารถดาวน์โหลดรูปภาพได้ กรุณาส่งรูปใหม่อีกครั้ง 😢")
+                        await delete_pending_context(user_id)
+                        return
+
+                    try:
+                        # Send analyzing message
+                        analyzing_text = get_analyzing_text(with_info=bool(extra_user_info))
+                        await reply_line(reply_token, analyzing_text)
+
+                        # 2. Run disease detection (no position/symptom)
+                        detection_result = await smart_detect_disease(image_bytes, extra_user_info=extra_user_info)
+
+                        # Override plant_type if user specified
+                        if plant_type and not detection_result.plant_type:
+                            detection_result.plant_type = plant_type
+
+                        # Check if we should recommend products
+                        skip_keywords = [
+                            "ไม่พบ", "ไม่ทราบ", "ปกติ", "ไม่ชัดเจน",
+                            "ขาดธาตุ", "ขาดไนโตรเจน", "ขาดฟอสฟอรัส", "ขาดโพแทสเซียม",
+                            "ขาดแมกนีเซียม", "ขาดเหล็ก", "ขาดแคลเซียม", "ขาดโบรอน",
+                            "Deficiency", "deficiency",
+                            "ใบเหลือง", "ใบซีด",
+                            "สุขภาพดี", "healthy", "Healthy",
+                            "Technical Error", "ไม่สามารถระบุได้", "Error", "error",
+                            "ไม่ใช่ภาพ", "ไม่ใช่รูป", "Not Found"
+                        ]
+                        should_recommend = True
+                        disease_name_lower = detection_result.disease_name.lower()
+
+                        try:
+                            conf_value = float(detection_result.confidence) if detection_result.confidence is not None else None
+                            if conf_value is not None and conf_value < 10:
+                                should_recommend = False
+                                logger.info(f"⏭️ Skipping product recommendation - confidence too low: {conf_value}%")
+                        except (ValueError, TypeError):
+                            pass
+
+                        for kw in skip_keywords:
+                            if kw.lower() in disease_name_lower:
+                                _, pest_name, _ = get_search_query_for_disease(detection_result.disease_name)
+                                if pest_name:
+                                    logger.info(f"🐛 โรคมีพาหะ '{pest_name}' → ยังแนะนำยาฆ่าแมลงได้")
                                 else:
-                                    await push_line(user_id, "ขออภัยค่ะ ไม่พบผลิตภัณฑ์ที่เหมาะสมสำหรับระยะนี้ 😢")
+                                    should_recommend = False
+                                    logger.info(f"⏭️ Skipping product recommendation - matched skip keyword: {kw}")
+                                break
+
+                        # Extract pest_type from raw_analysis
+                        pest_type = "ศัตรูพืช"
+                        if detection_result.raw_analysis:
+                            parts = detection_result.raw_analysis.split(":")
+                            if len(parts) > 0:
+                                pest_type = parts[0].strip()
+
+                        if should_recommend:
+                            # 3. Get product recommendations with matching score
+                            recommendations = await retrieve_products_with_matching_score(
+                                detection_result=detection_result,
+                                plant_type=plant_type,
+                                growth_stage=growth_stage
+                            )
 
-                                # Add to memory
-                                await add_to_memory(user_id, "user", f"[พืช] {plant_type} [ระยะ] {growth_stage}")
-                                await add_to_memory(user_id, "assistant", f"[ผลวิเคราะห์] {detection_result.disease_name} [แนะนำ] {len(recommendations)} รายการ")
+                            # Track product recommendations
+                            if analytics_tracker and recommendations:
+                                product_names = [p.product_name for p in recommendations]
+                                await analytics_tracker.track_product_recommendation(
+                                    user_id=user_id,
+                                    source="ImageDiagnosis",
+                                    products=product_names
+                                )
 
+                            # 4. Send combined results (diagnosis + products)
+                            # First send diagnosis
+                            text_messages = await generate_text_response(detection_result, [], extra_user_info=extra_user_info)
+                            await push_line(user_id, text_messages)
+
+                            # Then send product recommendations if any
+                            if recommendations:
+                                product_list = []
+                                for p in recommendations[:5]:
+                                    from app.utils.pest_columns import get_pest_text
+                                    _pest_text = get_pest_text({
+                                        'fungicides': p.fungicides, 'insecticides': p.insecticides,
+                                        'herbicides': p.herbicides, 'biostimulant': p.biostimulant,
+                                        'pgr_hormones': p.pgr_hormones,
+                                    }) or "-"
+                                    product_list.append({
+                                        "product_name": (p.product_name or "ไม่ระบุ")[:100],
+                                        "active_ingredient": (p.active_ingredient or "-")[:100],
+                                        "target_pest": _pest_text[:200],
+                                        "applicable_crops": (p.applicable_crops or "-")[:150],
+                                        "usage_period": (p.usage_period or "-")[:100],
+                                        "how_to_use": (p.how_to_use or "-")[:200],
+                                        "usage_rate": (p.usage_rate or "-")[:100],
+                                        "link_product": (p.link_product or "")[:500] if p.link_product and str(p.link_product).startswith("http") else "",
+                                        "image_url": (p.image_url or "") if hasattr(p, 'image_url') else "",
+                                        "similarity": p.score if hasattr(p, 'score') else 0.8
+                                    })
+
+                                product_text = format_product_list_text(product_list)
+
+                                # Send header text + product list
+                                header_text = f"💊 ผลิตภัณฑ์แนะนำสำหรับ {plant_type} {growth_stage}:"
+
+                                await push_line(user_id, [
+                                    header_text,
+                                    product_text
+                                ])
+
+                                # Save recommended products to memory
+                                await save_recommended_products(
+                                    user_id,
+                                    recommendations,
+                                    disease_name=detection_result.disease_name
+                                )
                             else:
-                                # ไม่ต้องแนะนำสินค้า (ขาดธาตุ, ไม่พบปัญหา, สุขภาพดี)
-                                text_messages = await generate_text_response(detection_result, [], extra_user_info=extra_user_info)
-                                await push_line(user_id, text_messages)
+                                await push_line(user_id, "ขออภัยค่ะ ไม่พบผลิตภัณฑ์ที่เหมาะสมสำหรับระยะนี้ 😢")
 
-                                # Add to memory
-                                await add_to_memory(user_id, "user", f"[พืช] {plant_type} [ระยะ] {growth_stage}")
-                                await add_to_memory(user_id, "assistant", f"[ผลวิเคราะห์] {detection_result.disease_name}")
+                            # Add to memory
+                            await add_to_memory(user_id, "user", f"[พืช] {plant_type} [ระยะ] {growth_stage}")
+                            await add_to_memory(user_id, "assistant", f"[ผลวิเคราะห์] {detection_result.disease_name} [แนะนำ] {len(recommendations)} รายการ")
 
-                            # Clear context
-                            await delete_pending_context(user_id)
+                        else:
+                            # ไม่ต้องแนะนำสินค้า (ขาดธาตุ, ไม่พบปัญหา, สุขภาพดี)
+                            text_messages = await generate_text_response(detection_result, [], extra_user_info=extra_user_info)
+                            await push_line(user_id, text_messages)
 
-                        except Exception as e:
-                            logger.error(f"Error processing growth stage response: {e}", exc_info=True)
-                            await reply_line(reply_token, "ขออภัยค่ะ เกิดข้อผิดพลาด กรุณาลองใหม่อีกครั้ง 😢")
-                            await delete_pending_context(user_id)
+                            # Add to memory
+                            await add_to_memory(user_id, "user", f"[พืช] {plant_type} [ระยะ] {growth_stage}")
+                            await add_to_memory(user_id, "assistant", f"[ผลวิเคราะห์] {detection_result.disease_name}")
 
-                    else:
-                        # Context exists but unknown state
-                        logger.warning(f"Found context for {user_id} but state is unknown: {ctx.get('state')}")
-                        # Clear unknown context and fall through to normal conversation
+                        # Clear context
                         await delete_pending_context(user_id)
 
-                        # Q&A Chat
-                        answer = await handle_natural_conversation(user_id, text)
-                        if answer is not None and not _is_no_data_answer(answer):
-                            await reply_line(reply_token, answer)
-                        else:
-                            logger.info(f"⏭️ No data for {user_id} — notifying admin + alert")
-                            await fire_no_data_alert(
-                                user_id=user_id, platform="line", question=text,
-                            )
+                    except Exception as e:
+                        logger.error(f"Error processing growth stage response: {e}", exc_info=True)
+                        await reply_line(reply_token, "ขออภัยค่ะ เกิดข้อผิดพลาด กรุณาลองใหม่อีกครั้ง 😢")
+                        await delete_pending_context(user_id)
 
                 else:
-                    # Normal text message handling
-                    if text.lower() in ["ล้างความจำ", "reset", "clear"]:
-                        await clear_memory(user_id)
-                        await reply_line(reply_token, "ล้างความจำเรียบร้อยค่ะ เริ่มต้นใหม่ได้เลย! ✨")
-
-                    elif text.lower() in ["ช่วยเหลือ", "help", "เมนู"]:
-                        # Use Flex Message for help menu
-                        help_flex = get_help_menu()
-                        await reply_line(reply_token, help_flex)
+                    # Context exists but unknown state
+                    logger.warning(f"Found context for {user_id} but state is unknown: {ctx.get('state')}")
+                    # Clear unknown context and fall through to normal conversation
+                    await delete_pending_context(user_id)
+
+                    # Q&A Chat
+                    answer = await handle_natural_conversation(user_id, text)
+                    if answer is not None and not _is_no_data_answer(answer):
+                        await reply_line(reply_token, answer)
+                    else:
+                        logger.info(f"⏭️ No data for {user_id} — notifying admin + alert")
+                        await fire_no_data_alert(
+                            user_id=user_id, platform="line", question=text,
+                        )
+
+            else:
+                # Normal text message handling
+                if text.lower() in ["ล้างความจำ", "reset", "clear"]:
+                    await clear_memory(user_id)
+                    await reply_line(reply_token, "ล้างความจำเรียบร้อยค่ะ เริ่มต้นใหม่ได้เลย! ✨")
+
+                elif text.lower() in ["ช่วยเหลือ", "help", "เมนู"]:
+                    # Use Flex Message for help menu
+                    help_flex = get_help_menu()
+                    await reply_line(reply_token, help_flex)
 
+                else:
+                    # Q&A Chat
+                    answer = await handle_natural_conversation(user_id, text)
+                    if answer is not None and not _is_no_data_answer(answer):
+                        await reply_line(reply_token, answer)
                     else:
-                        # Q&A Chat
-                        answer = await handle_natural_conversation(user_id, text)
-                        if answer is not None and not _is_no_data_answer(answer):
-                            await reply_line(reply_token, answer)
-                        else:
-                            logger.info(f"⏭️ No data for {user_id} — notifying admin + alert")
-                            await fire_no_data_alert(
-                                user_id=user_id, platform="line", question=text,
-                            )
-                            # Silent: ไม่ตอบ user — admin จะเห็นใน dashboard
+                        logger.info(f"⏭️ No data for {user_id} — notifying admin + alert")
+                        await fire_no_data_alert(
+                            user_id=user_id, platform="line", question=text,
+                        )
+                        # Silent: ไม่ตอบ user — admin จะเห็นใน dashboard
 
-            # 4. Handle Sticker (Just for fun)
-            elif event_type == "message" and event.get("message", {}).get("type") == "sticker":
-                # Reply with a sticker
-                await reply_line(reply_token, "ขอบคุณค่ะ! 😊", with_sticker=True)
+        # 4. Handle Sticker (Just for fun)
+        elif event_type == "message" and event.get("message", {}).get("type") == "sticker":
+            # Reply with a sticker
+            await reply_line(reply_token, "ขอบคุณค่ะ! 😊", with_sticker=True)
 
-        logger.info(f"✅ Background webhook processing completed in {time.time() - start_time:.2f}s")
+        logger.info(f"✅ Webhook event processed in {time.time() - start_time:.2f}s")
 
     except Exception as e:
         logger.error(f"Background webhook error: {e}", exc_info=True)
         # Try to send error reply if we have a valid reply_token
         try:
-            if 'reply_token' in dir() and reply_token:
+            if reply_token:
                 await reply_line(reply_token, "ขออภัยค่ะ เกิดข้อผิดพลาด กรุณาลองใหม่อีกครั้งนะคะ")
         except Exception:
             pass  # reply_token may have expired
+
+
+_dispatcher = KeyedEventDispatcher(
+    handler=_handle_line_job,
+    max_concurrent=MAX_CONCURRENT_TASKS,
+    max_queue_depth=MAX_QUEUE_DEPTH,
+    queue_timeout=_REPLY_TOKEN_TTL,  # wait for a global slot only (not behind the same user's messages)
+    on_reject=_reject_line_job,
+)
+if webhook_queue:
+    webhook_queue.register("line", _redeliver_line_job)
@@ -71,32 +71,44 @@ async def emit_alert(alert_type: str, message: str, severity: str):
     })
 
 
+_STATS_INTERVAL = 30  # seconds
+_stats_snapshot = {"ts": 0.0, "data": None}
+_stats_lock = asyncio.Lock()
+
+
+async def _get_stats_snapshot() -> dict:
+    """Quick stats shared by every connected socket — at most 1 query pair per interval."""
+    async with _stats_lock:
+        if _stats_snapshot["data"] is not None and time.time() - _stats_snapshot["ts"] < _STATS_INTERVAL:
+            return _stats_snapshot["data"]
+
+        from app.dependencies import supabase_client
+        from app.utils.async_db import aexecute
+        # estimated = exact ถ้าตารางเล็ก, ใช้ planner estimate เมื่อ events เยอะ (ไม่ scan ทั้งตาราง)
+        events, users = await asyncio.gather(
+            aexecute(supabase_client.table('ladda_analyst_event').select('id', count='estimated').limit(1)),
+            aexecute(supabase_client.table('user_ladda(LINE,FACE)').select('id', count='exact').limit(1)),
+        )
+        _stats_snapshot["data"] = {
+            "total_events": events.count or 0,
+            "total_users": users.count or 0,
+        }
+        _stats_snapshot["ts"] = time.time()
+        return _stats_snapshot["data"]
+
+
 async def _stats_loop(ws: WebSocket):
     """Send dashboard stats every 30 seconds."""
     while True:
         try:
-            await asyncio.sleep(30)
+            await asyncio.sleep(_STATS_INTERVAL)
             from app.dependencies import supabase_client
             if not supabase_client:
                 continue
 
-            # Quick stats
-            from app.utils.async_db import aexecute
-            events = await aexecute(
-                supabase_client.table('ladda_analyst_event')
-                .select('id', count='exact')
-            )
-            users = await aexecute(
-                supabase_client.table('user_ladda(LINE,FACE)')
-                .select('id', count='exact')
-            )
-
             await ws.send_text(json.dumps({
                 "event": "stats:update",
-                "data": {
-                    "total_events": events.count or 0,
-                    "total_users": users.count or 0,
-                },
+                "data": await _get_stats_snapshot(),
                 "ts": time.time(),
             }))
         except (WebSocketDisconnect, Exception):
@@ -0,0 +1,228 @@
+"""
+Admin Inbox — รายการแชทของ admin chat ที่อัพเดทแบบ incremental (ตาราง admin_inbox, 1 แถวต่อ user)
+
+เดิม: get_conversations ทุก poll (5 วิ) SELECT ทุกแถวใน user_ladda + memory 7 วัน (≤3000 แถว)
+แล้วนับ / preview / sort ใน Python → transfer O(users + messages) ต่อการ refresh ของ admin
+
+ตอนนี้:
+- memory write buffer flush → summarize_messages() รวมเป็น 1 delta ต่อ user
+  (ข้อความล่าสุด, role, เวลา, จำนวนต่อวัน) → RPC admin_inbox_apply 1 ครั้งต่อ flush
+- handoff create (UPSERT — สร้างแถวได้ถ้า flush แรกยังไม่มา) / resolve → has_handoff + handoff_id
+- clear_memory → reset preview / จำนวนของ user
+- อ่าน: keyset pagination (last_activity DESC, user_id DESC) บน index → 1 หน้า = 1 query ขนาดคงที่
+  cursor = base64 ของ (last_activity, user_id) ของแถวสุดท้ายในหน้า
+
+ตาราง / RPC / backfill: migrations/create_admin_inbox.sql
+ยังไม่ได้ migrate → page() raise → admin_chat ใช้ scan แบบเดิม
+"""
+import base64
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.async_db import aexecute
+
+logger = logging.getLogger(__name__)
+
+INBOX_TABLE = "admin_inbox"
+INBOX_APPLY_RPC = "admin_inbox_apply"
+COUNT_WINDOW_DAYS = 7
+PREVIEW_CHARS = 100
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_PAGE_COLUMNS = "user_id, platform, last_message, last_role, last_activity, day_counts, has_handoff, handoff_id"
+
+
+def _parse_ts(value) -> datetime:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return _EPOCH
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def platform_of(user_id: str) -> str:
+    return "facebook" if user_id.startswith("fb:") else "line"
+
+
+def summarize_messages(rows: List[dict]) -> List[dict]:
+    """Memory rows of one flush → one inbox delta per user (latest message wins, counts per UTC day)."""
+    deltas: Dict[str, dict] = {}
+    latest: Dict[str, datetime] = {}
+    for row in rows:
+        uid = row.get("user_id")
+        if not uid:
+            continue
+        ts = _parse_ts(row.get("created_at") or datetime.now(timezone.utc))
+        day = ts.astimezone(timezone.utc).strftime("%Y-%m-%d")
+        delta = deltas.get(uid)
+        if delta is None:
+            delta = deltas[uid] = {"user_id": uid, "platform": platform_of(uid), "day_counts": {}}
+        delta["day_counts"][day] = delta["day_counts"].get(day, 0) + 1
+        if uid not in latest or ts >= latest[uid]:
+            latest[uid] = ts
+            delta["last_message"] = (row.get("content") or "")[:PREVIEW_CHARS]
+            delta["last_role"] = row.get("role") or ""
+            delta["last_activity"] = ts.isoformat()
+    return list(deltas.values())
+
+
+def message_count(day_counts: Optional[dict], now: Optional[datetime] = None) -> int:
+    """Messages in the last COUNT_WINDOW_DAYS (whole UTC days — the oldest day is counted in full)."""
+    cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=COUNT_WINDOW_DAYS)).strftime("%Y-%m-%d")
+    return sum(int(n) for day, n in (day_counts or {}).items() if day >= cutoff)
+
+
+def encode_cursor(last_activity: str, user_id: str) -> str:
+    raw = json.dumps([last_activity, user_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; ValueError on anything that is not one of ours."""
+    try:
+        last_activity, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(last_activity, str) or not isinstance(user_id, str):
+        raise ValueError("Invalid cursor")
+    return last_activity, user_id
+
+
+def _quote(value: str) -> str:
+    """PostgREST filter value in double quotes (timestamps contain ':' / '+', user ids may contain ':')."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class AdminInbox:
+    """admin_inbox table: incremental writes from memory / handoffs, keyset-paginated reads."""
+
+    def __init__(self, supabase_client):
+        self.supabase = supabase_client
+        self._stats = {
+            "flushes": 0, "users_applied": 0, "apply_errors": 0,
+            "handoff_updates": 0, "handoff_errors": 0, "pages": 0,
+        }
+
+    # =====================================================================
+    # Writes
+    # =====================================================================
+
+    async def apply_messages(self, rows: List[dict]) -> int:
+        """Merge one memory flush into the inbox (1 RPC). Never raises — the memory rows are already stored."""
+        deltas = summarize_messages(rows)
+        if not deltas or not self.supabase:
+            return 0
+        try:
+            await aexecute(self.supabase.rpc(INBOX_APPLY_RPC, {"p_rows": deltas}))
+        except Exception as e:
+            self._stats["apply_errors"] += 1
+            logger.warning(f"Admin inbox update failed ({len(deltas)} users): {e}")
+            return 0
+        self._stats["flushes"] += 1
+        self._stats["users_applied"] += len(deltas)
+        return len(deltas)
+
+    async def _update(self, values: dict, column: str, value) -> None:
+        try:
+            await aexecute(self.supabase.table(INBOX_TABLE).update(values).eq(column, value))
+            self._stats["handoff_updates"] += 1
+        except Exception as e:
+            self._stats["handoff_errors"] += 1
+            logger.warning(f"Admin inbox update failed ({column}={value}): {e}")
+
+    async def set_handoff(self, user_id: str, handoff_id: int) -> None:
+        """UPSERT — a new user's handoff usually lands before the first memory flush creates the row."""
+        if not self.supabase:
+            return
+        row = {"user_id": user_id, "platform": platform_of(user_id), "has_handoff": True, "handoff_id": handoff_id}
+        try:
+            await aexecute(self.supabase.table(INBOX_TABLE).upsert(row, on_conflict="user_id"))
+            self._stats["handoff_updates"] += 1
+        except Exception as e:
+            self._stats["handoff_errors"] += 1
+            logger.warning(f"Admin inbox handoff upsert failed ({user_id[:12]}...): {e}")
+
+    async def clear_handoff(self, handoff_id: int) -> None:
+        if self.supabase:
+            await self._update({"has_handoff": False, "handoff_id": None}, "handoff_id", handoff_id)
+
+    async def reset(self, user_id: str) -> None:
+        """Conversation cleared — keep the row (ordering / handoff) but drop preview and counts."""
+        if self.supabase:
+            await self._update({"last_message": "", "last_role": "", "day_counts": {}}, "user_id", user_id)
+
+    # =====================================================================
+    # Reads
+    # =====================================================================
+
+    async def page(
+        self, has_handoff: bool, cursor: Optional[str] = None, limit: int = 50
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page, newest activity first → (sessions, next_cursor).
+        sessions have the get_conversations shape minus display_name; raises on DB errors.
+        """
+        query = (
+            self.supabase.table(INBOX_TABLE)
+            .select(_PAGE_COLUMNS)
+            .eq("has_handoff", has_handoff)
+        )
+        if cursor:
+            ts, uid = decode_cursor(cursor)
+            query = query.or_(
+                f"last_activity.lt.{_quote(ts)},"
+                f"and(last_activity.eq.{_quote(ts)},user_id.lt.{_quote(uid)})"
+            )
+        result = await aexecute(
+            query.order("last_activity", desc=True)
+            .order("user_id", desc=True)
+            .limit(limit + 1)
+        )
+        rows = result.data or []
+        self._stats["pages"] += 1
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["last_activity"], rows[-1]["user_id"])
+
+        now = datetime.now(timezone.utc)
+        sessions = [
+            {
+                "user_id": r["user_id"],
+                "platform": r.get("platform") or platform_of(r["user_id"]),
+                "last_message": r.get("last_message") or "",
+                "last_role": r.get("last_role") or "",
+                "last_activity": r.get("last_activity") or "",
+                "message_count": message_count(r.get("day_counts"), now),
+                "has_handoff": bool(r.get("has_handoff")),
+                "handoff_id": r.get("handoff_id"),
+            }
+            for r in rows
+        ]
+        return sessions, next_cursor
+
+    def get_stats(self) -> dict:
+        return dict(self._stats)
+
+
+_inbox: Optional[AdminInbox] = None
+
+
+def get_admin_inbox() -> Optional[AdminInbox]:
+    """Shared instance on the app's Supabase client (lazy — dependencies imports handoff → this module)."""
+    global _inbox
+    if _inbox is None:
+        from app.dependencies import supabase_client
+        if not supabase_client:
+            return None
+        _inbox = AdminInbox(supabase_client)
+    return _inbox
+
+
+def get_admin_inbox_stats() -> dict:
+    return _inbox.get_stats() if _inbox else {}
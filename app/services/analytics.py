@@ -10,6 +10,8 @@ from typing import Dict, List, Optional
 import os
 from supabase import Client
 from app.utils.async_db import aexecute
+from app.services.analytics_pipeline import AnalyticsEventPipeline
+from app.services.analytics_rollup import ROLLUP_TABLE, RollupBucket, RollupEngine, merge_buckets
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +23,42 @@ class AnalyticsTracker:
     """
     ติดตามสถิติการใช้งานด้วย Supabase
     เก็บข้อมูลใน database เพื่อวิเคราะห์ระยะยาว
+
+    track_* ไม่รอ DB — แค่ submit เข้า AnalyticsEventPipeline (multi-row INSERT เบื้องหลัง)
+    และนับเข้า RollupEngine (per-minute/per-day counters → ladda_analytics_rollup)
     """
     
     def __init__(self, supabase_client: Client):
         self.supabase = supabase_client
+        self.pipeline = AnalyticsEventPipeline(writer=self._insert_events)
+        self.rollup = RollupEngine(
+            writer=self._upsert_rollups,
+            reader=self._select_rollups,
+            pruner=self._prune_minute_rollups,
+        )
         logger.info("✓ Analytics tracker initialized (Supabase)")
+
+    async def _insert_events(self, rows: List[dict]):
+        """Multi-row INSERT (1 round trip ต่อ batch) — called by the pipeline"""
+        await aexecute(self.supabase.table('ladda_analyst_event').insert(rows))
+
+    async def _upsert_rollups(self, rows: List[dict]):
+        await aexecute(self.supabase.table(ROLLUP_TABLE).upsert(rows, on_conflict='granularity,bucket,worker_id'))
+
+    async def _select_rollups(self, granularity: str, since: str) -> List[dict]:
+        result = await aexecute(self.supabase.table(ROLLUP_TABLE)\
+            .select('*')\
+            .eq('granularity', granularity)\
+            .gte('bucket', since))
+        return result.data or []
+
+    async def _prune_minute_rollups(self, cutoff: str):
+        await aexecute(self.supabase.table(ROLLUP_TABLE).delete().eq('granularity', 'minute').lt('bucket', cutoff))
+
+    def _submit(self, event: dict):
+        event["created_at"] = event.get("created_at") or datetime.now().isoformat()
+        self.rollup.record(event)
+        self.pipeline.submit(event)
     
     async def track_question(
         self, 
@@ -36,18 +69,13 @@ class AnalyticsTracker:
     ):
         """บันทึกคำถาม"""
         try:
-            data = {
+            self._submit({
                 "user_id": user_id,
                 "event_type": "question",
                 "question_text": question[:200],  # จำกัดความยาว
                 "intent": intent,
                 "response_time_ms": int(round(response_time_ms)),
-                "created_at": datetime.now().isoformat()
-            }
-            
-            await aexecute(self.supabase.table('ladda_analyst_event').insert(data))
-            logger.debug(f"✓ Tracked question")
-            
+            })
         except Exception as e:
             logger.error(f"Failed to track question: {e}")
     
@@ -59,19 +87,15 @@ class AnalyticsTracker:
     ):
         """บันทึกการแนะนำผลิตภัณฑ์"""
         try:
+            created_at = datetime.now().isoformat()
             for product_name in products:
-                data = {
+                self._submit({
                     "user_id": user_id,
                     "event_type": "product_recommendation",
                     "source": source,
                     "product_name": product_name,
-                    "created_at": datetime.now().isoformat()
-                }
-                
-                await aexecute(self.supabase.table('ladda_analyst_event').insert(data))
-            
-            logger.debug(f"✓ Tracked {len(products)} product recommendations")
-            
+                    "created_at": created_at
+                })
         except Exception as e:
             logger.error(f"Failed to track product recommendations: {e}")
 
@@ -83,109 +107,69 @@ class AnalyticsTracker:
     ):
         """บันทึก error"""
         try:
-            data = {
+            self._submit({
                 "user_id": user_id,
                 "event_type": "error",
                 "error_type": error_type,
                 "error_message": error_message[:500],
-                "created_at": datetime.now().isoformat()
-            }
-            
-            await aexecute(self.supabase.table('ladda_analyst_event').insert(data))
-            logger.debug(f"✓ Tracked error: {error_type}")
-            
+            })
         except Exception as e:
             logger.error(f"Failed to track error: {e}")
-    
-    async def get_dashboard_stats(self, days: int = 1) -> dict:
-        """ดึงสถิติสำหรับ dashboard"""
-        try:
-            # Calculate date range
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
-            
-            # Get all events in date range
-            result = await aexecute(self.supabase.table('ladda_analyst_event')\
-                .select('*')\
-                .gte('created_at', start_date.isoformat())\
-                .lte('created_at', end_date.isoformat()))
-            
-            events = result.data if result.data else []
-            
-            # Calculate statistics (chat-only — no image analysis)
-            unique_users = set()
-            question_count = 0
-            error_count = 0
-            response_times = []
-            error_types = {}
-            daily_activity = {}
-            daily_users_sets = {}
-            daily_response_times_by_day = {}
-            daily_requests_by_day = {}
-            daily_errors_by_day = {}
-            platform_counter = {"line": 0, "facebook": 0}
-            platform_users = {"line": set(), "facebook": set()}
-            intent_counter = {}
-            question_texts = {}
-
-            for event in events:
-                user_id = event.get('user_id')
-                event_type = event.get('event_type')
 
-                if user_id:
-                    unique_users.add(user_id)
-                    platform = "facebook" if user_id.startswith("fb:") else "line"
-                    platform_counter[platform] += 1
-                    platform_users[platform].add(user_id)
+    async def flush(self) -> int:
+        """เขียน events ที่ค้างใน queue + rollup buckets ทั้งหมด (lifespan shutdown)"""
+        written = await self.pipeline.drain()
+        await self.rollup.drain()
+        return written
 
-                if event_type == 'question':
-                    question_count += 1
-                    response_time = event.get('response_time_ms', 0)
-                    if response_time:
-                        response_times.append(response_time)
-                    intent = event.get('intent')
-                    if intent:
-                        intent_counter[intent] = intent_counter.get(intent, 0) + 1
-                    q_text = event.get('question_text', '')
-                    if q_text:
-                        key = q_text[:60]
-                        question_texts[key] = question_texts.get(key, 0) + 1
-
-                elif event_type == 'error':
-                    error_count += 1
-                    error_type = event.get('error_type', 'unknown')
-                    error_types[error_type] = error_types.get(error_type, 0) + 1
+    def get_pipeline_stats(self) -> dict:
+        return {**self.pipeline.get_stats(), "rollup": self.rollup.get_stats()}
+    
+    async def _scan_daily_buckets(self, start_date: datetime, end_date: datetime) -> Dict[str, RollupBucket]:
+        """Fallback (ตาราง rollup ใช้ไม่ได้): scan events ในช่วงวัน → buckets รายวัน"""
+        result = await aexecute(self.supabase.table('ladda_analyst_event')\
+            .select('*')\
+            .gte('created_at', start_date.isoformat())\
+            .lte('created_at', end_date.isoformat()))
 
-                # Track daily activity
-                created_at = event.get('created_at')
-                if created_at:
-                    try:
-                        date_str = datetime.fromisoformat(created_at).strftime('%Y-%m-%d')
-                        daily_activity[date_str] = daily_activity.get(date_str, 0) + 1
+        daily: Dict[str, RollupBucket] = {}
+        for event in result.data or []:
+            try:
+                date_str = datetime.fromisoformat(event.get('created_at')).strftime('%Y-%m-%d')
+            except Exception:
+                continue
+            if date_str not in daily:
+                daily[date_str] = RollupBucket('day', date_str)
+            daily[date_str].record(event)
+        return dict(sorted(daily.items()))
 
-                        if user_id:
-                            if date_str not in daily_users_sets:
-                                daily_users_sets[date_str] = set()
-                            daily_users_sets[date_str].add(user_id)
+    async def get_dashboard_stats(self, days: int = 1) -> dict:
+        """
+        ดึงสถิติสำหรับ dashboard — อ่าน rollup รายวัน O(days) rows แทน scan ทุก event
 
-                        if event_type == 'question':
-                            daily_requests_by_day[date_str] = daily_requests_by_day.get(date_str, 0) + 1
-                            response_time = event.get('response_time_ms', 0)
-                            if response_time:
-                                if date_str not in daily_response_times_by_day:
-                                    daily_response_times_by_day[date_str] = []
-                                daily_response_times_by_day[date_str].append(response_time)
+        ช่วงเวลา = `days` วันตามปฏิทิน (นับวันนี้ด้วย) เพราะ rollup ละเอียดสุดที่ระดับวัน:
+        days=1 → ตั้งแต่เที่ยงคืนวันนี้, days=7 → 6 วันก่อน + วันนี้ (date_range.start = เที่ยงคืนวันแรก)
+        """
+        try:
+            # Calculate date range — whole days (start of the first day .. now)
+            end_date = datetime.now()
+            start_date = (end_date - timedelta(days=max(days, 1) - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
 
-                        if event_type == 'error':
-                            daily_errors_by_day[date_str] = daily_errors_by_day.get(date_str, 0) + 1
-                    except Exception:
-                        pass
+            try:
+                daily = await self.rollup.load('day', start_date.strftime('%Y-%m-%d'))
+            except Exception as e:
+                logger.warning(f"Rollup read failed, scanning events instead: {e}")
+                daily = await self._scan_daily_buckets(start_date, end_date)
 
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
+            total = merge_buckets(list(daily.values()))
+            counters = total.counters
+            question_count = counters["questions"]
+            error_count = counters["errors"]
+            avg_response_time = counters["latency_sum"] / counters["latency_count"] if counters["latency_count"] else 0
             total_requests = question_count
             error_rate = (error_count / total_requests * 100) if total_requests > 0 else 0
 
-            top_errors = sorted(error_types.items(), key=lambda x: x[1], reverse=True)[:5]
+            top_errors = sorted(total.dims["error_types"].items(), key=lambda x: x[1], reverse=True)[:5]
             
             # Determine health status
             health_status = "healthy"
@@ -194,37 +178,36 @@ class AnalyticsTracker:
             elif error_rate > 10 or avg_response_time > 5000:
                 health_status = "degraded"
 
-            # Get user statistics from user_ladda(LINE,FACE)
-            users_result = await aexecute(self.supabase.table('user_ladda(LINE,FACE)').select('line_user_id, display_name, created_at'))
-            users_data = users_result.data if users_result.data else []
-            total_registered = len(users_data)
-
-            # Recent users (newest first, top 10)
-            recent_users = sorted(users_data, key=lambda u: u.get('created_at', ''), reverse=True)[:10]
-
-            # Prepare daily series: avg response time and error rate per day
-            daily_response_time_avg = {}
-            for d, times in daily_response_times_by_day.items():
-                daily_response_time_avg[d] = round(sum(times) / len(times), 2) if times else 0
+            # User statistics from user_ladda(LINE,FACE) — count + newest 10 (ไม่ดึงทุกแถว)
+            users_result = await aexecute(self.supabase.table('user_ladda(LINE,FACE)')\
+                .select('line_user_id, display_name, created_at', count='exact')\
+                .order('created_at', desc=True)\
+                .limit(10))
+            recent_users = users_result.data if users_result.data else []
+            total_registered = users_result.count or len(recent_users)
 
-            daily_error_rate_percent = {}
-            for d, err_count in daily_errors_by_day.items():
-                reqs = daily_requests_by_day.get(d, 0)
-                daily_error_rate_percent[d] = round((err_count / reqs * 100) if reqs > 0 else 0, 2)
-
-            # daily unique users
-            daily_unique_users = {d: len(s) for d, s in daily_users_sets.items()}
+            # Daily series: avg response time and error rate per day
+            daily_response_time_avg = {
+                d: round(b.counters["latency_sum"] / b.counters["latency_count"], 2)
+                for d, b in daily.items() if b.counters["latency_count"]
+            }
+            daily_error_rate_percent = {
+                d: round((b.counters["errors"] / b.counters["questions"] * 100) if b.counters["questions"] else 0, 2)
+                for d, b in daily.items() if b.counters["errors"]
+            }
+            platform_messages = total.dims["platforms"]
 
             return {
                 "overview": {
-                    "unique_users": len(unique_users),
+                    "unique_users": total.unique_users(),
                     "questions_asked": question_count,
                     "total_requests": total_requests,
                     "errors": error_count
                 },
                 "performance": {
                     "avg_response_time_ms": round(avg_response_time, 2),
-                    "error_rate_percent": round(error_rate, 2)
+                    "error_rate_percent": round(error_rate, 2),
+                    "latency_histogram": total.dims["latency_hist"]
                 },
                 "health": {
                     "status": health_status
@@ -244,27 +227,27 @@ class AnalyticsTracker:
                 ],
                 "platform": {
                     "line": {
-                        "users": len(platform_users["line"]),
-                        "messages": platform_counter["line"]
+                        "users": total.unique_users("line"),
+                        "messages": platform_messages.get("line", 0)
                     },
                     "facebook": {
-                        "users": len(platform_users["facebook"]),
-                        "messages": platform_counter["facebook"]
+                        "users": total.unique_users("facebook"),
+                        "messages": platform_messages.get("facebook", 0)
                     }
                 },
                 "top_intents": [
                     {"name": name, "count": count}
-                    for name, count in sorted(intent_counter.items(), key=lambda x: x[1], reverse=True)[:10]
+                    for name, count in sorted(total.dims["intents"].items(), key=lambda x: x[1], reverse=True)[:10]
                 ],
                 "top_questions": [
                     {"text": text, "count": count}
-                    for text, count in sorted(question_texts.items(), key=lambda x: x[1], reverse=True)[:15]
+                    for text, count in sorted(total.dims["top_questions"].items(), key=lambda x: x[1], reverse=True)[:15]
                 ],
-                "daily_activity": dict(sorted(daily_activity.items())),
-                "daily_requests": dict(sorted(daily_requests_by_day.items())),
-                "daily_users": dict(sorted(daily_unique_users.items())),
-                "daily_response_time": dict(sorted(daily_response_time_avg.items())),
-                "daily_error_rate": dict(sorted(daily_error_rate_percent.items())),
+                "daily_activity": {d: b.counters["events"] for d, b in daily.items()},
+                "daily_requests": {d: b.counters["questions"] for d, b in daily.items() if b.counters["questions"]},
+                "daily_users": {d: n for d, b in daily.items() if (n := b.unique_users())},
+                "daily_response_time": daily_response_time_avg,
+                "daily_error_rate": daily_error_rate_percent,
                 "date_range": {
                     "start": start_date.isoformat(),
                     "end": end_date.isoformat(),
@@ -292,11 +275,18 @@ class AnalyticsTracker:
     async def get_health_status(self) -> dict:
         """ตรวจสอบสุขภาพของระบบ"""
         try:
-            # Get stats for last hour
-            stats = await self.get_dashboard_stats(days=1)
-            
-            error_rate = stats["performance"]["error_rate_percent"]
-            avg_response_time = stats["performance"]["avg_response_time_ms"]
+            # Get stats for last hour — per-minute rollups (≤ 60 rows ต่อ worker)
+            try:
+                since = (datetime.now() - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M')
+                minutes = await self.rollup.load('minute', since)
+                counters = merge_buckets(list(minutes.values()), granularity='minute').counters
+                error_rate = (counters["errors"] / counters["questions"] * 100) if counters["questions"] else 0
+                avg_response_time = counters["latency_sum"] / counters["latency_count"] if counters["latency_count"] else 0
+            except Exception as e:
+                logger.warning(f"Minute rollup read failed, using daily stats: {e}")
+                stats = await self.get_dashboard_stats(days=1)
+                error_rate = stats["performance"]["error_rate_percent"]
+                avg_response_time = stats["performance"]["avg_response_time_ms"]
             
             # Determine health status
             status = "healthy"
@@ -0,0 +1,153 @@
+"""
+Analytics Event Pipeline — buffered, batched writes สำหรับ ladda_analyst_event
+
+AnalyticsTracker เดิม: track_question / track_error = INSERT 1 แถวต่อ event บน hot path,
+track_product_recommendation = INSERT 1 แถวต่อสินค้า (loop await) → DB write QPS สูงตามจำนวน reply
+
+ตอนนี้:
+- submit() เป็น sync, O(1): ใส่ event ลง bounded queue (ANALYTICS_QUEUE_MAX) — ไม่มี I/O
+  queue เต็ม → drop event ใหม่ + นับ dropped (backpressure = ทิ้ง analytics, ไม่ block reply)
+- background flush: multi-row INSERT เมื่อครบ ANALYTICS_BATCH_SIZE หรือผ่านไป ANALYTICS_FLUSH_INTERVAL_MS
+- INSERT ล้มเหลว → retry 1 ครั้ง แล้วทิ้ง batch (นับ lost) — analytics ยอมเสียได้ ไม่ค้างใน memory
+- drain() ตอน lifespan shutdown → flush ที่เหลือทั้งหมด
+
+created_at ถูกกำหนดตอน submit (ไม่ใช่ตอน INSERT) → เวลาใน dashboard ตรงกับเวลาจริง
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from app.config import ANALYTICS_BATCH_SIZE, ANALYTICS_FLUSH_INTERVAL_MS, ANALYTICS_QUEUE_MAX
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(rows: List[dict]) -> List[dict]:
+    """PostgREST bulk insert ต้องการ keys ชุดเดียวกันทุกแถว → เติม None ให้ครบ union"""
+    columns = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+    return [{col: row.get(col) for col in columns} for row in rows]
+
+
+class AnalyticsEventPipeline:
+    """Bounded event queue, flushed in multi-row inserts by a background task."""
+
+    def __init__(
+        self,
+        writer: Callable[[List[dict]], Awaitable[None]],
+        batch_size: int = ANALYTICS_BATCH_SIZE,
+        flush_interval_ms: float = ANALYTICS_FLUSH_INTERVAL_MS,
+        queue_max: int = ANALYTICS_QUEUE_MAX,
+    ):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.queue_max = queue_max
+
+        self._queue: Deque[dict] = deque()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._max_depth = 0
+        self._stats = {
+            "submitted": 0,
+            "dropped": 0,
+            "written": 0,
+            "batches": 0,
+            "write_errors": 0,
+            "lost": 0,
+        }
+
+    # =====================================================================
+    # Submit path (no I/O)
+    # =====================================================================
+
+    def submit(self, event: dict) -> bool:
+        """Enqueue one event row. Returns False when the queue is full (event dropped)."""
+        if len(self._queue) >= self.queue_max:
+            self._stats["dropped"] += 1
+            if self._stats["dropped"] % 1000 == 1:
+                logger.warning(f"Analytics queue full ({self.queue_max}) — dropped {self._stats['dropped']} events")
+            return False
+
+        event = dict(event)
+        event.setdefault("created_at", datetime.now().isoformat())
+        self._queue.append(event)
+        self._stats["submitted"] += 1
+        self._max_depth = max(self._max_depth, len(self._queue))
+
+        if len(self._queue) >= self.batch_size:
+            self._schedule_flush(immediate=True)
+        elif self._flush_handle is None:
+            self._schedule_flush()
+        return True
+
+    def _schedule_flush(self, immediate: bool = False) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (sync caller) — next submit/drain() will flush
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if immediate:
+            self._start_flush()
+        else:
+            self._flush_handle = loop.call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    # =====================================================================
+    # Flush
+    # =====================================================================
+
+    async def flush(self) -> int:
+        """Write queued events in batches of batch_size. Returns events written."""
+        written = 0
+        async with self._flush_lock:
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if await self._write(batch):
+                    written += len(batch)
+
+        if written:
+            logger.debug(f"✓ Analytics flushed {written} events")
+        if self._queue:
+            self._schedule_flush()
+        return written
+
+    async def _write(self, batch: List[dict]) -> bool:
+        rows = _normalize_rows(batch)
+        for attempt in range(2):
+            try:
+                await self.writer(rows)
+                self._stats["written"] += len(rows)
+                self._stats["batches"] += 1
+                return True
+            except Exception as e:
+                self._stats["write_errors"] += 1
+                if attempt:
+                    self._stats["lost"] += len(rows)
+                    logger.error(f"Analytics batch insert failed, {len(rows)} events lost: {e}")
+        return False
+
+    async def drain(self) -> int:
+        """Flush everything now (lifespan shutdown)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+        return await self.flush() if self._queue else 0
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["queue_depth"] = len(self._queue)
+        stats["max_depth"] = self._max_depth
+        return stats
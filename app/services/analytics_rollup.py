@@ -0,0 +1,340 @@
+"""
+Analytics Rollup — pre-aggregated counters สำหรับ dashboard (ladda_analytics_rollup)
+
+get_dashboard_stats เดิม: select('*') ทุก event ในช่วงวัน + aggregate ใน Python ทุกครั้งที่เปิด dashboard
+→ O(events) rows ต่อ request
+
+ตอนนี้ AnalyticsTracker เรียก record(event) ตอน track (in-memory, O(1)):
+- bucket ต่อนาที ("minute", "2026-01-01T10:05") และต่อวัน ("day", "2026-01-01")
+- counters: events / questions / errors / recommendations, latency sum + histogram,
+  intents, error types, platforms, top questions (capped), unique users (HyperLogLog)
+- flush ทุก ANALYTICS_ROLLUP_FLUSH_INTERVAL วินาที: UPSERT เฉพาะ buckets ที่เปลี่ยน
+
+แต่ละ worker เป็นเจ้าของแถวของตัวเอง (granularity, bucket, worker_id) และเขียนสถานะสะสมทั้งก้อน
+→ upsert idempotent, ไม่มี read-modify-write ข้าม workers; ตอนอ่าน merge แถวของทุก worker
+(counters บวกกัน, HLL registers เอา max) → dashboard อ่าน O(days × workers) rows แทน O(events)
+
+Minute rows เก็บแค่ ANALYTICS_ROLLUP_MINUTE_RETENTION_HOURS (ใช้กับ health "ชั่วโมงล่าสุด")
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import ANALYTICS_ROLLUP_FLUSH_INTERVAL, ANALYTICS_ROLLUP_MINUTE_RETENTION_HOURS
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TABLE = "ladda_analytics_rollup"
+_HLL_PRECISION = 11  # 2048 registers → ~2.3% standard error, ~2.7KB base64 ต่อ HLL
+_TOP_QUESTIONS_CAP = 200
+# ms — bucket สุดท้าย (None) = มากกว่า 20s
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 3000, 5000, 10000, 20000, None)
+
+
+def _platform(user_id: str) -> str:
+    return "facebook" if user_id.startswith("fb:") else "line"
+
+
+def _bucket_keys(created_at: str) -> Tuple[str, str]:
+    """(minute, day) keys จาก ISO timestamp ของ event"""
+    ts = datetime.fromisoformat(created_at)
+    return ts.strftime("%Y-%m-%dT%H:%M"), ts.strftime("%Y-%m-%d")
+
+
+def _latency_bucket(ms: int) -> str:
+    for bound in LATENCY_BUCKETS_MS[:-1]:
+        if ms <= bound:
+            return f"le_{bound}"
+    return "inf"
+
+
+def _add_counts(target: Dict[str, int], source: Dict[str, int]) -> None:
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
+
+
+# =============================================================================
+# HyperLogLog
+# =============================================================================
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch (unique users) — registers serialize to base64."""
+
+    def __init__(self, precision: int = _HLL_PRECISION, registers: Optional[bytes] = None):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value: str) -> None:
+        x = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        idx = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting (small cardinalities)
+        return int(round(estimate))
+
+    def to_b64(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode("ascii")
+
+    @classmethod
+    def from_b64(cls, data: Optional[str]) -> "HyperLogLog":
+        if not data:
+            return cls()
+        registers = base64.b64decode(data)
+        return cls(int(math.log2(len(registers))), registers)
+
+
+# =============================================================================
+# Bucket
+# =============================================================================
+
+class RollupBucket:
+    """Counters for one (granularity, bucket) — additive except HLLs (merged by max)."""
+
+    COUNTERS = ("events", "questions", "errors", "recommendations", "latency_sum", "latency_count")
+    DIMS = ("latency_hist", "intents", "error_types", "platforms", "top_questions")
+    HLLS = ("all", "line", "facebook")
+
+    def __init__(self, granularity: str, bucket: str):
+        self.granularity = granularity
+        self.bucket = bucket
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.dims: Dict[str, Dict[str, int]] = {name: {} for name in self.DIMS}
+        self.hlls = {name: HyperLogLog() for name in self.HLLS}
+
+    def record(self, event: dict) -> None:
+        c = self.counters
+        c["events"] += 1
+        event_type = event.get("event_type")
+
+        user_id = event.get("user_id")
+        if user_id:
+            platform = _platform(user_id)
+            self.hlls["all"].add(user_id)
+            self.hlls[platform].add(user_id)
+            _add_counts(self.dims["platforms"], {platform: 1})
+
+        if event_type == "question":
+            c["questions"] += 1
+            response_time = event.get("response_time_ms") or 0
+            if response_time:
+                c["latency_sum"] += response_time
+                c["latency_count"] += 1
+                _add_counts(self.dims["latency_hist"], {_latency_bucket(response_time): 1})
+            if event.get("intent"):
+                _add_counts(self.dims["intents"], {event["intent"]: 1})
+            if event.get("question_text"):
+                self._count_question(event["question_text"][:60])
+        elif event_type == "error":
+            c["errors"] += 1
+            _add_counts(self.dims["error_types"], {event.get("error_type") or "unknown": 1})
+        elif event_type == "product_recommendation":
+            c["recommendations"] += 1
+
+    def _count_question(self, text: str, count: int = 1) -> None:
+        top = self.dims["top_questions"]
+        top[text] = top.get(text, 0) + count
+        if len(top) > 2 * _TOP_QUESTIONS_CAP:
+            kept = sorted(top.items(), key=lambda x: x[1], reverse=True)[:_TOP_QUESTIONS_CAP]
+            self.dims["top_questions"] = dict(kept)
+
+    def merge(self, other: "RollupBucket") -> None:
+        _add_counts(self.counters, other.counters)
+        for name in self.DIMS:
+            if name == "top_questions":
+                for text, count in other.dims[name].items():
+                    self._count_question(text, count)
+            else:
+                _add_counts(self.dims[name], other.dims[name])
+        for name in self.HLLS:
+            self.hlls[name].merge(other.hlls[name])
+
+    def unique_users(self, platform: str = "all") -> int:
+        return self.hlls[platform].count()
+
+    def to_row(self, worker_id: str) -> dict:
+        return {
+            "granularity": self.granularity,
+            "bucket": self.bucket,
+            "worker_id": worker_id,
+            **self.counters,
+            "dims": {name: dict(values) for name, values in self.dims.items()},  # snapshot (writer อาจ serialize ใน thread)
+            "hll": {name: hll.to_b64() for name, hll in self.hlls.items()},
+            "updated_at": datetime.now().isoformat(),
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> "RollupBucket":
+        bucket = cls(row["granularity"], row["bucket"])
+        for name in cls.COUNTERS:
+            bucket.counters[name] = int(row.get(name) or 0)
+        dims = row.get("dims") or {}
+        for name in cls.DIMS:
+            bucket.dims[name] = dict(dims.get(name) or {})
+        hll = row.get("hll") or {}
+        for name in cls.HLLS:
+            bucket.hlls[name] = HyperLogLog.from_b64(hll.get(name))
+        return bucket
+
+
+# =============================================================================
+# Engine
+# =============================================================================
+
+class RollupEngine:
+    """In-memory minute/day buckets for this worker, upserted in the background."""
+
+    def __init__(
+        self,
+        writer: Callable[[List[dict]], Awaitable[None]],
+        reader: Callable[[str, str], Awaitable[List[dict]]],
+        pruner: Optional[Callable[[str], Awaitable[None]]] = None,
+        flush_interval: float = ANALYTICS_ROLLUP_FLUSH_INTERVAL,
+        minute_retention_hours: float = ANALYTICS_ROLLUP_MINUTE_RETENTION_HOURS,
+        worker_id: Optional[str] = None,
+    ):
+        self.writer = writer
+        self.reader = reader
+        self.pruner = pruner
+        self.flush_interval = flush_interval
+        self.minute_retention_hours = minute_retention_hours
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._buckets: Dict[Tuple[str, str], RollupBucket] = {}
+        self._dirty: set = set()
+        self._last_prune = 0.0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stats = {"recorded": 0, "flushes": 0, "rows_upserted": 0, "flush_errors": 0}
+
+    def record(self, event: dict) -> None:
+        """Count one tracked event into its minute + day buckets (no I/O)."""
+        try:
+            minute, day = _bucket_keys(event["created_at"])
+        except (KeyError, TypeError, ValueError):
+            return
+        for key in (("minute", minute), ("day", day)):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = RollupBucket(*key)
+            bucket.record(event)
+            self._dirty.add(key)
+        self._stats["recorded"] += 1
+        if self._flush_handle is None:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (sync caller) — next record()/flush() will persist
+        self._flush_handle = loop.call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        """Upsert dirty buckets (cumulative state of this worker). Returns rows written."""
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = [self._buckets[key].to_row(self.worker_id) for key in sorted(dirty)]
+            written = 0
+            if rows:
+                try:
+                    await self.writer(rows)
+                    written = len(rows)
+                    self._stats["flushes"] += 1
+                    self._stats["rows_upserted"] += len(rows)
+                except Exception as e:
+                    self._stats["flush_errors"] += 1
+                    self._dirty |= dirty
+                    logger.error(f"Analytics rollup flush failed ({len(rows)} buckets kept dirty): {e}")
+            self._evict()
+            await self._prune()
+
+        if self._dirty and self._flush_handle is None:
+            self._schedule_flush()
+        return written
+
+    def _evict(self) -> None:
+        """ลืม buckets ที่ปิดไปแล้วและ flush แล้ว
+
+        created_at ถูก stamp ตอน track → event ใหม่ลง bucket ปัจจุบันเสมอ จึงไม่มี event
+        มาเขียนทับแถวสะสมของ bucket ที่ evict ไปแล้ว (เก็บ margin 5 นาที / 1 วัน)
+        """
+        now = datetime.now()
+        keep = {
+            "minute": (now - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M"),
+            "day": (now - timedelta(days=1)).strftime("%Y-%m-%d"),
+        }
+        for key in list(self._buckets):
+            if key not in self._dirty and key[1] < keep[key[0]]:
+                del self._buckets[key]
+
+    async def _prune(self) -> None:
+        if not self.pruner or time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = (datetime.now() - timedelta(hours=self.minute_retention_hours)).strftime("%Y-%m-%dT%H:%M")
+        try:
+            await self.pruner(cutoff)
+        except Exception as e:
+            logger.warning(f"Analytics rollup prune failed: {e}")
+
+    async def load(self, granularity: str, since: str) -> Dict[str, RollupBucket]:
+        """Buckets >= since, merged across workers (this worker's unflushed state included)."""
+        await self.flush()
+        merged: Dict[str, RollupBucket] = {}
+        for row in await self.reader(granularity, since):
+            bucket = RollupBucket.from_row(row)
+            if bucket.bucket in merged:
+                merged[bucket.bucket].merge(bucket)
+            else:
+                merged[bucket.bucket] = bucket
+        return dict(sorted(merged.items()))
+
+    async def drain(self) -> int:
+        """Persist everything now (lifespan shutdown)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+        return await self.flush() if self._dirty else 0
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["buckets"] = len(self._buckets)
+        stats["dirty"] = len(self._dirty)
+        return stats
+
+
+def merge_buckets(buckets: List[RollupBucket], granularity: str = "day", label: str = "total") -> RollupBucket:
+    """รวมหลาย buckets (เช่น ทุกวันในช่วง) เป็นก้อนเดียว"""
+    total = RollupBucket(granularity, label)
+    for bucket in buckets:
+        total.merge(bucket)
+    return total
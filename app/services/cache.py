@@ -8,8 +8,14 @@ from typing import Dict, Any, Optional
 from datetime import datetime, timedelta, timezone
 from app.config import CACHE_TTL, PENDING_CONTEXT_TTL, CONVERSATION_STATE_TTL, MAX_CACHE_SIZE
 from app.dependencies import supabase_client
-from app.services.redis_cache import is_redis_available, redis_get, redis_set, redis_delete
-from app.utils.async_db import aexecute
+from app.services.redis_cache import (
+    is_redis_available,
+    redis_get_async,
+    redis_get_with_ttl_async,
+    redis_set_async,
+    redis_delete_async,
+)
+from app.utils.async_db import aexecute, request_memo, request_forget
 
 logger = logging.getLogger(__name__)
 
@@ -164,9 +170,10 @@ async def get_from_cache(cache_type: str, key: str) -> Optional[Any]:
 
     # L0: Redis (if available)
     if is_redis_available():
-        value = redis_get(full_key)
+        # GET + TTL ใน round trip เดียว → L1 หมดอายุพร้อม Redis
+        value, ttl = await redis_get_with_ttl_async(full_key)
         if value is not None:
-            _memory_cache.set(full_key, value, CACHE_TTL)
+            _memory_cache.set(full_key, value, ttl if ttl > 0 else CACHE_TTL)
             logger.debug(f"✓ L0 Redis hit (backfill L1): {full_key[:50]}")
             return value
 
@@ -217,7 +224,7 @@ async def set_to_cache(cache_type: str, key: str, data: Any, ttl: int = CACHE_TT
 
     # L0: Redis
     if is_redis_available():
-        redis_set(full_key, data, ttl)
+        await redis_set_async(full_key, data, ttl)
 
     # L2: Persist to Supabase
     try:
@@ -248,7 +255,7 @@ async def delete_from_cache(cache_type: str, key: str):
 
     # L0: Redis
     if is_redis_available():
-        redis_delete(full_key)
+        await redis_delete_async(full_key)
 
     # L2: Delete from Supabase
     try:
@@ -274,6 +281,7 @@ async def save_pending_context(user_id: str, context_data: Dict[str, Any]):
             data_to_save["_is_bytes"] = True
         
         await set_to_cache("context", user_id, data_to_save, ttl=PENDING_CONTEXT_TTL)
+        request_forget(f"context:{user_id}")
         
     except Exception as e:
         logger.error(f"Error saving pending context: {e}")
@@ -281,6 +289,11 @@ async def save_pending_context(user_id: str, context_data: Dict[str, Any]):
 
 async def get_pending_context(user_id: str) -> Optional[Dict[str, Any]]:
     """Get pending context from cache (handles bytes deserialization)"""
+    # อ่านซ้ำใน message เดียวกัน → ใช้ค่าเดิม (request_scope)
+    return await request_memo(f"context:{user_id}", lambda: _load_pending_context(user_id))
+
+
+async def _load_pending_context(user_id: str) -> Optional[Dict[str, Any]]:
     try:
         data = await get_from_cache("context", user_id)
         if not data:
@@ -300,6 +313,7 @@ async def get_pending_context(user_id: str) -> Optional[Dict[str, Any]]:
 async def delete_pending_context(user_id: str):
     """Delete pending context from cache"""
     await delete_from_cache("context", user_id)
+    request_forget(f"context:{user_id}")
 
 
 # ============================================================================
@@ -324,13 +338,14 @@ async def save_conversation_state(user_id: str, state: Dict[str, Any]):
         state["updated_at"] = _time.time()
 
         full_key = f"conv_state:{user_id}"
+        request_forget(full_key)
 
         # L1: Memory cache (fast, same process)
         _memory_cache.set(full_key, state, CONVERSATION_STATE_TTL)
 
         # L0: Redis (cross-process, survives restart)
         if is_redis_available():
-            redis_set(full_key, state, CONVERSATION_STATE_TTL)
+            await redis_set_async(full_key, state, CONVERSATION_STATE_TTL)
 
         logger.info(f"✓ Conversation state saved: user={user_id[:8]}, product={state.get('active_product')}, intent={state.get('active_intent')}")
 
@@ -344,13 +359,19 @@ async def get_conversation_state(user_id: str) -> Optional[Dict[str, Any]]:
     IMPORTANT: Redis is checked FIRST because gunicorn multi-worker means
     each worker has its own L1 memory cache. Worker A may save state but
     Worker B still has stale L1 data. Redis is the cross-worker source of truth.
+    Within one message (request_scope) the first read is reused — saves the 2-3
+    repeat Redis round trips per AgenticRAG.process call.
     """
+    return await request_memo(f"conv_state:{user_id}", lambda: _load_conversation_state(user_id))
+
+
+async def _load_conversation_state(user_id: str) -> Optional[Dict[str, Any]]:
     try:
         full_key = f"conv_state:{user_id}"
 
         # L0: Redis first (cross-worker source of truth)
         if is_redis_available():
-            state = redis_get(full_key)
+            state = await redis_get_async(full_key)
             if state is not None:
                 # Backfill L1 for subsequent reads within same worker
                 _memory_cache.set(full_key, state, CONVERSATION_STATE_TTL)
@@ -372,13 +393,14 @@ async def clear_conversation_state(user_id: str):
     """Clear conversation state (on greeting or explicit topic change)."""
     try:
         full_key = f"conv_state:{user_id}"
+        request_forget(full_key)
 
         # L1: Memory
         _memory_cache.delete(full_key)
 
         # L0: Redis
         if is_redis_available():
-            redis_delete(full_key)
+            await redis_delete_async(full_key)
 
         logger.info(f"✓ Conversation state cleared: user={user_id[:8]}")
 
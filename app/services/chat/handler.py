@@ -6,14 +6,16 @@ import time
 from typing import List, Dict, Optional, Tuple
 from app.dependencies import openai_client, supabase_client
 from app.utils.async_db import aexecute
+from app.services.embedding_batcher import embed_text
 from app.services.memory import add_to_memory, get_recommended_products, get_enhanced_context
 from app.services.cache import get_from_cache, set_to_cache, save_conversation_state, clear_conversation_state
+from app.services.single_flight import rag_single_flight
+from app.services.chat.lexicon import analyze_query
 from app.utils.text_processing import extract_keywords_from_question, post_process_answer
 from app.services.product.recommendation import hybrid_search_products, filter_products_by_category
 from app.config import (
     USE_AGENTIC_RAG,
     LLM_MODEL_GENERAL_CHAT,
-    EMBEDDING_MODEL,
     LLM_TEMP_HANDLER_RAG,
     LLM_TOKENS_HANDLER_RAG,
     LLM_TEMP_GENERAL_CHAT,
@@ -72,11 +74,7 @@ AGRICULTURE_KEYWORDS = [
 
 def is_agriculture_question(message: str) -> bool:
     """ตรวจสอบว่าเป็นคำถามเกี่ยวกับการเกษตร/พืช/โรคพืชหรือไม่"""
-    message_lower = message.lower()
-    for keyword in AGRICULTURE_KEYWORDS:
-        if keyword in message_lower:
-            return True
-    return False
+    return bool(analyze_query(message).agriculture)
 
 
 # =============================================================================
@@ -110,10 +108,9 @@ def _is_clearly_non_agriculture(message: str) -> bool:
     - ถ้า False → ส่ง RAG เป็น default (ปลอดภัยกว่า)
     - เงื่อนไข: ข้อความสั้น (≤ 20 chars) + มี keyword non-agri
     """
-    msg = message.strip().lower()
-    if len(msg) > 20:
+    if len(message.strip().lower()) > 20:
         return False
-    return any(kw in msg for kw in _NON_AGRI_KEYWORDS)
+    return bool(analyze_query(message).non_agri)
 
 
 # =============================================================================
@@ -277,11 +274,7 @@ def extract_plant_type_from_question(question: str) -> Optional[str]:
 
 def is_product_question(message: str) -> bool:
     """ตรวจสอบว่าเป็นคำถามเกี่ยวกับสินค้า/ผลิตภัณฑ์หรือไม่"""
-    message_lower = message.lower()
-    for keyword in PRODUCT_KEYWORDS:
-        if keyword in message_lower:
-            return True
-    return False
+    return bool(analyze_query(message).product)
 
 
 # =============================================================================
@@ -393,17 +386,16 @@ def resolve_farmer_slang(query: str) -> dict:
         "problem_type": None,
     }
 
-    query_lower = query.lower()
     hint_parts = []
 
-    for slang, info in FARMER_SLANG_MAP.items():
-        if slang in query_lower:
-            result["matched_slangs"].append(slang)
-            hint_parts.append(f'"{slang}" หมายถึง {info["hint"]}')
-            if info.get("search_terms"):
-                result["search_terms"].extend(info["search_terms"])
-            if info.get("problem_type") and not result["problem_type"]:
-                result["problem_type"] = info["problem_type"]
+    for slang in analyze_query(query).slang:
+        info = FARMER_SLANG_MAP[slang]
+        result["matched_slangs"].append(slang)
+        hint_parts.append(f'"{slang}" หมายถึง {info["hint"]}')
+        if info.get("search_terms"):
+            result["search_terms"].extend(info["search_terms"])
+        if info.get("problem_type") and not result["problem_type"]:
+            result["problem_type"] = info["problem_type"]
 
     if hint_parts:
         result["hints"] = "; ".join(hint_parts)
@@ -416,16 +408,7 @@ def detect_problem_types(message: str) -> list:
     ตรวจจับประเภทปัญหาทั้งหมดในข้อความ (รองรับ compound intent)
     Returns: list เช่น ['disease', 'insect'] หรือ ['weed'] — เรียงตาม keyword count มากสุดก่อน
     """
-    from app.utils.text_processing import diacritics_match
-    message_lower = message.lower()
-
-    counts = {
-        'nutrient': sum(1 for kw in NUTRIENT_KEYWORDS if diacritics_match(message_lower, kw)),
-        'disease': sum(1 for kw in DISEASE_KEYWORDS if diacritics_match(message_lower, kw)),
-        'insect': sum(1 for kw in INSECT_KEYWORDS if diacritics_match(message_lower, kw)),
-        'weed': sum(1 for kw in WEED_KEYWORDS if diacritics_match(message_lower, kw)),
-    }
-    return [t for t, c in sorted(counts.items(), key=lambda x: -x[1]) if c > 0]
+    return analyze_query(message).problem_types
 
 
 def detect_problem_type(message: str) -> str:
@@ -447,12 +430,7 @@ async def generate_embedding(text: str) -> List[float]:
         return []
 
     try:
-        response = await openai_client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text,
-            encoding_format="float"
-        )
-        return response.data[0].embedding
+        return await embed_text(text, openai_client)
     except Exception as e:
         logger.error(f"Failed to generate embedding: {e}")
         return []
@@ -664,12 +642,8 @@ async def answer_qa_with_vector_search(question: str, context: str = "") -> str:
         if problem_type in ['insect', 'disease'] and is_treatment_question and not plant_in_question and not product_in_question:
             logger.info(f"⚠️ ถามเรื่อง {problem_type} แต่ไม่ระบุพืช → ถามพืชก่อน")
             # Extract ชื่อปัญหา/แมลง/โรค จากคำถาม
-            from app.utils.text_processing import diacritics_match as _dm_kw
-            problem_name = ""
-            for kw in INSECT_KEYWORDS + DISEASE_KEYWORDS:
-                if _dm_kw(question.lower(), kw) and len(kw) > 2:
-                    problem_name = kw
-                    break
+            _features = analyze_query(question)
+            problem_name = next((kw for kw in _features.insect + _features.disease if len(kw) > 2), "")
 
             if problem_type == 'insect':
                 logger.info(f"⏭️ No data — insect '{problem_name}' no plant specified, skipping reply (admin will handle)")
@@ -838,11 +812,7 @@ USAGE_QUESTION_PATTERNS = [
 
 def is_usage_question(message: str) -> bool:
     """ตรวจสอบว่าเป็นคำถามเกี่ยวกับวิธีใช้สินค้าหรือไม่"""
-    message_lower = message.lower()
-    for pattern in USAGE_QUESTION_PATTERNS:
-        if re.search(pattern, message_lower):
-            return True
-    return False
+    return analyze_query(message).usage
 
 
 async def _fetch_product_from_db(product_name: str) -> list:
@@ -1036,11 +1006,7 @@ def _is_cacheable_message(message: str) -> bool:
     if len(msg) < 15:
         return False
     # Contains follow-up markers → context-dependent
-    msg_lower = msg.lower()
-    for marker in _FOLLOWUP_MARKERS:
-        if marker in msg_lower:
-            return False
-    return True
+    return not analyze_query(message).followup
 
 
 def _make_response_cache_key(message: str) -> str:
@@ -1153,12 +1119,13 @@ def _check_unsupported_question(message: str) -> str | None:
     return None
 
 
+@rag_single_flight.scoped(exclude=(ERROR_GENERIC, ERROR_AI_UNAVAILABLE))
 async def handle_natural_conversation(user_id: str, message: str) -> str:
     """Handle natural conversation with context and intent detection"""
     try:
         _start_time = time.time()
 
-        # 0. Auto-refresh ProductRegistry + PlantRegistry if stale
+        # 0. Auto-refresh ProductRegistry + PlantRegistry + ProductCatalog if stale
         # (keeps in sync with DB after new products/plants added)
         try:
             await ProductRegistry.get_instance().refresh_if_stale(supabase_client)
@@ -1169,6 +1136,15 @@ async def handle_natural_conversation(user_id: str, message: str) -> str:
             await PlantRegistry.get_instance().refresh_if_stale(supabase_client)
         except Exception:
             pass  # non-critical — hardcoded fallback still works
+        try:
+            from app.services.product.catalog import ProductCatalog
+            if await ProductCatalog.get_instance().refresh_if_stale(supabase_client):
+                from app.config import PRODUCT_SEARCH_BACKEND
+                if PRODUCT_SEARCH_BACKEND == "local":
+                    from app.services.product.local_search import LocalProductSearch
+                    await LocalProductSearch.get_instance().sync(supabase_client, ProductCatalog.get_instance())
+        except Exception:
+            pass  # non-critical — retrieval falls back to DB queries
 
         # 1+2. Add message to memory + get context in parallel (saves ~100-200ms)
         import asyncio as _asyncio
@@ -1267,14 +1243,15 @@ async def handle_natural_conversation(user_id: str, message: str) -> str:
 
         if _cache_eligible:
             import asyncio as _asyncio
-            from app.services.rag.retrieval_agent import _get_cached_embedding, _generate_embedding_standalone
+            from app.services.embedding_cache import get_cached_embedding
+            from app.services.rag.retrieval_agent import _generate_embedding_standalone
 
             # Start cache check + embedding generation in parallel
             _cache_task = _asyncio.create_task(
                 get_from_cache("response", _response_cache_key)
             ) if _response_cache_key else None
 
-            _query_embedding_for_semantic = _get_cached_embedding(message)
+            _query_embedding_for_semantic = get_cached_embedding(message)
             _emb_task = None
             if not _query_embedding_for_semantic and openai_client:
                 _emb_task = _asyncio.create_task(
@@ -1283,6 +1260,15 @@ async def handle_natural_conversation(user_id: str, message: str) -> str:
 
             # Await cache result first (faster — just a DB lookup)
             cached_answer = await _cache_task if _cache_task else None
+            # Single-flight: identical question already running (this or another worker) → reuse its answer
+            if not cached_answer and _response_cache_key:
+                _shared_answer = await rag_single_flight.join(_response_cache_key)
+                if _shared_answer:
+                    if _emb_task:
+                        _emb_task.cancel()
+                    if _shared_answer != NO_DATA_REPLY:
+                        await add_to_memory(user_id, "assistant", _shared_answer)
+                    return _shared_answer
             if cached_answer:
                 _CACHE_NO_DATA = [
                     "ไม่พบข้อมูล", "ไม่มีข้อมูล", "ไม่อยู่ในฐานข้อมูล",
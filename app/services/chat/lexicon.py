@@ -0,0 +1,141 @@
+"""
+Query lexicon — tag one message against every keyword list in a single pass.
+
+เดิม: handler + Stage 0 วน `any(kw in query for kw in LIST)` หลายสิบรอบต่อข้อความ
+(AGRICULTURE / PRODUCT / NON_AGRI / DISEASE / INSECT / NUTRIENT / WEED / FARMER_SLANG_MAP /
+SYMPTOM_PATHOGEN_MAP / DISEASE_PATTERNS_SORTED / _FOLLOWUP_MARKERS / USAGE_QUESTION_PATTERNS)
+และ diacritics_match ตัดวรรณยุกต์ของข้อความใหม่ทุก keyword
+
+ตอนนี้: compile ทุก list ครั้งเดียวเป็น Aho-Corasick 2 ตัว (ข้อความ lower / ข้อความตัดวรรณยุกต์)
++ usage regex ตัวเดียว → analyze_query(text) ตัดวรรณยุกต์ 1 ครั้ง scan 2 pass แล้วคืน QueryFeatures
+(cache ต่อข้อความ — handler กับ Stage 0 ถามข้อความเดียวกันหลายรอบ)
+
+ผลเหมือน loop เดิมทุกกรณี: keyword ที่ match เรียงตามลำดับใน list เดิม (ซ้ำ = นับซ้ำ)
+keyword lists ยังอยู่ที่เดิม (handler / text_processing / disease.constants) — แก้ที่นั่นตามปกติ
+
+Usage:
+    features = analyze_query("ใบทุเรียนเป็นจุด ใช้ยาอะไรดี")
+    features.problem_types      # → ['disease']
+    features.disease_pattern    # → 'ใบเป็นจุด'
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.utils.aho_corasick import AhoCorasick
+from app.utils.text_processing import strip_thai_diacritics
+
+_PROBLEM_CLASSES = ("nutrient", "disease", "insect", "weed")  # tie order of detect_problem_types
+
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    """Every keyword class found in one message (keywords in their list order)."""
+    agriculture: Tuple[str, ...] = ()
+    product: Tuple[str, ...] = ()
+    non_agri: Tuple[str, ...] = ()
+    nutrient: Tuple[str, ...] = ()
+    disease: Tuple[str, ...] = ()
+    insect: Tuple[str, ...] = ()
+    weed: Tuple[str, ...] = ()
+    slang: Tuple[str, ...] = ()
+    symptoms: Tuple[str, ...] = ()
+    disease_patterns: Tuple[str, ...] = ()
+    followup: Tuple[str, ...] = ()
+    usage: bool = False
+
+    @property
+    def problem_counts(self) -> Dict[str, int]:
+        return {cls: len(getattr(self, cls)) for cls in _PROBLEM_CLASSES}
+
+    @property
+    def problem_types(self) -> List[str]:
+        """['disease', 'insect', ...] — most keyword hits first (same as detect_problem_types)."""
+        return [t for t, c in sorted(self.problem_counts.items(), key=lambda x: -x[1]) if c > 0]
+
+    @property
+    def disease_pattern(self) -> Optional[str]:
+        """Longest DISEASE_PATTERNS_SORTED entry present (diacritics-insensitive)."""
+        return self.disease_patterns[0] if self.disease_patterns else None
+
+
+class KeywordLexicon:
+    """Keyword classes compiled into one raw and one diacritics-stripped automaton."""
+
+    def __init__(self, raw: Dict[str, Sequence[str]], stripped: Dict[str, Sequence[str]], usage_patterns: Sequence[str]):
+        """
+        raw:      class → keywords matched as `kw in text.lower()`
+        stripped: class → keywords matched as `diacritics_match(text.lower(), kw)`
+        """
+        self._raw, self._raw_owners = self._compile(raw, lambda kw: kw)
+        self._stripped, self._stripped_owners = self._compile(stripped, strip_thai_diacritics)
+        self._keywords: Dict[str, Tuple[str, ...]] = {cls: tuple(kws) for cls, kws in {**raw, **stripped}.items()}
+        # any(re.search(p) for p in patterns) == one search over the alternation
+        self._usage = re.compile("|".join(f"(?:{p})" for p in usage_patterns)) if usage_patterns else None
+
+    @staticmethod
+    def _compile(classes: Dict[str, Sequence[str]], normalize):
+        owners: Dict[str, List[Tuple[str, int]]] = {}
+        for cls, keywords in classes.items():
+            for idx, kw in enumerate(keywords):
+                owners.setdefault(normalize(kw), []).append((cls, idx))
+        matcher = AhoCorasick(owners)
+        return matcher, [owners[p] for p in matcher.patterns]
+
+    @staticmethod
+    def _collect(matcher: AhoCorasick, owners, text: str, hits: Dict[str, set]) -> None:
+        for pid in {pid for _, _, pid in matcher.find_all(text)}:
+            for cls, idx in owners[pid]:
+                hits.setdefault(cls, set()).add(idx)
+
+    def analyze(self, text: str) -> QueryFeatures:
+        lowered = text.lower()
+        hits: Dict[str, set] = {}
+        self._collect(self._raw, self._raw_owners, lowered, hits)
+        self._collect(self._stripped, self._stripped_owners, strip_thai_diacritics(lowered), hits)
+        fields = {cls: tuple(self._keywords[cls][i] for i in sorted(idxs)) for cls, idxs in hits.items()}
+        return QueryFeatures(usage=bool(self._usage and self._usage.search(lowered)), **fields)
+
+
+_lexicon: Optional[KeywordLexicon] = None
+
+
+def get_lexicon() -> KeywordLexicon:
+    """Build the lexicon from the live keyword lists on first use (lazy — handler imports this module)."""
+    global _lexicon
+    if _lexicon is None:
+        from app.services.chat.handler import (
+            AGRICULTURE_KEYWORDS, PRODUCT_KEYWORDS, _NON_AGRI_KEYWORDS,
+            NUTRIENT_KEYWORDS, DISEASE_KEYWORDS, INSECT_KEYWORDS, WEED_KEYWORDS,
+            FARMER_SLANG_MAP, _FOLLOWUP_MARKERS, USAGE_QUESTION_PATTERNS,
+        )
+        from app.services.disease.constants import DISEASE_PATTERNS_SORTED
+        from app.utils.text_processing import SYMPTOM_PATHOGEN_MAP
+
+        # symptom / disease patterns are Thai-only → lower() ไม่เปลี่ยนผล (เดิม match กับข้อความไม่ lower)
+        _lexicon = KeywordLexicon(
+            raw={
+                "agriculture": AGRICULTURE_KEYWORDS,
+                "product": PRODUCT_KEYWORDS,
+                "non_agri": _NON_AGRI_KEYWORDS,
+                "slang": list(FARMER_SLANG_MAP),
+                "symptoms": list(SYMPTOM_PATHOGEN_MAP),
+                "followup": _FOLLOWUP_MARKERS,
+            },
+            stripped={
+                "nutrient": NUTRIENT_KEYWORDS,
+                "disease": DISEASE_KEYWORDS,
+                "insect": INSECT_KEYWORDS,
+                "weed": WEED_KEYWORDS,
+                "disease_patterns": DISEASE_PATTERNS_SORTED,
+            },
+            usage_patterns=USAGE_QUESTION_PATTERNS,
+        )
+    return _lexicon
+
+
+@lru_cache(maxsize=1024)
+def analyze_query(text: str) -> QueryFeatures:
+    """Tag *text* once; repeated calls for the same message are free."""
+    return get_lexicon().analyze(text)
@@ -0,0 +1,163 @@
+"""
+Conversation Context Cache — per-user pre-parsed history สำหรับ get_enhanced_context
+
+เดิมทุก turn: SELECT MEMORY_CONTEXT_WINDOW rows + SELECT อีกรอบใน get_conversation_summary
++ regex scan (สินค้า/โรค/แมลง) ทุกข้อความใน history ซ้ำ
+
+ตอนนี้เก็บ messages ที่ parse แล้ว (memory.parse_memory_message) ต่อ user:
+- L1: in-process LRU (CONTEXT_CACHE_MAX_USERS) + TTL
+- L0: Redis list memctx:{user_id} — 1 element (JSON) ต่อข้อความ
+  append = RPUSHX + LTRIM + EXPIRE ใน pipeline เดียว (atomic ต่อ command, ไม่มี read-modify-write ข้าม workers)
+  RPUSHX ไม่สร้าง key ใหม่ → key ที่ยังไม่ hydrate จาก DB จะไม่มีแค่ข้อความล่าสุดข้อความเดียว
+
+Read: Redis (cross-worker source of truth) → L1 (เมื่อไม่มี Redis) → None = cold → caller โหลดจาก DB แล้ว put()
+
+ไม่มี Redis: L1 ของแต่ละ worker ไม่เห็น append ของ worker อื่น → TTL แค่ CONTEXT_CACHE_LOCAL_TTL
+(ใช้ซ้ำภายใน turn เดียว เช่น context + summary) turn ถัดไปอ่าน DB ใหม่เหมือนเดิม
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.config import MEMORY_CONTEXT_WINDOW, CONTEXT_CACHE_TTL, CONTEXT_CACHE_MAX_USERS, CONTEXT_CACHE_LOCAL_TTL
+
+logger = logging.getLogger(__name__)
+
+_REDIS_PREFIX = "memctx:"
+
+
+def _get_redis():
+    """Get async Redis client if available."""
+    try:
+        from app.services.redis_cache import async_redis_client
+        return async_redis_client
+    except Exception:
+        return None
+
+
+def _redis_key(user_id: str) -> str:
+    return f"{_REDIS_PREFIX}{user_id}"
+
+
+class ConversationContextCache:
+    """Per-user list of pre-parsed messages (chronological, last `window` only)."""
+
+    def __init__(self, window: int = MEMORY_CONTEXT_WINDOW, ttl: int = CONTEXT_CACHE_TTL,
+                 max_users: int = CONTEXT_CACHE_MAX_USERS, local_ttl: int = CONTEXT_CACHE_LOCAL_TTL):
+        self.window = window
+        self.ttl = ttl
+        self.local_ttl = local_ttl  # L1 TTL when Redis is not configured
+        self.max_users = max_users
+        self._l1: "OrderedDict[str, Tuple[float, List[dict]]]" = OrderedDict()
+        self._stats = {"l1_hits": 0, "redis_hits": 0, "misses": 0, "appends": 0, "redis_errors": 0}
+
+    # =====================================================================
+    # L1
+    # =====================================================================
+
+    def _l1_get(self, user_id: str) -> Optional[List[dict]]:
+        entry = self._l1.get(user_id)
+        if entry is None:
+            return None
+        expires_at, messages = entry
+        if expires_at < time.time():
+            del self._l1[user_id]
+            return None
+        self._l1.move_to_end(user_id)
+        return messages
+
+    def _l1_put(self, user_id: str, messages: List[dict]) -> None:
+        ttl = self.ttl if _get_redis() else self.local_ttl
+        self._l1[user_id] = (time.time() + ttl, messages[-self.window:])
+        self._l1.move_to_end(user_id)
+        while len(self._l1) > self.max_users:
+            self._l1.popitem(last=False)
+
+    # =====================================================================
+    # Public API
+    # =====================================================================
+
+    async def get(self, user_id: str) -> Optional[List[dict]]:
+        """Cached messages, or None on a cold cache."""
+        redis = _get_redis()
+        if redis:
+            try:
+                raws = await redis.lrange(_redis_key(user_id), 0, -1)
+                if raws:
+                    messages = [json.loads(r) for r in raws]
+                    self._l1_put(user_id, messages)
+                    self._stats["redis_hits"] += 1
+                    return messages
+                # key หาย (TTL/evict) → L1 ของ worker นี้อาจไม่ครบ → ถือว่า cold
+                self._l1.pop(user_id, None)
+                self._stats["misses"] += 1
+                return None
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Context cache Redis read failed: {e}")
+
+        messages = self._l1_get(user_id)
+        if messages is not None:
+            self._stats["l1_hits"] += 1
+            return messages
+        self._stats["misses"] += 1
+        return None
+
+    async def put(self, user_id: str, messages: List[dict]) -> None:
+        """Hydrate after a DB read (cold cache)."""
+        messages = messages[-self.window:]
+        self._l1_put(user_id, messages)
+
+        redis = _get_redis()
+        if redis and messages:
+            try:
+                from app.services.redis_cache import apipeline
+                key = _redis_key(user_id)
+                pipe = apipeline(redis)
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(m, ensure_ascii=False) for m in messages])
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Context cache Redis write failed: {e}")
+
+    async def append(self, user_id: str, message: dict) -> None:
+        """Add one new message to an already-warm context (no-op when cold)."""
+        self._stats["appends"] += 1
+        messages = self._l1_get(user_id)
+        if messages is not None:
+            self._l1_put(user_id, messages + [message])
+
+        redis = _get_redis()
+        if redis:
+            try:
+                from app.services.redis_cache import apipeline
+                key = _redis_key(user_id)
+                pipe = apipeline(redis)
+                pipe.rpushx(key, json.dumps(message, ensure_ascii=False))
+                pipe.ltrim(key, -self.window, -1)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Context cache Redis append failed: {e}")
+
+    async def invalidate(self, user_id: str) -> None:
+        self._l1.pop(user_id, None)
+        redis = _get_redis()
+        if redis:
+            try:
+                await redis.delete(_redis_key(user_id))
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Context cache Redis delete failed: {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        lookups = stats["l1_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        stats["l1_users"] = len(self._l1)
+        return stats
@@ -0,0 +1,276 @@
+"""
+Durable Webhook Queue — SQLite (WAL) ก่อนตอบ 200, lease / ack / redelivery
+
+เดิม webhook.callback / facebook_webhook.receive ส่ง events เข้า asyncio task ตรงๆ
+→ worker restart / OOM = คำถามเกษตรกรที่กำลังประมวลผลหายเงียบ
+
+ตอนนี้:
+- enqueue(): INSERT ทั้ง batch ใน transaction เดียว (WAL + synchronous=NORMAL) ก่อน return 200
+  dedup ด้วย LINE webhookEventId / FB message mid (ตาราง seen, เก็บ WEBHOOK_DEDUP_TTL)
+  → LINE redelivery (isRedelivery) ของ event ที่รับไปแล้วถูกข้าม
+- แถวที่ enqueue ถูก lease ให้ process นี้ทันที (owner + lease_until) → dispatch ในหน่วยความจำได้เลย
+- ack(): DELETE หลังประมวลผลเสร็จ (สำเร็จ หรือ handler ตอบ error ไปแล้ว)
+- sweep(): claim แถวที่ lease หมดอายุ หรือ owner เป็น pid บนเครื่องนี้ที่ตายไปแล้ว
+  → ส่งกลับเข้า handler ของ channel (redelivery); เกิน WEBHOOK_QUEUE_MAX_ATTEMPTS → dead-letter (log + ลบ)
+
+ไฟล์เดียวใช้ร่วมกันได้ทุก uvicorn worker บนเครื่องเดียวกัน; sqlite calls รันใน thread (ไม่ block loop)
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import (
+    WEBHOOK_QUEUE_PATH,
+    WEBHOOK_QUEUE_LEASE,
+    WEBHOOK_QUEUE_MAX_ATTEMPTS,
+    WEBHOOK_QUEUE_SWEEP_INTERVAL,
+    WEBHOOK_DEDUP_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel       TEXT    NOT NULL,
+    partition_key TEXT    NOT NULL,
+    payload       TEXT    NOT NULL,
+    owner         TEXT    NOT NULL,
+    lease_until   REAL    NOT NULL,
+    attempts      INTEGER NOT NULL DEFAULT 1,
+    created_at    REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_lease ON events (lease_until);
+CREATE TABLE IF NOT EXISTS seen (
+    dedup_key TEXT PRIMARY KEY,
+    seen_at   REAL NOT NULL
+);
+"""
+
+# (partition_key, dedup_key or None, payload)
+QueueItem = Tuple[str, Optional[str], dict]
+# (row id, payload, redelivered)
+QueueJob = Tuple[int, dict, bool]
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DurableQueue:
+    """SQLite-backed at-least-once queue; one file shared by the workers on a host."""
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = WEBHOOK_QUEUE_LEASE,
+        max_attempts: int = WEBHOOK_QUEUE_MAX_ATTEMPTS,
+        dedup_ttl: float = WEBHOOK_DEDUP_TTL,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.dedup_ttl = dedup_ttl
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}"
+        self._handlers: Dict[str, Callable[[QueueJob], Awaitable[None]]] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_prune = 0.0
+        self._stats = {
+            "enqueued": 0,
+            "duplicates": 0,
+            "acked": 0,
+            "redelivered": 0,
+            "dead_lettered": 0,
+            "errors": 0,
+        }
+
+    # =====================================================================
+    # Connection
+    # =====================================================================
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable ต่อ process crash, fsync ตอน checkpoint
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # =====================================================================
+    # Sync core (called via asyncio.to_thread)
+    # =====================================================================
+
+    def _enqueue(self, channel: str, items: List[QueueItem]) -> List[QueueJob]:
+        now = time.time()
+        jobs: List[QueueJob] = []
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for partition_key, dedup_key, payload in items:
+                    if dedup_key:
+                        cur = conn.execute(
+                            "INSERT OR IGNORE INTO seen (dedup_key, seen_at) VALUES (?, ?)",
+                            (f"{channel}:{dedup_key}", now),
+                        )
+                        if cur.rowcount == 0:
+                            self._stats["duplicates"] += 1
+                            continue
+                    cur = conn.execute(
+                        "INSERT INTO events (channel, partition_key, payload, owner, lease_until, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (channel, partition_key, json.dumps(payload, ensure_ascii=False),
+                         self.owner, now + self.lease_seconds, now),
+                    )
+                    jobs.append((cur.lastrowid, payload, False))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._stats["enqueued"] += len(jobs)
+        return jobs
+
+    def _ack(self, job_id: int) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM events WHERE id = ?", (job_id,))
+        self._stats["acked"] += 1
+
+    def _dead_owners(self, conn: sqlite3.Connection) -> List[str]:
+        dead = []
+        for (owner,) in conn.execute("SELECT DISTINCT owner FROM events"):
+            host, _, pid = owner.rpartition(":")
+            if owner != self.owner and host == self.host and pid.isdigit() and not _pid_alive(int(pid)):
+                dead.append(owner)
+        return dead
+
+    def _claim(self, limit: int = 100) -> Dict[str, List[QueueJob]]:
+        """Take over expired / orphaned leases. Returns jobs grouped by channel."""
+        now = time.time()
+        claimed: Dict[str, List[QueueJob]] = {}
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                dead = self._dead_owners(conn)
+                placeholders = ",".join("?" * len(dead))
+                orphan_clause = f" OR owner IN ({placeholders})" if dead else ""
+                rows = conn.execute(
+                    "UPDATE events SET owner = ?, lease_until = ?, attempts = attempts + 1 "
+                    f"WHERE id IN (SELECT id FROM events WHERE lease_until < ?{orphan_clause} ORDER BY id LIMIT ?) "
+                    "RETURNING id, channel, payload, attempts",
+                    (self.owner, now + self.lease_seconds, now, *dead, limit),
+                ).fetchall()
+                poisoned = [row[0] for row in rows if row[3] > self.max_attempts]
+                if poisoned:
+                    conn.execute(f"DELETE FROM events WHERE id IN ({','.join('?' * len(poisoned))})", poisoned)
+                if now - self._last_prune > 3600:
+                    conn.execute("DELETE FROM seen WHERE seen_at < ?", (now - self.dedup_ttl,))
+                    self._last_prune = now
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        for job_id, channel, payload, attempts in sorted(rows):
+            if attempts > self.max_attempts:
+                self._stats["dead_lettered"] += 1
+                logger.error(f"Webhook queue: dead-lettered {channel} event {job_id} after {attempts - 1} attempts: {payload[:300]}")
+                continue
+            claimed.setdefault(channel, []).append((job_id, json.loads(payload), True))
+        return claimed
+
+    def _depth(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    # =====================================================================
+    # Async API
+    # =====================================================================
+
+    def register(self, channel: str, handler: Callable[[QueueJob], Awaitable[None]]) -> None:
+        """Handler for redelivered jobs of a channel (ต้อง ack เองเมื่อเสร็จ)."""
+        self._handlers[channel] = handler
+
+    async def enqueue(self, channel: str, items: List[QueueItem]) -> List[QueueJob]:
+        """Persist a webhook batch (one transaction); returns the new (non-duplicate) jobs, leased to us."""
+        if not items:
+            return []
+        return await asyncio.to_thread(self._enqueue, channel, items)
+
+    async def ack(self, job_id: Optional[int]) -> None:
+        if job_id is None:
+            return
+        try:
+            await asyncio.to_thread(self._ack, job_id)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"Webhook queue ack failed for {job_id}: {e}")
+
+    async def sweep(self) -> int:
+        """Redeliver expired / orphaned jobs to their channel handlers. Returns jobs redelivered."""
+        claimed = await asyncio.to_thread(self._claim)
+        count = 0
+        for channel, jobs in claimed.items():
+            handler = self._handlers.get(channel)
+            for job in jobs:
+                if handler is None:
+                    logger.warning(f"Webhook queue: no handler for channel {channel}, job {job[0]} waits for lease expiry")
+                    continue
+                count += 1
+                await handler(job)
+        if count:
+            self._stats["redelivered"] += count
+            logger.warning(f"Webhook queue: redelivered {count} unacked events")
+        return count
+
+    async def run_sweeper(self, interval: float = WEBHOOK_QUEUE_SWEEP_INTERVAL) -> None:
+        """Background loop (lifespan) — first sweep immediately to recover a crashed worker's events."""
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"Webhook queue sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        try:
+            stats["depth"] = self._depth()
+        except Exception:
+            stats["depth"] = None
+        return stats
+
+
+# Module-level queue (WEBHOOK_QUEUE_PATH ว่าง = ปิด → dispatch ในหน่วยความจำแบบเดิม)
+webhook_queue: Optional[DurableQueue] = DurableQueue(WEBHOOK_QUEUE_PATH) if WEBHOOK_QUEUE_PATH else None
+
+
+def get_webhook_queue_stats() -> Optional[dict]:
+    return webhook_queue.get_stats() if webhook_queue else None
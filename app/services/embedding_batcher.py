@@ -0,0 +1,141 @@
+"""
+Embedding micro-batcher — coalesce concurrent embedding requests into one API call.
+
+Every embedding request (retrieval expanded queries, orchestrator prefetch, semantic
+cache, hybrid search) goes through embed_text(). Requests that arrive within
+EMBEDDING_BATCH_WINDOW_MS of each other — from any coroutine or user — are sent as a
+single `embeddings.create(input=[...])` and the results are fanned back out.
+Identical texts already in flight share the same future instead of a second API call.
+
+Stats (batch size, wait time) are exposed via get_embedding_batcher_stats() → /health.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from app.config import EMBEDDING_MODEL, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Per-process batcher; one pending batch per (event loop, OpenAI client)."""
+
+    def __init__(self, window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_batch: int = EMBEDDING_BATCH_MAX):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        # (loop id, client id) → (client, [(text, enqueued_at)])
+        self._pending: Dict[Tuple[int, int], Tuple[object, List[Tuple[str, float]]]] = {}
+        self._inflight: Dict[Tuple[int, int, str], asyncio.Future] = {}
+        self._flush_handles: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+        self._stats = {
+            "requests": 0,
+            "deduped": 0,
+            "batches": 0,
+            "api_errors": 0,
+            "max_batch_size": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+        }
+
+    async def embed(self, text: str, openai_client) -> List[float]:
+        """Embedding for one text; raises if the batched API call fails."""
+        self._stats["requests"] += 1
+        loop = asyncio.get_running_loop()
+        batch_key = (id(loop), id(openai_client))
+        key = batch_key + (text,)
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self._stats["deduped"] += 1
+            return await asyncio.shield(fut)
+
+        fut = loop.create_future()
+        self._inflight[key] = fut
+
+        _, batch = self._pending.setdefault(batch_key, (openai_client, []))
+        batch.append((text, time.perf_counter()))
+
+        if len(batch) >= self.max_batch:
+            self._schedule_flush(batch_key, loop, immediate=True)
+        elif batch_key not in self._flush_handles:
+            self._schedule_flush(batch_key, loop)
+
+        return await asyncio.shield(fut)
+
+    def _schedule_flush(self, batch_key: Tuple[int, int], loop, immediate: bool = False) -> None:
+        handle = self._flush_handles.pop(batch_key, None)
+        if handle:
+            handle.cancel()
+        if immediate:
+            self._start_flush(batch_key, loop)
+        else:
+            self._flush_handles[batch_key] = loop.call_later(self.window, self._start_flush, batch_key, loop)
+
+    def _start_flush(self, batch_key: Tuple[int, int], loop) -> None:
+        self._flush_handles.pop(batch_key, None)
+        client, batch = self._pending.pop(batch_key, (None, []))
+        if batch:
+            loop.create_task(self._flush(batch_key, client, batch))
+
+    async def _flush(self, batch_key: Tuple[int, int], openai_client, batch: List[Tuple[str, float]]) -> None:
+        texts = [text for text, _ in batch]
+        now = time.perf_counter()
+        waits = [(now - t) * 1000 for _, t in batch]
+
+        stats = self._stats
+        stats["batches"] += 1
+        stats["max_batch_size"] = max(stats["max_batch_size"], len(texts))
+        stats["total_wait_ms"] += sum(waits)
+        stats["max_wait_ms"] = max(stats["max_wait_ms"], max(waits))
+
+        try:
+            response = await openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=texts,
+                encoding_format="float"
+            )
+            data = list(response.data or [])
+            embeddings: Dict[int, List[float]] = {}
+            for pos, item in enumerate(data):
+                idx = getattr(item, "index", pos)
+                embeddings[idx if isinstance(idx, int) else pos] = item.embedding
+
+            for i, text in enumerate(texts):
+                fut = self._inflight.pop(batch_key + (text,), None)
+                if fut is None or fut.done():
+                    continue
+                if i in embeddings:
+                    fut.set_result(embeddings[i])
+                else:
+                    fut.set_exception(RuntimeError("OpenAI embedding returned empty data"))
+            if len(texts) > 1:
+                logger.info(f"Embedding batch: {len(texts)} texts in 1 call (max wait {max(waits):.1f}ms)")
+        except Exception as e:
+            stats["api_errors"] += 1
+            for text in texts:
+                fut = self._inflight.pop(batch_key + (text,), None)
+                if fut is not None and not fut.done():
+                    fut.set_exception(e)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        batches = stats["batches"]
+        batched_texts = stats["requests"] - stats["deduped"]
+        stats["avg_batch_size"] = round(batched_texts / batches, 2) if batches else 0.0
+        stats["avg_wait_ms"] = round(stats["total_wait_ms"] / batched_texts, 2) if batched_texts else 0.0
+        stats["total_wait_ms"] = round(stats["total_wait_ms"], 2)
+        stats["max_wait_ms"] = round(stats["max_wait_ms"], 2)
+        return stats
+
+
+_batcher = EmbeddingBatcher()
+
+
+async def embed_text(text: str, openai_client) -> List[float]:
+    """Batched embedding for one text (raises on API failure — callers keep their own fallbacks)."""
+    return await _batcher.embed(text, openai_client)
+
+
+def get_embedding_batcher_stats() -> dict:
+    return _batcher.get_stats()
@@ -0,0 +1,329 @@
+"""
+Embedding Cache — tiered store for query embeddings (shared across workers + restarts)
+
+Embeddings are deterministic per (model, text), so every tier is keyed by
+sha1(EMBEDDING_MODEL + normalized text):
+- L1: in-process LRU (OrderedDict, O(1) get/put/evict) — EMBEDDING_CACHE_MAX entries
+- L2: Redis — emb:{key} → base64 float32 bytes (6KB/embedding แทน JSON ~30KB), TTL EMBEDDING_CACHE_REDIS_TTL
+- L3: optional on-disk file (keys header + float32 rows, memory-mapped) — EMBEDDING_CACHE_DISK_PATH
+  load_from_disk() ตอน startup → warm start ไม่ต้องจ่าย OpenAI ซ้ำหลัง deploy
+  save_to_disk() ตอน shutdown → เขียน L1 (ล่าสุดก่อน) + entries เดิมบน disk แบบ atomic
+  keys กับ vectors อยู่ไฟล์เดียว (temp ต่อ process + os.replace ครั้งเดียว) และทุก worker save
+  ทีละตัวภายใต้ flock — แต่ละตัว reload ไฟล์ของตัวก่อนหน้าแล้ว merge → key ไม่มีทางชี้ผิด vector
+
+Normalization = Unicode NFC + collapse whitespace (ไม่ lowercase — case มีผลกับ embedding)
+
+Hit/miss counters per tier → get_embedding_cache_stats() → /health
+"""
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import tempfile
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX — saves are still atomic, just not serialized across workers
+    fcntl = None
+
+from app.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_MAX,
+    EMBEDDING_CACHE_REDIS_TTL,
+    EMBEDDING_CACHE_DISK_PATH,
+    EMBEDDING_CACHE_DISK_MAX,
+)
+
+logger = logging.getLogger(__name__)
+
+_REDIS_PREFIX = "emb:"
+_WHITESPACE = re.compile(r"\s+")
+_DISK_MAGIC = b"LADDAEMB1\n"
+_DISK_ALIGN = 64               # float32 rows start on a 64-byte boundary (mmap-friendly)
+_SAVE_LOCK_TIMEOUT = 10.0      # seconds to wait for another worker's save at shutdown
+
+
+def _get_redis():
+    """Get async Redis client if available."""
+    try:
+        from app.services.redis_cache import async_redis_client
+        return async_redis_client
+    except Exception:
+        return None
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def cache_key(text: str, model: str = EMBEDDING_MODEL) -> str:
+    return hashlib.sha1(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _encode(vec: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vec, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _decode(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+def _write_disk_file(path: str, keys: List[str], vectors: List[np.ndarray], dim: int) -> None:
+    """
+    One artifact: MAGIC | u64 header length | JSON {dim, keys} | padding | float32 rows.
+    Written to a per-process mkstemp file in the same directory, then a single os.replace.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    header = json.dumps({"dim": dim, "keys": keys}).encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_DISK_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            f.write(b"\0" * (-f.tell() % _DISK_ALIGN))
+            for vec in vectors:
+                f.write(np.asarray(vec, dtype="<f4").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _read_disk_file(path: str):
+    """(keys, read-only memmap of shape (len(keys), dim)) — ValueError on a foreign / truncated file."""
+    with open(path, "rb") as f:
+        if f.read(len(_DISK_MAGIC)) != _DISK_MAGIC:
+            raise ValueError("not an embedding cache file")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+        offset = f.tell()
+    offset += -offset % _DISK_ALIGN
+    keys, dim = header["keys"], int(header["dim"])
+    expected = offset + len(keys) * dim * 4
+    if os.path.getsize(path) != expected:
+        raise ValueError(f"size {os.path.getsize(path)} != expected {expected} for {len(keys)}x{dim}")
+    if not keys:
+        return keys, np.zeros((0, dim), dtype=np.float32)
+    return keys, np.memmap(path, dtype="<f4", mode="r", offset=offset, shape=(len(keys), dim))
+
+
+@contextlib.contextmanager
+def _save_lock(path: str, timeout: float = _SAVE_LOCK_TIMEOUT):
+    """Exclusive flock on {path}.lock — yields False if another worker holds it past `timeout`."""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", "a") as lock_file:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    yield False
+                    return
+                time.sleep(0.05)
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """L1 LRU + Redis + optional mmap file. Values are float32 arrays; callers get lists."""
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX, disk_path: str = EMBEDDING_CACHE_DISK_PATH):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._disk_matrix: Optional[np.ndarray] = None  # read-only memmap
+        self._disk_rows: Dict[str, int] = {}             # key → row in _disk_matrix
+        self._stats = {"l1_hits": 0, "disk_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    # =====================================================================
+    # Lookup / store
+    # =====================================================================
+
+    def _put_l1(self, key: str, vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get_local(self, text: str) -> Optional[List[float]]:
+        """L1 + disk only (no network) — safe to call from sync code."""
+        key = cache_key(text)
+        vec = self._lru.get(key)
+        if vec is not None:
+            self._lru.move_to_end(key)
+            self._stats["l1_hits"] += 1
+            return vec.tolist()
+        row = self._disk_rows.get(key)
+        if row is not None and self._disk_matrix is not None:
+            vec = np.array(self._disk_matrix[row], dtype=np.float32)
+            self._put_l1(key, vec)
+            self._stats["disk_hits"] += 1
+            return vec.tolist()
+        return None
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        """L1 → disk → Redis. A lower-tier hit is promoted into L1."""
+        local = self.get_local(text)
+        if local is not None:
+            return local
+
+        redis = _get_redis()
+        if redis:
+            key = cache_key(text)
+            try:
+                raw = await redis.get(f"{_REDIS_PREFIX}{key}")
+                if raw:
+                    vec = _decode(raw)
+                    self._put_l1(key, vec)
+                    self._stats["redis_hits"] += 1
+                    return vec.tolist()
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Embedding cache Redis read failed: {e}")
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, text: str, embedding) -> None:
+        if embedding is None or len(embedding) == 0:
+            return
+        key = cache_key(text)
+        vec = np.asarray(embedding, dtype=np.float32)
+        self._put_l1(key, vec)
+
+        redis = _get_redis()
+        if redis:
+            try:
+                await redis.set(f"{_REDIS_PREFIX}{key}", _encode(vec), ex=EMBEDDING_CACHE_REDIS_TTL)
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Embedding cache Redis write failed: {e}")
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    # =====================================================================
+    # Disk tier (warm start)
+    # =====================================================================
+
+    def load_from_disk(self) -> int:
+        """Memory-map the on-disk file (rows are read lazily on hit). Returns entry count."""
+        if not self.disk_path or not os.path.exists(self.disk_path):
+            return 0
+        try:
+            keys, matrix = _read_disk_file(self.disk_path)
+            self._disk_matrix = matrix
+            self._disk_rows = {k: i for i, k in enumerate(keys)}
+            logger.info(f"Embedding cache: mapped {len(keys)} embeddings from {self.disk_path}")
+        except Exception as e:
+            logger.warning(f"Embedding cache: disk load failed ({e}), starting cold")
+            self._disk_matrix = None
+            self._disk_rows = {}
+        return len(self._disk_rows)
+
+    def save_to_disk(self) -> int:
+        """Write L1 (most recent first) + entries on disk now, capped at EMBEDDING_CACHE_DISK_MAX."""
+        if not self.disk_path:
+            return 0
+        try:
+            with _save_lock(self.disk_path) as locked:
+                if not locked:
+                    logger.warning("Embedding cache: another worker is still saving, skipping disk save")
+                    return 0
+                # ไฟล์อาจถูก worker อื่น save ทับหลัง startup → merge กับของล่าสุด ไม่ใช่ของตอน load
+                self.load_from_disk()
+                saved = self._write_merged()
+        except Exception as e:
+            logger.warning(f"Embedding cache: disk save failed ({e})")
+            return 0
+        if saved:
+            self.load_from_disk()
+        return saved
+
+    def _write_merged(self) -> int:
+        keys: List[str] = []
+        vectors: List[np.ndarray] = []
+        seen = set()
+        for key, vec in reversed(self._lru.items()):
+            keys.append(key)
+            vectors.append(vec)
+            seen.add(key)
+        if self._disk_matrix is not None:
+            for key, row in self._disk_rows.items():
+                if key not in seen:
+                    keys.append(key)
+                    vectors.append(self._disk_matrix[row])
+        if not vectors:
+            return 0
+
+        dim = len(vectors[0])
+        pairs = [(k, v) for k, v in zip(keys, vectors) if len(v) == dim][:EMBEDDING_CACHE_DISK_MAX]
+        _write_disk_file(self.disk_path, [k for k, _ in pairs], [v for _, v in pairs], dim)
+        logger.info(f"Embedding cache: saved {len(pairs)} embeddings to {self.disk_path}")
+        return len(pairs)
+
+    # =====================================================================
+    # Stats
+    # =====================================================================
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        hits = stats["l1_hits"] + stats["disk_hits"] + stats["redis_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        stats["l1_size"] = len(self._lru)
+        stats["disk_size"] = len(self._disk_rows)
+        return stats
+
+
+_embedding_cache = EmbeddingCache()
+
+
+def get_cached_embedding(text: str) -> Optional[List[float]]:
+    """Sync lookup (L1 + disk) — for hot paths that must not wait on Redis."""
+    return _embedding_cache.get_local(text)
+
+
+async def aget_cached_embedding(text: str) -> Optional[List[float]]:
+    return await _embedding_cache.get(text)
+
+
+async def set_cached_embedding(text: str, embedding) -> None:
+    await _embedding_cache.set(text, embedding)
+
+
+def load_embedding_cache_from_disk() -> int:
+    return _embedding_cache.load_from_disk()
+
+
+def save_embedding_cache_to_disk() -> int:
+    return _embedding_cache.save_to_disk()
+
+
+def get_embedding_cache_stats() -> dict:
+    return _embedding_cache.get_stats()
@@ -0,0 +1,157 @@
+"""
+Keyed Event Dispatcher — concurrent across users, FIFO within a user
+
+LINE webhook เดิม: 1 semaphore slot ต่อ batch แล้ววน events ทีละตัว
+→ batch ที่มีหลาย users ทำงานแบบ serial, RAG ช้า 1 ตัวหน่วงทุกคนใน batch
+→ webhook 2 batch ของ user เดียวกันอาจทำงานพร้อมกันและสลับลำดับ
+
+ตอนนี้:
+- submit(key, event) เป็น sync: ใส่ event ลง FIFO ของ key (user_id)
+- 1 worker task ต่อ key ที่มีงาน → ลำดับข้อความของ user คงเดิม, users ต่างกันทำงานขนานกัน
+- MAX_CONCURRENT_TASKS / MAX_QUEUE_DEPTH นับต่อ event (ไม่ใช่ต่อ batch):
+  - events ที่รอ slot เกิน max_queue_depth → on_reject (ตอบ "กำลังตรวจสอบ" แทนการเงียบ)
+  - รอ global slot นานเกิน queue_timeout → on_reject เช่นกัน
+    (นับตั้งแต่ event ถึงหัวคิวของ key — เวลาที่รอข้อความก่อนหน้าของ user เดียวกันไม่นับ)
+- stats: queue depth, active, wait time (avg / p95 / max)
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WAIT_SAMPLES = 500
+
+
+class KeyedEventDispatcher:
+    """Per-key FIFO queues drained by one worker per key, bounded by a global slot semaphore."""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        max_concurrent: int,
+        max_queue_depth: int,
+        queue_timeout: float = 30.0,
+        on_reject: Optional[Callable[[dict, str], Awaitable[None]]] = None,
+    ):
+        self.handler = handler
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.on_reject = on_reject
+
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._queues: Dict[str, Deque[Tuple[dict, float]]] = {}
+        self._workers: Set[asyncio.Task] = set()
+        self._waiting = 0  # events submitted but not yet holding a slot
+        self._active = 0
+        self._waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+        self._stats = {
+            "submitted": 0,
+            "processed": 0,
+            "rejected": 0,
+            "expired": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+            "max_wait_ms": 0.0,
+        }
+
+    # =====================================================================
+    # Submit
+    # =====================================================================
+
+    def submit(self, key: str, event: dict) -> bool:
+        """Queue one event behind earlier events of the same key. False = rejected (queue full)."""
+        self._stats["submitted"] += 1
+        # events ที่รออยู่เกินจำนวน slot ว่าง = คิวจริง (burst ที่ slot ยังพอ ไม่ถูก reject)
+        backlog = self._waiting - (self.max_concurrent - self._active)
+        if backlog >= self.max_queue_depth:
+            self._stats["rejected"] += 1
+            logger.warning(f"Dispatch queue full ({self.max_queue_depth}) — rejecting event for {key[:12]}")
+            self._spawn(self._reject(event, "queue_full"))
+            return False
+
+        self._waiting += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._waiting)
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append((event, time.monotonic()))  # worker ของ key นี้กำลังทำงาน → ต่อคิว
+            return True
+        self._queues[key] = deque([(event, time.monotonic())])
+        self._spawn(self._drain_key(key))
+        return True
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+
+    # =====================================================================
+    # Workers
+    # =====================================================================
+
+    async def _drain_key(self, key: str) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                event, enqueued_at = queue.popleft()
+                await self._run_one(event, enqueued_at)
+        finally:
+            # queue ว่างแล้ว (ไม่มี await ระหว่างเช็ค while กับ pop นี้) → submit ถัดไปสร้าง worker ใหม่
+            self._queues.pop(key, None)
+            for event, _ in queue:  # cancelled mid-queue
+                self._waiting -= 1
+
+    async def _run_one(self, event: dict, enqueued_at: float) -> None:
+        # timeout = รอ slot เท่านั้น: follow-up หลัง RAG ช้าของข้อความแรกไม่ใช่ overload → ไม่ reject
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._waiting -= 1
+            self._stats["expired"] += 1
+            logger.error(f"Event waited > {self.queue_timeout:.0f}s for a slot — rejecting")
+            await self._reject(event, "timeout")
+            return
+        except BaseException:
+            self._waiting -= 1
+            raise
+
+        self._waiting -= 1
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        self._waits.append(wait_ms)
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], round(wait_ms, 1))
+        self._active += 1
+        try:
+            await self.handler(event)
+            self._stats["processed"] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"Dispatched event handler error: {e}", exc_info=True)
+        finally:
+            self._active -= 1
+            self._slots.release()
+
+    async def _reject(self, event: dict, reason: str) -> None:
+        if not self.on_reject:
+            return
+        try:
+            await self.on_reject(event, reason)
+        except Exception as e:
+            logger.warning(f"Dispatch reject handler failed: {e}")
+
+    async def drain(self) -> None:
+        """Wait for every queued/in-flight event (tests, shutdown)."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers), return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        waits = sorted(self._waits)
+        stats["queue_depth"] = self._waiting
+        stats["active"] = self._active
+        stats["active_keys"] = len(self._queues)
+        stats["avg_wait_ms"] = round(sum(waits) / len(waits), 1) if waits else 0.0
+        stats["p95_wait_ms"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 1) if waits else 0.0
+        return stats
@@ -8,6 +8,7 @@ from datetime import datetime, timezone
 from typing import List, Optional
 
 from supabase import Client
+from app.services.admin_inbox import get_admin_inbox
 from app.utils.async_db import aexecute
 
 logger = logging.getLogger(__name__)
@@ -57,6 +58,9 @@ class HandoffManager:
                 logger.info(
                     f"Handoff created: id={hid} user={user_id[:8]}... platform={platform}"
                 )
+                inbox = get_admin_inbox()
+                if inbox:
+                    await inbox.set_handoff(user_id, hid)
                 return hid
             return None
         except Exception as e:
@@ -125,6 +129,9 @@ class HandoffManager:
                 "id", handoff_id
             ))
             logger.info(f"Handoff {handoff_id} resolved by {admin_name}")
+            inbox = get_admin_inbox()
+            if inbox:
+                await inbox.clear_handoff(handoff_id)
             return True
         except Exception as e:
             logger.error(f"Failed to resolve handoff: {e}")
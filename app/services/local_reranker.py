@@ -0,0 +1,237 @@
+"""
+Local Reranker — CPU-only replacement for the gpt-4o-mini rerank round trip
+
+The LLM rerank (retrieval_agent._rerank_with_llm, reranker.rerank_products_with_llm)
+costs 0.5–2s per query for an ordering of ≤15 candidates. LocalReranker scores each
+candidate as a linear combination of cheap features:
+
+    similarity        — vector/hybrid score from retrieval
+    input_rank        — position in the candidate list (1.0 = first)
+    crop_match        — plant_type (or query word) found in applicable_crops (+1) / missing (-1)
+    pest_overlap      — share of query trigrams found in the pest columns
+    pest_entity_match — pest/disease/weed entity found in the pest columns
+    category_match    — product_category matches the expected category (+1) / mismatch (-1)
+    priority_strategy — Skyrocket/Expand
+    relevance_boost   — simple_relevance_boost() / 0.3
+
+Weights come from scripts/train_local_reranker.py (pairwise logistic regression on
+logged LLM orderings + reports/capability_test_*.jsonl). Without a weights file the
+hand-tuned DEFAULT_WEIGHTS are used.
+
+rank() returns (order, margin): margin = score(top1) − score(top2). Callers fall back
+to the LLM when margin < RERANK_LOCAL_MIN_MARGIN.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX — single O_APPEND write per record, not serialized across workers
+    fcntl = None
+
+from app.config import RERANK_LOCAL_WEIGHTS_PATH, RERANK_LOG_PATH
+from app.services.reranker import simple_relevance_boost
+from app.utils.pest_columns import get_pest_text_lower
+
+logger = logging.getLogger(__name__)
+
+FEATURE_NAMES = (
+    "similarity",
+    "input_rank",
+    "crop_match",
+    "pest_overlap",
+    "pest_entity_match",
+    "category_match",
+    "priority_strategy",
+    "relevance_boost",
+)
+
+DEFAULT_WEIGHTS = {
+    "similarity": 1.0,
+    "input_rank": 0.3,
+    "crop_match": 0.6,
+    "pest_overlap": 1.0,
+    "pest_entity_match": 1.2,
+    "category_match": 1.5,
+    "priority_strategy": 0.4,
+    "relevance_boost": 0.5,
+}
+
+_PRIORITY_STRATEGIES = {"Skyrocket", "Expand"}
+_WORD_PATTERN = re.compile(r"[0-9a-z\u0E00-\u0E7F]+")
+
+
+def _trigrams(text: str) -> set:
+    grams = set()
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if len(word) < 3:
+            grams.add(word)
+        else:
+            grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def extract_features(
+    query: str,
+    product: dict,
+    similarity: float = 0.0,
+    input_rank: float = 0.0,
+    expected_category: Optional[str] = None,
+    plant_type: str = "",
+    pest_terms: Iterable[str] = (),
+    query_grams: Optional[set] = None,
+) -> List[float]:
+    """Feature vector (FEATURE_NAMES order) for one candidate — product is a DB row or doc.metadata."""
+    crops = (product.get("applicable_crops") or "").lower()
+    if plant_type:
+        crop_match = 1.0 if plant_type.lower() in crops else -1.0
+    else:
+        crop_match = 1.0 if any(w in crops for w in query.lower().split() if len(w) > 2) else 0.0
+
+    pest_text = get_pest_text_lower(product)
+    grams = query_grams if query_grams is not None else _trigrams(query)
+    pest_overlap = len(grams & _trigrams(pest_text)) / len(grams) if grams and pest_text else 0.0
+    pest_entity_match = 1.0 if any(t and t.lower() in pest_text for t in pest_terms) else 0.0
+
+    category = str(product.get("category") or product.get("product_category") or "").lower()
+    if not expected_category or not category:
+        category_match = 0.0
+    else:
+        category_match = 1.0 if expected_category.lower() in category else -1.0
+
+    return [
+        float(similarity or 0.0),
+        float(input_rank),
+        crop_match,
+        pest_overlap,
+        pest_entity_match,
+        category_match,
+        1.0 if product.get("strategy") in _PRIORITY_STRATEGIES else 0.0,
+        simple_relevance_boost(query, product) / 0.3,
+    ]
+
+
+class LocalReranker:
+    """Singleton linear scorer over extract_features()."""
+
+    _instance: Optional['LocalReranker'] = None
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        merged = dict(DEFAULT_WEIGHTS)
+        merged.update(weights or {})
+        self.weights = np.array([merged[name] for name in FEATURE_NAMES], dtype=np.float64)
+
+    @classmethod
+    def get_instance(cls) -> 'LocalReranker':
+        if cls._instance is None:
+            cls._instance = cls(load_weights(RERANK_LOCAL_WEIGHTS_PATH))
+        return cls._instance
+
+    def features(
+        self,
+        query: str,
+        products: Sequence[dict],
+        similarities: Optional[Sequence[float]] = None,
+        expected_category: Optional[str] = None,
+        plant_type: str = "",
+        pest_terms: Iterable[str] = (),
+    ) -> np.ndarray:
+        n = len(products)
+        pest_terms = [t for t in pest_terms if t]
+        grams = _trigrams(query)
+        rows = [
+            extract_features(
+                query, p,
+                similarity=similarities[i] if similarities is not None else p.get("similarity", 0.0),
+                input_rank=1.0 - i / n,
+                expected_category=expected_category,
+                plant_type=plant_type,
+                pest_terms=pest_terms,
+                query_grams=grams,
+            )
+            for i, p in enumerate(products)
+        ]
+        return np.array(rows, dtype=np.float64).reshape(n, len(FEATURE_NAMES))
+
+    def rank(self, query: str, products: Sequence[dict], **kwargs) -> Tuple[List[int], float]:
+        """Indices best → worst, and the top1−top2 score margin (inf for a single candidate)."""
+        if not products:
+            return [], 0.0
+        scores = self.features(query, products, **kwargs) @ self.weights
+        order = sorted(range(len(products)), key=lambda i: (-scores[i], i))
+        margin = float(scores[order[0]] - scores[order[1]]) if len(order) > 1 else float("inf")
+        return order, margin
+
+
+def load_weights(path: str) -> Optional[Dict[str, float]]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        weights = {k: float(v) for k, v in data.get("weights", data).items() if k in FEATURE_NAMES}
+        logger.info(f"LocalReranker: loaded weights from {path}")
+        return weights
+    except Exception as e:
+        logger.warning(f"LocalReranker: failed to load weights {path} ({e}), using defaults")
+        return None
+
+
+# Candidate fields kept in the training log (enough to recompute every feature)
+_LOG_FIELDS = ("id", "product_name", "applicable_crops", "category", "product_category", "strategy",
+               "fungicides", "insecticides", "herbicides", "biostimulant", "pgr_hormones", "fertilizer")
+
+
+def _append_log_line(path: str, line: str) -> None:
+    """One JSONL record under an exclusive flock — gunicorn workers share the file (runs in a thread)."""
+    with open(path, "a", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+            f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+async def log_llm_ranking(
+    query: str,
+    products: Sequence[dict],
+    order: Sequence[int],
+    similarities: Optional[Sequence[float]] = None,
+    expected_category: Optional[str] = None,
+    plant_type: str = "",
+    pest_terms: Iterable[str] = (),
+) -> None:
+    """Append one LLM ordering to RERANK_LOG_PATH (JSONL) — training data for the local model.
+
+    The file write runs in a thread (asyncio.to_thread) — never blocks the event loop.
+    """
+    if not RERANK_LOG_PATH or not order:
+        return
+    try:
+        record = {
+            "ts": time.time(),
+            "query": query,
+            "expected_category": expected_category,
+            "plant_type": plant_type,
+            "pest_terms": [t for t in pest_terms if t],
+            "candidates": [
+                {**{k: p.get(k) for k in _LOG_FIELDS if p.get(k) is not None},
+                 "similarity": similarities[i] if similarities is not None else p.get("similarity", 0.0)}
+                for i, p in enumerate(products)
+            ],
+            "order": list(order),
+        }
+        await asyncio.to_thread(_append_log_line, RERANK_LOG_PATH, json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.warning(f"Rerank log write failed: {e}")
@@ -3,8 +3,11 @@ import asyncio
 import re
 from app.dependencies import supabase_client
 from datetime import datetime, timezone, timedelta
-from app.config import MAX_MEMORY_MESSAGES, MEMORY_CONTEXT_WINDOW, MEMORY_CONTENT_PREVIEW, MEMORY_TABLE, MEMORY_SESSION_TIMEOUT_HOURS, MEMORY_TTL_DAYS
+from app.config import MAX_MEMORY_MESSAGES, MEMORY_CONTEXT_WINDOW, MEMORY_CONTENT_PREVIEW, MEMORY_TABLE, MEMORY_SESSION_TIMEOUT_HOURS, MEMORY_TTL_DAYS, MEMORY_TRIM_INTERVAL
 from app.utils.async_db import aexecute
+from app.services.memory_buffer import MemoryWriteBuffer
+from app.services.context_cache import ConversationContextCache
+from app.services.admin_inbox import get_admin_inbox
 
 logger = logging.getLogger(__name__)
 
@@ -17,29 +20,121 @@ def _get_cleanup_lock(user_id: str) -> asyncio.Lock:
         _cleanup_locks[user_id] = asyncio.Lock()
     return _cleanup_locks[user_id]
 
+
+async def _insert_memory_rows(rows: list):
+    """Bulk INSERT (1 round trip ต่อ batch) — called by the write buffer"""
+    await aexecute(supabase_client.table(MEMORY_TABLE).insert(rows))
+    # admin inbox: 1 RPC ต่อ batch — ไม่ raise (rows ลง DB แล้ว ห้าม buffer retry ซ้ำ)
+    inbox = get_admin_inbox()
+    if inbox:
+        await inbox.apply_messages(rows)
+
+
+_TTL_PURGE_LOCK = "memory:ttl_purge"
+
+
+def _get_redis():
+    """Get async Redis client if available."""
+    try:
+        from app.services.redis_cache import async_redis_client
+        return async_redis_client
+    except Exception:
+        return None
+
+
+async def _claim_ttl_purge() -> bool:
+    """TTL purge เป็น DELETE ทั้งตาราง → 1 worker ต่อ MEMORY_TRIM_INTERVAL ทั้ง fleet (Redis SET NX EX)
+
+    ไม่มี Redis (instance เดียว) / Redis error → worker นี้ทำเอง (กันข้อมูลค้างเกิน TTL)
+    """
+    redis = _get_redis()
+    if not redis:
+        return True
+    try:
+        return bool(await redis.set(_TTL_PURGE_LOCK, "1", ex=max(1, MEMORY_TRIM_INTERVAL), nx=True))
+    except Exception as e:
+        logger.warning(f"TTL purge lock failed, purging locally: {e}")
+        return True
+
+
+async def trim_memory(user_ids: list):
+    """
+    Batch job (run by the write buffer every MEMORY_TRIM_INTERVAL):
+    1. ลบ messages เก่ากว่า MEMORY_TTL_DAYS — 1 query สำหรับทุก user, 1 worker ต่อรอบ (_claim_ttl_purge)
+    2. Keep only last MAX_MEMORY_MESSAGES ต่อ user ที่มีข้อความใหม่ตั้งแต่รอบก่อน
+    """
+    if not supabase_client:
+        return
+
+    if await _claim_ttl_purge():
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=MEMORY_TTL_DAYS)).isoformat()
+        # returning=minimal → ไม่ดึงแถวที่ลบกลับมา (อาจเป็นหลายพันแถว)
+        await aexecute(supabase_client.table(MEMORY_TABLE)\
+            .delete(returning="minimal")\
+            .lt('created_at', cutoff))
+        logger.info(f"✓ TTL cleanup: purged messages older than {MEMORY_TTL_DAYS} days")
+
+    for user_id in user_ids:
+        await cleanup_old_memory(user_id)
+
+
+_write_buffer = MemoryWriteBuffer(writer=_insert_memory_rows, trimmer=trim_memory)
+_context_cache = ConversationContextCache()
+
+
+async def _record_row(user_id: str, role: str, content: str, metadata: dict = None) -> dict:
+    """Write buffer (DB, write-behind) + context cache (pre-parsed, for get_enhanced_context)"""
+    row = _write_buffer.append({
+        "user_id": user_id,
+        "role": role,  # "user" or "assistant"
+        "content": content,
+        "metadata": metadata or {}
+    })
+    await _context_cache.append(user_id, parse_memory_message(row))
+    return row
+
+
+async def _fetch_recent_messages(user_id: str, limit: int) -> list:
+    """Last `limit` messages (newest first) from DB + rows still in the write buffer"""
+    result = await aexecute(supabase_client.table(MEMORY_TABLE)\
+        .select('role, content, metadata, created_at')\
+        .eq('user_id', user_id)\
+        .order('created_at', desc=True)\
+        .limit(limit))
+    return _write_buffer.merge(user_id, result.data or [], limit)
+
+
+async def flush_memory_buffer() -> int:
+    """Write all buffered messages now (shutdown)"""
+    return await _write_buffer.drain()
+
+
+def get_memory_buffer_stats() -> dict:
+    return _write_buffer.get_stats()
+
+
+def get_context_cache_stats() -> dict:
+    return _context_cache.get_stats()
+
+
 async def add_to_memory(user_id: str, role: str, content: str, metadata: dict = None):
-    """Add message to conversation memory in Supabase"""
+    """
+    Add message to conversation memory (write-behind)
+
+    ไม่รอ DB — row เข้า write buffer แล้ว flush เป็น bulk insert ภายหลัง
+    trim (TTL / MAX_MEMORY_MESSAGES) ทำเป็น batch job ไม่ใช่ทุกครั้งที่เขียน
+    """
     try:
         if not supabase_client:
             logger.warning("Supabase not available, skipping memory storage")
             return
-        
+
         # Truncate very long messages
         truncated_content = content[:2000] if len(content) > 2000 else content
-        
-        data = {
-            "user_id": user_id,
-            "role": role,  # "user" or "assistant"
-            "content": truncated_content,
-            "metadata": metadata or {}
-        }
-        
-        result = await aexecute(supabase_client.table(MEMORY_TABLE).insert(data))
+
+        await _record_row(user_id, role, truncated_content, metadata)
         logger.info(f"✓ Added to memory: {role} message for user {user_id[:8]}...")
-        
-        # Clean up old messages (keep last N per user)
-        await cleanup_old_memory(user_id)
-        
+
     except Exception as e:
         logger.error(f"Failed to add to memory: {e}")
 
@@ -50,17 +145,13 @@ async def get_conversation_context(user_id: str, limit: int = MEMORY_CONTEXT_WIN
             return ""
 
         # Get last N messages for this user
-        result = await aexecute(supabase_client.table(MEMORY_TABLE)\
-            .select('role, content, metadata, created_at')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .limit(limit))
+        rows = await _fetch_recent_messages(user_id, limit)
 
-        if not result.data:
+        if not rows:
             return ""
 
         # Session timeout check
-        latest_created = result.data[0].get("created_at", "")
+        latest_created = rows[0].get("created_at", "")
         if latest_created and MEMORY_SESSION_TIMEOUT_HOURS > 0:
             try:
                 last_time = datetime.fromisoformat(latest_created.replace("Z", "+00:00"))
@@ -72,7 +163,7 @@ async def get_conversation_context(user_id: str, limit: int = MEMORY_CONTEXT_WIN
                 pass
 
         # Reverse to get chronological order
-        messages = list(reversed(result.data))
+        messages = list(reversed(rows))
 
         context_parts = []
         for msg in messages:
@@ -97,7 +188,7 @@ async def get_conversation_context(user_id: str, limit: int = MEMORY_CONTEXT_WIN
         return ""
 
 async def cleanup_old_memory(user_id: str):
-    """Keep only last N messages per user + ลบ messages เก่ากว่า MEMORY_TTL_DAYS"""
+    """Keep only last MAX_MEMORY_MESSAGES per user (TTL delete อยู่ใน trim_memory)"""
     lock = _get_cleanup_lock(user_id)
     if lock.locked():
         return
@@ -107,26 +198,14 @@ async def cleanup_old_memory(user_id: str):
             if not supabase_client:
                 return
 
-            # 1. ลบ messages เก่ากว่า TTL (7 วัน)
-            cutoff = (datetime.now(timezone.utc) - timedelta(days=MEMORY_TTL_DAYS)).isoformat()
-            ttl_result = await aexecute(supabase_client.table(MEMORY_TABLE)\
-                .delete()\
-                .eq('user_id', user_id)\
-                .lt('created_at', cutoff))
-            ttl_deleted = len(ttl_result.data) if ttl_result.data else 0
-            if ttl_deleted > 0:
-                logger.info(f"✓ TTL cleanup: deleted {ttl_deleted} messages older than {MEMORY_TTL_DAYS} days for user {user_id[:8]}...")
-
-            # 2. Keep only last MAX_MEMORY_MESSAGES
+            # ดึงเฉพาะ ids ที่เกิน MAX_MEMORY_MESSAGES (ไม่ดึงทั้งหมด)
             result = await aexecute(supabase_client.table(MEMORY_TABLE)\
                 .select('id')\
                 .eq('user_id', user_id)\
-                .order('created_at', desc=True))
+                .order('created_at', desc=True)\
+                .range(MAX_MEMORY_MESSAGES, MAX_MEMORY_MESSAGES + 999))
 
-            if not result.data or len(result.data) <= MAX_MEMORY_MESSAGES:
-                return
-
-            ids_to_delete = [msg['id'] for msg in result.data[MAX_MEMORY_MESSAGES:]]
+            ids_to_delete = [msg['id'] for msg in (result.data or [])]
 
             if ids_to_delete:
                 await aexecute(supabase_client.table(MEMORY_TABLE)\
@@ -144,11 +223,20 @@ async def clear_memory(user_id: str):
             logger.warning("Supabase not available")
             return
 
+        # 0. Drop unflushed rows (และรอ flush ที่กำลังเขียนอยู่) — กันข้อความกลับมาหลังลบ
+        await _write_buffer.discard(user_id)
+        await _context_cache.invalidate(user_id)
+
         # 1. Delete from conversation_memory table
         await aexecute(supabase_client.table(MEMORY_TABLE)\
             .delete()\
             .eq('user_id', user_id))
 
+        # 2. Admin inbox: ล้าง preview / จำนวนข้อความ
+        inbox = get_admin_inbox()
+        if inbox:
+            await inbox.reset(user_id)
+
         logger.info(f"✓ Cleared memory for user {user_id[:8]}...")
 
     except Exception as e:
@@ -215,14 +303,7 @@ async def save_recommended_products(user_id: str, products: list, disease_name:
         if disease_name:
             content = f"[แนะนำสินค้าสำหรับ {disease_name}] {', '.join(product_names[:5])}"
 
-        data = {
-            "user_id": user_id,
-            "role": "assistant",
-            "content": content,
-            "metadata": metadata
-        }
-
-        result = await aexecute(supabase_client.table(MEMORY_TABLE).insert(data))
+        await _record_row(user_id, "assistant", content, metadata)
         logger.info(f"✓ Saved {len(products_data)} recommended products to memory for user {user_id[:8]}...")
 
     except Exception as e:
@@ -239,19 +320,15 @@ async def get_recommended_products(user_id: str, limit: int = 5) -> list:
             return []
 
         # ค้นหาข้อความที่มี metadata เป็น product_recommendation
-        result = await aexecute(supabase_client.table(MEMORY_TABLE)\
-            .select('content, metadata, created_at')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .limit(20))
+        rows = await _fetch_recent_messages(user_id, 20)
 
-        if not result.data:
+        if not rows:
             return []
 
         # หา product recommendations จาก metadata — เฉพาะรอบล่าสุดเท่านั้น
         # ป้องกันสินค้าจากหัวข้อเก่าปนมา
         latest_products = []
-        for msg in result.data:
+        for msg in rows:
             metadata = msg.get("metadata", {})
             if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
                 products = metadata.get("products", [])
@@ -285,17 +362,13 @@ async def get_full_conversation_history(user_id: str, limit: int = MEMORY_CONTEX
         if not supabase_client:
             return []
 
-        result = await aexecute(supabase_client.table(MEMORY_TABLE)\
-            .select('role, content, metadata, created_at')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .limit(limit))
+        rows = await _fetch_recent_messages(user_id, limit)
 
-        if not result.data:
+        if not rows:
             return []
 
         # Reverse to get chronological order
-        messages = list(reversed(result.data))
+        messages = list(reversed(rows))
         logger.info(f"✓ Retrieved {len(messages)} full messages from memory")
         return messages
 
@@ -304,101 +377,183 @@ async def get_full_conversation_history(user_id: str, limit: int = MEMORY_CONTEX
         return []
 
 
-async def get_conversation_summary(user_id: str) -> dict:
+# ============================================================================
+# Pre-parsed messages — parse ครั้งเดียวตอน append แล้วเก็บใน context cache
+# (topic split / summary ไม่ต้อง regex scan history ซ้ำทุก turn)
+# ============================================================================
+
+# Common pest keywords not in DISEASE_PATTERNS (insects/mites)
+_PEST_KEYWORDS = ['เพลี้ย', 'หนอน', 'ด้วง', 'ไรแดง', 'ไรขาว', 'แมลง', 'หอยทาก', 'หอยเชอรี่', 'ปลวก', 'มด']
+
+# Topic-change keywords (user is done with previous topic)
+_TOPIC_BOUNDARY_WORDS = [
+    "ขอบคุณ", "โอเค", "oke", "ok", "อีกเรื่อง", "เปลี่ยนเรื่อง",
+    "ถามเรื่องอื่น", "เรื่องอื่น", "หัวข้ออื่น",
+]
+
+# Plant keywords (conversation summary)
+_PLANT_KEYWORDS = [
+    "ข้าว", "ทุเรียน", "มะม่วง", "ส้ม", "พริก", "ข้าวโพด", "อ้อย",
+    "ลำไย", "มันสำปะหลัง", "ยางพารา", "ปาล์ม", "ถั่ว", "ผัก"
+]
+
+
+def _metadata_product_names(metadata) -> list:
+    if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
+        return [p.get("product_name", "") for p in metadata.get("products", []) if p.get("product_name")]
+    return []
+
+
+def _format_message(role: str, content: str, product_names: list) -> str:
+    label = "ผู้ใช้" if role == "user" else "น้องลัดดา"
+    text = content[:MEMORY_CONTENT_PREVIEW]
+    if product_names:
+        text += f" (สินค้าที่แนะนำ: {', '.join(product_names[:3])})"
+    return f"{label}: {text}"
+
+
+def _extract_disease_or_pest(text: str) -> str:
+    """Extract disease/pest name from text for topic boundary detection."""
+    from app.services.disease.constants import DISEASE_PATTERNS_SORTED, get_canonical
+    from app.utils.text_processing import diacritics_match
+
+    # Check disease patterns first (canonical names)
+    for pattern in DISEASE_PATTERNS_SORTED:
+        if diacritics_match(text, pattern):
+            return get_canonical(pattern)
+    # Check pest keywords (return as-is for comparison)
+    for kw in _PEST_KEYWORDS:
+        if kw in text:
+            return kw
+    return ''
+
+
+def parse_memory_message(msg: dict) -> dict:
     """
-    สรุปบทสนทนา: หัวข้อที่คุย, สินค้าที่แนะนำ, พืชที่ถาม
-    ใช้สำหรับให้ AI เข้าใจ context ได้ดีขึ้น
+    Pre-parse one memory row → dict ที่ compute_active_topic / summary ใช้ได้ทันที
+
+    Keys: role, content, created_at, text (formatted), products (จาก metadata),
+          product (ชื่อสินค้าใน content), disease, boundary
     """
     try:
-        if not supabase_client:
-            return {}
-
-        result = await aexecute(supabase_client.table(MEMORY_TABLE)\
-            .select('role, content, metadata, created_at')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .limit(MEMORY_CONTEXT_WINDOW))
+        from app.services.chat.handler import extract_product_name_from_question
+    except ImportError:
+        extract_product_name_from_question = None
+
+    role = msg.get("role", "")
+    content = msg.get("content") or ""
+    products = _metadata_product_names(msg.get("metadata"))
+    is_user = role == "user"
+    return {
+        "role": role,
+        "content": content,
+        "created_at": msg.get("created_at", ""),
+        "text": _format_message(role, content, products),
+        "products": products,
+        "product": (extract_product_name_from_question(content) or "") if extract_product_name_from_question else "",
+        "disease": _extract_disease_or_pest(content) if is_user else "",
+        "boundary": is_user and any(word in content.lower() for word in _TOPIC_BOUNDARY_WORDS),
+    }
+
+
+def summarize_parsed_messages(parsed: list) -> dict:
+    """
+    สรุปบทสนทนา: หัวข้อที่คุย, สินค้าที่แนะนำ, พืชที่ถาม
+    parsed = pre-parsed messages (chronological, oldest first)
+    """
+    if not parsed:
+        return {}
 
-        if not result.data:
-            return {}
+    topics = []
+    products_mentioned = []
+    plants_mentioned = []
+    last_question = ""
 
-        # Extract topics and products from conversation
-        topics = []
-        products_mentioned = []
-        plants_mentioned = []
-        last_question = ""
+    for msg in reversed(parsed):  # newest first
+        content = msg.get("content", "")
 
-        # Plant keywords
-        plant_keywords = [
-            "ข้าว", "ทุเรียน", "มะม่วง", "ส้ม", "พริก", "ข้าวโพด", "อ้อย",
-            "ลำไย", "มันสำปะหลัง", "ยางพารา", "ปาล์ม", "ถั่ว", "ผัก"
-        ]
+        # Get last user question
+        if msg["role"] == "user" and not last_question:
+            last_question = content[:200]
 
-        for msg in result.data:
-            content = msg.get("content", "")
-            metadata = msg.get("metadata", {})
+        # Extract products from metadata
+        for name in msg.get("products", []):
+            if name not in products_mentioned:
+                products_mentioned.append(name)
+
+        # Extract plants from content
+        for plant in _PLANT_KEYWORDS:
+            if plant in content and plant not in plants_mentioned:
+                plants_mentioned.append(plant)
+
+        # Extract topics (simple keyword detection)
+        if msg["role"] == "user":
+            if any(kw in content for kw in ["โรค", "รักษา", "ป้องกัน"]):
+                if "โรคพืช" not in topics:
+                    topics.append("โรคพืช")
+            if any(kw in content for kw in ["แมลง", "เพลี้ย", "หนอน", "กำจัด"]):
+                if "แมลงศัตรูพืช" not in topics:
+                    topics.append("แมลงศัตรูพืช")
+            if any(kw in content for kw in ["หญ้า", "วัชพืช"]):
+                if "วัชพืช" not in topics:
+                    topics.append("วัชพืช")
+            if any(kw in content for kw in ["บำรุง", "ธาตุ", "ปุ๋ย", "ติดดอก", "ติดผล"]):
+                if "การบำรุง" not in topics:
+                    topics.append("การบำรุง")
+            if any(kw in content for kw in ["วิธีใช้", "อัตรา", "ผสม"]):
+                if "วิธีใช้สินค้า" not in topics:
+                    topics.append("วิธีใช้สินค้า")
+
+    # Fallback: if no products found via metadata, scan assistant message text
+    if not products_mentioned:
+        try:
+            from app.services.chat.handler import ICP_PRODUCT_NAMES
+            for msg in reversed(parsed):
+                if msg["role"] != "assistant":
+                    continue
+                content_lower = msg.get("content", "").lower()
+                for product_name, aliases in ICP_PRODUCT_NAMES.items():
+                    for alias in aliases:
+                        if alias.lower() in content_lower and product_name not in products_mentioned:
+                            products_mentioned.append(product_name)
+                if products_mentioned:
+                    break  # got products from most recent assistant message
+        except ImportError:
+            logger.warning("Could not import ICP_PRODUCT_NAMES for fallback product extraction")
+
+    return {
+        "topics": topics[:5],
+        "products_mentioned": products_mentioned[:10],
+        "plants_mentioned": plants_mentioned[:5],
+        "last_question": last_question,
+        "total_messages": len(parsed)
+    }
+
+
+async def _get_parsed_context(user_id: str) -> list:
+    """Pre-parsed last MEMORY_CONTEXT_WINDOW messages (chronological) — context cache, DB on cold cache"""
+    parsed = await _context_cache.get(user_id)
+    if parsed is not None:
+        return parsed
+
+    rows = await _fetch_recent_messages(user_id, MEMORY_CONTEXT_WINDOW)
+    parsed = [parse_memory_message(r) for r in reversed(rows)]
+    await _context_cache.put(user_id, parsed)
+    return parsed
 
-            # Get last user question
-            if msg["role"] == "user" and not last_question:
-                last_question = content[:200]
 
-            # Extract products from metadata
-            if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
-                products = metadata.get("products", [])
-                for p in products:
-                    name = p.get("product_name", "")
-                    if name and name not in products_mentioned:
-                        products_mentioned.append(name)
-
-            # Extract plants from content
-            for plant in plant_keywords:
-                if plant in content and plant not in plants_mentioned:
-                    plants_mentioned.append(plant)
-
-            # Extract topics (simple keyword detection)
-            if msg["role"] == "user":
-                if any(kw in content for kw in ["โรค", "รักษา", "ป้องกัน"]):
-                    if "โรคพืช" not in topics:
-                        topics.append("โรคพืช")
-                if any(kw in content for kw in ["แมลง", "เพลี้ย", "หนอน", "กำจัด"]):
-                    if "แมลงศัตรูพืช" not in topics:
-                        topics.append("แมลงศัตรูพืช")
-                if any(kw in content for kw in ["หญ้า", "วัชพืช"]):
-                    if "วัชพืช" not in topics:
-                        topics.append("วัชพืช")
-                if any(kw in content for kw in ["บำรุง", "ธาตุ", "ปุ๋ย", "ติดดอก", "ติดผล"]):
-                    if "การบำรุง" not in topics:
-                        topics.append("การบำรุง")
-                if any(kw in content for kw in ["วิธีใช้", "อัตรา", "ผสม"]):
-                    if "วิธีใช้สินค้า" not in topics:
-                        topics.append("วิธีใช้สินค้า")
-
-        # Fallback: if no products found via metadata, scan assistant message text
-        if not products_mentioned:
-            try:
-                from app.services.chat.handler import ICP_PRODUCT_NAMES
-                for msg in result.data:
-                    if msg["role"] != "assistant":
-                        continue
-                    content_lower = msg.get("content", "").lower()
-                    for product_name, aliases in ICP_PRODUCT_NAMES.items():
-                        for alias in aliases:
-                            if alias.lower() in content_lower and product_name not in products_mentioned:
-                                products_mentioned.append(product_name)
-                    if products_mentioned:
-                        break  # got products from most recent assistant message
-            except ImportError:
-                logger.warning("Could not import ICP_PRODUCT_NAMES for fallback product extraction")
-
-        summary = {
-            "topics": topics[:5],
-            "products_mentioned": products_mentioned[:10],
-            "plants_mentioned": plants_mentioned[:5],
-            "last_question": last_question,
-            "total_messages": len(result.data)
-        }
+async def get_conversation_summary(user_id: str) -> dict:
+    """
+    สรุปบทสนทนา: หัวข้อที่คุย, สินค้าที่แนะนำ, พืชที่ถาม
+    ใช้สำหรับให้ AI เข้าใจ context ได้ดีขึ้น
+    """
+    try:
+        if not supabase_client:
+            return {}
 
-        logger.info(f"✓ Conversation summary: {len(topics)} topics, {len(products_mentioned)} products")
+        summary = summarize_parsed_messages(await _get_parsed_context(user_id))
+        if summary:
+            logger.info(f"✓ Conversation summary: {len(summary['topics'])} topics, {len(summary['products_mentioned'])} products")
         return summary
 
     except Exception as e:
@@ -406,188 +561,93 @@ async def get_conversation_summary(user_id: str) -> dict:
         return {}
 
 
-def compute_active_topic(formatted_messages: list, current_query: str) -> tuple:
+def split_active_topic(parsed: list, current_query: str) -> tuple:
     """
-    แบ่ง messages ออกเป็น active topic (เกี่ยวกับคำถามปัจจุบัน) กับ past topics.
-
-    Scan จากหลังมาหน้า (ล่าสุดก่อน). ข้อความเป็น active topic จนกว่าจะเจอ
-    topic boundary — คือข้อความที่พูดถึงสินค้า/โรค/แมลงตัวอื่น หรือมีคำบ่งชี้เปลี่ยนหัวข้อ.
-
-    Args:
-        formatted_messages: list of dicts with keys: role, content, metadata
-                            (chronological order, oldest first)
-        current_query: คำถามปัจจุบันของ user
+    compute_active_topic บน pre-parsed messages (ดู parse_memory_message)
+    ต้อง extract เฉพาะ current_query — history parse ไว้แล้ว
 
     Returns:
         (active_messages: list[str], past_summary: str, recent_products: list[str])
-        active_messages = formatted strings "ผู้ใช้: ..." or "น้องลัดดา: ..."
-        past_summary = short summary of past topics (or "")
-        recent_products = product names from the last assistant recommendation in active topic
     """
+    if not parsed:
+        return [], "", []
+
     try:
-        from app.services.chat.handler import extract_product_name_from_question, ICP_PRODUCT_NAMES
+        from app.services.chat.handler import extract_product_name_from_question
     except ImportError:
         # Fallback: return all messages as active, no past summary
-        all_formatted = []
-        for msg in formatted_messages:
-            role = "ผู้ใช้" if msg["role"] == "user" else "น้องลัดดา"
-            content = msg["content"][:MEMORY_CONTENT_PREVIEW]
-            metadata = msg.get("metadata", {})
-            if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
-                products = metadata.get("products", [])
-                if products:
-                    pnames = [p.get("product_name", "") for p in products[:3]]
-                    content += f" (สินค้าที่แนะนำ: {', '.join(pnames)})"
-            all_formatted.append(f"{role}: {content}")
-        return all_formatted, "", []
+        return [m["text"] for m in parsed], "", []
 
     # --- Extract entities from current query ---
     current_product = extract_product_name_from_question(current_query)
-
-    # Extract disease/pest from current query for boundary detection
-    from app.services.disease.constants import DISEASE_PATTERNS_SORTED as _DP_MEM, get_canonical as _gc_mem
-    from app.utils.text_processing import diacritics_match as _dm_mem
-
-    # Common pest keywords not in DISEASE_PATTERNS (insects/mites)
-    _PEST_KEYWORDS = ['เพลี้ย', 'หนอน', 'ด้วง', 'ไรแดง', 'ไรขาว', 'แมลง', 'หอยทาก', 'หอยเชอรี่', 'ปลวก', 'มด']
-
-    def _extract_disease_or_pest(text: str) -> str:
-        """Extract disease/pest name from text for topic boundary detection."""
-        # Check disease patterns first (canonical names)
-        for _pat in _DP_MEM:
-            if _dm_mem(text, _pat):
-                return _gc_mem(_pat)
-        # Check pest keywords (return as-is for comparison)
-        for kw in _PEST_KEYWORDS:
-            if kw in text:
-                return kw
-        return ''
-
     current_disease = _extract_disease_or_pest(current_query)
 
-    # Topic-change keywords (user is done with previous topic)
-    _TOPIC_BOUNDARY_WORDS = [
-        "ขอบคุณ", "โอเค", "oke", "ok", "อีกเรื่อง", "เปลี่ยนเรื่อง",
-        "ถามเรื่องอื่น", "เรื่องอื่น", "หัวข้ออื่น",
-    ]
-
-    # Format all messages first
-    formatted = []
-    for msg in formatted_messages:
-        role = "ผู้ใช้" if msg["role"] == "user" else "น้องลัดดา"
-        content = msg["content"][:MEMORY_CONTENT_PREVIEW]
-        metadata = msg.get("metadata", {})
-        if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
-            products = metadata.get("products", [])
-            if products:
-                pnames = [p.get("product_name", "") for p in products[:3]]
-                content += f" (สินค้าที่แนะนำ: {', '.join(pnames)})"
-        formatted.append({
-            "text": f"{role}: {content}",
-            "role": msg["role"],
-            "content": msg["content"],
-            "metadata": metadata,
-        })
-
-    if not formatted:
-        return [], ""
+    def _boundary_at(i: int) -> int:
+        # Include the assistant reply to this boundary user msg in past too
+        if i + 1 < len(parsed) and parsed[i + 1]["role"] == "assistant":
+            return i + 1
+        return i
 
     # --- Scan from newest to oldest to find topic boundary ---
-    boundary_idx = -1  # index in formatted (chronological) where boundary is found
-    for i in range(len(formatted) - 1, -1, -1):
-        entry = formatted[i]
-        raw_content = entry["content"]
+    boundary_idx = -1  # index in parsed (chronological) where boundary is found
+    for i in range(len(parsed) - 1, -1, -1):
+        entry = parsed[i]
 
         # Only user messages can be topic boundaries
         if entry["role"] != "user":
             continue
 
         # Check for topic-change keywords
-        content_lower = raw_content.lower()
-        if any(word in content_lower for word in _TOPIC_BOUNDARY_WORDS):
-            # Include the assistant reply (if any) in past too
-            if i + 1 < len(formatted) and formatted[i + 1]["role"] == "assistant":
-                boundary_idx = i + 1
-            else:
-                boundary_idx = i
+        if entry["boundary"]:
+            boundary_idx = _boundary_at(i)
             break
 
         # Check if user mentioned a DIFFERENT product than current query
-        msg_product = extract_product_name_from_question(raw_content)
+        msg_product = entry["product"]
         if msg_product and current_product and msg_product != current_product:
-            # Include the assistant reply to this boundary user msg in past too
-            if i + 1 < len(formatted) and formatted[i + 1]["role"] == "assistant":
-                boundary_idx = i + 1
-            else:
-                boundary_idx = i
+            boundary_idx = _boundary_at(i)
             break
 
         # Check if user mentioned a DIFFERENT disease/pest than current query
         if current_disease:
-            msg_disease = _extract_disease_or_pest(raw_content)
+            msg_disease = entry["disease"]
             if msg_disease and msg_disease != current_disease:
-                # Include the assistant reply to this boundary user msg in past too
-                if i + 1 < len(formatted) and formatted[i + 1]["role"] == "assistant":
-                    boundary_idx = i + 1
-                else:
-                    boundary_idx = i
+                boundary_idx = _boundary_at(i)
                 break
 
-        # Check if current query has a product but this old user message asks about
-        # a different topic (disease/pest) without the current product
-        if current_product and not msg_product:
-            # This older message is about something else — could be same topic or not
-            # We only break if we already found active messages below this
-            pass
-
     # --- Helper: extract recent products from active entries (newest assistant msg) ---
     def _extract_recent_products(entries):
         """Find product names from the last assistant message with product metadata."""
         for entry in reversed(entries):
-            if entry["role"] != "assistant":
-                continue
-            metadata = entry.get("metadata", {})
-            if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
-                products = metadata.get("products", [])
-                pnames = [p.get("product_name", "") for p in products if p.get("product_name")]
-                if pnames:
-                    return pnames
+            if entry["role"] == "assistant" and entry["products"]:
+                return list(entry["products"])
         return []
 
     # --- Split into active / past ---
     if boundary_idx < 0:
         # No boundary found — all messages are active topic
-        active_texts = [f["text"] for f in formatted]
-        recent_products = _extract_recent_products(formatted)
-        return active_texts, "", recent_products
+        return [m["text"] for m in parsed], "", _extract_recent_products(parsed)
 
-    active_texts = [f["text"] for f in formatted[boundary_idx + 1:]]
-    past_entries = formatted[:boundary_idx + 1]
+    active_entries = parsed[boundary_idx + 1:]
+    past_entries = parsed[:boundary_idx + 1]
+    active_texts = [m["text"] for m in active_entries]
 
     # If active is empty (boundary is the very last msg), include boundary msg itself
     if not active_texts:
-        active_texts = [formatted[boundary_idx]["text"]]
-        past_entries = formatted[:boundary_idx]
+        active_texts = [parsed[boundary_idx]["text"]]
+        past_entries = parsed[:boundary_idx]
 
     # Extract recent products from active topic entries only
-    active_entries = formatted[boundary_idx + 1:] if boundary_idx >= 0 else formatted
     recent_products = _extract_recent_products(active_entries)
 
     # --- Build past summary ---
     past_products = set()
     past_topics = []
     for entry in past_entries:
-        # Extract products from metadata
-        metadata = entry.get("metadata", {})
-        if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
-            for p in metadata.get("products", []):
-                name = p.get("product_name", "")
-                if name:
-                    past_products.add(name)
-        # Extract products from text
-        p = extract_product_name_from_question(entry["content"])
-        if p:
-            past_products.add(p)
+        # Extract products from metadata + text
+        past_products.update(entry["products"])
+        if entry["product"]:
+            past_products.add(entry["product"])
         # Collect user questions as topic hints
         if entry["role"] == "user":
             q = entry["content"][:80].strip()
@@ -606,12 +666,36 @@ def compute_active_topic(formatted_messages: list, current_query: str) -> tuple:
     return active_texts, past_summary, recent_products
 
 
+def compute_active_topic(formatted_messages: list, current_query: str) -> tuple:
+    """
+    แบ่ง messages ออกเป็น active topic (เกี่ยวกับคำถามปัจจุบัน) กับ past topics.
+
+    Scan จากหลังมาหน้า (ล่าสุดก่อน). ข้อความเป็น active topic จนกว่าจะเจอ
+    topic boundary — คือข้อความที่พูดถึงสินค้า/โรค/แมลงตัวอื่น หรือมีคำบ่งชี้เปลี่ยนหัวข้อ.
+
+    Args:
+        formatted_messages: list of dicts with keys: role, content, metadata
+                            (chronological order, oldest first)
+        current_query: คำถามปัจจุบันของ user
+
+    Returns:
+        (active_messages: list[str], past_summary: str, recent_products: list[str])
+        active_messages = formatted strings "ผู้ใช้: ..." or "น้องลัดดา: ..."
+        past_summary = short summary of past topics (or "")
+        recent_products = product names from the last assistant recommendation in active topic
+    """
+    return split_active_topic([parse_memory_message(m) for m in formatted_messages], current_query)
+
+
 async def get_enhanced_context(user_id: str, current_query: str = "") -> str:
     """
     สร้าง context แบบ enhanced สำหรับ AI
     รวม: บทสนทนาปัจจุบัน (topic-aware) + สรุปหัวข้อก่อนหน้า + สินค้าที่แนะนำ
     ใช้ structured format เพื่อให้ AI เข้าใจง่ายขึ้น
 
+    Messages มาจาก per-user context cache (pre-parsed, อัปเดตตอน add_to_memory)
+    → อ่าน DB เฉพาะตอน cache ว่าง
+
     Args:
         user_id: User identifier
         current_query: คำถามปัจจุบันของ user (ใช้สำหรับแยก active topic)
@@ -620,19 +704,20 @@ async def get_enhanced_context(user_id: str, current_query: str = "") -> str:
         if not supabase_client:
             return ""
 
-        # Fetch raw messages from DB
-        result = await aexecute(supabase_client.table(MEMORY_TABLE)\
-            .select('role, content, metadata, created_at')\
-            .eq('user_id', user_id)\
-            .order('created_at', desc=True)\
-            .limit(MEMORY_CONTEXT_WINDOW))
+        # Pre-parsed messages (chronological, oldest first)
+        messages = await _get_parsed_context(user_id)
 
-        if not result.data:
+        # ข้อความของ turn นี้ (add_to_memory วิ่งคู่กัน → อยู่ใน write buffer / context cache แล้ว)
+        # ไม่ใช่ context: ตัดออกก่อนเช็ค session timeout ไม่งั้น gap = 0 เสมอ และถามซ้ำตัวเองใน context
+        if (current_query and messages and messages[-1].get("role") == "user"
+                and messages[-1].get("content") == current_query):
+            messages = messages[:-1]
+
+        if not messages:
             return ""
 
         # --- Session timeout: ถ้าข้อความล่าสุดเก่ากว่า N ชม. → ไม่ส่ง context เก่า ---
-        latest_msg = result.data[0]  # newest (desc order)
-        latest_created = latest_msg.get("created_at", "")
+        latest_created = messages[-1].get("created_at", "")
         if latest_created and MEMORY_SESSION_TIMEOUT_HOURS > 0:
             try:
                 last_time = datetime.fromisoformat(latest_created.replace("Z", "+00:00"))
@@ -644,26 +729,13 @@ async def get_enhanced_context(user_id: str, current_query: str = "") -> str:
             except Exception:
                 pass  # parse error — proceed normally
 
-        # Chronological order (oldest first)
-        messages = list(reversed(result.data))
-
         # --- Topic-aware splitting ---
         recent_products = []
         if current_query:
-            active_texts, past_summary, recent_products = compute_active_topic(messages, current_query)
+            active_texts, past_summary, recent_products = split_active_topic(messages, current_query)
         else:
             # No current query — format all messages as before (backward compat)
-            active_texts = []
-            for msg in messages:
-                role = "ผู้ใช้" if msg["role"] == "user" else "น้องลัดดา"
-                content = msg["content"][:MEMORY_CONTENT_PREVIEW]
-                metadata = msg.get("metadata", {})
-                if isinstance(metadata, dict) and metadata.get("type") == "product_recommendation":
-                    products = metadata.get("products", [])
-                    if products:
-                        pnames = [p.get("product_name", "") for p in products[:3]]
-                        content += f" (สินค้าที่แนะนำ: {', '.join(pnames)})"
-                active_texts.append(f"{role}: {content}")
+            active_texts = [m["text"] for m in messages]
             past_summary = ""
 
         # Build structured enhanced context
@@ -685,8 +757,8 @@ async def get_enhanced_context(user_id: str, current_query: str = "") -> str:
             parts.append("[สรุปหัวข้อก่อนหน้า]")
             parts.append(past_summary)
 
-        # Section 3: Get conversation summary for products/topics metadata
-        summary = await get_conversation_summary(user_id)
+        # Section 3: Conversation summary for products/topics metadata (same cached messages)
+        summary = summarize_parsed_messages(messages)
 
         if summary:
             if summary.get("products_mentioned"):
@@ -0,0 +1,232 @@
+"""
+Memory Write Buffer — write-behind สำหรับ conversation memory (memory_chatladda)
+
+add_to_memory() เดิม = INSERT 1 แถว + cleanup (TTL DELETE, SELECT ids, DELETE in_) ทุกข้อความ
+→ ~8 DB round trips ต่อ chat turn บน request path
+
+ตอนนี้:
+- append() เป็น sync, O(1): ใส่ row ลง per-user ring buffer + pending list (ไม่มี I/O)
+- flush แบบ bulk INSERT เมื่อครบ MEMORY_FLUSH_MAX_ROWS หรือผ่านไป MEMORY_FLUSH_INTERVAL_MS
+- ทุก MEMORY_TRIM_INTERVAL วินาที flush task เรียก trimmer (TTL + MAX_MEMORY_MESSAGES)
+  เฉพาะ users ที่มีข้อความใหม่ — ไม่ทำทุกครั้งที่เขียน
+- reader ใช้ merge(): DB rows + ring buffer (read-your-writes ก่อน flush เสร็จ)
+
+created_at ถูกกำหนดตอน append (ไม่ใช่ตอน INSERT) → ลำดับข้อความถูกต้องแม้ flush ทีหลัง
+Flush ล้มเหลว → rows กลับเข้า pending (จำกัด MEMORY_BUFFER_MAX_PENDING แถว) แล้วลองใหม่รอบถัดไป
+
+Note: ring buffer เป็น per-process — worker อื่นเห็นข้อความหลัง flush (≤ flush interval)
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+
+from app.config import (
+    MEMORY_FLUSH_INTERVAL_MS,
+    MEMORY_FLUSH_MAX_ROWS,
+    MEMORY_BUFFER_PER_USER,
+    MEMORY_BUFFER_MAX_USERS,
+    MEMORY_BUFFER_MAX_PENDING,
+    MEMORY_TRIM_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_INSERT_CHUNK = 500
+
+
+def _parse_ts(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return _EPOCH
+
+
+def _row_identity(row: dict) -> tuple:
+    return (row.get("role"), row.get("content"), _parse_ts(row.get("created_at")))
+
+
+class MemoryWriteBuffer:
+    """Per-user ring buffers + pending rows, flushed in bulk by a background task."""
+
+    def __init__(
+        self,
+        writer: Callable[[List[dict]], Awaitable[None]],
+        trimmer: Optional[Callable[[List[str]], Awaitable[None]]] = None,
+        flush_interval_ms: float = MEMORY_FLUSH_INTERVAL_MS,
+        flush_max_rows: int = MEMORY_FLUSH_MAX_ROWS,
+        ring_size: int = MEMORY_BUFFER_PER_USER,
+        max_users: int = MEMORY_BUFFER_MAX_USERS,
+        max_pending: int = MEMORY_BUFFER_MAX_PENDING,
+        trim_interval: float = MEMORY_TRIM_INTERVAL,
+    ):
+        self.writer = writer
+        self.trimmer = trimmer
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_max_rows = flush_max_rows
+        self.ring_size = ring_size
+        self.max_users = max_users
+        self.max_pending = max_pending
+        self.trim_interval = trim_interval
+
+        self._rings: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+        self._pending: List[dict] = []
+        self._dirty_users: set = set()
+        self._last_trim = time.monotonic()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stats = {
+            "appended": 0,
+            "flushes": 0,
+            "rows_flushed": 0,
+            "flush_errors": 0,
+            "dropped": 0,
+            "trims": 0,
+        }
+
+    # =====================================================================
+    # Write path (no I/O)
+    # =====================================================================
+
+    def append(self, row: dict) -> dict:
+        """Buffer one memory row; flush is scheduled in the background."""
+        row = dict(row)
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        user_id = row["user_id"]
+
+        ring = self._rings.get(user_id)
+        if ring is None:
+            ring = self._rings[user_id] = deque(maxlen=self.ring_size)
+        self._rings.move_to_end(user_id)
+        ring.append(row)
+        while len(self._rings) > self.max_users:
+            self._rings.popitem(last=False)
+
+        self._pending.append(row)
+        self._dirty_users.add(user_id)
+        self._stats["appended"] += 1
+
+        if len(self._pending) >= self.flush_max_rows:
+            self._schedule_flush(immediate=True)
+        elif self._flush_handle is None:
+            self._schedule_flush()
+        return row
+
+    def _schedule_flush(self, immediate: bool = False) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (sync caller) — next append/drain() will flush
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if immediate:
+            self._start_flush()
+        else:
+            self._flush_handle = loop.call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+        # flush ที่กำลังทำงานอยู่จะ reschedule เองถ้ายังมี pending เหลือ
+
+    async def flush(self) -> int:
+        """Bulk INSERT all pending rows. Returns rows written."""
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            written = 0
+            try:
+                for start in range(0, len(rows), _INSERT_CHUNK):
+                    chunk = rows[start:start + _INSERT_CHUNK]
+                    await self.writer(chunk)
+                    written += len(chunk)
+            except Exception as e:
+                self._stats["flush_errors"] += 1
+                failed = rows[written:]
+                self._pending = failed + self._pending
+                overflow = len(self._pending) - self.max_pending
+                if overflow > 0:
+                    self._stats["dropped"] += overflow
+                    self._pending = self._pending[overflow:]
+                    logger.error(f"Memory buffer: dropped {overflow} oldest unflushed rows")
+                logger.error(f"Memory buffer flush failed ({len(failed)} rows requeued): {e}")
+
+            if written:
+                self._stats["flushes"] += 1
+                self._stats["rows_flushed"] += written
+                logger.info(f"✓ Memory buffer flushed {written} rows in {(written - 1) // _INSERT_CHUNK + 1} insert(s)")
+
+            if self.trimmer and self._dirty_users and time.monotonic() - self._last_trim >= self.trim_interval:
+                await self._trim()
+
+        if self._pending:
+            self._schedule_flush()
+        return written
+
+    async def _trim(self) -> None:
+        users, self._dirty_users = sorted(self._dirty_users), set()
+        self._last_trim = time.monotonic()
+        try:
+            await self.trimmer(users)
+            self._stats["trims"] += 1
+        except Exception as e:
+            logger.error(f"Memory trim failed: {e}")
+
+    async def drain(self) -> int:
+        """Flush everything now (shutdown / before destructive operations)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+        return await self.flush() if self._pending else 0
+
+    # =====================================================================
+    # Read path
+    # =====================================================================
+
+    def recent(self, user_id: str, limit: int) -> List[dict]:
+        """Buffered rows for a user, newest first."""
+        ring = self._rings.get(user_id)
+        if not ring:
+            return []
+        return list(reversed(ring))[:limit]
+
+    def merge(self, user_id: str, db_rows: Iterable[dict], limit: int) -> List[dict]:
+        """DB rows (newest first) + buffered rows, de-duplicated, newest first."""
+        ring = self._rings.get(user_id)
+        db_rows = list(db_rows or [])
+        if not ring:
+            return db_rows[:limit]
+        seen = set()
+        merged = []
+        for row in list(ring) + db_rows:
+            ident = _row_identity(row)
+            if ident in seen:
+                continue
+            seen.add(ident)
+            merged.append(row)
+        merged.sort(key=lambda r: _parse_ts(r.get("created_at")), reverse=True)
+        return merged[:limit]
+
+    async def discard(self, user_id: str) -> None:
+        """Forget a user's buffered rows (clear_memory) — waits for an in-flight flush first."""
+        self._rings.pop(user_id, None)
+        self._pending = [r for r in self._pending if r["user_id"] != user_id]
+        self._dirty_users.discard(user_id)
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = len(self._pending)
+        stats["users"] = len(self._rings)
+        stats["dirty_users"] = len(self._dirty_users)
+        return stats
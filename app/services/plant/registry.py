@@ -21,6 +21,7 @@ import re
 import time
 from typing import Dict, List, Optional, Set
 
+from app.utils.aho_corasick import AhoCorasick
 from app.utils.async_db import aexecute
 
 logger = logging.getLogger(__name__)
@@ -79,6 +80,8 @@ class PlantRegistry:
         self._canonical_to_aliases: Dict[str, List[str]] = {}
         # Flat sorted list (longest first) used for matching
         self._sorted_names: List[str] = []
+        # Compiled over _sorted_names — one pass per extract()
+        self._matcher: AhoCorasick = AhoCorasick(())
         # Lookup from any-name (alias/typo/canonical) → canonical
         self._lookup: Dict[str, str] = {}
         self._loaded: bool = False
@@ -174,6 +177,7 @@ class PlantRegistry:
         all_match_strings = list(self._lookup.keys())
         all_match_strings.sort(key=len, reverse=True)
         self._sorted_names = all_match_strings
+        self._matcher = AhoCorasick(all_match_strings)
 
     # -------------------------------------------------------------------------
     # Refresh
@@ -205,11 +209,10 @@ class PlantRegistry:
         """
         if not self._loaded or not question:
             return None
-        q = question.lower()
-        for name in self._sorted_names:
-            if name in q:
-                return self._lookup[name]
-        return None
+        pid = self._matcher.first(question.lower())
+        if pid is None:
+            return None
+        return self._lookup[self._matcher.patterns[pid]]
 
     def get_canonical_list(self) -> List[str]:
         return sorted(self._canonical_to_aliases.keys())
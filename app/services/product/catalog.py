@@ -0,0 +1,253 @@
+"""
+Product Catalog — in-process snapshot of the products table with column indexes.
+
+The products table is small (~100 rows), so instead of one Supabase ilike/or_
+round trip per retrieval fallback we keep every row in memory and answer those
+filters from indexes:
+- Value index (exact value → ids) for product_category, strategy, physical_form
+- Character-trigram index (trigram → ids) for the pest columns + applicable_crops
+  → substring (ilike '%kw%') lookups only verify the candidate rows
+
+Refresh compares `row_hash` (written by scripts/sync_sheets_to_supabase.py) and
+re-fetches only rows that were added or changed.
+
+Usage:
+    catalog = ProductCatalog.get_instance()
+    await catalog.load_from_db(supabase_client)
+    ids = catalog.ids_containing('insecticides', 'เพลี้ยไฟ') & catalog.ids_in('strategy', ['Skyrocket'])
+    rows = catalog.rows(ids, limit=5)
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.utils.async_db import aexecute
+from app.utils.pest_columns import PEST_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Columns used by RetrievalAgent._build_doc_from_row — excludes embedding (1536 floats), row_hash, timestamps
+PRODUCT_COLUMNS = (
+    "id, product_name, common_name_th, active_ingredient, "
+    "fungicides, insecticides, herbicides, biostimulant, pgr_hormones, fertilizer, "
+    "applicable_crops, product_category, how_to_use, usage_rate, usage_period, "
+    "selling_point, action_characteristics, absorption_method, strategy, "
+    "package_size, physical_form, phytotoxicity, chemical_group_rac, caution_notes, aliases"
+)
+
+_NGRAM = 3
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+
+class ProductCatalog:
+    """
+    Singleton in-memory copy of the products table.
+
+    Provides (all ids are str, matching RetrievedDocument.id):
+    - ids_containing(column, keyword) — case-insensitive substring (= ilike '%kw%')
+    - ids_containing_any(columns, keywords) — OR across columns × keywords (= .or_(...))
+    - ids_equal(column, value) / ids_in(column, values) — exact match (= .eq / .in_)
+    - rows(ids, limit) — rows in id order (= default PostgREST order)
+    """
+
+    _instance: Optional['ProductCatalog'] = None
+
+    _AUTO_REFRESH_INTERVAL = 300  # 5 minutes — refresh only pulls (id, row_hash)
+
+    TEXT_INDEX_COLUMNS = tuple(PEST_COLUMNS) + ('applicable_crops',)
+    VALUE_INDEX_COLUMNS = ('product_category', 'strategy', 'physical_form')
+
+    def __init__(self):
+        self._rows: Dict[str, dict] = {}                       # id → row
+        self._hashes: Dict[str, Optional[str]] = {}            # id → row_hash
+        self._order: Dict[str, int] = {}                       # id → position in id order
+        self._value_index: Dict[str, Dict[str, Set[str]]] = {}  # column → value → ids
+        self._text_lower: Dict[str, Dict[str, str]] = {}       # column → id → lowercase text
+        self._ngram_index: Dict[str, Dict[str, Set[str]]] = {}  # column → trigram → ids
+        self._loaded: bool = False
+        self._load_time: float = 0
+
+    @classmethod
+    def get_instance(cls) -> 'ProductCatalog':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # =====================================================================
+    # Loading
+    # =====================================================================
+
+    async def load_from_db(self, supabase_client) -> bool:
+        """Load every product row from DB. Keeps the previous snapshot on failure."""
+        try:
+            if supabase_client is None:
+                raise RuntimeError("supabase_client is None")
+
+            from app.config import PRODUCT_TABLE
+            result = await aexecute(supabase_client.table(PRODUCT_TABLE).select(f"{PRODUCT_COLUMNS}, row_hash"))
+            if not result.data:
+                raise RuntimeError("No products returned from DB")
+
+            self.load_rows(result.data)
+            logger.info(f"ProductCatalog: loaded {len(self._rows)} products from DB")
+        except Exception as e:
+            logger.warning(f"ProductCatalog: DB load failed ({e}), retrieval falls back to DB queries")
+        return self._loaded
+
+    async def refresh_if_stale(self, supabase_client) -> bool:
+        """
+        Incremental refresh by row_hash if more than _AUTO_REFRESH_INTERVAL seconds
+        since last load. Only added/changed rows are re-fetched.
+        Returns True if a refresh check was performed.
+        """
+        if not self._loaded:
+            return await self.load_from_db(supabase_client)
+        elapsed = time.time() - self._load_time
+        if elapsed < self._AUTO_REFRESH_INTERVAL:
+            return False
+
+        try:
+            from app.config import PRODUCT_TABLE
+            result = await aexecute(supabase_client.table(PRODUCT_TABLE).select('id, row_hash'))
+            if not result.data:
+                raise RuntimeError("No products returned from DB")
+
+            remote = {str(r['id']): r.get('row_hash') for r in result.data}
+            changed = [i for i, h in remote.items() if h is None or self._hashes.get(i) != h or i not in self._rows]
+            removed = set(self._rows) - set(remote)
+
+            rows = dict(self._rows)
+            for i in removed:
+                rows.pop(i, None)
+            if changed:
+                fetched = await aexecute(supabase_client.table(PRODUCT_TABLE)
+                                         .select(f"{PRODUCT_COLUMNS}, row_hash")
+                                         .in_('id', [int(i) for i in changed if i.isdigit()]))
+                for row in fetched.data or []:
+                    rows[str(row['id'])] = row
+
+            if changed or removed:
+                self.load_rows(list(rows.values()))
+                logger.info(f"ProductCatalog: refreshed {len(changed)} changed, {len(removed)} removed")
+            else:
+                self._load_time = time.time()
+        except Exception as e:
+            logger.warning(f"ProductCatalog: refresh failed ({e}), keeping current snapshot")
+            self._load_time = time.time()
+        return True
+
+    def load_rows(self, rows: List[dict]) -> None:
+        """Build snapshot + indexes from row dicts (also used by tests)."""
+        by_id = {str(r['id']): r for r in rows if r.get('id') is not None}
+        ordered = sorted(by_id, key=lambda i: (0, int(i)) if i.isdigit() else (1, i))
+
+        value_index: Dict[str, Dict[str, Set[str]]] = {c: {} for c in self.VALUE_INDEX_COLUMNS}
+        text_lower: Dict[str, Dict[str, str]] = {c: {} for c in self.TEXT_INDEX_COLUMNS}
+        ngram_index: Dict[str, Dict[str, Set[str]]] = {c: {} for c in self.TEXT_INDEX_COLUMNS}
+        for row_id in ordered:
+            row = by_id[row_id]
+            for col in self.VALUE_INDEX_COLUMNS:
+                val = row.get(col)
+                if val:
+                    value_index[col].setdefault(str(val), set()).add(row_id)
+            for col in self.TEXT_INDEX_COLUMNS:
+                text = (row.get(col) or '').lower()
+                if not text:
+                    continue
+                text_lower[col][row_id] = text
+                for gram in _ngrams(text):
+                    ngram_index[col].setdefault(gram, set()).add(row_id)
+
+        # Swap in one go — readers never see a half-built index
+        self._rows = by_id
+        self._hashes = {i: r.get('row_hash') for i, r in by_id.items()}
+        self._order = {i: pos for pos, i in enumerate(ordered)}
+        self._value_index = value_index
+        self._text_lower = text_lower
+        self._ngram_index = ngram_index
+        self._loaded = bool(by_id)
+        self._load_time = time.time()
+
+    # =====================================================================
+    # Lookups
+    # =====================================================================
+
+    def all_ids(self) -> Set[str]:
+        return set(self._rows)
+
+    def row_hashes(self) -> Dict[str, Optional[str]]:
+        return dict(self._hashes)
+
+    def get(self, row_id) -> Optional[dict]:
+        return self._rows.get(str(row_id))
+
+    def rows(self, ids: Optional[Iterable[str]] = None, limit: Optional[int] = None) -> List[dict]:
+        """Rows for ids (all rows if None), sorted by id like an unordered PostgREST select."""
+        order = self._order
+        selected = sorted((i for i in (self._rows if ids is None else ids) if i in order), key=order.__getitem__)
+        if limit is not None:
+            selected = selected[:limit]
+        return [self._rows[i] for i in selected]
+
+    def ids_equal(self, column: str, value: str) -> Set[str]:
+        """Exact match (= .eq(column, value))."""
+        if column in self._value_index:
+            return set(self._value_index[column].get(value, ()))
+        return {i for i, r in self._rows.items() if r.get(column) == value}
+
+    def ids_in(self, column: str, values: Iterable[str]) -> Set[str]:
+        """Exact match against any value (= .in_(column, values))."""
+        ids: Set[str] = set()
+        for value in values:
+            ids |= self.ids_equal(column, value)
+        return ids
+
+    def ids_containing(self, column: str, keyword: str) -> Set[str]:
+        """Case-insensitive substring match (= .ilike(column, '%keyword%'))."""
+        kw = (keyword or '').lower()
+        if not kw:
+            return {i for i, r in self._rows.items() if r.get(column) is not None}
+
+        if column in self._value_index:
+            ids: Set[str] = set()
+            for value, value_ids in self._value_index[column].items():
+                if kw in value.lower():
+                    ids |= value_ids
+            return ids
+
+        if column in self._ngram_index:
+            texts = self._text_lower[column]
+            if len(kw) < _NGRAM:
+                return {i for i, text in texts.items() if kw in text}
+            index = self._ngram_index[column]
+            candidates: Optional[Set[str]] = None
+            for gram in _ngrams(kw):
+                posting = index.get(gram)
+                if not posting:
+                    return set()
+                candidates = set(posting) if candidates is None else candidates & posting
+                if not candidates:
+                    return set()
+            return {i for i in candidates if kw in texts[i]}
+
+        return {i for i, r in self._rows.items() if kw in (r.get(column) or '').lower()}
+
+    def ids_containing_any(self, columns: Iterable[str], keywords: Iterable[str]) -> Set[str]:
+        """OR of substring matches across columns × keywords (= .or_('col.ilike.%kw%,...'))."""
+        columns = list(columns)
+        ids: Set[str] = set()
+        for kw in keywords:
+            for col in columns:
+                ids |= self.ids_containing(col, kw)
+        return ids
@@ -0,0 +1,121 @@
+"""
+Fuzzy alias index — fast ProductRegistry.fuzzy_match with the same results.
+
+เดิม: SequenceMatcher ทุก token × ทุก alias × ทุก sliding window → หลายพัน ratio() ต่อ miss
+
+ตอนนี้ (ผลเหมือนเดิมทุกกรณี — score ยังเป็น SequenceMatcher.ratio ที่ threshold เดิม):
+1. index ตอน build: ตัวนับตัวอักษรของทุก alias (numpy matrix, alias × char)
+2. bound: ratio = 2·M/(len_a+len_b) และ M ≤ จำนวนตัวอักษรที่ซ้ำกัน (multiset overlap)
+   → คำนวณ upper bound ของทุก (token|window, alias) แบบ vectorized ในครั้งเดียว
+   → ตัดคู่ที่ bound < threshold ทิ้ง (ไม่มีทางผ่าน)
+3. เรียก ratio() จริงเฉพาะคู่ที่เหลือ เรียง bound มาก → น้อย หยุดเมื่อ bound < best score
+4. tie → ลำดับเดียวกับ loop เดิม (token → alias → direct ก่อน window ซ้ายไปขวา)
+
+Overlap bound (n-gram n=1) ตัดได้อย่างปลอดภัยที่ 0.75 แม้ token 4 ตัวอักษร — trigram filter
+หรือ edit-distance แทน ratio จะทำให้บางชื่อที่เคยผ่าน 0.75 หลุด/เพิ่ม
+"""
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'[\u0E00-\u0E7F]+|[a-zA-Z]+')  # same tokens as the old fuzzy_match
+_MIN_TOKEN_LEN = 4
+_MIN_WINDOW_ALIAS_LEN = 3
+
+
+class FuzzyAliasIndex:
+    """Character-count index over aliases; candidates pruned by overlap bound, scored by SequenceMatcher."""
+
+    def __init__(self, aliases: Sequence[Tuple[str, str]]):
+        """aliases: (alias_lower, canonical) in the registry's alias_index order."""
+        self.aliases: List[str] = [alias for alias, _ in aliases]
+        self.canonicals: List[str] = [canonical for _, canonical in aliases]
+        self._lengths = np.array([len(a) for a in self.aliases], dtype=np.int64)
+
+        chars = sorted({ch for alias in self.aliases for ch in alias})
+        self._col: Dict[str, int] = {ch: i for i, ch in enumerate(chars)}
+        counts = np.zeros((len(self.aliases), len(chars)), dtype=np.int16)
+        for row, alias in enumerate(self.aliases):
+            for ch in alias:
+                counts[row, self._col[ch]] += 1
+        self._counts = counts
+        self._matchers: Dict[int, SequenceMatcher] = {}  # alias id → matcher with seq2 = alias (b2j cached)
+
+    def __len__(self) -> int:
+        return len(self.aliases)
+
+    def _ratio(self, alias_id: int, text: str) -> float:
+        matcher = self._matchers.get(alias_id)
+        if matcher is None:
+            matcher = SequenceMatcher(None, "", self.aliases[alias_id])
+            self._matchers[alias_id] = matcher
+        matcher.set_seq1(text)
+        return matcher.ratio()
+
+    def _candidates(self, token: str, threshold: float):
+        """Arrays (bound, alias id, start, end) for every token/window ↔ alias pair whose bound reaches threshold."""
+        distinct = [ch for ch in dict.fromkeys(token) if ch in self._col]
+        if not distinct:
+            return None
+        local = {ch: i for i, ch in enumerate(distinct)}
+        token_cols = np.array([local.get(ch, -1) for ch in token])
+        onehot = (token_cols[:, None] == np.arange(len(distinct))[None, :]).astype(np.int32)
+
+        counts = self._counts[:, [self._col[ch] for ch in distinct]]
+        lengths = self._lengths
+        length = len(token)
+        overlap = np.minimum(counts, onehot.sum(0)).sum(1)
+
+        # Direct token ↔ alias comparison
+        bound = 2.0 * overlap / (length + lengths)
+        aids = np.nonzero(bound >= threshold)[0]
+        parts = [(bound[aids], aids, np.zeros_like(aids), np.full_like(aids, length))]
+
+        # Sliding windows (len alias+1, last one len alias) — any window overlap ≤ token overlap
+        windowed = (length > lengths + 1) & (lengths >= _MIN_WINDOW_ALIAS_LEN) & (overlap / np.maximum(lengths, 1) >= threshold)
+        group = np.nonzero(windowed)[0]
+        if len(group):
+            prefix = np.vstack([np.zeros((1, len(distinct)), dtype=np.int32), np.cumsum(onehot, axis=0)])
+            m = lengths[group][:, None]
+            starts = np.arange(length)[None, :]
+            ends = np.minimum(starts + m + 1, length)
+            valid = starts <= length - m
+            window_counts = prefix[np.where(valid, ends, 0)] - prefix[np.where(valid, starts, 0)]
+            window_overlap = np.minimum(window_counts, counts[group][:, None, :]).sum(-1)
+            window_bound = np.where(valid, 2.0 * window_overlap / np.maximum((ends - starts) + m, 1), 0.0)
+            gi, wi = np.nonzero(window_bound >= threshold)
+            parts.append((window_bound[gi, wi], group[gi], wi, ends[gi, wi]))
+        return [np.concatenate(col) for col in zip(*parts)]
+
+    def match(self, text: str, threshold: float = 0.75) -> Optional[str]:
+        """Canonical of the best-scoring alias (ratio ≥ threshold), or None."""
+        tokens = [t.lower() for t in _TOKEN_RE.findall(text) if len(t) >= _MIN_TOKEN_LEN]
+        if not tokens or not self.aliases:
+            return None
+
+        best_score = 0.0
+        best_key: Optional[Tuple[int, int, int]] = None
+        found = [(ti, self._candidates(token, threshold)) for ti, token in enumerate(tokens)]
+        bounds = [(ti, c) for ti, c in found if c is not None and len(c[0])]
+        if not bounds:
+            return None
+        bound = np.concatenate([c[0] for _, c in bounds])
+        token_ids = np.concatenate([np.full(len(c[0]), ti) for ti, c in bounds])
+        aids, starts, ends = (np.concatenate([c[i] for _, c in bounds]) for i in (1, 2, 3))
+
+        for i in np.argsort(-bound, kind="stable"):
+            if bound[i] < best_score:
+                break  # nothing left can reach the best score
+            ti, aid, start, end = int(token_ids[i]), int(aids[i]), int(starts[i]), int(ends[i])
+            token = tokens[ti]
+            score = self._ratio(aid, token[start:end])
+            if score < threshold:
+                continue
+            # old loop order: token → alias → direct comparison → windows left to right
+            key = (ti, aid, -1 if (start, end) == (0, len(token)) else start)
+            if score > best_score or (score == best_score and key < best_key):
+                best_score, best_key = score, key
+
+        return None if best_key is None else self.canonicals[best_key[1]]
@@ -0,0 +1,220 @@
+"""
+Local Product Search — in-process replacement for the hybrid_search_products3 RPC.
+
+The RPC scores every product as
+    vector_weight * cosine(embedding, query) + keyword_weight * ts_rank(search_vector, query)
+and ships a 1536-float JSON array per expanded query. The catalog is ~100 rows,
+so we keep the same fusion locally:
+- Vector: pre-normalized float32 matrix of product embeddings → cosine = one matmul
+- Keyword: BM25 over character trigrams of build_embedding_text(row)
+  (Thai has no spaces, so word tokens — what the 'simple' tsvector uses — rarely match)
+- search_batch() scores ALL expanded queries in one matrix multiply per signal
+
+Embeddings are synced from DB by ProductCatalog row_hash — only changed rows are re-fetched.
+
+Usage (PRODUCT_SEARCH_BACKEND=local):
+    engine = LocalProductSearch.get_instance()
+    await engine.sync(supabase_client, ProductCatalog.get_instance())
+    results = engine.search_batch(embeddings, queries, match_count=20)
+"""
+
+import json
+import logging
+import math
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.utils.async_db import aexecute
+from app.utils.embedding_text import build_embedding_text
+
+logger = logging.getLogger(__name__)
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+# ts_rank (normalization 0) ของ RPC แทบไม่เกิน ~0.1 → scale BM25 ที่ normalize แล้ว (0..1)
+# ลงมาช่วงเดียวกัน เพื่อให้ weight 0.6/0.4 และ vector_threshold ทำงานเหมือนเดิม
+_KEYWORD_SCORE_SCALE = 0.1
+
+_WORD_PATTERN = re.compile(r'[0-9a-z\u0E00-\u0E7F]+')
+
+
+def _trigrams(text: str) -> List[str]:
+    """Character trigrams per word (lowercase). Words shorter than 3 chars are kept whole."""
+    grams = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if len(word) < 3:
+            grams.append(word)
+        else:
+            grams.extend(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def _parse_embedding(value) -> Optional[np.ndarray]:
+    """pgvector comes back from PostgREST as a '[0.1,0.2,...]' string."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    vec = np.asarray(value, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    if vec.size == 0 or norm == 0.0:
+        return None
+    return vec / norm
+
+
+class LocalProductSearch:
+    """
+    Singleton hybrid (vector + keyword) search over the in-memory product catalog.
+
+    Provides:
+    - sync(supabase_client, catalog) — load/refresh embeddings + rebuild indexes
+    - search_batch(embeddings, queries, ...) — RPC-equivalent rows (+ 'similarity') per query
+    """
+
+    _instance: Optional['LocalProductSearch'] = None
+
+    def __init__(self):
+        self._embeddings: Dict[str, np.ndarray] = {}   # id → unit vector
+        self._hashes: Dict[str, Optional[str]] = {}    # id → row_hash the embedding was loaded at
+        self._rows: List[dict] = []                     # rows aligned with matrix rows
+        self._matrix: Optional[np.ndarray] = None       # (n_products, dim)
+        self._vocab: Dict[str, int] = {}                # trigram → column in _bm25
+        self._idf: Optional[np.ndarray] = None          # (vocab,)
+        self._bm25: Optional[np.ndarray] = None         # (n_products, vocab) per-term BM25 weights
+        self._unseen_idf: float = 0.0
+        self._loaded: bool = False
+
+    @classmethod
+    def get_instance(cls) -> 'LocalProductSearch':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    # =====================================================================
+    # Loading
+    # =====================================================================
+
+    async def sync(self, supabase_client, catalog) -> bool:
+        """Fetch embeddings for catalog rows that are new/changed, then rebuild indexes."""
+        if not catalog.loaded:
+            return self._loaded
+        try:
+            hashes = catalog.row_hashes()
+            changed = [i for i, h in hashes.items()
+                       if i not in self._embeddings or h is None or self._hashes.get(i) != h]
+            removed = set(self._embeddings) - set(hashes)
+
+            embeddings = dict(self._embeddings)
+            for i in removed:
+                embeddings.pop(i, None)
+            if changed:
+                if supabase_client is None:
+                    raise RuntimeError("supabase_client is None")
+                from app.config import PRODUCT_TABLE
+                result = await aexecute(supabase_client.table(PRODUCT_TABLE)
+                                        .select('id, embedding')
+                                        .in_('id', [int(i) for i in changed if i.isdigit()]))
+                for row in result.data or []:
+                    vec = _parse_embedding(row.get('embedding'))
+                    if vec is None:
+                        embeddings.pop(str(row['id']), None)
+                    else:
+                        embeddings[str(row['id'])] = vec
+
+            if changed or removed or not self._loaded:
+                rows = [catalog.get(i) for i in sorted(embeddings, key=lambda i: (0, int(i)) if i.isdigit() else (1, i))]
+                self.build([r for r in rows if r], embeddings)
+                self._hashes = {i: hashes.get(i) for i in embeddings}
+                logger.info(f"LocalProductSearch: indexed {len(self._rows)} products ({len(changed)} embeddings fetched)")
+        except Exception as e:
+            logger.warning(f"LocalProductSearch: sync failed ({e}), keeping current index")
+        return self._loaded
+
+    def build(self, rows: List[dict], embeddings: Dict[str, np.ndarray]) -> None:
+        """Build vector matrix + BM25 trigram index (rows without an embedding are skipped, like the RPC)."""
+        rows = [r for r in rows if str(r.get('id')) in embeddings]
+        if not rows:
+            self._loaded = False
+            return
+
+        matrix = np.stack([embeddings[str(r['id'])] for r in rows]).astype(np.float32)
+
+        docs = [_trigrams(build_embedding_text(r)) for r in rows]
+        vocab: Dict[str, int] = {}
+        for grams in docs:
+            for g in grams:
+                vocab.setdefault(g, len(vocab))
+
+        n = len(docs)
+        tf = np.zeros((n, len(vocab)), dtype=np.float32)
+        for d, grams in enumerate(docs):
+            for g in grams:
+                tf[d, vocab[g]] += 1
+        df = (tf > 0).sum(axis=0)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        doc_len = tf.sum(axis=1, keepdims=True)
+        avgdl = float(doc_len.mean()) or 1.0
+        denom = tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * doc_len / avgdl)
+        bm25 = np.where(tf > 0, idf * tf * (_BM25_K1 + 1) / denom, 0.0).astype(np.float32)
+
+        self._rows = rows
+        self._embeddings = embeddings
+        self._matrix = matrix
+        self._vocab = vocab
+        self._idf = idf
+        self._bm25 = bm25
+        self._unseen_idf = math.log1p((n + 0.5) / 0.5)
+        self._loaded = True
+
+    # =====================================================================
+    # Search
+    # =====================================================================
+
+    def _keyword_scores(self, queries: List[str]) -> np.ndarray:
+        """(n_queries, n_products) BM25 normalized to 0..1 by the query's best possible score."""
+        q = np.zeros((len(queries), len(self._vocab)), dtype=np.float32)
+        upper = np.zeros(len(queries), dtype=np.float32)
+        for qi, query in enumerate(queries):
+            for g in set(_trigrams(query)):
+                col = self._vocab.get(g)
+                if col is None:
+                    upper[qi] += self._unseen_idf * (_BM25_K1 + 1)
+                else:
+                    q[qi, col] = 1.0
+                    upper[qi] += self._idf[col] * (_BM25_K1 + 1)
+        scores = q @ self._bm25.T
+        upper[upper == 0] = 1.0
+        return scores / upper[:, None]
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        queries: List[str],
+        vector_weight: float = 0.6,
+        keyword_weight: float = 0.4,
+        match_count: int = 20,
+    ) -> List[List[dict]]:
+        """Hybrid search for many queries at once — same row shape as the RPC (row + 'similarity')."""
+        if not self._loaded or not queries:
+            return [[] for _ in queries]
+
+        q = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vector_scores = (q / norms) @ self._matrix.T
+        keyword_scores = self._keyword_scores(queries) * _KEYWORD_SCORE_SCALE
+        fused = vector_weight * vector_scores + keyword_weight * keyword_scores
+
+        k = min(match_count, len(self._rows))
+        results = []
+        for scores in fused:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results.append([{**self._rows[i], 'similarity': float(scores[i])} for i in top])
+        return results
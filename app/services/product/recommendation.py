@@ -6,8 +6,9 @@ from app.dependencies import supabase_client, openai_client
 from app.services.cache import get_from_cache, set_to_cache
 from app.utils.text_processing import extract_keywords_from_question
 from app.services.reranker import rerank_products_with_llm, simple_relevance_boost
-from app.config import LLM_MODEL_RESPONSE_GEN, EMBEDDING_MODEL, LLM_TEMP_PRODUCT_FORMAT, LLM_TOKENS_PRODUCT_FORMAT, PRODUCT_TABLE, PRODUCT_RPC
+from app.config import LLM_MODEL_RESPONSE_GEN, LLM_TEMP_PRODUCT_FORMAT, LLM_TOKENS_PRODUCT_FORMAT, PRODUCT_TABLE, PRODUCT_RPC
 from app.utils.async_db import aexecute
+from app.services.embedding_batcher import embed_text
 
 logger = logging.getLogger(__name__)
 
@@ -1120,12 +1121,7 @@ async def hybrid_search_products(query: str, match_count: int = 15,
         logger.info(f"🔍 Hybrid Search: '{query}' (vector={vector_weight}, keyword={keyword_weight})")
 
         # Generate embedding for vector search
-        response = await openai_client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=query,
-            encoding_format="float"
-        )
-        query_embedding = response.data[0].embedding
+        query_embedding = await embed_text(query, openai_client)
 
         # Try hybrid search RPC first (if SQL function exists)
         try:
@@ -2067,7 +2063,8 @@ async def retrieve_products_with_matching_score(
                     top_k=6,
                     openai_client=openai_client,
                     required_category=required_category,
-                    required_category_th=required_category_th
+                    required_category_th=required_category_th,
+                    plant_type=plant_type or ""
                 )
                 if reranked_products:
                     scored_products = reranked_products
@@ -10,12 +10,14 @@ Usage:
     product = registry.extract_product_name("โทมาหอค ใช้ยังไง")  # → "โทมาฮอค"
 """
 
+import bisect
 import logging
 import re
 import time
-from difflib import SequenceMatcher
 from typing import Dict, List, Optional, Tuple
 
+from app.services.product.fuzzy_index import FuzzyAliasIndex
+from app.utils.aho_corasick import AhoCorasick
 from app.utils.async_db import aexecute
 
 logger = logging.getLogger(__name__)
@@ -169,6 +171,13 @@ class ProductRegistry:
         self._canonical_list: List[str] = []             # flat list for LLM prompt
         self._alias_index: Dict[str, str] = {}           # lowercase alias → canonical
         self._stripped_index: Dict[str, str] = {}         # diacritics-stripped alias → canonical
+        self._alias_matcher: AhoCorasick = AhoCorasick(())     # over _alias_index, longest-first ids
+        self._stripped_matcher: AhoCorasick = AhoCorasick(())  # over _stripped_index, longest-first ids
+        self._canonical_by_lower: Dict[str, List[str]] = {}    # canonical.lower() → canonicals
+        self._lower_sorted: List[Tuple[str, str]] = []         # (canonical.lower(), canonical), for prefix ranges
+        self._families: Dict[str, List[Tuple[str, str]]] = {}  # prefix → [(canonical, suffix_lower)], ≥2 members
+        self._suffix_matcher: AhoCorasick = AhoCorasick(())    # over family suffixes
+        self._fuzzy_index: FuzzyAliasIndex = FuzzyAliasIndex(())
         self._loaded: bool = False
         self._load_time: float = 0
 
@@ -297,6 +306,22 @@ class ProductRegistry:
 
         self._alias_index = alias_index
         self._stripped_index = stripped_index
+
+        # Compile once: pattern ids follow the longest-first order the old per-call sort produced
+        self._alias_matcher = AhoCorasick(sorted(alias_index, key=len, reverse=True))
+        self._stripped_matcher = AhoCorasick(sorted(stripped_index, key=len, reverse=True))
+        self._fuzzy_index = FuzzyAliasIndex(list(alias_index.items()))
+
+        canonical_by_lower: Dict[str, List[str]] = {}
+        for canonical in self._canonical_list:
+            canonical_by_lower.setdefault(canonical.lower(), []).append(canonical)
+        self._canonical_by_lower = canonical_by_lower
+        self._lower_sorted = sorted((c.lower(), c) for c in self._canonical_list)
+        self._families = self._build_families(self._canonical_list)
+        self._suffix_matcher = AhoCorasick(
+            suffix for members in self._families.values() for _, suffix in members
+        )
+
         self._loaded = True
         self._load_time = time.time()
         logger.info(f"ProductRegistry: indexed {len(self._canonical_list)} products, {len(alias_index)} aliases")
@@ -313,19 +338,17 @@ class ProductRegistry:
         self._ensure_loaded()
         question_lower = question.lower()
 
-        # Step 1: Exact substring match — scan aliases sorted by length (longest first)
+        # Step 1: Exact substring match — longest alias present wins
         # to prefer more specific matches
-        sorted_aliases = sorted(self._alias_index.keys(), key=len, reverse=True)
-        for alias in sorted_aliases:
-            if alias in question_lower:
-                return self._alias_index[alias]
+        pid = self._alias_matcher.first(question_lower)
+        if pid is not None:
+            return self._alias_index[self._alias_matcher.patterns[pid]]
 
         # Step 2: Diacritics-stripped match
         question_stripped = _strip_diacritics(question_lower)
-        sorted_stripped = sorted(self._stripped_index.keys(), key=len, reverse=True)
-        for stripped_alias in sorted_stripped:
-            if stripped_alias in question_stripped:
-                return self._stripped_index[stripped_alias]
+        pid = self._stripped_matcher.first(question_stripped)
+        if pid is not None:
+            return self._stripped_index[self._stripped_matcher.patterns[pid]]
 
         # Step 3: Fuzzy match (fallback)
         return self.fuzzy_match(question)
@@ -342,46 +365,36 @@ class ProductRegistry:
         question_lower = question.lower()
         found = []
         seen = set()
-        remaining = question_lower
-
-        # Scan aliases longest-first; remove matched span to find remaining products
-        sorted_aliases = sorted(self._alias_index.keys(), key=len, reverse=True)
-        for alias in sorted_aliases:
-            if alias in remaining:
-                canonical = self._alias_index[alias]
-                if canonical not in seen:
-                    found.append(canonical)
-                    seen.add(canonical)
-                # Remove matched span so it doesn't interfere with next match
-                remaining = remaining.replace(alias, ' ', 1)
+
+        # Claim aliases longest-first; matched spans are removed so they don't interfere with next match
+        alias_hits = self._alias_matcher.find_all(question_lower)
+        remaining = self._claim_hits(
+            self._alias_matcher, self._alias_index, question_lower, alias_hits, found, seen
+        )
 
         # Also try diacritics-stripped matching on remaining text
         if remaining.strip():
             remaining_stripped = _strip_diacritics(remaining)
-            sorted_stripped = sorted(self._stripped_index.keys(), key=len, reverse=True)
-            for stripped_alias in sorted_stripped:
-                if stripped_alias in remaining_stripped:
-                    canonical = self._stripped_index[stripped_alias]
-                    if canonical not in seen:
-                        found.append(canonical)
-                        seen.add(canonical)
-                    remaining_stripped = remaining_stripped.replace(stripped_alias, ' ', 1)
+            self._claim_hits(
+                self._stripped_matcher, self._stripped_index, remaining_stripped,
+                self._stripped_matcher.find_all(remaining_stripped), found, seen,
+            )
 
         # Family expansion: if user typed base name, include all variants
         # e.g. "โบว์แลน" → ["โบว์แลน", "โบว์แลน 285"]
         # e.g. "พรีดิคท์" → ["พรีดิคท์ 10%", "พรีดิคท์ 15%", "พรีดิคท์ 25% เอฟ"]
-        all_canonical = self.get_canonical_list()
-
         # Find shortest canonical name that appears in query (the "base")
         # This handles case where "โบว์แลน" alias → maps to "โบว์แลน 285" but
         # product "โบว์แลน" (base) also exists as separate product
-        base_candidates = []
-        for canonical in all_canonical:
-            c_lower = canonical.lower()
-            if c_lower in question_lower:
-                base_candidates.append(canonical)
-        # Sort by length: shortest = base name
-        base_candidates.sort(key=len)
+        # (every canonical.lower() is an alias, so the alias pass already saw it)
+        matched_aliases = {self._alias_matcher.patterns[pid] for _, _, pid in alias_hits}
+        base_candidates = [
+            canonical
+            for alias in matched_aliases
+            for canonical in self._canonical_by_lower.get(alias, ())
+        ]
+        # Sort by length: shortest = base name (ties in canonical-list order)
+        base_candidates.sort(key=lambda c: (len(c), c))
 
         if base_candidates:
             base = base_candidates[0]
@@ -398,7 +411,7 @@ class ProductRegistry:
                     found.insert(0, base)
                     seen.add(base)
                 # Add all variants
-                for other in all_canonical:
+                for other in self._canonicals_with_prefix(base_lower):
                     if other == base or other in seen:
                         continue
                     other_lower = other.lower()
@@ -420,17 +433,57 @@ class ProductRegistry:
 
         return found
 
-    def _scan_family_suffixes(self, question_lower: str, already_found: set) -> list:
+    def _canonicals_with_prefix(self, prefix_lower: str) -> List[str]:
+        """Canonicals whose lowercase name starts with prefix_lower, in canonical-list order."""
+        lowers = self._lower_sorted
+        i = bisect.bisect_left(lowers, (prefix_lower, ''))
+        matches = []
+        while i < len(lowers) and lowers[i][0].startswith(prefix_lower):
+            matches.append(lowers[i][1])
+            i += 1
+        return sorted(matches)
+
+    @staticmethod
+    def _claim_hits(
+        matcher: AhoCorasick,
+        index: Dict[str, str],
+        text: str,
+        hits: List[Tuple[int, int, int]],
+        found: list,
+        seen: set,
+    ) -> str:
         """
-        Detect multi-suffix queries for space-separated product families.
-        Example: canonical 'บอมส์ ไวท์', 'บอมส์ แม็กซ์', 'บอมส์ ซิงค์' all share prefix 'บอมส์'.
-        If user types 'ไวท์ แม็กซ์' (≥2 suffixes from same family) → return all matching siblings.
-
-        Returns list of canonical names to add.
+        Non-overlapping hits in longest-first order (first occurrence of each alias),
+        same result as scanning sorted aliases and replacing each match with ' '.
+        Appends new canonicals to found/seen; returns text with claimed spans replaced.
         """
-        # Group canonicals by prefix (first space-delimited token)
-        families: Dict[str, List[Tuple[str, str]]] = {}  # prefix → [(canonical, suffix_lower)]
-        for canonical in self._canonical_list:
+        claimed: List[Tuple[int, int]] = []
+        done = set()
+        for start, end, pid in sorted(hits, key=lambda h: (h[2], h[0])):
+            if pid in done or any(start < e and s < end for s, e in claimed):
+                continue
+            done.add(pid)
+            claimed.append((start, end))
+            canonical = index[matcher.patterns[pid]]
+            if canonical not in seen:
+                found.append(canonical)
+                seen.add(canonical)
+
+        if not claimed:
+            return text
+        parts, pos = [], 0
+        for start, end in sorted(claimed):
+            parts.append(text[pos:start])
+            parts.append(' ')
+            pos = end
+        parts.append(text[pos:])
+        return ''.join(parts)
+
+    @staticmethod
+    def _build_families(canonical_list: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """Group canonicals by prefix (first space-delimited token) → [(canonical, suffix_lower)]; real families only."""
+        families: Dict[str, List[Tuple[str, str]]] = {}
+        for canonical in canonical_list:
             parts = canonical.split(' ', 1)
             if len(parts) != 2:
                 continue
@@ -439,29 +492,35 @@ class ProductRegistry:
             if not suffix_lower:
                 continue
             families.setdefault(prefix, []).append((canonical, suffix_lower))
+        return {prefix: members for prefix, members in families.items() if len(members) >= 2}
+
+    def _scan_family_suffixes(self, question_lower: str, already_found: set) -> list:
+        """
+        Detect multi-suffix queries for space-separated product families.
+        Example: canonical 'บอมส์ ไวท์', 'บอมส์ แม็กซ์', 'บอมส์ ซิงค์' all share prefix 'บอมส์'.
+        If user types 'ไวท์ แม็กซ์' (≥2 suffixes from same family) → return all matching siblings.
+
+        Returns list of canonical names to add.
+        """
+        # word-boundary-ish check: suffix must appear surrounded by space/start/end/punct
+        # (otherwise "ไวท์" inside "บลูไวท์" would false-match)
+        bounded = set()
+        for start, end, pid in self._suffix_matcher.find_all(question_lower):
+            before = question_lower[start - 1] if start > 0 else ' '
+            after = question_lower[end] if end < len(question_lower) else ' '
+            # Thai words don't have spaces internally; require non-Thai char on both sides
+            # OR that the prefix token is NOT immediately before (to avoid บลูไวท์ matching ไวท์)
+            is_boundary_before = not ('\u0E00' <= before <= '\u0E7F')
+            is_boundary_after = not ('\u0E00' <= after <= '\u0E7F')
+            if is_boundary_before and is_boundary_after:
+                bounded.add(self._suffix_matcher.patterns[pid])
+        if len(bounded) < 2:
+            return []
 
         additions: List[str] = []
-        for prefix, members in families.items():
-            if len(members) < 2:
-                continue  # not a real family
+        for prefix, members in self._families.items():
             # Count how many distinct suffixes appear in query
-            matched = []
-            for canonical, suffix_lower in members:
-                # word-boundary-ish check: suffix must appear surrounded by space/start/end/punct
-                # (otherwise "ไวท์" inside "บลูไวท์" would false-match)
-                idx = question_lower.find(suffix_lower)
-                while idx >= 0:
-                    before = question_lower[idx - 1] if idx > 0 else ' '
-                    after_i = idx + len(suffix_lower)
-                    after = question_lower[after_i] if after_i < len(question_lower) else ' '
-                    # Thai words don't have spaces internally; require non-Thai char on both sides
-                    # OR that the prefix token is NOT immediately before (to avoid บลูไวท์ matching ไวท์)
-                    is_boundary_before = not ('\u0E00' <= before <= '\u0E7F')
-                    is_boundary_after = not ('\u0E00' <= after <= '\u0E7F')
-                    if is_boundary_before and is_boundary_after:
-                        matched.append((canonical, suffix_lower))
-                        break
-                    idx = question_lower.find(suffix_lower, idx + 1)
+            matched = [(canonical, suffix_lower) for canonical, suffix_lower in members if suffix_lower in bounded]
             if len(matched) >= 2:
                 for canonical, _ in matched:
                     if canonical not in already_found:
@@ -474,37 +533,7 @@ class ProductRegistry:
         e.g. "แแกนเตอ" → "แกนเตอร์", "โมเดิ้น" → "โมเดิน"
         """
         self._ensure_loaded()
-        tokens = re.findall(r'[\u0E00-\u0E7F]+|[a-zA-Z]+', text)
-
-        best_match = None
-        best_score = 0.0
-
-        for token in tokens:
-            if len(token) < 4:
-                continue
-            token_lower = token.lower()
-            for alias, canonical in self._alias_index.items():
-                # Direct comparison
-                score = SequenceMatcher(None, token_lower, alias).ratio()
-                if score > best_score and score >= threshold:
-                    best_score = score
-                    best_match = canonical
-
-                # Sliding window for long tokens
-                alias_len = len(alias)
-                if len(token_lower) > alias_len + 1 and alias_len >= 3:
-                    for i in range(len(token_lower) - alias_len + 2):
-                        end = min(i + alias_len + 1, len(token_lower))
-                        sub = token_lower[i:end]
-                        # Skip substrings shorter than alias (edge artifacts)
-                        if len(sub) < alias_len:
-                            continue
-                        score = SequenceMatcher(None, sub, alias).ratio()
-                        if score > best_score and score >= threshold:
-                            best_score = score
-                            best_match = canonical
-
-        return best_match
+        return self._fuzzy_index.match(text, threshold)
 
     # =====================================================================
     # Query API (backward-compatible)
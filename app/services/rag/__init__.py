@@ -67,6 +67,7 @@ class RetrievalResult:
     avg_similarity: float
     avg_rerank_score: float
     sources_used: List[str] = field(default_factory=list)
+    stage_timings: Dict[str, float] = field(default_factory=dict)  # retrieval stage → wall time (ms)
 
 
 @dataclass
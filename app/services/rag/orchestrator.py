@@ -202,7 +202,11 @@ class AgenticRAG:
                 )
                 from app.utils.text_processing import generate_thai_disease_variants, resolve_symptom_to_pathogens, diacritics_match
 
+                from app.services.chat.lexicon import analyze_query
+
                 _skip_context_product = False  # flag: ถ้า new_topic detected → ไม่ดึง product จาก context
+                # One lexicon pass — slang / symptoms / problem types / disease pattern all read this
+                query_features = analyze_query(query)
 
                 # --- Farmer Slang Resolution ---
                 slang_result = resolve_farmer_slang(query)
@@ -405,13 +409,12 @@ class AgenticRAG:
                     logger.info(f"  - Compound intent: {detected_problems}")
 
                 # --- Pre-LLM Entity Extraction: Disease ---
-                from app.services.disease.constants import DISEASE_PATTERNS_SORTED, get_canonical
-                for pattern in DISEASE_PATTERNS_SORTED:
-                    if diacritics_match(query, pattern):
-                        hints['disease_name'] = get_canonical(pattern)
-                        hints['disease_variants'] = generate_thai_disease_variants(pattern)
-                        logger.info(f"  - Pre-extracted disease: '{pattern}' variants={hints['disease_variants']}")
-                        break
+                from app.services.disease.constants import get_canonical
+                pattern = query_features.disease_pattern
+                if pattern:
+                    hints['disease_name'] = get_canonical(pattern)
+                    hints['disease_variants'] = generate_thai_disease_variants(pattern)
+                    logger.info(f"  - Pre-extracted disease: '{pattern}' variants={hints['disease_variants']}")
 
                 # --- Broad disease term detection (e.g. "เชื้อรา" = generic fungal disease) ---
                 if not hints.get('disease_name') and hints.get('problem_type') == 'disease':
@@ -175,13 +175,10 @@ class ResponseGeneratorAgent:
 
                 # Also try extracting disease from original query (LLM may have changed disease name)
                 if not has_disease_match and has_documents and query_analysis.intent in (IntentType.DISEASE_TREATMENT, IntentType.PRODUCT_RECOMMENDATION):
-                    from app.utils.text_processing import diacritics_match as _dm
-                    from app.services.disease.constants import DISEASE_PATTERNS_SORTED as _DP, get_canonical as _gc
-                    original_disease = ''
-                    for pattern in _DP:
-                        if _dm(query_analysis.original_query, pattern):
-                            original_disease = _gc(pattern)
-                            break
+                    from app.services.chat.lexicon import analyze_query as _aq
+                    from app.services.disease.constants import get_canonical as _gc
+                    _orig_pattern = _aq(query_analysis.original_query).disease_pattern
+                    original_disease = _gc(_orig_pattern) if _orig_pattern else ''
                     if original_disease and original_disease != disease_name:
                         original_variants = generate_thai_disease_variants(original_disease)
                         for doc in retrieval_result.documents[:5]:
@@ -622,7 +619,8 @@ class ResponseGeneratorAgent:
             from app.utils.text_processing import diacritics_match as _dm_early
             from app.services.disease.constants import DISEASE_PATTERNS_SORTED as _DP_EARLY, get_canonical as _gc_early
             _orig_q = query_analysis.original_query
-            _has_disease_in_query = any(_dm_early(_orig_q, _p) for _p in _DP_EARLY)
+            from app.services.chat.lexicon import analyze_query as _aq_early
+            _has_disease_in_query = bool(_aq_early(_orig_q).disease_patterns)
             if not _has_disease_in_query:
                 for _pat in _DP_EARLY:
                     if _dm_early(context, _pat):
@@ -774,12 +772,10 @@ class ResponseGeneratorAgent:
 
         # Also extract disease from original query (LLM may misidentify)
         from app.utils.text_processing import diacritics_match as _dm_gen
+        from app.services.chat.lexicon import analyze_query as _aq_gen
         from app.services.disease.constants import DISEASE_PATTERNS_SORTED as _DP_GEN, get_canonical as _gc_gen
-        original_disease_gen = ''
-        for _pat in _DP_GEN:
-            if _dm_gen(query_analysis.original_query, _pat):
-                original_disease_gen = _gc_gen(_pat)
-                break
+        _gen_pattern = _aq_gen(query_analysis.original_query).disease_pattern
+        original_disease_gen = _gc_gen(_gen_pattern) if _gen_pattern else ''
 
         # Extract disease from conversation context (follow-up like "มีตัวอื่นไหม")
         # NOTE: context_disease already initialized earlier (before doc filter block)
@@ -11,9 +11,8 @@ Responsibilities:
 import logging
 import asyncio
 import re
-import hashlib
 import time
-from typing import List, Dict
+from typing import Awaitable, Callable, List, Dict, Optional
 
 from app.services.rag import (
     QueryAnalysis,
@@ -21,71 +20,44 @@ from app.services.rag import (
     RetrievalResult,
     IntentType
 )
-from app.config import LLM_MODEL_RERANKING, EMBEDDING_MODEL, LLM_TEMP_RERANKING, LLM_TOKENS_RERANKING, PRODUCT_TABLE, PRODUCT_RPC
+from app.config import (
+    LLM_MODEL_RERANKING, LLM_TEMP_RERANKING, LLM_TOKENS_RERANKING,
+    PRODUCT_TABLE, PRODUCT_RPC, PRODUCT_SEARCH_BACKEND, RETRIEVAL_SPECULATIVE_FALLBACKS,
+    RERANK_BACKEND, RERANK_LOCAL_MIN_MARGIN,
+)
 from app.utils.async_db import aexecute
+from app.services.product.catalog import ProductCatalog, PRODUCT_COLUMNS as _PRODUCT_COLUMNS
+from app.services.product.local_search import LocalProductSearch
+from app.services.embedding_batcher import embed_text
+from app.services.embedding_cache import aget_cached_embedding, set_cached_embedding
+from app.services.local_reranker import LocalReranker, log_llm_ranking
 
 logger = logging.getLogger(__name__)
 
 # Configuration
+HYBRID_VECTOR_WEIGHT = 0.6
+HYBRID_KEYWORD_WEIGHT = 0.4
 DEFAULT_VECTOR_THRESHOLD = 0.25  # Lowered from 0.35 for better recall
 DEFAULT_RERANK_THRESHOLD = 0.50
 DEFAULT_TOP_K = 10
 MIN_RELEVANT_DOCS = 3
 
-# Columns used by _build_doc_from_row — excludes embedding (1536 floats), row_hash, timestamps
-_PRODUCT_COLUMNS = (
-    "id, product_name, common_name_th, active_ingredient, "
-    "fungicides, insecticides, herbicides, biostimulant, pgr_hormones, fertilizer, "
-    "applicable_crops, product_category, how_to_use, usage_rate, usage_period, "
-    "selling_point, action_characteristics, absorption_method, strategy, "
-    "package_size, physical_form, phytotoxicity, chemical_group_rac, caution_notes, aliases"
-)
-
-# ============================================================================
-# Embedding LRU Cache — avoids re-computing identical embeddings
-# ============================================================================
-_EMBEDDING_CACHE_MAX = 500
-_EMBEDDING_CACHE_TTL = 3600  # 1 hour
-_embedding_cache: Dict[str, dict] = {}  # key -> {"embedding": [...], "ts": float}
-
-
-def _get_cached_embedding(text: str):
-    """Return cached embedding list or None"""
-    key = hashlib.md5(text.encode()).hexdigest()
-    entry = _embedding_cache.get(key)
-    if entry and (time.time() - entry["ts"]) < _EMBEDDING_CACHE_TTL:
-        return entry["embedding"]
-    return None
+# Embeddings are cached in app.services.embedding_cache (L1 LRU → disk → Redis)
 
 
 async def _generate_embedding_standalone(text: str, openai_client) -> list:
     """Generate embedding without RetrievalAgent instance (for semantic cache)."""
-    cached = _get_cached_embedding(text)
+    cached = await aget_cached_embedding(text)
     if cached is not None:
         return cached
     try:
-        from app.config import EMBEDDING_MODEL
-        response = await openai_client.embeddings.create(
-            model=EMBEDDING_MODEL, input=text, encoding_format="float"
-        )
-        embedding = response.data[0].embedding
-        _set_cached_embedding(text, embedding)
+        embedding = await embed_text(text, openai_client)
+        await set_cached_embedding(text, embedding)
         return embedding
     except Exception:
         return []
 
 
-def _set_cached_embedding(text: str, embedding: list):
-    """Store embedding in cache, evict oldest if full"""
-    key = hashlib.md5(text.encode()).hexdigest()
-    if len(_embedding_cache) >= _EMBEDDING_CACHE_MAX:
-        # Evict oldest 10%
-        sorted_keys = sorted(_embedding_cache, key=lambda k: _embedding_cache[k]["ts"])
-        for k in sorted_keys[:max(1, len(sorted_keys) // 10)]:
-            del _embedding_cache[k]
-    _embedding_cache[key] = {"embedding": embedding, "ts": time.time()}
-
-
 # Broader category mapping: specific plant → parent categories
 # Used in Stage 3.65 crop-mismatch and Stage 3.7 priority promotion
 # e.g. ทุเรียน is ไม้ยืนต้น, so "ไม้ยืนต้น เช่น ปาล์ม ยาง" should match ทุเรียน
@@ -166,6 +138,73 @@ def _plant_matches_crops(plant_type: str, crops_str: str) -> bool:
     return False
 
 
+class _StageRunner:
+    """
+    Runs retrieval stages as concurrent tasks; the caller awaits them in stage order.
+
+    - launch(name, coro) → start immediately
+    - defer(name, factory) → conditional stage: start now when speculative, else on first result()
+    - result(name, default) → await; errors are logged and replaced by default
+    - cancel(name) → trigger condition turned out false, drop the work
+    - timings → per-stage wall time in ms (cancelled stages are listed separately)
+    """
+
+    def __init__(self, speculative: bool = True):
+        self.speculative = speculative
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._deferred: Dict[str, Callable[[], Awaitable]] = {}
+        self.timings: Dict[str, float] = {}
+        self.cancelled: List[str] = []
+
+    def launch(self, name: str, coro) -> None:
+        self._tasks[name] = asyncio.create_task(self.run(name, coro))
+
+    def defer(self, name: str, factory: Callable[[], Awaitable]) -> None:
+        if self.speculative:
+            self.launch(name, factory())
+        else:
+            self._deferred[name] = factory
+
+    async def run(self, name: str, coro):
+        """Await a stage and record its wall time (also used inline for dependent stages)."""
+        started = time.perf_counter()
+        result = await coro
+        self.timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def result(self, name: str, default=None):
+        factory = self._deferred.pop(name, None)
+        if factory is not None:
+            self.launch(name, factory())
+        task = self._tasks.pop(name, None)
+        if task is None:
+            return default
+        try:
+            return await task
+        except Exception as e:
+            logger.error(f"Retrieval stage '{name}' failed: {e}")
+            return default
+
+    def cancel(self, name: str) -> None:
+        self._deferred.pop(name, None)  # never started
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            if not task.done():
+                task.cancel()
+            self.cancelled.append(name)
+
+    def cancel_all(self) -> None:
+        self._deferred.clear()
+        for name in list(self._tasks):
+            self.cancel(name)
+
+    def summary(self) -> str:
+        parts = [f"{name}={ms:.0f}ms" for name, ms in sorted(self.timings.items(), key=lambda kv: -kv[1])]
+        if self.cancelled:
+            parts.append(f"cancelled={self.cancelled}")
+        return ", ".join(parts) or "none"
+
+
 class RetrievalAgent:
     """
     Agent 2: Retrieval
@@ -200,6 +239,12 @@ class RetrievalAgent:
         self.vector_threshold = vector_threshold
         self.rerank_threshold = rerank_threshold
 
+    @staticmethod
+    def _catalog():
+        """In-memory ProductCatalog if loaded (None → fall back to Supabase queries)."""
+        catalog = ProductCatalog.get_instance()
+        return catalog if catalog.loaded else None
+
     @staticmethod
     def _build_doc_from_row(item: dict, similarity: float, content_extra: str = "") -> 'RetrievedDocument':
         """Build a RetrievedDocument from a DB row dict (single source for metadata construction)."""
@@ -282,25 +327,32 @@ class RetrievalAgent:
             return []
 
         try:
-            # Step 1: Exact match first (prevents bundle false positive,
-            # e.g. "ไฮซีส" should NOT match "ชุด กล่องม่วง (แอสไปร์ + ไฮซีส)")
-            result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
-                .select(_PRODUCT_COLUMNS) \
-                .eq('product_name', product_name) \
-                .limit(5))
-
-            # Step 2: Fallback to ilike if exact match finds nothing
-            if not result.data:
+            catalog = self._catalog()
+            if catalog:
+                # Step 1: Exact match first, Step 2: substring (same order as the DB path below)
+                rows = catalog.rows(catalog.ids_equal('product_name', product_name), limit=5) \
+                    or catalog.rows(catalog.ids_containing('product_name', product_name), limit=5)
+            else:
+                # Step 1: Exact match first (prevents bundle false positive,
+                # e.g. "ไฮซีส" should NOT match "ชุด กล่องม่วง (แอสไปร์ + ไฮซีส)")
                 result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
                     .select(_PRODUCT_COLUMNS) \
-                    .ilike('product_name', f'%{product_name}%') \
+                    .eq('product_name', product_name) \
                     .limit(5))
 
-            if not result.data:
+                # Step 2: Fallback to ilike if exact match finds nothing
+                if not result.data:
+                    result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
+                        .select(_PRODUCT_COLUMNS) \
+                        .ilike('product_name', f'%{product_name}%') \
+                        .limit(5))
+                rows = result.data
+
+            if not rows:
                 return []
 
             docs = []
-            for item in result.data:
+            for item in rows:
                 doc = self._build_doc_from_row(item, similarity=1.0)
                 doc.rerank_score = 1.0
                 docs.append(doc)
@@ -312,6 +364,78 @@ class RetrievalAgent:
             logger.error(f"Direct product lookup error: {e}")
             return []
 
+    # Broad disease terms — search by category instead of literal text
+    _BROAD_DISEASE_TERMS = {'เชื้อรา', 'โรคเชื้อรา', 'โรคพืช', 'โรคราพืช'}
+
+    def _disease_fallback_plan(self, query_analysis: QueryAnalysis) -> Optional[dict]:
+        """Disease names/variants for Stage 1.2 (None if the query names no disease)."""
+        from app.utils.text_processing import generate_thai_disease_variants
+
+        # Collect all disease names to check (entity + original query)
+        disease_names_to_check = set()
+        entity_disease = query_analysis.entities.get('disease_name', '')
+        if entity_disease:
+            disease_names_to_check.add(entity_disease)
+        original_disease = self._extract_disease_from_query(query_analysis.original_query)
+        if original_disease:
+            disease_names_to_check.add(original_disease)
+
+        # Split combined disease names like "ใบจุดและใบขีดสีน้ำตาล" → ["ใบจุด", "ใบขีดสีน้ำตาล"]
+        _split_names = set()
+        for dname in list(disease_names_to_check):
+            for sep in ['และ', 'กับ', ',']:
+                if sep in dname:
+                    parts = [p.strip() for p in dname.split(sep) if p.strip() and len(p.strip()) >= 3]
+                    _split_names.update(parts)
+        if _split_names:
+            disease_names_to_check.update(_split_names)
+            logger.info(f"  - Disease split: added {_split_names} from combined names")
+
+        if not disease_names_to_check:
+            return None
+
+        if any(d in self._BROAD_DISEASE_TERMS for d in disease_names_to_check):
+            return {"broad": True, "names": disease_names_to_check, "variants": []}
+
+        # Build combined variants from all disease names
+        all_variants = []
+        for d in disease_names_to_check:
+            all_variants.extend(generate_thai_disease_variants(d))
+        return {"broad": False, "names": disease_names_to_check, "variants": list(set(all_variants))}
+
+    @staticmethod
+    def _fertilizer_form_from_query(query: str) -> Optional[List[str]]:
+        """"ปุ๋ยเกล็ด" → ผง/เกล็ด (NPK), "ปุ๋ยน้ำ" → น้ำ (บอมส์ ซิงค์/แม็กซ์/ไวท์)"""
+        _q_lower = query.lower()
+        if any(kw in _q_lower for kw in ['ปุ๋ยเกล็ด', 'ปุ๋ยสูตร', 'ปุ๋ยnpk']):
+            return ['ผง', 'เกล็ด']
+        if 'ปุ๋ยน้ำ' in _q_lower:
+            return ['น้ำ']
+        return None
+
+    async def _fertilizer_form_search(self, fert_form: List[str]) -> List[RetrievedDocument]:
+        """Stage 1.97: Fertilizer products with the requested physical_form."""
+        try:
+            _catalog = self._catalog()
+            if _catalog:
+                _fert_rows = _catalog.rows(
+                    _catalog.ids_equal('product_category', 'Fertilizer')
+                    & _catalog.ids_in('physical_form', fert_form)
+                )
+            else:
+                _q_builder = self.supabase.table(PRODUCT_TABLE) \
+                    .select(_PRODUCT_COLUMNS) \
+                    .eq('product_category', 'Fertilizer')
+                if len(fert_form) == 1:
+                    _q_builder = _q_builder.eq('physical_form', fert_form[0])
+                else:
+                    _q_builder = _q_builder.in_('physical_form', fert_form)
+                _fert_rows = (await aexecute(_q_builder)).data
+            return [self._build_doc_from_row(item, similarity=0.70) for item in _fert_rows or []]
+        except Exception as e:
+            logger.warning(f"Fertilizer form fallback failed: {e}")
+            return []
+
     async def _fallback_keyword_search(self, query: str, top_k: int = 5) -> List[RetrievedDocument]:
         """Fallback keyword search when vector search returns no results"""
         if not self.supabase:
@@ -325,26 +449,32 @@ class RetrievalAgent:
             if not keywords:
                 return []
 
-            # Build OR filter for ilike search
-            or_conditions = []
-            from app.utils.pest_columns import build_pest_or_conditions
-            for kw in keywords[:3]:  # Limit to 3 keywords
-                or_conditions.append(f"product_name.ilike.%{kw}%")
-                or_conditions.extend(build_pest_or_conditions(kw))
-                or_conditions.append(f"active_ingredient.ilike.%{kw}%")
-                or_conditions.append(f"common_name_th.ilike.%{kw}%")
+            from app.utils.pest_columns import PEST_COLUMNS, build_pest_or_conditions
+            catalog = self._catalog()
+            if catalog:
+                columns = ['product_name', *PEST_COLUMNS, 'active_ingredient', 'common_name_th']
+                rows = catalog.rows(catalog.ids_containing_any(columns, keywords[:3]), limit=top_k)
+            else:
+                # Build OR filter for ilike search
+                or_conditions = []
+                for kw in keywords[:3]:  # Limit to 3 keywords
+                    or_conditions.append(f"product_name.ilike.%{kw}%")
+                    or_conditions.extend(build_pest_or_conditions(kw))
+                    or_conditions.append(f"active_ingredient.ilike.%{kw}%")
+                    or_conditions.append(f"common_name_th.ilike.%{kw}%")
 
-            or_filter = ",".join(or_conditions)
+                or_filter = ",".join(or_conditions)
 
-            result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
-                .select(_PRODUCT_COLUMNS) \
-                .or_(or_filter) \
-                .limit(top_k))
+                result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
+                    .select(_PRODUCT_COLUMNS) \
+                    .or_(or_filter) \
+                    .limit(top_k))
+                rows = result.data
 
-            if not result.data:
+            if not rows:
                 return []
 
-            docs = [self._build_doc_from_row(item, similarity=0.5) for item in result.data]
+            docs = [self._build_doc_from_row(item, similarity=0.5) for item in rows]
 
             logger.info(f"    Fallback keyword search: {len(docs)} docs for '{query[:30]}...'")
             return docs
@@ -394,18 +524,6 @@ class RetrievalAgent:
 
             logger.info(f"    Supplementary priority search keywords: {keywords}")
 
-            # Search Skyrocket/Expand products matching keywords in pest columns or selling_point
-            from app.utils.pest_columns import build_pest_or_conditions
-            or_conditions = []
-            for kw in keywords:
-                or_conditions.extend(build_pest_or_conditions(kw))
-                or_conditions.append(f"selling_point.ilike.%{kw}%")
-                or_conditions.append(f"common_name_th.ilike.%{kw}%")
-                or_conditions.append(f"active_ingredient.ilike.%{kw}%")
-                or_conditions.append(f"applicable_crops.ilike.%{kw}%")
-
-            or_filter = ",".join(or_conditions)
-
             # Apply category filter if intent requires specific product type
             cat_filter = self.INTENT_CATEGORY_MAP.get(query_analysis.intent)
             if not cat_filter:
@@ -413,21 +531,42 @@ class RetrievalAgent:
                 if inferred:
                     cat_filter = inferred[0]
 
-            query_builder = self.supabase.table(PRODUCT_TABLE) \
-                .select(_PRODUCT_COLUMNS) \
-                .in_('strategy', ['Skyrocket', 'Expand']) \
-                .or_(or_filter) \
-                .limit(top_k)
-            if cat_filter:
-                query_builder = query_builder.ilike('product_category', f'%{cat_filter}%')
-            result = await aexecute(query_builder)
+            # Search Skyrocket/Expand products matching keywords in pest columns or selling_point
+            from app.utils.pest_columns import PEST_COLUMNS, build_pest_or_conditions
+            catalog = self._catalog()
+            if catalog:
+                columns = [*PEST_COLUMNS, 'selling_point', 'common_name_th', 'active_ingredient', 'applicable_crops']
+                ids = catalog.ids_containing_any(columns, keywords) & catalog.ids_in('strategy', ['Skyrocket', 'Expand'])
+                if cat_filter:
+                    ids &= catalog.ids_containing('product_category', cat_filter)
+                rows = catalog.rows(ids, limit=top_k)
+            else:
+                or_conditions = []
+                for kw in keywords:
+                    or_conditions.extend(build_pest_or_conditions(kw))
+                    or_conditions.append(f"selling_point.ilike.%{kw}%")
+                    or_conditions.append(f"common_name_th.ilike.%{kw}%")
+                    or_conditions.append(f"active_ingredient.ilike.%{kw}%")
+                    or_conditions.append(f"applicable_crops.ilike.%{kw}%")
 
-            if not result.data:
+                or_filter = ",".join(or_conditions)
+
+                query_builder = self.supabase.table(PRODUCT_TABLE) \
+                    .select(_PRODUCT_COLUMNS) \
+                    .in_('strategy', ['Skyrocket', 'Expand']) \
+                    .or_(or_filter) \
+                    .limit(top_k)
+                if cat_filter:
+                    query_builder = query_builder.ilike('product_category', f'%{cat_filter}%')
+                result = await aexecute(query_builder)
+                rows = result.data
+
+            if not rows:
                 return []
 
             existing_ids = {d.id for d in existing_docs}
             docs = []
-            for item in result.data:
+            for item in rows:
                 doc_id = str(item.get('id', ''))
                 if doc_id in existing_ids:
                     continue  # Skip duplicates
@@ -464,27 +603,33 @@ class RetrievalAgent:
             keywords.extend(['วัชพืช', 'หญ้า'])
 
             # Build OR filter on pest columns, applicable_crops, selling_point
-            from app.utils.pest_columns import build_pest_or_conditions
-            or_conditions = []
-            for kw in keywords:
-                or_conditions.extend(build_pest_or_conditions(kw))
-                or_conditions.append(f"applicable_crops.ilike.%{kw}%")
-                or_conditions.append(f"selling_point.ilike.%{kw}%")
-            or_filter = ",".join(or_conditions)
-
-            existing_ids = {d.id for d in existing_docs}
+            from app.utils.pest_columns import PEST_COLUMNS, build_pest_or_conditions
+            catalog = self._catalog()
+            if catalog:
+                columns = [*PEST_COLUMNS, 'applicable_crops', 'selling_point']
+                ids = catalog.ids_containing_any(columns, keywords) & catalog.ids_containing('product_category', 'Herbicide')
+                rows = catalog.rows(ids, limit=top_k)
+            else:
+                or_conditions = []
+                for kw in keywords:
+                    or_conditions.extend(build_pest_or_conditions(kw))
+                    or_conditions.append(f"applicable_crops.ilike.%{kw}%")
+                    or_conditions.append(f"selling_point.ilike.%{kw}%")
+                or_filter = ",".join(or_conditions)
 
-            result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
-                .select(_PRODUCT_COLUMNS) \
-                .ilike('product_category', '%Herbicide%') \
-                .or_(or_filter) \
-                .limit(top_k))
+                result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
+                    .select(_PRODUCT_COLUMNS) \
+                    .ilike('product_category', '%Herbicide%') \
+                    .or_(or_filter) \
+                    .limit(top_k))
+                rows = result.data
 
-            if not result.data:
+            if not rows:
                 return []
 
+            existing_ids = {d.id for d in existing_docs}
             docs = []
-            for item in result.data:
+            for item in rows:
                 doc_id = str(item.get('id', ''))
                 if doc_id in existing_ids:
                     continue
@@ -522,25 +667,30 @@ class RetrievalAgent:
             return []
 
         try:
-            from app.utils.pest_columns import build_pest_or_conditions
-            or_conditions = build_pest_or_conditions(pest_name)
-            if not or_conditions:
-                return []
-            or_filter = ",".join(or_conditions)
-
-            existing_ids = {d.id for d in existing_docs}
+            from app.utils.pest_columns import PEST_COLUMNS, build_pest_or_conditions
+            catalog = self._catalog()
+            if catalog:
+                ids = catalog.ids_containing_any(PEST_COLUMNS, [pest_name]) & catalog.ids_containing('product_category', 'Insecticide')
+                rows = catalog.rows(ids, limit=top_k)
+            else:
+                or_conditions = build_pest_or_conditions(pest_name)
+                if not or_conditions:
+                    return []
+                or_filter = ",".join(or_conditions)
 
-            result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
-                .select(_PRODUCT_COLUMNS) \
-                .ilike('product_category', '%Insecticide%') \
-                .or_(or_filter) \
-                .limit(top_k))
+                result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
+                    .select(_PRODUCT_COLUMNS) \
+                    .ilike('product_category', '%Insecticide%') \
+                    .or_(or_filter) \
+                    .limit(top_k))
+                rows = result.data
 
-            if not result.data:
+            if not rows:
                 return []
 
+            existing_ids = {d.id for d in existing_docs}
             docs = []
-            for item in result.data:
+            for item in rows:
                 doc_id = str(item.get('id', ''))
                 if doc_id in existing_ids:
                     continue
@@ -574,12 +724,17 @@ class RetrievalAgent:
             return
 
         try:
-            result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
-                .select('id, strategy, selling_point, applicable_crops, package_size') \
-                .in_('id', [int(i) for i in set(missing_ids) if i.isdigit()]))
+            catalog = self._catalog()
+            if catalog:
+                rows = catalog.rows(set(missing_ids))
+            else:
+                result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
+                    .select('id, strategy, selling_point, applicable_crops, package_size') \
+                    .in_('id', [int(i) for i in set(missing_ids) if i.isdigit()]))
+                rows = result.data
 
-            if result.data:
-                enrich_map = {str(r['id']): r for r in result.data}
+            if rows:
+                enrich_map = {str(r['id']): r for r in rows}
                 enriched = 0
                 for doc in docs:
                     if doc.id in enrich_map:
@@ -608,7 +763,8 @@ class RetrievalAgent:
         Perform retrieval based on query analysis
 
         Stages:
-        1. Initial retrieval (parallel from multiple sources)
+        1. Initial retrieval + fallbacks (launched concurrently, applied in stage order;
+           per-stage timings → RetrievalResult.stage_timings)
         2. De-duplication
         3. Re-ranking with LLM
         4. Relevance filtering
@@ -622,7 +778,17 @@ class RetrievalAgent:
             logger.info(f"  - Sources: {query_analysis.required_sources}")
             logger.info(f"  - Expanded queries: {len(query_analysis.expanded_queries)}")
 
-            # Stage 0: Direct product lookup if entity has product_name(s)
+            # Stages 0–1.97 run through _StageRunner: every stage whose inputs are known from
+            # query_analysis alone is launched up front (concurrently). Results are then applied
+            # in the original stage order, so trigger conditions that depend on earlier stages
+            # (e.g. "fewer than MIN_RELEVANT_DOCS so far") see exactly the same docs as before.
+            # Speculative stages whose trigger turns out false are cancelled.
+            # Conditional stages (defer) only start up front when they read the in-memory catalog
+            # (or RETRIEVAL_SPECULATIVE_FALLBACKS=1); otherwise they would cost DB queries on every
+            # request, so they start at apply time and only when their trigger is true.
+            # All fallbacks query first and exclude existing ids afterwards, so running them
+            # with existing_docs=[] and filtering at apply time gives identical results.
+            stages = _StageRunner(speculative=RETRIEVAL_SPECULATIVE_FALLBACKS or self._catalog() is not None)
             all_docs = []
             # Inject pre-fetched docs from parallel embedding (started during Agent 1)
             if prefetch_docs:
@@ -631,96 +797,98 @@ class RetrievalAgent:
             direct_lookup_ids = set()
             symptom_fallback_ids = set()
             pest_fallback_ids = set()
+            disease_fallback_ids = set()
             product_name = query_analysis.entities.get('product_name')
             # Support multi-product queries (e.g. "แกนเตอร์กับแมสฟอดใช้ต่างกันยังไง")
             product_names_list = query_analysis.entities.get('product_names', [])
             if not product_names_list and product_name:
                 product_names_list = [product_name]
-            for _pname in product_names_list:
-                direct_docs = await self._direct_product_lookup(_pname)
-                if direct_docs:
-                    all_docs.extend(direct_docs)
-                    direct_lookup_ids.update(doc.id for doc in direct_docs)
-            if direct_lookup_ids:
-                logger.info(f"  - Direct lookup found: {len(direct_lookup_ids)} docs for {product_names_list}")
-
-            # Stage 1: Parallel retrieval from multiple sources
-            multi_docs = await self._multi_source_retrieval(query_analysis, top_k)
-            all_docs.extend(multi_docs)
-
-            # Stage 1.2: Consolidated disease fallback (runs ONCE after all vector searches)
-            # Checks if disease is in any retrieved doc's target_pest
-            # If not, does a single direct DB lookup instead of per-query fallbacks
-            disease_fallback_ids = set()
-            if query_analysis.intent in (IntentType.DISEASE_TREATMENT, IntentType.PRODUCT_RECOMMENDATION):
-                from app.utils.text_processing import generate_thai_disease_variants
-
-                # Collect all disease names to check (entity + original query)
-                disease_names_to_check = set()
-                entity_disease = query_analysis.entities.get('disease_name', '')
-                if entity_disease:
-                    disease_names_to_check.add(entity_disease)
-                original_disease = self._extract_disease_from_query(query_analysis.original_query)
-                if original_disease:
-                    disease_names_to_check.add(original_disease)
-
-                # Split combined disease names like "ใบจุดและใบขีดสีน้ำตาล" → ["ใบจุด", "ใบขีดสีน้ำตาล"]
-                _split_names = set()
-                for dname in list(disease_names_to_check):
-                    for sep in ['และ', 'กับ', ',']:
-                        if sep in dname:
-                            parts = [p.strip() for p in dname.split(sep) if p.strip() and len(p.strip()) >= 3]
-                            _split_names.update(parts)
-                if _split_names:
-                    disease_names_to_check.update(_split_names)
-                    logger.info(f"  - Disease split: added {_split_names} from combined names")
-
-                if disease_names_to_check:
-                    # Broad disease terms — search by category instead of literal text
-                    _BROAD_DISEASE_TERMS = {'เชื้อรา', 'โรคเชื้อรา', 'โรคพืช', 'โรคราพืช'}
-                    _is_broad_disease = any(d in _BROAD_DISEASE_TERMS for d in disease_names_to_check)
-
-                    if _is_broad_disease:
-                        # Broad disease: search Fungicide category + crop filter
-                        plant_type = query_analysis.entities.get('plant_type', '')
-                        logger.info(f"  - Disease fallback: broad term {disease_names_to_check}, searching Fungicide category" +
-                                    (f" for crop '{plant_type}'" if plant_type else ""))
-                        fallback_docs = await self._broad_disease_category_search(plant_type, all_docs)
+            intent = query_analysis.intent
+            pest_name = query_analysis.entities.get('pest_name', '')
+            _has_weed_entity = bool(query_analysis.entities.get('weed_type'))
+            disease_plan = self._disease_fallback_plan(query_analysis) \
+                if intent in (IntentType.DISEASE_TREATMENT, IntentType.PRODUCT_RECOMMENDATION) else None
+            fert_form = self._fertilizer_form_from_query(query_analysis.original_query) \
+                if intent == IntentType.NUTRIENT_SUPPLEMENT else None
+
+            try:
+                # ---- Launch ----
+                for i, _pname in enumerate(product_names_list):
+                    stages.launch(f"direct_lookup:{i}", self._direct_product_lookup(_pname))
+                stages.launch("multi_source", self._multi_source_retrieval(query_analysis, top_k))
+                if disease_plan:
+                    if disease_plan["broad"]:
+                        stages.launch("disease_fallback", self._broad_disease_category_search(
+                            query_analysis.entities.get('plant_type', ''), []))
+                    else:
+                        stages.defer("disease_fallback", lambda: self._search_by_target_pest(
+                            disease_plan["variants"], query_analysis))
+                if intent in (
+                    IntentType.NUTRIENT_SUPPLEMENT, IntentType.PRODUCT_RECOMMENDATION,
+                    IntentType.GENERAL_AGRICULTURE, IntentType.UNKNOWN,
+                ):
+                    stages.launch("symptom_fallback", self._search_by_symptom_keywords(
+                        query_analysis.original_query, query_analysis))
+                stages.defer("keyword_fallback", lambda: self._fallback_keyword_search(
+                    query_analysis.original_query, top_k))
+                stages.defer("supplementary_priority", lambda: self._supplementary_priority_search(
+                    query_analysis, [], top_k))
+                if intent == IntentType.WEED_CONTROL or _has_weed_entity:
+                    stages.defer("weed_fallback", lambda: self._weed_category_fallback_search(query_analysis, []))
+                if pest_name and intent in (IntentType.PEST_CONTROL, IntentType.PRODUCT_RECOMMENDATION):
+                    stages.defer("pest_column_fallback", lambda: self._pest_column_fallback_search(query_analysis, []))
+                if fert_form:
+                    stages.launch("fertilizer_form_fallback", self._fertilizer_form_search(fert_form))
+
+                # ---- Apply in stage order ----
+                # Stage 0: Direct product lookup if entity has product_name(s)
+                for i in range(len(product_names_list)):
+                    direct_docs = await stages.result(f"direct_lookup:{i}", [])
+                    if direct_docs:
+                        all_docs.extend(direct_docs)
+                        direct_lookup_ids.update(doc.id for doc in direct_docs)
+                if direct_lookup_ids:
+                    logger.info(f"  - Direct lookup found: {len(direct_lookup_ids)} docs for {product_names_list}")
+
+                # Stage 1: Parallel retrieval from multiple sources
+                all_docs.extend(await stages.result("multi_source", []))
+
+                # Stage 1.2: Consolidated disease fallback (runs ONCE after all vector searches)
+                # Checks if disease is in any retrieved doc's target_pest
+                # If not, does a single direct DB lookup instead of per-query fallbacks
+                if disease_plan and disease_plan["broad"]:
+                    # Broad disease: search Fungicide category + crop filter
+                    plant_type = query_analysis.entities.get('plant_type', '')
+                    logger.info(f"  - Disease fallback: broad term {disease_plan['names']}, searching Fungicide category" +
+                                (f" for crop '{plant_type}'" if plant_type else ""))
+                    existing_ids = {d.id for d in all_docs}
+                    fallback_docs = [d for d in await stages.result("disease_fallback", []) if d.id not in existing_ids]
+                    if fallback_docs:
+                        disease_fallback_ids = {doc.id for doc in fallback_docs}
+                        all_docs.extend(fallback_docs)
+                        logger.info(f"  - Broad disease fallback found: {len(fallback_docs)} Fungicide products")
+                elif disease_plan:
+                    # Check if any existing doc already matches
+                    from app.utils.pest_columns import get_pest_text_lower
+                    all_variants = disease_plan["variants"]
+                    has_disease_in_docs = any(
+                        any(v.lower() in get_pest_text_lower(doc.metadata) for v in all_variants)
+                        for doc in all_docs
+                    ) if all_docs else False
+
+                    if has_disease_in_docs:
+                        stages.cancel("disease_fallback")
+                    else:
+                        logger.info(f"  - Disease fallback: {disease_plan['names']} not in retrieved docs, searching pest columns")
+                        fallback_docs = await stages.result("disease_fallback", [])
                         if fallback_docs:
                             disease_fallback_ids = {doc.id for doc in fallback_docs}
                             all_docs.extend(fallback_docs)
-                            logger.info(f"  - Broad disease fallback found: {len(fallback_docs)} Fungicide products")
-                    else:
-                        # Build combined variants from all disease names
-                        all_variants = []
-                        for d in disease_names_to_check:
-                            all_variants.extend(generate_thai_disease_variants(d))
-                        all_variants = list(set(all_variants))
-
-                        # Check if any existing doc already matches
-                        from app.utils.pest_columns import get_pest_text_lower
-                        has_disease_in_docs = any(
-                            any(v.lower() in get_pest_text_lower(doc.metadata) for v in all_variants)
-                            for doc in all_docs
-                        ) if all_docs else False
-
-                        if not has_disease_in_docs:
-                            logger.info(f"  - Disease fallback: {disease_names_to_check} not in retrieved docs, searching pest columns")
-                            fallback_docs = await self._search_by_target_pest(all_variants, query_analysis)
-                            if fallback_docs:
-                                disease_fallback_ids = {doc.id for doc in fallback_docs}
-                                all_docs.extend(fallback_docs)
-                                logger.info(f"  - Disease fallback found: {len(fallback_docs)} products via pest columns")
-
-            # Stage 1.3: Symptom-based pest columns fallback
-            # Matches symptom phrases (ไม่โต, ไม่กินปุ๋ย, เหลือง, etc.) against DB pest columns
-            if query_analysis.intent in (
-                IntentType.NUTRIENT_SUPPLEMENT, IntentType.PRODUCT_RECOMMENDATION,
-                IntentType.GENERAL_AGRICULTURE, IntentType.UNKNOWN,
-            ):
-                symptom_docs = await self._search_by_symptom_keywords(
-                    query_analysis.original_query, query_analysis
-                )
+                            logger.info(f"  - Disease fallback found: {len(fallback_docs)} products via pest columns")
+
+                # Stage 1.3: Symptom-based pest columns fallback
+                # Matches symptom phrases (ไม่โต, ไม่กินปุ๋ย, เหลือง, etc.) against DB pest columns
+                symptom_docs = await stages.result("symptom_fallback", [])
                 if symptom_docs:
                     existing_ids = {d.id for d in all_docs}
                     new_docs = [d for d in symptom_docs if d.id not in existing_ids]
@@ -729,83 +897,75 @@ class RetrievalAgent:
                         all_docs.extend(new_docs)
                         logger.info(f"  - Symptom fallback found: {len(new_docs)} new docs via pest columns")
 
-            # Stage 1.5: Fallback keyword search if insufficient results
-            if len(all_docs) < MIN_RELEVANT_DOCS:
-                fallback_docs = await self._fallback_keyword_search(query_analysis.original_query, top_k)
-                existing_ids = {d.id for d in all_docs}
-                new_fallback = [d for d in fallback_docs if d.id not in existing_ids]
-                all_docs.extend(new_fallback)
-                if new_fallback:
-                    logger.info(f"  - Fallback keyword added: {len(new_fallback)} new docs")
+                # Stage 1.5: Fallback keyword search if insufficient results
+                if len(all_docs) < MIN_RELEVANT_DOCS:
+                    fallback_docs = await stages.result("keyword_fallback", [])
+                    existing_ids = {d.id for d in all_docs}
+                    new_fallback = [d for d in fallback_docs if d.id not in existing_ids]
+                    all_docs.extend(new_fallback)
+                    if new_fallback:
+                        logger.info(f"  - Fallback keyword added: {len(new_fallback)} new docs")
+                else:
+                    stages.cancel("keyword_fallback")
+
+                # Stage 1.8: Enrich strategy for docs missing it (RPC doesn't return it)
+                await stages.run("enrich_strategy", self._enrich_strategy(all_docs))
+
+                # Stage 1.9: Supplementary search for Skyrocket/Expand if none found
+                if not direct_lookup_ids:
+                    existing_ids = {d.id for d in all_docs}
+                    priority_docs = [d for d in await stages.result("supplementary_priority", [])
+                                     if d.id not in existing_ids]
+                    if priority_docs:
+                        all_docs.extend(priority_docs)
+                        logger.info(f"  - Supplementary priority search added: {len(priority_docs)} docs")
+                else:
+                    stages.cancel("supplementary_priority")
+
+                # Stage 1.95: Weed category fallback — search ALL Herbicides when still insufficient
+                # Trigger for WEED_CONTROL intent OR any query with weed_type entity
+                # (LLM sometimes classifies weed queries as PRODUCT_RECOMMENDATION)
+                if (intent == IntentType.WEED_CONTROL or _has_weed_entity) and len(all_docs) < MIN_RELEVANT_DOCS:
+                    existing_ids = {d.id for d in all_docs}
+                    weed_docs = [d for d in await stages.result("weed_fallback", []) if d.id not in existing_ids]
+                    if weed_docs:
+                        all_docs.extend(weed_docs)
+                        logger.info(f"  - Weed category fallback added: {len(weed_docs)} docs")
+                else:
+                    stages.cancel("weed_fallback")
+
+                # Stage 1.96: Pest column fallback — search insecticides column for specific pest_name
+                # Triggered when vector search missed products that DO target the queried pest
+                if pest_name and intent in (IntentType.PEST_CONTROL, IntentType.PRODUCT_RECOMMENDATION):
+                    # Count how many retrieved docs mention pest_name in insecticides
+                    _pest_match_count = sum(
+                        1 for d in all_docs
+                        if pest_name.lower() in (d.metadata.get('insecticides') or '').lower()
+                    )
+                    if _pest_match_count < 3:
+                        logger.info(f"  - Stage 1.96: pest_match_count={_pest_match_count} < 3, triggering fallback for '{pest_name}'")
+                        existing_ids = {d.id for d in all_docs}
+                        pest_fallback_docs = [d for d in await stages.result("pest_column_fallback", [])
+                                              if d.id not in existing_ids]
+                        if pest_fallback_docs:
+                            pest_fallback_ids = {d.id for d in pest_fallback_docs}
+                            all_docs.extend(pest_fallback_docs)
+                            logger.info(f"  - Pest column fallback added: {len(pest_fallback_docs)} docs for '{pest_name}'")
+                    else:
+                        stages.cancel("pest_column_fallback")
 
-            # Stage 1.8: Enrich strategy for docs missing it (RPC doesn't return it)
-            await self._enrich_strategy(all_docs)
+                # Stage 1.97: Fertilizer form-specific fallback
+                if fert_form:
+                    existing_ids = {d.id for d in all_docs}
+                    _fert_docs = [d for d in await stages.result("fertilizer_form_fallback", [])
+                                  if d.id not in existing_ids]
+                    if _fert_docs:
+                        all_docs.extend(_fert_docs)
+                        logger.info(f"  - Fertilizer form fallback: added {len(_fert_docs)} docs for form={fert_form}")
+            finally:
+                stages.cancel_all()
 
-            # Stage 1.9: Supplementary search for Skyrocket/Expand if none found
-            if not direct_lookup_ids:
-                priority_docs = await self._supplementary_priority_search(
-                    query_analysis, all_docs, top_k
-                )
-                if priority_docs:
-                    all_docs.extend(priority_docs)
-                    logger.info(f"  - Supplementary priority search added: {len(priority_docs)} docs")
-
-            # Stage 1.95: Weed category fallback — search ALL Herbicides when still insufficient
-            # Trigger for WEED_CONTROL intent OR any query with weed_type entity
-            # (LLM sometimes classifies weed queries as PRODUCT_RECOMMENDATION)
-            _has_weed_entity = bool(query_analysis.entities.get('weed_type'))
-            if (query_analysis.intent == IntentType.WEED_CONTROL or _has_weed_entity) and len(all_docs) < MIN_RELEVANT_DOCS:
-                weed_docs = await self._weed_category_fallback_search(query_analysis, all_docs)
-                if weed_docs:
-                    all_docs.extend(weed_docs)
-                    logger.info(f"  - Weed category fallback added: {len(weed_docs)} docs")
-
-            # Stage 1.96: Pest column fallback — search insecticides column for specific pest_name
-            # Triggered when vector search missed products that DO target the queried pest
-            pest_name = query_analysis.entities.get('pest_name', '')
-            if pest_name and query_analysis.intent in (IntentType.PEST_CONTROL, IntentType.PRODUCT_RECOMMENDATION):
-                # Count how many retrieved docs mention pest_name in insecticides
-                _pest_match_count = sum(
-                    1 for d in all_docs
-                    if pest_name.lower() in (d.metadata.get('insecticides') or '').lower()
-                )
-                if _pest_match_count < 3:
-                    logger.info(f"  - Stage 1.96: pest_match_count={_pest_match_count} < 3, triggering fallback for '{pest_name}'")
-                    pest_fallback_docs = await self._pest_column_fallback_search(query_analysis, all_docs)
-                    if pest_fallback_docs:
-                        pest_fallback_ids = {d.id for d in pest_fallback_docs}
-                        all_docs.extend(pest_fallback_docs)
-                        logger.info(f"  - Pest column fallback added: {len(pest_fallback_docs)} docs for '{pest_name}'")
-
-            # Stage 1.97: Fertilizer form-specific fallback
-            # "ปุ๋ยเกล็ด" → fetch Fertilizer + physical_form=ผง/เกล็ด (NPK)
-            # "ปุ๋ยน้ำ" → fetch Fertilizer + physical_form=น้ำ (บอมส์ ซิงค์/แม็กซ์/ไวท์)
-            if query_analysis.intent == IntentType.NUTRIENT_SUPPLEMENT:
-                _q_lower = query_analysis.original_query.lower()
-                _fert_form = None
-                if any(kw in _q_lower for kw in ['ปุ๋ยเกล็ด', 'ปุ๋ยสูตร', 'ปุ๋ยnpk']):
-                    _fert_form = ['ผง', 'เกล็ด']
-                elif 'ปุ๋ยน้ำ' in _q_lower:
-                    _fert_form = ['น้ำ']
-                if _fert_form:
-                    try:
-                        _existing_ids = {d.id for d in all_docs}
-                        _q_builder = self.supabase.table(PRODUCT_TABLE) \
-                            .select(_PRODUCT_COLUMNS) \
-                            .eq('product_category', 'Fertilizer')
-                        if len(_fert_form) == 1:
-                            _q_builder = _q_builder.eq('physical_form', _fert_form[0])
-                        else:
-                            _q_builder = _q_builder.in_('physical_form', _fert_form)
-                        _fert_result = await aexecute(_q_builder)
-                        if _fert_result.data:
-                            _fert_docs = [self._build_doc_from_row(item, similarity=0.70)
-                                          for item in _fert_result.data
-                                          if str(item.get('id')) not in _existing_ids]
-                            all_docs.extend(_fert_docs)
-                            logger.info(f"  - Fertilizer form fallback: added {len(_fert_docs)} docs for form={_fert_form}")
-                    except Exception as e:
-                        logger.warning(f"Fertilizer form fallback failed: {e}")
+            logger.info(f"  - Stage timings: {stages.summary()}")
 
             total_retrieved = len(all_docs)
             logger.info(f"  - Total retrieved: {total_retrieved}")
@@ -817,7 +977,8 @@ class RetrievalAgent:
                     total_after_rerank=0,
                     avg_similarity=0.0,
                     avg_rerank_score=0.0,
-                    sources_used=query_analysis.required_sources
+                    sources_used=query_analysis.required_sources,
+                    stage_timings=stages.timings
                 )
 
             # Stage 2: De-duplication
@@ -834,7 +995,8 @@ class RetrievalAgent:
                 reranked_docs = await self._rerank_with_llm(
                     query_analysis.original_query,
                     unique_docs,
-                    query_analysis.intent
+                    query_analysis.intent,
+                    query_analysis.entities
                 )
             else:
                 # Sort by similarity score if no LLM
@@ -1118,7 +1280,8 @@ class RetrievalAgent:
                 total_after_rerank=total_after_rerank,
                 avg_similarity=avg_similarity,
                 avg_rerank_score=avg_rerank_score,
-                sources_used=list(set(d.source for d in filtered_docs))
+                sources_used=list(set(d.source for d in filtered_docs)),
+                stage_timings=stages.timings
             )
 
         except Exception as e:
@@ -1138,6 +1301,9 @@ class RetrievalAgent:
         top_k: int
     ) -> List[RetrievedDocument]:
         """Retrieve from multiple sources in parallel"""
+        if PRODUCT_SEARCH_BACKEND == "local" and LocalProductSearch.get_instance().loaded:
+            return await self._search_products_local(query_analysis, top_k)
+
         all_docs = []
         tasks = []
 
@@ -1156,6 +1322,64 @@ class RetrievalAgent:
 
         return all_docs
 
+    async def _search_products_local(
+        self,
+        query_analysis: QueryAnalysis,
+        top_k: int
+    ) -> List[RetrievedDocument]:
+        """Search all expanded queries with LocalProductSearch (one batched scoring pass, no RPC)"""
+        if not self.openai_client:
+            return []
+
+        queries = list(query_analysis.expanded_queries)
+        embeddings = await asyncio.gather(*(self._generate_embedding(q) for q in queries))
+        pairs = [(q, e) for q, e in zip(queries, embeddings) if e]
+        if not pairs:
+            return []
+
+        results = LocalProductSearch.get_instance().search_batch(
+            [e for _, e in pairs],
+            [q for q, _ in pairs],
+            vector_weight=HYBRID_VECTOR_WEIGHT,
+            keyword_weight=HYBRID_KEYWORD_WEIGHT,
+            match_count=top_k * 2,
+        )
+
+        all_docs = []
+        for (query, _), rows in zip(pairs, results):
+            docs = self._docs_from_search_rows(rows, query, query_analysis)
+            logger.info(f"    Product search (local): {len(docs)} docs for '{query[:30]}...'")
+            all_docs.extend(docs)
+        return all_docs
+
+    def _docs_from_search_rows(
+        self,
+        rows: List[dict],
+        query: str,
+        query_analysis: QueryAnalysis
+    ) -> List[RetrievedDocument]:
+        """Convert hybrid-search rows (RPC or local) to RetrievedDocument with name boost + threshold"""
+        docs = []
+        _original_query_lower = query_analysis.original_query.lower() if query_analysis and query_analysis.original_query else query.lower()
+        for item in rows:
+            similarity = float(item.get('similarity', 0))
+
+            # Name-match boost: user ถามชื่อสินค้าตรง → boost score +0.25
+            # ป้องกัน "แจ๊ส" → ได้ "เกรค" (vector similarity สูงเพราะ insecticide คล้ายกัน)
+            _pname = str(item.get('product_name', '')).lower()
+            if _original_query_lower and _pname and _pname in _original_query_lower:
+                similarity = min(1.0, similarity + 0.25)
+
+            # Filter by threshold
+            if similarity < self.vector_threshold:
+                continue
+
+            # Category filter removed - let reranker handle relevance instead
+
+            doc = self._build_doc_from_row(item, similarity=similarity)
+            docs.append(doc)
+        return docs
+
     async def _search_products(
         self,
         query: str,
@@ -1179,8 +1403,8 @@ class RetrievalAgent:
             rpc_params = {
                 'query_embedding': embedding,
                 'search_query': query,
-                'vector_weight': 0.6,
-                'keyword_weight': 0.4,
+                'vector_weight': HYBRID_VECTOR_WEIGHT,
+                'keyword_weight': HYBRID_KEYWORD_WEIGHT,
                 'match_count': top_k * 2
             }
 
@@ -1190,25 +1414,7 @@ class RetrievalAgent:
                 return []
 
             # Convert to RetrievedDocument with filtering
-            docs = []
-            _original_query_lower = query_analysis.original_query.lower() if query_analysis and query_analysis.original_query else query.lower()
-            for item in result.data:
-                similarity = float(item.get('similarity', 0))
-
-                # Name-match boost: user ถามชื่อสินค้าตรง → boost score +0.25
-                # ป้องกัน "แจ๊ส" → ได้ "เกรค" (vector similarity สูงเพราะ insecticide คล้ายกัน)
-                _pname = str(item.get('product_name', '')).lower()
-                if _original_query_lower and _pname and _pname in _original_query_lower:
-                    similarity = min(1.0, similarity + 0.25)
-
-                # Filter by threshold
-                if similarity < self.vector_threshold:
-                    continue
-
-                # Category filter removed - let reranker handle relevance instead
-
-                doc = self._build_doc_from_row(item, similarity=similarity)
-                docs.append(doc)
+            docs = self._docs_from_search_rows(result.data, query, query_analysis)
 
             logger.info(f"    Product search: {len(docs)} docs for '{query[:30]}...'")
 
@@ -1228,12 +1434,12 @@ class RetrievalAgent:
             'แก้', 'แก้ไข', 'ช่วย', 'อัตรา', 'ผสม', 'ฉีด', 'พ่น',
         }
         # Known disease name patterns (single source of truth)
-        from app.services.disease.constants import DISEASE_PATTERNS_SORTED, get_canonical
-        # Try known patterns first (diacritics-tolerant)
-        from app.utils.text_processing import diacritics_match
-        for pattern in DISEASE_PATTERNS_SORTED:
-            if diacritics_match(query, pattern):
-                return get_canonical(pattern)
+        from app.services.disease.constants import get_canonical
+        # Try known patterns first (diacritics-tolerant, lexicon pass shared with Stage 0)
+        from app.services.chat.lexicon import analyze_query
+        pattern = analyze_query(query).disease_pattern
+        if pattern:
+            return get_canonical(pattern)
 
         # Try extracting from "โรค..." prefix
         import re
@@ -1255,18 +1461,23 @@ class RetrievalAgent:
         query_analysis: QueryAnalysis
     ) -> List[RetrievedDocument]:
         """Fallback: ค้นหาสินค้าจาก pest columns โดยตรง (ไม่ใช้ vector search)"""
-        from app.utils.pest_columns import build_pest_or_filter
+        from app.utils.pest_columns import PEST_COLUMNS, build_pest_or_filter
         try:
+            catalog = self._catalog()
             for variant in disease_variants:
                 if len(variant) < 3:
                     continue
-                or_filter = build_pest_or_filter(variant)
-                result = await aexecute(self.supabase.table(PRODUCT_TABLE).select(_PRODUCT_COLUMNS).or_(
-                    or_filter
-                ).limit(5))
-
-                if result.data:
-                    docs = [self._build_doc_from_row(item, similarity=0.50) for item in result.data]
+                if catalog:
+                    rows = catalog.rows(catalog.ids_containing_any(PEST_COLUMNS, [variant]), limit=5)
+                else:
+                    or_filter = build_pest_or_filter(variant)
+                    result = await aexecute(self.supabase.table(PRODUCT_TABLE).select(_PRODUCT_COLUMNS).or_(
+                        or_filter
+                    ).limit(5))
+                    rows = result.data
+
+                if rows:
+                    docs = [self._build_doc_from_row(item, similarity=0.50) for item in rows]
                     return docs
             return []
         except Exception as e:
@@ -1281,17 +1492,22 @@ class RetrievalAgent:
         if not self.supabase:
             return []
         try:
-            result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
-                .select(_PRODUCT_COLUMNS) \
-                .ilike('product_category', '%Fungicide%') \
-                .limit(top_k))
+            catalog = self._catalog()
+            if catalog:
+                rows = catalog.rows(catalog.ids_containing('product_category', 'Fungicide'), limit=top_k)
+            else:
+                result = await aexecute(self.supabase.table(PRODUCT_TABLE) \
+                    .select(_PRODUCT_COLUMNS) \
+                    .ilike('product_category', '%Fungicide%') \
+                    .limit(top_k))
+                rows = result.data
 
-            if not result.data:
+            if not rows:
                 return []
 
             existing_ids = {d.id for d in existing_docs}
             docs = []
-            for item in result.data:
+            for item in rows:
                 if str(item['id']) in existing_ids:
                     continue
                 # If plant_type specified, filter by crop match
@@ -1341,25 +1557,34 @@ class RetrievalAgent:
             logger.info(f"    Symptom keyword fallback: matched {matched_symptoms}")
 
             # Build OR filter across pest columns
-            from app.utils.pest_columns import build_pest_or_conditions
-            or_conditions = []
-            for s in matched_symptoms:
-                or_conditions.extend(build_pest_or_conditions(s))
-            or_filter = ",".join(or_conditions)
+            from app.utils.pest_columns import PEST_COLUMNS, build_pest_or_conditions
+            plant_type = query_analysis.entities.get('plant_type', '')
+            catalog = self._catalog()
+            if catalog:
+                ids = catalog.ids_containing_any(PEST_COLUMNS, matched_symptoms)
+                # Narrow by plant type if available
+                if plant_type:
+                    ids &= catalog.ids_containing('applicable_crops', plant_type)
+                rows = catalog.rows(ids, limit=10)
+            else:
+                or_conditions = []
+                for s in matched_symptoms:
+                    or_conditions.extend(build_pest_or_conditions(s))
+                or_filter = ",".join(or_conditions)
 
-            query_builder = self.supabase.table(PRODUCT_TABLE).select(_PRODUCT_COLUMNS).or_(or_filter).limit(10)
+                query_builder = self.supabase.table(PRODUCT_TABLE).select(_PRODUCT_COLUMNS).or_(or_filter).limit(10)
 
-            # Narrow by plant type if available
-            plant_type = query_analysis.entities.get('plant_type', '')
-            if plant_type:
-                query_builder = query_builder.ilike('applicable_crops', f'%{plant_type}%')
+                # Narrow by plant type if available
+                if plant_type:
+                    query_builder = query_builder.ilike('applicable_crops', f'%{plant_type}%')
 
-            result = await aexecute(query_builder)
+                result = await aexecute(query_builder)
+                rows = result.data
 
-            if not result.data:
+            if not rows:
                 return []
 
-            docs = [self._build_doc_from_row(item, similarity=0.60) for item in result.data]
+            docs = [self._build_doc_from_row(item, similarity=0.60) for item in rows]
             logger.info(f"    Symptom keyword fallback: {len(docs)} docs found")
             return docs
 
@@ -1370,21 +1595,14 @@ class RetrievalAgent:
     async def _generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for search query (with LRU cache)"""
         # Check cache first
-        cached = _get_cached_embedding(text)
+        cached = await aget_cached_embedding(text)
         if cached is not None:
             return cached
 
         try:
-            response = await self.openai_client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=text,
-                encoding_format="float"
-            )
-            if not response.data:
-                logger.error("OpenAI embedding returned empty data")
-                return []
-            embedding = response.data[0].embedding
-            _set_cached_embedding(text, embedding)
+            # micro-batched: expanded queries ที่ยิงพร้อมกันรวมเป็น API call เดียว
+            embedding = await embed_text(text, self.openai_client)
+            await set_cached_embedding(text, embedding)
             return embedding
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
@@ -1404,13 +1622,42 @@ class RetrievalAgent:
 
         return unique_docs
 
+    @staticmethod
+    def _apply_rerank_order(
+        docs: List[RetrievedDocument],
+        rerank_pool: List[RetrievedDocument],
+        ranking_indices: List[int]
+    ) -> List[RetrievedDocument]:
+        """Reorder by pool indices; rerank_score by position, docs not ranked get 0.3."""
+        reranked = []
+        seen_indices = set()
+        _reranked_ids = set()
+        total_ranked = max(len(ranking_indices), 1)  # prevent division by zero
+        for rank, idx in enumerate(ranking_indices):
+            if idx not in seen_indices and idx < len(rerank_pool):
+                doc = rerank_pool[idx]
+                # Assign rerank score based on position (higher = better)
+                doc.rerank_score = 1.0 - (rank / total_ranked)
+                reranked.append(doc)
+                seen_indices.add(idx)
+                _reranked_ids.add(doc.id)
+
+        # Add remaining docs with lower scores (from full docs list)
+        for i, doc in enumerate(docs):
+            if doc.id not in _reranked_ids:
+                doc.rerank_score = 0.3  # Default low score
+                reranked.append(doc)
+
+        return reranked
+
     async def _rerank_with_llm(
         self,
         query: str,
         docs: List[RetrievedDocument],
-        intent: IntentType
+        intent: IntentType,
+        entities: Dict = None
     ) -> List[RetrievedDocument]:
-        """Re-rank documents using LLM as cross-encoder"""
+        """Re-rank documents using LLM as cross-encoder (or LocalReranker when RERANK_BACKEND=local)"""
         if not self.openai_client or len(docs) <= 1:
             return docs
 
@@ -1435,6 +1682,24 @@ class RetrievalAgent:
                             logger.info(f"  - Injected {_strat} product '{d.title}' into rerank window (category: {_cat})")
                             break
 
+            entities = entities or {}
+            _rank_kwargs = dict(
+                similarities=[d.similarity_score for d in rerank_pool],
+                expected_category=self.INTENT_CATEGORY_MAP.get(intent),
+                plant_type=str(entities.get('plant_type') or ''),
+                pest_terms=[entities[k] for k in ('pest_name', 'disease_name', 'weed_type')
+                            if isinstance(entities.get(k), str)],
+            )
+            _pool_meta = [d.metadata for d in rerank_pool]
+
+            # Local feature-based rerank — LLM only when the top pick is not clear-cut
+            if RERANK_BACKEND == "local":
+                order, margin = LocalReranker.get_instance().rank(query, _pool_meta, **_rank_kwargs)
+                if margin >= RERANK_LOCAL_MIN_MARGIN:
+                    logger.info(f"    Local rerank (margin={margin:.2f}): {[rerank_pool[i].title for i in order[:5]]}")
+                    return self._apply_rerank_order(docs, rerank_pool, order)
+                logger.info(f"    Local rerank margin {margin:.2f} < {RERANK_LOCAL_MIN_MARGIN} → LLM rerank")
+
             # Prepare document summaries
             doc_texts = []
             for i, doc in enumerate(rerank_pool, 1):
@@ -1510,27 +1775,8 @@ class RetrievalAgent:
                 except ValueError:
                     pass
 
-            # Build reranked list with scores
-            reranked = []
-            seen_indices = set()
-            _reranked_ids = set()
-            total_ranked = max(len(ranking_indices), 1)  # prevent division by zero
-            for rank, idx in enumerate(ranking_indices):
-                if idx not in seen_indices and idx < len(rerank_pool):
-                    doc = rerank_pool[idx]
-                    # Assign rerank score based on position (higher = better)
-                    doc.rerank_score = 1.0 - (rank / total_ranked)
-                    reranked.append(doc)
-                    seen_indices.add(idx)
-                    _reranked_ids.add(doc.id)
-
-            # Add remaining docs with lower scores (from full docs list)
-            for i, doc in enumerate(docs):
-                if doc.id not in _reranked_ids:
-                    doc.rerank_score = 0.3  # Default low score
-                    reranked.append(doc)
-
-            return reranked
+            await log_llm_ranking(query, _pool_meta, list(dict.fromkeys(ranking_indices)), **_rank_kwargs)
+            return self._apply_rerank_order(docs, rerank_pool, ranking_indices)
 
         except Exception as e:
             logger.warning(f"LLM rerank failed: {e}, using similarity scores")
@@ -4,7 +4,10 @@ Uses GPT-4o-mini for Thai language support (better than sentence-transformers fo
 """
 import logging
 from typing import List, Dict
-from app.config import LLM_MODEL_RERANKING, LLM_TEMP_RERANKING, LLM_TOKENS_RERANKING
+from app.config import (
+    LLM_MODEL_RERANKING, LLM_TEMP_RERANKING, LLM_TOKENS_RERANKING,
+    RERANK_BACKEND, RERANK_LOCAL_MIN_MARGIN,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +18,8 @@ async def rerank_products_with_llm(
     top_k: int = 6,
     openai_client=None,
     required_category: str = None,
-    required_category_th: str = None
+    required_category_th: str = None,
+    plant_type: str = ""
 ) -> List[Dict]:
     """
     Re-rank products using GPT-4o-mini as cross-encoder
@@ -28,23 +32,36 @@ async def rerank_products_with_llm(
     - openai_client: OpenAI async client
     - required_category: Required product category (fungicide/insecticide/herbicide)
     - required_category_th: Thai name of required category
+    - plant_type: crop from the query (local reranker crop feature)
+
+    RERANK_BACKEND=local → LocalReranker first, LLM only when its margin is low
 
     Returns:
     - Re-ranked list of products
     """
     try:
-        if not openai_client:
-            logger.warning("OpenAI client not available for re-ranking, returning original order")
-            return products[:top_k]
-
         if len(products) <= top_k:
             logger.info(f"Only {len(products)} products, skipping re-ranking")
             return products
 
+        from app.services.local_reranker import LocalReranker, log_llm_ranking
+        candidates = products[:15]
+        rank_kwargs = dict(expected_category=required_category, plant_type=plant_type or "")
+        if RERANK_BACKEND == "local":
+            order, margin = LocalReranker.get_instance().rank(query, candidates, **rank_kwargs)
+            if margin >= RERANK_LOCAL_MIN_MARGIN or not openai_client:
+                reranked = [candidates[i] for i in order]
+                logger.info(f"✓ Local re-rank (margin={margin:.2f}): {[p.get('product_name', '')[:20] for p in reranked[:top_k]]}")
+                return reranked[:top_k]
+            logger.info(f"Local re-rank margin {margin:.2f} < {RERANK_LOCAL_MIN_MARGIN} → LLM re-rank")
+
+        if not openai_client:
+            logger.warning("OpenAI client not available for re-ranking, returning original order")
+            return products[:top_k]
+
         logger.info(f"🔄 Re-ranking {len(products)} products for query: '{query}'")
 
         # Prepare product summaries for re-ranking (limit to top 15 candidates)
-        candidates = products[:15]
         product_texts = []
         for i, p in enumerate(candidates, 1):
             text = f"[{i}] {p.get('product_name', 'N/A')}"
@@ -125,6 +142,8 @@ async def rerank_products_with_llm(
                     reranked.append(candidates[idx])
                     seen_indices.add(idx)
 
+            await log_llm_ranking(query, candidates, list(dict.fromkeys(ranking_indices)), **rank_kwargs)
+
             # Add any remaining products not in ranking
             for i, p in enumerate(candidates):
                 if i not in seen_indices:
@@ -5,34 +5,66 @@ Semantic Cache — Upstash Redis + In-Memory with 3-Layer Protection
 
 Storage:
 - L0: Upstash Redis (persistent, shared across workers)
-- L1: In-Memory (fast fallback)
+  - semantic_cache:entry:{id} → 1 key ต่อ entry (embedding เป็น float32 bytes แบบ base64 + response)
+  - semantic_cache:index / semantic_cache:plant:{plant} → sorted set ของ entry id (score = created_at)
+  - แต่ละ worker sync แบบ incremental: ดึงเฉพาะ id ใหม่ที่ยังไม่เคยเห็น (ไม่ดาวน์โหลดทั้ง cache)
+- L1: In-Memory vector index (fast, per-worker)
+
+L1 layout:
+- 1 partition ต่อ plant_type → query ที่ระบุพืชสแกนเฉพาะ partition ของพืชนั้น
+- แต่ละ partition = float32 matrix (pre-normalized) → lookup = matrix-vector product ครั้งเดียว
+- created_at เก็บใน array คู่ขนาน → เช็ค TTL แบบ vectorized, evict แบบ swap-remove (ไม่ rebuild list)
+- partition ที่ใหญ่เกิน SEMANTIC_CACHE_IVF_MIN_ENTRIES จะสร้าง IVF index (spherical k-means)
+  แล้ว probe เฉพาะ SEMANTIC_CACHE_IVF_NPROBE clusters ที่ใกล้ที่สุด
+  k-means รันบน snapshot ใน thread (นอก _lock / event loop) แล้ว swap centroids กลับใต้ lock
 """
+import asyncio
+import base64
 import json
 import logging
-import math
 import time
 import threading
-from typing import List, Dict, Optional
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
 
 from app.config import (
     SEMANTIC_CACHE_ENABLED,
     SEMANTIC_CACHE_THRESHOLD,
     SEMANTIC_CACHE_TTL,
     SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_IVF_MIN_ENTRIES,
+    SEMANTIC_CACHE_IVF_NPROBE,
 )
 
 logger = logging.getLogger(__name__)
 
-# L1: In-Memory cache (per-worker, fast)
-_semantic_cache: List[Dict] = []
-_lock = threading.Lock()
+# L0: Redis keys
+_REDIS_ENTRY_PREFIX = "semantic_cache:entry:"
+_REDIS_INDEX_KEY = "semantic_cache:index"
+_REDIS_PLANT_INDEX_PREFIX = "semantic_cache:plant:"
+# sync ย้อนหลังเผื่อ clock skew ระหว่าง workers (id ซ้ำถูกกรองด้วย _seen_ids)
+_SYNC_SKEW_SECONDS = 5.0
+_MGET_CHUNK = 100
 
-# L0: Redis key prefix
-_REDIS_KEY = "semantic_cache:entries"
+_INITIAL_CAPACITY = 64
+_IVF_TRAIN_ITERATIONS = 5
+_IVF_TRAIN_SAMPLE = 8192
 
 
 def _get_redis():
-    """Get Redis client if available."""
+    """Get async Redis client if available (search/store run on the event loop)."""
+    try:
+        from app.services.redis_cache import async_redis_client
+        return async_redis_client
+    except Exception:
+        return None
+
+
+def _get_sync_redis():
+    """Sync client — only for clear_semantic_cache() (admin/tests)."""
     try:
         from app.services.redis_cache import redis_client
         return redis_client
@@ -40,49 +72,329 @@ def _get_redis():
         return None
 
 
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Cosine similarity between two vectors."""
-    dot = sum(x * y for x, y in zip(a, b))
-    mag_a = math.sqrt(sum(x * x for x in a))
-    mag_b = math.sqrt(sum(y * y for y in b))
-    if mag_a == 0 or mag_b == 0:
-        return 0.0
-    return dot / (mag_a * mag_b)
+def _normalize(embedding) -> Optional[np.ndarray]:
+    """แปลง embedding เป็น float32 unit vector (None ถ้าเป็น zero vector)."""
+    vec = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vec))
+    if vec.size == 0 or norm == 0.0 or not np.isfinite(norm):
+        return None
+    return vec / norm
+
+
+class _PlantPartition:
+    """Contiguous float32 matrix + parallel arrays สำหรับ plant_type เดียว."""
+
+    __slots__ = ("dim", "vectors", "created", "assign", "ids", "meta",
+                 "row_of", "size", "centroids", "trained_size", "training")
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.vectors = np.empty((_INITIAL_CAPACITY, dim), dtype=np.float32)
+        self.created = np.empty(_INITIAL_CAPACITY, dtype=np.float64)
+        self.assign = np.full(_INITIAL_CAPACITY, -1, dtype=np.int32)
+        self.ids: List[int] = []
+        self.meta: List[Dict] = []
+        self.row_of: Dict[int, int] = {}
+        self.size = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self.training = False  # snapshot กำลัง train อยู่ใน thread
+
+    def _grow(self) -> None:
+        capacity = self.vectors.shape[0] * 2
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        created = np.empty(capacity, dtype=np.float64)
+        created[:self.size] = self.created[:self.size]
+        assign = np.full(capacity, -1, dtype=np.int32)
+        assign[:self.size] = self.assign[:self.size]
+        self.vectors, self.created, self.assign = vectors, created, assign
+
+    def add(self, entry_id: int, vec: np.ndarray, created_at: float, meta: Dict) -> None:
+        if self.size == self.vectors.shape[0]:
+            self._grow()
+        row = self.size
+        self.vectors[row] = vec
+        self.created[row] = created_at
+        self.assign[row] = int(np.argmax(self.centroids @ vec)) if self.centroids is not None else -1
+        self.ids.append(entry_id)
+        self.meta.append(meta)
+        self.row_of[entry_id] = row
+        self.size += 1
+
+    def remove(self, entry_id: int) -> None:
+        """Swap-remove: ย้ายแถวสุดท้ายมาแทนที่ → O(dim) ไม่ต้อง shift ทั้ง matrix."""
+        row = self.row_of.pop(entry_id)
+        last = self.size - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.created[row] = self.created[last]
+            self.assign[row] = self.assign[last]
+            self.ids[row] = moved_id
+            self.meta[row] = self.meta[last]
+            self.row_of[moved_id] = row
+        self.ids.pop()
+        self.meta.pop()
+        self.size = last
+        if self.centroids is not None and self.size < SEMANTIC_CACHE_IVF_MIN_ENTRIES // 2:
+            self.centroids = None
+            self.trained_size = 0
+
+    def needs_training(self) -> bool:
+        """สร้าง/สร้างใหม่ IVF centroids เมื่อ partition ใหญ่ขึ้น 2 เท่าจากรอบก่อน."""
+        if self.training or self.size < SEMANTIC_CACHE_IVF_MIN_ENTRIES:
+            return False
+        return self.centroids is None or self.size >= self.trained_size * 2
+
+    def snapshot(self) -> Tuple[List[int], np.ndarray]:
+        """(ids, vectors copy) สำหรับ train นอก lock — เรียกใต้ _lock."""
+        self.training = True
+        return list(self.ids), self.vectors[:self.size].copy()
+
+    def install(self, centroids: np.ndarray, ids: List[int], labels: np.ndarray) -> None:
+        """Swap in centroids trained on a snapshot — rows added/moved since then are re-assigned by id."""
+        self.training = False
+        if self.size < SEMANTIC_CACHE_IVF_MIN_ENTRIES // 2:
+            return  # shrank below the IVF range while training
+        assign = np.full(self.size, -1, dtype=np.int32)
+        for entry_id, label in zip(ids, labels):
+            row = self.row_of.get(entry_id)
+            if row is not None:
+                assign[row] = label
+        missing = np.flatnonzero(assign < 0)
+        if missing.size:
+            assign[missing] = np.argmax(self.vectors[missing] @ centroids.T, axis=1)
+        self.assign[:self.size] = assign
+        self.centroids = centroids
+        self.trained_size = len(ids)
+
+    def best(self, query: np.ndarray, min_created: float) -> Tuple[float, int]:
+        """คืน (similarity, row) ของแถวที่ยังไม่หมดอายุและใกล้ query ที่สุด (-1 ถ้าไม่มี)."""
+        if self.size == 0:
+            return 0.0, -1
+
+        fresh = self.created[:self.size] >= min_created
+        if self.centroids is not None:
+            nprobe = min(SEMANTIC_CACHE_IVF_NPROBE, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            fresh &= np.isin(self.assign[:self.size], probe)
+            rows = np.flatnonzero(fresh)
+            if rows.size == 0:
+                return 0.0, -1
+            scores = self.vectors[rows] @ query
+            i = int(np.argmax(scores))
+            return float(scores[i]), int(rows[i])
+
+        scores = self.vectors[:self.size] @ query
+        scores[~fresh] = -np.inf
+        i = int(np.argmax(scores))
+        if not np.isfinite(scores[i]):
+            return 0.0, -1
+        return float(scores[i]), i
+
+
+def _train_ivf(data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means on a partition snapshot → (centroids, label per row). Pure — runs in a thread."""
+    size = len(data)
+    nlist = max(2, int(np.sqrt(size)))
+    rng = np.random.default_rng(size)
+    sample_size = min(size, max(_IVF_TRAIN_SAMPLE, nlist * 4))
+    sample = data[rng.choice(size, size=sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+    for _ in range(_IVF_TRAIN_ITERATIONS):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[labels == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids /= norms
+
+    logger.info(f"Semantic cache IVF trained: {size} entries → {nlist} lists")
+    return centroids, np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+
+
+class _SemanticIndex:
+    """L1 semantic cache: partition ตาม plant_type + FIFO order สำหรับ TTL/size eviction."""
+
+    def __init__(self):
+        self._partitions: Dict[str, _PlantPartition] = {}
+        # entry_id → plant_type ตามลำดับการเพิ่ม (= ลำดับ created_at) → evict ตัวเก่าสุดได้ O(1)
+        self._order: "OrderedDict[int, str]" = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def clear(self) -> None:
+        self._partitions.clear()
+        self._order.clear()
+
+    def add(self, query_text: str, embedding, response: str,
+            plant_type: str, created_at: float) -> bool:
+        vec = _normalize(embedding)
+        if vec is None:
+            return False
+        partition = self._partitions.get(plant_type)
+        if partition is None:
+            partition = self._partitions[plant_type] = _PlantPartition(vec.size)
+        elif partition.dim != vec.size:
+            logger.warning(f"Semantic cache: embedding dim {vec.size} != {partition.dim}, skipped")
+            return False
+
+        entry_id = self._next_id
+        self._next_id += 1
+        partition.add(entry_id, vec, created_at, {
+            "query_text": query_text,
+            "response": response,
+            "plant_type": plant_type,
+        })
+        self._order[entry_id] = plant_type
+        return True
+
+    def training_jobs(self) -> List[Tuple[_PlantPartition, List[int], np.ndarray]]:
+        """Snapshots of partitions due for IVF (re)training — call under _lock, train outside it."""
+        return [(partition, *partition.snapshot())
+                for partition in self._partitions.values() if partition.needs_training()]
+
+    def _remove(self, entry_id: int) -> None:
+        plant_type = self._order.pop(entry_id)
+        partition = self._partitions[plant_type]
+        partition.remove(entry_id)
+        if partition.size == 0:
+            del self._partitions[plant_type]
+
+    def evict(self, now: float, ttl: float, max_entries: int) -> None:
+        """ลบ entry หมดอายุ + ตัวเก่าสุดจนเหลือที่ว่างสำหรับ 1 entry."""
+        while self._order:
+            oldest_id, plant_type = next(iter(self._order.items()))
+            partition = self._partitions[plant_type]
+            row = partition.row_of[oldest_id]
+            if now - partition.created[row] <= ttl and len(self._order) < max_entries:
+                break
+            self._remove(oldest_id)
+
+    def search(self, query_embedding, plant_type: str,
+               threshold: float, now: float, ttl: float) -> Optional[Dict]:
+        query = _normalize(query_embedding)
+        if query is None:
+            return None
+
+        # Layer 2: plant_type — ระบุพืช → เฉพาะ partition ของพืชนั้น, ไม่ระบุ → ทุก partition
+        if plant_type:
+            partitions = [self._partitions[plant_type]] if plant_type in self._partitions else []
+        else:
+            partitions = list(self._partitions.values())
+
+        best_sim = 0.0
+        best_meta = None
+        for partition in partitions:
+            if partition.dim != query.size:
+                continue
+            # Layer 3 (TTL) + Layer 1 (similarity) ใน matrix op เดียว
+            sim, row = partition.best(query, now - ttl)
+            if row >= 0 and sim >= threshold and sim > best_sim:
+                best_sim = sim
+                best_meta = partition.meta[row]
+
+        if best_meta is None:
+            return None
+        return {
+            "response": best_meta["response"],
+            "similarity": best_sim,
+            "query_text": best_meta["query_text"],
+            "plant_type": best_meta["plant_type"],
+        }
 
 
-def _search_entries(entries: List[Dict], query_embedding: List[float],
-                    plant_type: str, threshold: float) -> Optional[Dict]:
-    """Search through entries with 3-layer protection."""
-    now = time.time()
-    best_match = None
-    best_sim = 0.0
+# L1: In-Memory vector index (per-worker, fast)
+_semantic_cache = _SemanticIndex()
+_lock = threading.Lock()
 
-    for entry in entries:
-        # Layer 3: TTL check
-        if now - entry.get("created_at", 0) > SEMANTIC_CACHE_TTL:
-            continue
+# L0 sync state: entry id → created_at ที่ worker นี้มีแล้ว + cursor ต่อ index key
+_seen_ids: Dict[str, float] = {}
+_sync_cursors: Dict[str, float] = {}
 
-        # Layer 2: plant_type check
-        entry_plant = entry.get("plant_type", "")
-        if plant_type and entry_plant and plant_type != entry_plant:
-            continue
-        if plant_type and not entry_plant:
-            continue
 
-        # Layer 1: similarity check
-        sim = _cosine_similarity(query_embedding, entry["embedding"])
-        if sim >= threshold and sim > best_sim:
-            best_sim = sim
-            best_match = entry
+def _encode_embedding(embedding) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype="<f4").tobytes()).decode("ascii")
+
+
+def _decode_embedding(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+def _index_key(plant_type: str) -> str:
+    return f"{_REDIS_PLANT_INDEX_PREFIX}{plant_type}" if plant_type else _REDIS_INDEX_KEY
 
-    if best_match:
-        return {
-            "response": best_match["response"],
-            "similarity": best_sim,
-            "query_text": best_match["query_text"],
-            "plant_type": best_match.get("plant_type", ""),
-        }
-    return None
+
+async def _sync_from_redis(redis, plant_type: str) -> int:
+    """ดึงเฉพาะ entries ใหม่จาก Redis เข้า L1 — คืนจำนวน entries ที่เพิ่ม.
+
+    plant_type ระบุ → sync จาก per-plant index, ไม่ระบุ → sync จาก global index
+    ZRANGEBYSCORE 1 round trip + MGET ทุก chunk รวมใน pipeline เดียว
+    """
+    from app.services.redis_cache import apipeline
+
+    now = time.time()
+    key = _index_key(plant_type)
+    with _lock:
+        since = max(_sync_cursors.get(key, 0.0), now - SEMANTIC_CACHE_TTL) - _SYNC_SKEW_SECONDS
+
+    ids = await redis.zrangebyscore(key, since, "+inf") or []
+    with _lock:
+        new_ids = [i for i in ids if i not in _seen_ids]
+
+    entries = []
+    if new_ids:
+        chunks = [new_ids[start:start + _MGET_CHUNK] for start in range(0, len(new_ids), _MGET_CHUNK)]
+        pipe = apipeline(redis)
+        for chunk in chunks:
+            pipe.mget(*[f"{_REDIS_ENTRY_PREFIX}{i}" for i in chunk])
+        for chunk, raws in zip(chunks, await pipe.execute()):
+            for entry_id, raw in zip(chunk, raws or []):
+                entries.append((entry_id, json.loads(raw) if raw else None))
+
+    added = 0
+    with _lock:
+        for entry_id, e in entries:
+            if entry_id in _seen_ids:
+                continue
+            _seen_ids[entry_id] = e["created_at"] if e else now
+            if not e or now - e["created_at"] > SEMANTIC_CACHE_TTL:
+                continue
+            # eviction เดียวกับ store — sync ไม่ดัน L1 เกิน SEMANTIC_CACHE_MAX_ENTRIES
+            _semantic_cache.evict(now, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_ENTRIES)
+            if _semantic_cache.add(e["query_text"], _decode_embedding(e["embedding"]),
+                                         e["response"], e["plant_type"], e["created_at"]):
+                added += 1
+        _sync_cursors[key] = now
+        # ลืม id ที่หมดอายุไปแล้ว (ไม่มีทางถูก sync กลับมาอีก)
+        cutoff = now - SEMANTIC_CACHE_TTL - _SYNC_SKEW_SECONDS
+        for entry_id in [i for i, t in _seen_ids.items() if t < cutoff]:
+            del _seen_ids[entry_id]
+    if added:
+        await _train_pending()
+    return added
+
+
+async def _train_pending() -> None:
+    """IVF (re)training นอก _lock: snapshot ใต้ lock → k-means ใน thread → install ใต้ lock."""
+    with _lock:
+        jobs = _semantic_cache.training_jobs()
+    for partition, ids, data in jobs:
+        try:
+            centroids, labels = await asyncio.to_thread(_train_ivf, data)
+        except Exception as e:
+            logger.warning(f"Semantic cache IVF training failed: {e}")
+            with _lock:
+                partition.training = False
+            continue
+        with _lock:
+            partition.install(centroids, ids, labels)
 
 
 async def search_semantic_cache(
@@ -99,25 +411,22 @@ async def search_semantic_cache(
 
     # Try L1 (in-memory) first — fastest
     with _lock:
-        result = _search_entries(_semantic_cache, query_embedding, plant_type, threshold)
+        result = _semantic_cache.search(query_embedding, plant_type, threshold,
+                                        time.time(), SEMANTIC_CACHE_TTL)
 
     if result:
         logger.info(f"✓ Semantic cache hit L1 (sim={result['similarity']:.3f}, plant={plant_type or 'none'})")
         return result
 
-    # Try L0 (Redis) — persistent, shared across workers
+    # Try L0 (Redis) — pull entries other workers stored since last sync, then re-search L1
     redis = _get_redis()
     if redis:
         try:
-            raw = redis.get(_REDIS_KEY)
-            if raw:
-                entries = json.loads(raw) if isinstance(raw, str) else json.loads(raw.decode())
-                result = _search_entries(entries, query_embedding, plant_type, threshold)
+            if await _sync_from_redis(redis, plant_type):
+                with _lock:
+                    result = _semantic_cache.search(query_embedding, plant_type, threshold,
+                                                    time.time(), SEMANTIC_CACHE_TTL)
                 if result:
-                    # Promote to L1 for faster access next time
-                    with _lock:
-                        _semantic_cache.clear()
-                        _semantic_cache.extend(entries)
                     logger.info(f"✓ Semantic cache hit L0/Redis (sim={result['similarity']:.3f}, plant={plant_type or 'none'})")
                     return result
         except Exception as e:
@@ -137,48 +446,60 @@ async def store_semantic_cache(
     if not SEMANTIC_CACHE_ENABLED or not query_embedding:
         return
 
-    entry = {
-        "query_text": query_text,
-        "embedding": query_embedding,
-        "response": response,
-        "plant_type": plant_type,
-        "created_at": time.time(),
-    }
+    now = time.time()
+    entry_id = f"{int(now * 1000)}-{uuid.uuid4().hex[:12]}"
 
     with _lock:
-        # Evict expired entries
-        now = time.time()
-        _semantic_cache[:] = [
-            e for e in _semantic_cache
-            if now - e.get("created_at", 0) <= SEMANTIC_CACHE_TTL
-        ]
-
-        # Evict oldest if full
-        if len(_semantic_cache) >= SEMANTIC_CACHE_MAX_ENTRIES:
-            _semantic_cache.sort(key=lambda e: e.get("created_at", 0))
-            del _semantic_cache[:max(1, len(_semantic_cache) // 5)]
-
-        _semantic_cache.append(entry)
-        entries_snapshot = list(_semantic_cache)
-
-    # Persist to Redis (fire-and-forget)
+        # Evict expired + oldest if full
+        _semantic_cache.evict(now, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_ENTRIES)
+        _semantic_cache.add(query_text, query_embedding, response, plant_type, now)
+        _seen_ids[entry_id] = now
+        entry_count = len(_semantic_cache)
+    await _train_pending()
+
+    # Persist to Redis — เขียนเฉพาะ entry นี้ ไม่ทับ entries ของ worker อื่น
+    # SET + ZADD/ZREMRANGEBYSCORE/EXPIRE ทุก index รวมใน pipeline เดียว (1 round trip)
     redis = _get_redis()
     if redis:
         try:
-            redis.set(_REDIS_KEY, json.dumps(entries_snapshot), ex=SEMANTIC_CACHE_TTL)
+            from app.services.redis_cache import apipeline
+            pipe = apipeline(redis)
+            pipe.set(f"{_REDIS_ENTRY_PREFIX}{entry_id}", json.dumps({
+                "query_text": query_text,
+                "response": response,
+                "plant_type": plant_type,
+                "created_at": now,
+                "embedding": _encode_embedding(query_embedding),
+            }, ensure_ascii=False), ex=SEMANTIC_CACHE_TTL)
+            index_keys = [_REDIS_INDEX_KEY] + ([_index_key(plant_type)] if plant_type else [])
+            for key in index_keys:
+                pipe.zadd(key, {entry_id: now})
+                pipe.zremrangebyscore(key, "-inf", now - SEMANTIC_CACHE_TTL)
+                pipe.expire(key, SEMANTIC_CACHE_TTL)
+            await pipe.execute()
         except Exception as e:
             logger.warning(f"Semantic cache Redis write failed: {e}")
 
-    logger.info(f"✓ Semantic cache stored (plant={plant_type or 'none'}, entries={len(entries_snapshot)})")
+    logger.info(f"✓ Semantic cache stored (plant={plant_type or 'none'}, entries={entry_count})")
 
 
 def clear_semantic_cache() -> None:
     """ล้าง semantic cache ทั้งหมด (L1 + L0)."""
     with _lock:
         _semantic_cache.clear()
-    redis = _get_redis()
+        _seen_ids.clear()
+        _sync_cursors.clear()
+    redis = _get_sync_redis()
     if redis:
         try:
-            redis.delete(_REDIS_KEY)
+            ids = redis.zrangebyscore(_REDIS_INDEX_KEY, "-inf", "+inf") or []
+            keys = [_REDIS_INDEX_KEY]
+            for start in range(0, len(ids), _MGET_CHUNK):
+                entry_keys = [f"{_REDIS_ENTRY_PREFIX}{i}" for i in ids[start:start + _MGET_CHUNK]]
+                for raw in redis.mget(*entry_keys) or []:
+                    if raw:
+                        keys.append(_index_key(json.loads(raw).get("plant_type", "")))
+                keys.extend(entry_keys)
+            redis.delete(*set(keys))
         except Exception:
             pass
@@ -0,0 +1,265 @@
+"""
+Single-flight for identical concurrent RAG requests.
+
+ช่วง outbreak เกษตรกรหลายคนถามคำถามเดียวกันพร้อมกัน → เดิมทุกข้อความรัน response cache
+lookup + embedding + AgenticRAG 4 agents + store_semantic_cache แยกกันหมด (LLM spend ซ้ำ N เท่า)
+
+ตอนนี้ (key = _make_response_cache_key เดียวกับ response cache):
+- request แรก = leader → รัน pipeline ตามปกติ
+- request ที่ตามมาระหว่างนั้น = follower → รอคำตอบของ leader (ไม่เรียก LLM เอง)
+- ข้าม worker: leader ถือ Redis lock (SET NX EX); worker อื่น poll result key ที่ leader เขียนตอนจบ
+- leader error / timeout / ไม่มีคำตอบที่ share ได้ → follower คำนวณเอง (ไม่มีใครค้าง)
+
+Usage:
+    @rag_single_flight.scoped(exclude=(ERROR_GENERIC,))
+    async def handle(...):
+        ...
+        shared = await rag_single_flight.join(key)  # None → this request is the leader
+
+Stats exposed via get_rag_single_flight_stats() → /health.
+"""
+import asyncio
+import functools
+import logging
+import math
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+from app.config import (
+    RAG_SINGLE_FLIGHT_ENABLED,
+    RAG_SINGLE_FLIGHT_POLL_MS,
+    RAG_SINGLE_FLIGHT_REDIS,
+    RAG_SINGLE_FLIGHT_WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+_REDIS_PREFIX = "ragflight:"
+_RESULT_TTL = 60  # seconds — remote followers only need it while the burst lasts
+
+# DEL เฉพาะ lock ที่ยังเป็น token ของเรา — leader ช้ากว่า wait → lock หมดอายุแล้ว worker อื่นอาจถือต่อ
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _get_redis():
+    """Get async Redis client if available."""
+    try:
+        from app.services.redis_cache import async_redis_client
+        return async_redis_client
+    except Exception:
+        return None
+
+
+def _lock_key(key: str) -> str:
+    return f"{_REDIS_PREFIX}lock:{key}"
+
+
+def _result_key(key: str) -> str:
+    return f"{_REDIS_PREFIX}result:{key}"
+
+
+class _Flight:
+    """Per-request state: keys this request leads + the answer to hand out."""
+
+    __slots__ = ("led", "redis_locks", "answer")
+
+    def __init__(self):
+        self.led: List[str] = []
+        self.redis_locks: Dict[str, str] = {}  # key → lock token
+        self.answer: Optional[str] = None
+
+    def publish(self, answer: Optional[str]) -> None:
+        self.answer = answer
+
+
+_current_flight: ContextVar[Optional[_Flight]] = ContextVar("rag_single_flight", default=None)
+
+
+class SingleFlight:
+    """In-process futures per key, optionally arbitrated across workers by a Redis lock."""
+
+    def __init__(
+        self,
+        enabled: bool = RAG_SINGLE_FLIGHT_ENABLED,
+        use_redis: bool = RAG_SINGLE_FLIGHT_REDIS,
+        wait: float = RAG_SINGLE_FLIGHT_WAIT,
+        poll_ms: float = RAG_SINGLE_FLIGHT_POLL_MS,
+    ):
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.wait = wait
+        self.poll = poll_ms / 1000.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {
+            "leaders": 0,
+            "followers": 0,
+            "remote_followers": 0,
+            "shared": 0,
+            "timeouts": 0,
+            "redis_errors": 0,
+        }
+
+    # =====================================================================
+    # Request scope
+    # =====================================================================
+
+    @asynccontextmanager
+    async def scope(self):
+        """One request; on exit every key it leads is resolved with flight.answer (None = not shareable)."""
+        flight = _Flight()
+        token = _current_flight.set(flight)
+        try:
+            yield flight
+        finally:
+            _current_flight.reset(token)
+            await self._finish(flight)
+
+    def scoped(self, exclude: Iterable[str] = ()):
+        """Decorator: run the handler in a scope and share its return value unless it is in `exclude`."""
+        excluded = frozenset(exclude)
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                async with self.scope() as flight:
+                    answer = await fn(*args, **kwargs)
+                    if isinstance(answer, str) and answer and answer not in excluded:
+                        flight.publish(answer)
+                    return answer
+            return wrapper
+        return decorator
+
+    # =====================================================================
+    # Join
+    # =====================================================================
+
+    async def join(self, key: str) -> Optional[str]:
+        """Answer computed by a concurrent identical request, or None → caller leads and computes it."""
+        flight = _current_flight.get()
+        if not self.enabled or flight is None or not key or key in flight.led:
+            return None
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self._stats["followers"] += 1
+            try:
+                answer = await asyncio.wait_for(asyncio.shield(fut), self.wait)
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                logger.warning(f"Single-flight: leader still running after {self.wait:.0f}s, computing locally")
+                return None
+            if answer:
+                self._stats["shared"] += 1
+                logger.info(f"✓ Single-flight: shared in-flight answer [{key[:8]}]")
+            return answer
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        flight.led.append(key)
+
+        if self.use_redis:
+            answer = await self._join_remote(key, flight)
+            if answer:
+                # another worker answered — hand it to our local followers too
+                flight.led.remove(key)
+                self._resolve(key, answer)
+                return answer
+
+        self._stats["leaders"] += 1
+        return None
+
+    async def _join_remote(self, key: str, flight: _Flight) -> Optional[str]:
+        """Take the cross-worker lock, or poll for the answer of the worker holding it."""
+        redis = _get_redis()
+        if redis is None:
+            return None
+
+        from app.services.redis_cache import apipeline
+        lock_key, result_key = _lock_key(key), _result_key(key)
+        token = uuid.uuid4().hex
+        try:
+            pipe = apipeline(redis)
+            pipe.get(result_key)
+            pipe.set(lock_key, token, ex=max(1, math.ceil(self.wait)), nx=True)
+            result, acquired = await pipe.execute()
+            if result:
+                if acquired:
+                    await redis.delete(lock_key)
+                self._stats["shared"] += 1
+                return result
+            if acquired:
+                flight.redis_locks[key] = token
+                return None
+
+            self._stats["remote_followers"] += 1
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.wait
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll)
+                pipe = apipeline(redis)
+                pipe.get(result_key)
+                pipe.exists(lock_key)
+                result, locked = await pipe.execute()
+                if result:
+                    self._stats["shared"] += 1
+                    logger.info(f"✓ Single-flight: shared answer from another worker [{key[:8]}]")
+                    return result
+                if not locked:
+                    return None  # remote leader finished without a shareable answer
+            self._stats["timeouts"] += 1
+            return None
+        except Exception as e:
+            self._stats["redis_errors"] += 1
+            logger.warning(f"Single-flight Redis error (computing locally): {e}")
+            return None
+
+    # =====================================================================
+    # Finish
+    # =====================================================================
+
+    def _resolve(self, key: str, answer: Optional[str]) -> None:
+        fut = self._inflight.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(answer)
+
+    async def _finish(self, flight: _Flight) -> None:
+        answer = flight.answer
+        for key in flight.led:
+            self._resolve(key, answer)
+        if not flight.redis_locks:
+            return
+
+        redis = _get_redis()
+        if redis is None:
+            return
+        try:
+            from app.services.redis_cache import apipeline
+            pipe = apipeline(redis)
+            for key, token in flight.redis_locks.items():
+                if answer:
+                    pipe.set(_result_key(key), answer, ex=_RESULT_TTL)
+                pipe.eval_script(_RELEASE_LOCK_SCRIPT, [_lock_key(key)], [token])
+            await pipe.execute()
+        except Exception as e:
+            self._stats["redis_errors"] += 1
+            logger.warning(f"Single-flight Redis release failed: {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["in_flight"] = len(self._inflight)
+        return stats
+
+
+rag_single_flight = SingleFlight()
+
+
+def get_rag_single_flight_stats() -> dict:
+    return rag_single_flight.get_stats()
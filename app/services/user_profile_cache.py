@@ -0,0 +1,280 @@
+"""
+User Profile Cache — display name ต่อ user ใช้ร่วมกันทุก worker (user_service / admin inbox)
+
+เดิม:
+- ensure_user_exists: _known_users เป็น set ต่อ process → เจอ user ครั้งแรกในแต่ละ worker
+  = LINE/FB profile API + SELECT + UPDATE
+- FB user ที่รู้จักแล้ว: SELECT display_name ทุกข้อความเพื่อเช็คว่ายังเป็น "FB User #..." ไหม
+- admin get_conversations: refresh_display_name ทีละคน (≤5 API calls) + UPDATE ทีละแถว ระหว่าง request
+
+ตอนนี้:
+- entry ต่อ user {name, fallback, retry_at}: L1 LRU + Redis userprof:{user_id} (TTL USER_PROFILE_CACHE_TTL)
+  → webhook ของ user ที่รู้จักแล้ว = cache hit ไม่มี profile API / DB I/O
+- ชื่อ fallback → schedule_refresh() (sync, ไม่มี I/O) → background batch หลัง USER_PROFILE_REFRESH_DELAY_MS
+  ดึง profile พร้อมกัน ≤ USER_PROFILE_REFRESH_CONCURRENCY แล้ว bulk UPSERT display_name ครั้งเดียว
+- ดึงไม่สำเร็จ = negative cache: retry_at = now + USER_PROFILE_NEGATIVE_TTL (worker อื่นเห็นผ่าน Redis)
+  ชื่อ fallback หน้าตาแย่ ("User_fb:...") ถูกแก้เป็น "FB User #xxxx" ใน UPSERT เดียวกัน
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.config import (
+    USER_PROFILE_CACHE_TTL,
+    USER_PROFILE_NEGATIVE_TTL,
+    USER_PROFILE_CACHE_MAX_USERS,
+    USER_PROFILE_REFRESH_DELAY_MS,
+    USER_PROFILE_REFRESH_CONCURRENCY,
+    USER_PROFILE_REFRESH_BATCH,
+)
+
+logger = logging.getLogger(__name__)
+
+_REDIS_PREFIX = "userprof:"
+_UPSERT_CHUNK = 500
+
+
+def _get_redis():
+    """Get async Redis client if available."""
+    try:
+        from app.services.redis_cache import async_redis_client
+        return async_redis_client
+    except Exception:
+        return None
+
+
+def _redis_key(user_id: str) -> str:
+    return f"{_REDIS_PREFIX}{user_id}"
+
+
+def fallback_display_name(user_id: str) -> str:
+    """Name stored when no profile could be fetched."""
+    return f"FB User #{user_id[-4:]}" if user_id.startswith("fb:") else f"User_{user_id[:8]}"
+
+
+def is_fallback_name(name: Optional[str]) -> bool:
+    """True for empty / auto-generated names ("FB User #...", "User_...", legacy "User_fb:...")."""
+    return not name or name.startswith("FB User #") or name.startswith("User_")
+
+
+class UserProfileCache:
+    """Per-user display-name entries (L1 + Redis) with a batched background name refresher."""
+
+    def __init__(
+        self,
+        fetcher: Callable[[str], Awaitable[Optional[str]]],
+        writer: Callable[[List[dict]], Awaitable[None]],
+        ttl: int = USER_PROFILE_CACHE_TTL,
+        negative_ttl: int = USER_PROFILE_NEGATIVE_TTL,
+        max_users: int = USER_PROFILE_CACHE_MAX_USERS,
+        refresh_delay_ms: float = USER_PROFILE_REFRESH_DELAY_MS,
+        concurrency: int = USER_PROFILE_REFRESH_CONCURRENCY,
+        batch_size: int = USER_PROFILE_REFRESH_BATCH,
+    ):
+        self.fetcher = fetcher  # user_id → display name from LINE/FB, None on failure
+        self.writer = writer    # rows [{line_user_id, display_name}] → one bulk UPSERT
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_users = max_users
+        self.refresh_delay = refresh_delay_ms / 1000.0
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+
+        self._l1: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._pending: "OrderedDict[str, Optional[str]]" = OrderedDict()  # user_id → current (fallback) name
+        self._refresh_handle: Optional[asyncio.TimerHandle] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self._stats = {
+            "l1_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0,
+            "refresh_scheduled": 0, "refreshed": 0, "refresh_failed": 0,
+            "rows_written": 0, "write_errors": 0,
+        }
+
+    # =====================================================================
+    # Entries
+    # =====================================================================
+
+    def _entry(self, user_id: str, name: Optional[str], failed: bool) -> dict:
+        fallback = is_fallback_name(name)
+        return {
+            "name": name or fallback_display_name(user_id),
+            "fallback": fallback,
+            "retry_at": time.time() + self.negative_ttl if (fallback and failed) else 0.0,
+        }
+
+    def _l1_get(self, user_id: str) -> Optional[dict]:
+        item = self._l1.get(user_id)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.time():
+            del self._l1[user_id]
+            return None
+        self._l1.move_to_end(user_id)
+        return entry
+
+    def _l1_put(self, user_id: str, entry: dict) -> None:
+        self._l1[user_id] = (time.time() + self.ttl, entry)
+        self._l1.move_to_end(user_id)
+        while len(self._l1) > self.max_users:
+            self._l1.popitem(last=False)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """Cached entry, or None when this user has not been seen (by any worker) within TTL."""
+        entry = self._l1_get(user_id)
+        if entry is not None:
+            self._stats["l1_hits"] += 1
+            return entry
+
+        redis = _get_redis()
+        if redis:
+            try:
+                raw = await redis.get(_redis_key(user_id))
+                if raw:
+                    entry = json.loads(raw)
+                    self._l1_put(user_id, entry)
+                    self._stats["redis_hits"] += 1
+                    return entry
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Profile cache Redis read failed: {e}")
+        self._stats["misses"] += 1
+        return None
+
+    async def put(self, user_id: str, name: Optional[str], failed: bool = False) -> dict:
+        """Record the user's stored display name; failed=True negative-caches a fallback name."""
+        entry = self._entry(user_id, name, failed)
+        self._l1_put(user_id, entry)
+        redis = _get_redis()
+        if redis:
+            try:
+                await redis.set(_redis_key(user_id), json.dumps(entry, ensure_ascii=False), ex=self.ttl)
+            except Exception as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Profile cache Redis write failed: {e}")
+        return entry
+
+    async def _reload(self, user_ids: List[str]) -> Dict[str, dict]:
+        """Fresh entries from Redis (another worker may have fixed / negative-cached them)."""
+        redis = _get_redis()
+        if not redis or not user_ids:
+            return {}
+        try:
+            raws = await redis.mget(*[_redis_key(uid) for uid in user_ids])
+        except Exception as e:
+            self._stats["redis_errors"] += 1
+            logger.warning(f"Profile cache Redis read failed: {e}")
+            return {}
+        found = {}
+        for uid, raw in zip(user_ids, raws):
+            if raw:
+                found[uid] = json.loads(raw)
+                self._l1_put(uid, found[uid])
+        return found
+
+    # =====================================================================
+    # Background refresher
+    # =====================================================================
+
+    def schedule_refresh(self, user_id: str, current_name: Optional[str] = None) -> bool:
+        """Queue a fallback-name fix (no I/O). False when not needed or negative-cached."""
+        entry = self._l1_get(user_id)
+        if entry is not None and (not entry["fallback"] or entry["retry_at"] > time.time()):
+            return False
+        if user_id in self._pending or len(self._pending) >= self.max_users:
+            return False
+        self._pending[user_id] = current_name if current_name is not None else (entry or {}).get("name")
+        self._stats["refresh_scheduled"] += 1
+        if self._refresh_handle is None:
+            self._schedule()
+        return True
+
+    def schedule_refresh_many(self, users: Iterable[Tuple[str, Optional[str]]]) -> int:
+        return sum(1 for uid, name in users if self.schedule_refresh(uid, name))
+
+    def _schedule(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (sync caller) — next schedule_refresh() will arm the timer
+        self._refresh_handle = loop.call_later(self.refresh_delay, self._start_refresh)
+
+    def _start_refresh(self) -> None:
+        self._refresh_handle = None
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh_pending())
+
+    async def refresh_pending(self) -> int:
+        """Fetch profiles for up to batch_size queued users, then one bulk UPSERT. Returns names fixed."""
+        async with self._refresh_lock:
+            batch: Dict[str, Optional[str]] = {}
+            while self._pending and len(batch) < self.batch_size:
+                uid, name = self._pending.popitem(last=False)
+                batch[uid] = name
+
+            now = time.time()
+            for uid, entry in (await self._reload(list(batch))).items():
+                if not entry["fallback"] or entry["retry_at"] > now:
+                    batch.pop(uid, None)
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def _fetch(uid: str) -> Optional[str]:
+                async with semaphore:
+                    try:
+                        return await self.fetcher(uid)
+                    except Exception as e:
+                        logger.warning(f"Profile refresh failed for {uid[:12]}...: {e}")
+                        return None
+
+            names = await asyncio.gather(*(_fetch(uid) for uid in batch))
+
+            rows, results = [], []
+            for (uid, current), name in zip(batch.items(), names):
+                if name:
+                    rows.append({"line_user_id": uid, "display_name": name})
+                    results.append((uid, name, False))
+                else:
+                    clean = fallback_display_name(uid)
+                    if current and current != clean:  # legacy "User_fb:..." → "FB User #xxxx"
+                        rows.append({"line_user_id": uid, "display_name": clean})
+                    results.append((uid, clean, True))
+
+            written = True
+            try:
+                for start in range(0, len(rows), _UPSERT_CHUNK):
+                    await self.writer(rows[start:start + _UPSERT_CHUNK])
+                self._stats["rows_written"] += len(rows)
+            except Exception as e:
+                written = False
+                self._stats["write_errors"] += 1
+                logger.error(f"Profile refresh bulk update failed ({len(rows)} rows): {e}")
+
+            fixed = 0
+            for uid, name, failed in results:
+                if not written and not failed:
+                    name, failed = batch[uid], True  # DB still has the old name — retry after negative TTL
+                await self.put(uid, name, failed=failed)
+                if failed:
+                    self._stats["refresh_failed"] += 1
+                else:
+                    fixed += 1
+            self._stats["refreshed"] += fixed
+            if rows and written:
+                logger.info(f"✓ Profile refresh: {fixed}/{len(batch)} names fixed, {len(rows)} rows in 1 upsert")
+
+        if self._pending and self._refresh_handle is None:
+            self._schedule()
+        return fixed
+
+    def get_stats(self) -> dict:
+        stats = dict(self._stats)
+        lookups = stats["l1_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        stats["l1_users"] = len(self._l1)
+        stats["pending_refresh"] = len(self._pending)
+        return stats
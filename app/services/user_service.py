@@ -1,15 +1,19 @@
 """
 User Service
 Handles user profile tracking via user_ladda(LINE,FACE) table only.
+
+Known users are served from the shared UserProfileCache (L1 + Redis) — no profile API / DB I/O
+on the webhook path; fallback names are fixed in the background with bulk UPSERTs.
 """
 
 import logging
 from typing import Optional, Dict
 from datetime import datetime, timezone
-import httpx
 from app.dependencies import supabase_client
 from app.config import LINE_CHANNEL_ACCESS_TOKEN, FB_PAGE_ACCESS_TOKEN
 from app.utils.async_db import aexecute
+from app.utils.http_clients import FACEBOOK_GRAPH, LINE_API, http_request
+from app.services.user_profile_cache import UserProfileCache, fallback_display_name
 
 logger = logging.getLogger(__name__)
 
@@ -37,12 +41,12 @@ async def get_line_profile(user_id: str) -> Optional[Dict]:
             "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                LINE_PROFILE_API.format(user_id=user_id),
-                headers=headers,
-                timeout=10.0
-            )
+        response = await http_request(
+            LINE_API, "GET",
+            LINE_PROFILE_API.format(user_id=user_id),
+            headers=headers,
+            timeout=10.0
+        )
 
         if response.status_code == 200:
             profile = response.json()
@@ -88,8 +92,7 @@ async def get_facebook_profile(psid: str, skip_cache: bool = False) -> Optional[
             "access_token": FB_PAGE_ACCESS_TOKEN,
         }
         url = FB_GRAPH_API.format(psid=psid)
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=10.0)
+        response = await http_request(FACEBOOK_GRAPH, "GET", url, params=params, timeout=10.0)
 
         if response.status_code == 200:
             profile = response.json()
@@ -125,14 +128,19 @@ async def register_user_ladda(user_id: str, display_name: Optional[str] = None)
         user_id: LINE user ID or fb:{psid} for Facebook users
         display_name: Display name (optional, mainly from LINE profile)
     """
+    return await _register_user_ladda(user_id, display_name) is not None
+
+
+async def _register_user_ladda(user_id: str, display_name: Optional[str] = None) -> Optional[str]:
+    """register_user_ladda body — returns the display_name now stored in DB (None on error)."""
     try:
         if not supabase_client:
             logger.warning("Supabase client not available — skip register_user_ladda")
-            return False
+            return None
 
         # Check if user already exists
         result = await aexecute(supabase_client.table(TABLE) \
-            .select('id, line_user_id') \
+            .select('id, line_user_id, display_name') \
             .eq('line_user_id', user_id))
 
         now = datetime.now(timezone.utc).isoformat()
@@ -147,16 +155,11 @@ async def register_user_ladda(user_id: str, display_name: Optional[str] = None)
                 .update(update_data) \
                 .eq('line_user_id', user_id))
             logger.debug(f"✓ Updated user_ladda for {user_id}")
+            return display_name or result.data[0].get('display_name') or ""
         else:
             # New user → insert
             # Better fallback name for FB users
-            if not display_name:
-                if user_id.startswith("fb:"):
-                    fallback = f"FB User #{user_id[-4:]}"
-                else:
-                    fallback = f"User_{user_id[:8]}"
-            else:
-                fallback = display_name
+            fallback = display_name or fallback_display_name(user_id)
 
             insert_data = {
                 "line_user_id": user_id,
@@ -167,32 +170,50 @@ async def register_user_ladda(user_id: str, display_name: Optional[str] = None)
             await aexecute(supabase_client.table(TABLE) \
                 .insert(insert_data))
             logger.info(f"🆕 Registered new user_ladda: {user_id} ({display_name or 'no name'})")
-
-        return True
+            return fallback
 
     except Exception as e:
         logger.error(f"Error in register_user_ladda for {user_id}: {e}", exc_info=True)
-        return False
+        return None
+
+
+async def _fetch_display_name(user_id: str) -> Optional[str]:
+    """Display name from the LINE / Facebook profile API (None if unavailable)."""
+    if user_id.startswith("fb:"):
+        psid = user_id.replace("fb:", "", 1)
+        profile = await get_facebook_profile(psid)
+        if profile:
+            return f"{profile.get('first_name', '')} {profile.get('last_name', '')}".strip() or None
+        return None
+    profile = await get_line_profile(user_id)
+    return profile.get("displayName") if profile else None
+
+
+async def _bulk_update_display_names(rows: list) -> None:
+    """One UPSERT for many {line_user_id, display_name} rows (line_user_id is UNIQUE)."""
+    if not supabase_client:
+        raise RuntimeError("Supabase client not available")
+    await aexecute(supabase_client.table(TABLE).upsert(rows, on_conflict="line_user_id"))
+
+
+# Shared (L1 + Redis) known-user / display-name cache + background fallback-name refresher
+profile_cache = UserProfileCache(fetcher=_fetch_display_name, writer=_bulk_update_display_names)
+
+
+def get_user_profile_cache_stats() -> dict:
+    return profile_cache.get_stats()
 
 
 async def refresh_display_name(user_id: str) -> Optional[str]:
     """Re-fetch profile and update display_name for users with fallback names (User_xxx)."""
     try:
-        display_name = None
-        if user_id.startswith("fb:"):
-            psid = user_id.replace("fb:", "", 1)
-            profile = await get_facebook_profile(psid)
-            if profile:
-                display_name = f"{profile.get('first_name', '')} {profile.get('last_name', '')}".strip()
-        else:
-            profile = await get_line_profile(user_id)
-            if profile:
-                display_name = profile.get("displayName")
+        display_name = await _fetch_display_name(user_id)
 
         if display_name and supabase_client:
             await aexecute(supabase_client.table(TABLE) \
                 .update({"display_name": display_name}) \
                 .eq("line_user_id", user_id))
+            await profile_cache.put(user_id, display_name)
             logger.info(f"Refreshed display_name for {user_id[:12]}... → {display_name}")
 
         return display_name
@@ -201,47 +222,28 @@ async def refresh_display_name(user_id: str) -> Optional[str]:
         return None
 
 
-# In-memory cache of known user IDs — skip DB check for repeat messages
-_known_users: set = set()
-
-
 async def ensure_user_exists(user_id: str) -> bool:
     """
     Ensure user exists in user_ladda(LINE,FACE) table.
     Fetches LINE/Facebook profile for display_name.
-    Uses in-memory cache to skip DB for known users.
-    For FB users with fallback names, retries fetching real name.
+    Known users (any worker, within USER_PROFILE_CACHE_TTL) are a cache hit — no API / DB I/O.
+    Fallback names (FB User #..., User_...) are queued for the background refresher.
     """
-    if user_id in _known_users:
-        # FB users with fallback name → retry fetching real name
-        if user_id.startswith("fb:"):
-            try:
-                if supabase_client:
-                    result = await aexecute(supabase_client.table(TABLE)
-                        .select('display_name')
-                        .eq('line_user_id', user_id))
-                    if result.data and result.data[0].get('display_name', '').startswith('FB User'):
-                        await refresh_display_name(user_id)
-            except Exception:
-                pass
+    entry = await profile_cache.get(user_id)
+    if entry is not None:
+        if entry["fallback"]:
+            profile_cache.schedule_refresh(user_id, entry["name"])
         return True
 
     try:
-        display_name = None
-        if user_id.startswith("fb:"):
-            psid = user_id.replace("fb:", "", 1)
-            profile = await get_facebook_profile(psid)
-            if profile:
-                display_name = f"{profile.get('first_name', '')} {profile.get('last_name', '')}".strip()
-        else:
-            profile = await get_line_profile(user_id)
-            if profile:
-                display_name = profile.get("displayName")
-
-        success = await register_user_ladda(user_id, display_name)
-        if success:
-            _known_users.add(user_id)
-        return success
+        display_name = await _fetch_display_name(user_id)
+
+        stored_name = await _register_user_ladda(user_id, display_name)
+        if stored_name is None:
+            return False
+        # fetch failed + DB still has a fallback name → negative-cached (retried after USER_PROFILE_NEGATIVE_TTL)
+        await profile_cache.put(user_id, stored_name, failed=not display_name)
+        return True
 
     except Exception as e:
         logger.error(f"Error ensuring user exists {user_id}: {e}", exc_info=True)
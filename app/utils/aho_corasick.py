@@ -0,0 +1,106 @@
+"""
+Aho-Corasick multi-pattern matcher (pure Python, built once, matched many times).
+
+ProductRegistry / PlantRegistry เดิม: sort alias หลายพันตัวตามความยาวทุก call แล้ว `alias in text`
+ทีละตัว → O(#aliases × len(text)) ต่อ call และเรียกหลายครั้งต่อข้อความ
+
+ตอนนี้: compile aliases เป็น automaton ตอน _build_index → match ทุก alias ใน 1 pass O(len(text))
+
+Pattern id = ลำดับที่ส่งเข้ามา (ซ้ำ = ใช้ตัวแรก). Registries ส่ง aliases เรียง longest-first
+แบบเดียวกับ loop เดิม → "id น้อยสุดที่เจอ" = alias ที่ loop เดิมจะเจอก่อน (ผลลัพธ์เหมือนเดิม)
+
+Usage:
+    matcher = AhoCorasick(["ข้าวโพด", "ข้าว"])
+    matcher.first("ปลูกข้าวโพด")        # → 0  (lowest pattern id present)
+    matcher.find_all("ข้าวโพดกับข้าว")   # → [(0, 4, 1), (0, 7, 0), (10, 14, 1)]
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_NONE = -1
+
+
+class AhoCorasick:
+    """Trie + failure links; every node knows the lowest pattern id on its suffix chain."""
+
+    __slots__ = ("patterns", "_ids", "_goto", "_fail", "_out", "_dict_link", "_best")
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[int] = [_NONE]  # pattern ending exactly at node
+
+        for pattern in patterns:
+            if not pattern or pattern in self._ids:
+                continue
+            pid = len(self.patterns)
+            self._ids[pattern] = pid
+            self.patterns.append(pattern)
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(_NONE)
+                node = nxt
+            self._out[node] = pid
+
+        size = len(self._goto)
+        self._fail: List[int] = [0] * size
+        self._dict_link: List[int] = [_NONE] * size  # nearest proper suffix node with an output
+        self._best: List[int] = list(self._out)      # min pattern id on node's suffix chain
+        self._link()
+
+    def _link(self) -> None:
+        goto, fail, out, dict_link, best = self._goto, self._fail, self._out, self._dict_link, self._best
+        queue = list(goto[0].values())  # depth-1 nodes: fail → root
+        for node in queue:  # BFS — suffix nodes are always finished before their extensions
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[child] = f
+                dict_link[child] = f if out[f] != _NONE else dict_link[f]
+                if best[f] != _NONE and (best[child] == _NONE or best[f] < best[child]):
+                    best[child] = best[f]
+                queue.append(child)
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _walk(self, text: str):
+        """Yield (end, node) for each char of text."""
+        goto, fail = self._goto, self._fail
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            yield i + 1, node
+
+    def first(self, text: str) -> Optional[int]:
+        """Lowest pattern id that occurs anywhere in text (None if nothing matches)."""
+        best_at = self._best
+        found = _NONE
+        for _, node in self._walk(text):
+            pid = best_at[node]
+            if pid != _NONE and (found == _NONE or pid < found):
+                found = pid
+                if found == 0:
+                    break
+        return None if found == _NONE else found
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """Every occurrence (start, end, pattern id), overlaps included, ordered by end."""
+        out, dict_link, patterns = self._out, self._dict_link, self.patterns
+        hits: List[Tuple[int, int, int]] = []
+        for end, node in self._walk(text):
+            n = node if out[node] != _NONE else dict_link[node]
+            while n != _NONE and n:
+                pid = out[n]
+                hits.append((end - len(patterns[pid]), end, pid))
+                n = dict_link[n]
+        return hits
@@ -2,13 +2,315 @@
 Async wrapper for sync Supabase .execute() calls.
 
 Supabase Python SDK uses sync httpx — every .execute() blocks the async event loop
-for 50-200ms. This wrapper runs them in a thread pool via asyncio.to_thread().
+for 50-200ms. This wrapper sends supabase-py builders natively through the shared
+async HTTP pool (postgrest_async, POSTGREST_ASYNC=1); anything else (or
+POSTGREST_ASYNC=0) runs in a thread pool via asyncio.to_thread().
+
+Request-scoped loader (request_scope):
+one farmer message issues many tiny queries (conversation state read 2-3x,
+pending context, ensure_user_exists, registry lookups). Inside a scope, aexecute:
+- dedupes identical in-flight reads (GET/HEAD) → one round trip, all callers share it
+- memoizes reads until the scope ends; a write to the same table drops that table's memo
+- batches concurrent same-table point lookups `select(...).eq(col, v)` → one `in.(...)` query
+- counts DB round trips per request (get_request_loader_stats → /health)
+Every caller gets its own deep copy of a shared result. RPC calls are never memoized.
+Outside a scope (background jobs, admin routes) aexecute behaves exactly as before.
 """
 
 import asyncio
-from typing import Any
+import copy
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
+from httpx import QueryParams
+from postgrest import APIResponse
+from postgrest._sync.request_builder import (
+    SyncFilterRequestBuilder,
+    SyncQueryRequestBuilder,
+    SyncSelectRequestBuilder,
+    SyncSingleRequestBuilder,
+)
+from postgrest.utils import sanitize_param
 
-async def aexecute(query_builder) -> Any:
-    """Run sync Supabase .execute() in thread pool — does not block event loop."""
+from app.config import POSTGREST_ASYNC, REQUEST_LOADER_ENABLED
+from app.utils.postgrest_async import execute_async, is_postgrest_builder
+
+logger = logging.getLogger(__name__)
+
+_READ_METHODS = ("GET", "HEAD")
+_BATCH_MAX = 100  # values per in.(...) query — keeps the URL short
+
+
+async def _run(query_builder) -> Any:
+    """One DB round trip: native async for supabase-py builders, thread pool otherwise."""
+    if POSTGREST_ASYNC and is_postgrest_builder(query_builder):
+        return await execute_async(query_builder)
     return await asyncio.to_thread(query_builder.execute)
+
+
+def _param_value(value: Any) -> str:
+    """Row value → the string PostgREST put in the eq. filter."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+class RequestLoader:
+    """Per-message DB access layer: in-flight dedupe, memo, point-lookup batching, round-trip count."""
+
+    def __init__(self, label: str = "request"):
+        self.label = label
+        self.closed = False
+        self.queries = 0
+        self.round_trips = 0
+        self.memo_hits = 0
+        self.coalesced = 0
+        self.batched = 0
+        self._memo: Dict[tuple, asyncio.Future] = {}
+        self._pending: Dict[tuple, Dict[str, Any]] = {}
+        self._flushes: Set[asyncio.Task] = set()
+
+    # =====================================================================
+    # Query keys
+    # =====================================================================
+
+    @staticmethod
+    def _query_key(qb) -> Optional[tuple]:
+        """Identity of a read query, or None if it must not be memoized."""
+        if not isinstance(qb, (SyncQueryRequestBuilder, SyncSingleRequestBuilder)):
+            return None
+        if qb.http_method not in _READ_METHODS or qb.path.startswith("/rpc/"):
+            return None
+        return (
+            type(qb).__name__,
+            id(qb.session),
+            qb.http_method,
+            qb.path,
+            tuple(qb.params.multi_items()),
+            tuple(sorted(qb.headers.items())),
+        )
+
+    @staticmethod
+    def _batch_spec(qb) -> Optional[Tuple[tuple, str, str]]:
+        """(group key, column, value) for a plain `select(cols).eq(col, v)` read, else None."""
+        if type(qb) not in (SyncSelectRequestBuilder, SyncFilterRequestBuilder) or qb.http_method != "GET":
+            return None
+        if qb.headers:  # count= / single-object Accept / Range → not a plain row list
+            return None
+        items = qb.params.multi_items()
+        if len(items) != 2 or items[0][0] != "select" or not items[1][1].startswith("eq."):
+            return None
+        select, (column, criteria) = items[0][1], items[1]
+        if select != "*" and column not in select.split(","):
+            return None  # rows must carry the column to be split back per value
+        return (id(qb.session), qb.path, select, column), column, criteria[3:]
+
+    # =====================================================================
+    # Execute
+    # =====================================================================
+
+    async def _execute(self, qb) -> Any:
+        self.round_trips += 1
+        return await _run(qb)
+
+    async def execute(self, qb) -> Any:
+        self.queries += 1
+        key = self._query_key(qb)
+        if key is None:
+            if isinstance(qb, SyncQueryRequestBuilder) and qb.http_method not in _READ_METHODS \
+                    and not qb.path.startswith("/rpc/"):
+                self._invalidate(id(qb.session), qb.path)
+            return await self._execute(qb)
+        spec = self._batch_spec(qb)
+        fetch = (lambda: self._batched_fetch(qb, spec)) if spec else (lambda: self._execute(qb))
+        return await self.memoize(key, fetch)
+
+    async def memoize(self, key: Any, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch once per key for the scope; concurrent callers share the in-flight result."""
+        future = self._memo.get(key)
+        if future is not None:
+            if future.done():
+                self.memo_hits += 1
+            else:
+                self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(fetch())
+            self._memo[key] = future
+            future.add_done_callback(lambda f: self._forget_failed(key, f))
+        result = await asyncio.shield(future)
+        return copy.deepcopy(result)
+
+    def _forget_failed(self, key: Any, future: asyncio.Future) -> None:
+        # failed read → next caller retries instead of re-raising the cached error
+        if (future.cancelled() or future.exception() is not None) and self._memo.get(key) is future:
+            del self._memo[key]
+
+    def forget(self, key: Any) -> None:
+        self._memo.pop(key, None)
+
+    def _invalidate(self, session_id: int, path: str) -> None:
+        for key in [k for k in self._memo if isinstance(k, tuple) and len(k) == 6
+                    and k[1] == session_id and k[3] == path]:
+            del self._memo[key]
+
+    # =====================================================================
+    # Point-lookup batching
+    # =====================================================================
+
+    def _batched_fetch(self, qb, spec: Tuple[tuple, str, str]) -> asyncio.Future:
+        group_key, _, value = spec
+        group = self._pending.get(group_key)
+        if group is None or len(group["waiters"]) >= _BATCH_MAX:
+            group = {"builder": qb, "spec": spec, "waiters": {}}
+            self._pending[group_key] = group
+            # flush after every task already scheduled this tick has registered its lookup
+            asyncio.get_running_loop().call_soon(self._spawn_flush, group_key, group)
+        future = group["waiters"].get(value)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            group["waiters"][value] = future
+        return future
+
+    def _spawn_flush(self, group_key: tuple, group: Dict[str, Any]) -> None:
+        task = asyncio.ensure_future(self._flush_group(group_key, group))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_group(self, group_key: tuple, group: Dict[str, Any]) -> None:
+        if self._pending.get(group_key) is group:
+            del self._pending[group_key]
+        waiters: Dict[str, asyncio.Future] = group["waiters"]
+        qb, (_, column, _) = group["builder"], group["spec"]
+        if len(waiters) == 1:
+            await self._settle(waiters, lambda: self._execute(qb))
+            return
+
+        self.batched += len(waiters)
+        batch = copy.copy(qb)
+        values = ",".join(sanitize_param(v) for v in waiters)
+        batch.params = QueryParams([("select", qb.params["select"]), (column, f"in.({values})")])
+        try:
+            response = await self._execute(batch)
+        except Exception as e:
+            for future in waiters.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        rows: Dict[str, List[dict]] = {value: [] for value in waiters}
+        unmatched = False
+        for row in response.data:
+            matched = rows.get(_param_value(row.get(column)))
+            if matched is None:
+                unmatched = True  # type coercion we can't mirror (e.g. numeric formatting)
+            else:
+                matched.append(row)
+        for value, future in waiters.items():
+            if future.done():
+                continue
+            if rows[value] or not unmatched:
+                future.set_result(APIResponse(data=rows[value], count=None))
+            else:
+                single = copy.copy(qb)
+                single.params = QueryParams([("select", qb.params["select"]), (column, f"eq.{value}")])
+                await self._settle({value: future}, lambda: self._execute(single))
+
+    @staticmethod
+    async def _settle(waiters: Dict[str, asyncio.Future], fetch: Callable[[], Awaitable[Any]]) -> None:
+        [future] = waiters.values()
+        try:
+            result = await fetch()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    # =====================================================================
+    # Scope end
+    # =====================================================================
+
+    def close(self) -> None:
+        self.closed = True
+        self._memo.clear()
+        _stats["requests"] += 1
+        _stats["queries"] += self.queries
+        _stats["round_trips"] += self.round_trips
+        _stats["memo_hits"] += self.memo_hits
+        _stats["coalesced"] += self.coalesced
+        _stats["batched"] += self.batched
+        _stats["max_round_trips"] = max(_stats["max_round_trips"], self.round_trips)
+        logger.debug(
+            f"[db] {self.label}: {self.round_trips} round trips for {self.queries} queries "
+            f"(memo {self.memo_hits}, coalesced {self.coalesced}, batched {self.batched})"
+        )
+
+
+_current_loader: ContextVar[Optional[RequestLoader]] = ContextVar("request_loader", default=None)
+_stats = {
+    "requests": 0,
+    "queries": 0,
+    "round_trips": 0,
+    "memo_hits": 0,
+    "coalesced": 0,
+    "batched": 0,
+    "max_round_trips": 0,
+}
+
+
+def _active_loader() -> Optional[RequestLoader]:
+    loader = _current_loader.get()
+    # tasks spawned inside a scope inherit the ContextVar — after the scope ends they go direct
+    return loader if loader is not None and not loader.closed else None
+
+
+@asynccontextmanager
+async def request_scope(label: str = "request"):
+    """Scope one incoming message; nested scopes reuse the outer loader."""
+    loader = _active_loader()
+    if loader is not None or not REQUEST_LOADER_ENABLED:
+        yield loader
+        return
+    loader = RequestLoader(label)
+    token = _current_loader.set(loader)
+    try:
+        yield loader
+    finally:
+        _current_loader.reset(token)
+        loader.close()
+
+
+async def request_memo(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Memoize a non-DB read (Redis / cache) for the current request scope."""
+    loader = _active_loader()
+    if loader is None:
+        return await fetch()
+    return await loader.memoize(("memo", key), fetch)
+
+
+def request_forget(key: str) -> None:
+    """Drop a request_memo entry after the value was written."""
+    loader = _active_loader()
+    if loader is not None:
+        loader.forget(("memo", key))
+
+
+def get_request_loader_stats() -> dict:
+    stats = dict(_stats)
+    requests = stats["requests"]
+    stats["avg_round_trips"] = round(stats["round_trips"] / requests, 2) if requests else 0.0
+    stats["avg_queries"] = round(stats["queries"] / requests, 2) if requests else 0.0
+    return stats
+
+
+async def aexecute(query_builder) -> Any:
+    """Execute a Supabase query without blocking the event loop."""
+    loader = _active_loader()
+    if loader is not None:
+        return await loader.execute(query_builder)
+    return await _run(query_builder)
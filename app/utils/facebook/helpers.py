@@ -1,8 +1,8 @@
 import logging
 import hmac
 import hashlib
-import httpx
 from app.config import FB_PAGE_ACCESS_TOKEN, FB_VERIFY_TOKEN, FB_APP_SECRET
+from app.utils.http_clients import FACEBOOK_GRAPH, http_request
 
 logger = logging.getLogger(__name__)
 
@@ -43,11 +43,10 @@ async def send_facebook_message(psid: str, text: str) -> None:
         "message": {"text": text},
     }
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, params=params, json=payload)
-            if response.status_code != 200:
-                logger.error(f"FB Send API error: {response.status_code} - {response.text}")
-            response.raise_for_status()
+        response = await http_request(FACEBOOK_GRAPH, "POST", url, headers=headers, params=params, json=payload, timeout=30.0)
+        if response.status_code != 200:
+            logger.error(f"FB Send API error: {response.status_code} - {response.text}")
+        response.raise_for_status()
         logger.info(f"Message sent to FB user {psid}")
     except Exception as e:
         logger.error(f"Error sending FB message to {psid}: {e}", exc_info=True)
@@ -62,8 +61,7 @@ async def send_typing_on(psid: str) -> None:
         "sender_action": "typing_on",
     }
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            await client.post(url, params=params, json=payload)
+        await http_request(FACEBOOK_GRAPH, "POST", url, params=params, json=payload, timeout=10.0, retries=0)
     except Exception:
         pass  # typing indicator is best-effort
 
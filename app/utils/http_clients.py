@@ -0,0 +1,202 @@
+"""
+Shared outbound HTTP clients — 1 pooled httpx.AsyncClient ต่อ upstream host
+
+เดิม reply_line / push_line / show_loading / Facebook Send API ทำ `async with httpx.AsyncClient()`
+ทุกข้อความ → TCP + TLS handshake ใหม่ไป api.line.me ทุกครั้ง (~100-300ms ต่อ reply/push)
+
+ตอนนี้:
+- client ต่อ host สร้างครั้งแรกที่ใช้ แล้ว reuse (keep-alive, HTTP/2 ถ้ามี h2) — ปิดใน lifespan shutdown
+- limits ปรับได้ (HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE / HTTP_KEEPALIVE_EXPIRY)
+  host ที่ต้องการ pool ขนาดอื่น (เช่น Supabase PostgREST) → set_host_limits() ก่อนใช้ครั้งแรก
+- retry เมื่อ 429 / connect error ด้วย exponential backoff + jitter (เคารพ Retry-After)
+  5xx / connection หลุดหลังส่ง retry เฉพาะ request ที่ idempotent (POST ไม่ retry → ไม่ตอบ user ซ้ำ)
+- stats ต่อ host: requests, retries, errors, in_flight, max_in_flight, saturated (pool เต็มตอนเริ่ม request)
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_RETRIES,
+    HTTP_BACKOFF_BASE_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+LINE_API = "api.line.me"
+LINE_DATA_API = "api-data.line.me"
+FACEBOOK_GRAPH = "graph.facebook.com"
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# ยังไม่มีการเชื่อมต่อ → request ไม่ถึง server แน่นอน: retry ได้ทุก method (429 = server ปฏิเสธ ไม่ได้ทำ)
+_CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# server อาจทำไปแล้ว (5xx หลังรับ / connection หลุดระหว่างรอ response) → retry เฉพาะ request ที่ idempotent
+# (GET/PUT/DELETE หรือ caller ส่ง idempotent=True เช่น LINE push ที่มี X-Line-Retry-Key)
+_AMBIGUOUS_ERRORS = (httpx.RemoteProtocolError,)
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_MAX_BACKOFF = 5.0  # seconds
+
+try:
+    import h2  # noqa: F401 — httpx ใช้ h2 สำหรับ HTTP/2
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return min(float(value), _MAX_BACKOFF) if value else None
+    except ValueError:
+        return None
+
+
+class HTTPClientRegistry:
+    """Per-host pooled AsyncClients with retry + saturation metrics."""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        retries: int = HTTP_RETRIES,
+        backoff_base_ms: float = HTTP_BACKOFF_BASE_MS,
+        http2: bool = _HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.retries = retries
+        self.backoff_base = backoff_base_ms / 1000.0
+        self.http2 = http2
+        self.transport = transport  # tests: httpx.MockTransport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, dict] = {}
+        self._host_limits: Dict[str, httpx.Limits] = {}
+
+    def set_host_limits(self, host: str, max_connections: int, max_keepalive: Optional[int] = None) -> None:
+        """Own pool size for one host (applies to its client from the next creation on)."""
+        self._host_limits[host] = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=self.limits.max_keepalive_connections if max_keepalive is None else max_keepalive,
+            keepalive_expiry=self.limits.keepalive_expiry,
+        )
+
+    def limits_for(self, host: str) -> httpx.Limits:
+        return self._host_limits.get(host, self.limits)
+
+    def get(self, host: str) -> httpx.AsyncClient:
+        """Pooled client for a host (created on first use, recreated if closed)."""
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits_for(host),
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                transport=self.transport,
+            )
+            self._clients[host] = client
+            self._stats.setdefault(host, {
+                "requests": 0, "retries": 0, "errors": 0,
+                "in_flight": 0, "max_in_flight": 0, "saturated": 0, "total_ms": 0.0,
+            })
+        return client
+
+    async def request(
+        self,
+        host: str,
+        method: str,
+        url: str,
+        *,
+        retries: Optional[int] = None,
+        idempotent: Optional[bool] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Send via the host's pool; returns the last response.
+        Retries 429 / connect errors always; 5xx / RemoteProtocolError only when idempotent
+        (default: by method — pass idempotent=True for POSTs the server dedups, e.g. retry keys).
+        """
+        client = self.get(host)
+        stats = self._stats[host]
+        retries = self.retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method.upper() in _IDEMPOTENT_METHODS
+        retry_errors = _CONNECT_ERRORS + _AMBIGUOUS_ERRORS if idempotent else _CONNECT_ERRORS
+        max_connections = self.limits_for(host).max_connections
+
+        for attempt in range(retries + 1):
+            if stats["in_flight"] >= max_connections:
+                stats["saturated"] += 1
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                stats["errors"] += 1
+                if not isinstance(e, retry_errors) or attempt >= retries:
+                    raise
+                delay = None
+                logger.warning(f"HTTP {method} {host} failed ({type(e).__name__}), retry {attempt + 1}/{retries}")
+            else:
+                retryable = response.status_code == 429 or (idempotent and response.status_code in _RETRY_STATUSES)
+                if not retryable or attempt >= retries:
+                    return response
+                delay = _retry_after(response)
+                logger.warning(f"HTTP {method} {host} → {response.status_code}, retry {attempt + 1}/{retries}")
+            finally:
+                stats["in_flight"] -= 1
+                stats["total_ms"] += (time.perf_counter() - start) * 1000
+
+            stats["retries"] += 1
+            if delay is None:
+                delay = min(_MAX_BACKOFF, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"HTTP client close failed: {e}")
+
+    def get_stats(self) -> dict:
+        result = {"http2": self.http2, "max_connections": self.limits.max_connections}
+        for host, stats in self._stats.items():
+            entry = dict(stats)
+            entry["avg_ms"] = round(entry.pop("total_ms") / entry["requests"], 1) if entry["requests"] else 0.0
+            max_connections = self.limits_for(host).max_connections
+            if max_connections != self.limits.max_connections:
+                entry["max_connections"] = max_connections
+            entry["pool_utilization"] = round(entry["max_in_flight"] / max_connections, 3)
+            result[host] = entry
+        return result
+
+
+# Module-level registry (lifespan ปิดตอน shutdown)
+http_clients = HTTPClientRegistry()
+
+
+async def http_request(host: str, method: str, url: str, **kwargs) -> httpx.Response:
+    return await http_clients.request(host, method, url, **kwargs)
+
+
+async def close_http_clients() -> None:
+    await http_clients.close()
+
+
+def get_http_client_stats() -> dict:
+    return http_clients.get_stats()
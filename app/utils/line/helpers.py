@@ -2,12 +2,18 @@ import logging
 import hmac
 import hashlib
 import base64
-import httpx
-from typing import Union, Dict, List
+import uuid
+from contextvars import ContextVar
+from typing import Optional, Union, Dict, List
 from app.config import LINE_CHANNEL_SECRET, LINE_CHANNEL_ACCESS_TOKEN
+from app.utils.http_clients import LINE_API, LINE_DATA_API, http_request
 
 logger = logging.getLogger(__name__)
 
+# Redelivered webhook events (หลัง worker crash) — reply token มักหมดอายุแล้ว
+# → reply_line ที่ไม่สำเร็จจะ push ไปหา user นี้แทน (ตั้งโดย webhook dispatcher)
+reply_fallback_user: ContextVar[Optional[str]] = ContextVar("reply_fallback_user", default=None)
+
 def verify_line_signature(body: bytes, signature: str) -> bool:
     if not LINE_CHANNEL_SECRET:
         logger.error("LINE_CHANNEL_SECRET not set — rejecting request for security")
@@ -29,22 +35,21 @@ async def show_loading(user_id: str, seconds: int = 20) -> None:
             "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
         }
         payload = {"chatId": user_id, "loadingSeconds": min(seconds, 60)}
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.post(url, json=payload, headers=headers)
-            if resp.status_code == 202:
-                logger.info(f"··· Loading animation sent for {user_id[:12]}")
-            else:
-                logger.warning(f"Loading animation status {resp.status_code}: {resp.text[:200]}")
+        # best-effort: ไม่ retry — ถ้าช้ากว่าคำตอบจริงก็ไม่มีประโยชน์
+        resp = await http_request(LINE_API, "POST", url, json=payload, headers=headers, timeout=5.0, retries=0)
+        if resp.status_code == 202:
+            logger.info(f"··· Loading animation sent for {user_id[:12]}")
+        else:
+            logger.warning(f"Loading animation status {resp.status_code}: {resp.text[:200]}")
     except Exception as e:
         logger.warning(f"Loading animation failed: {e}")
 
 async def get_image_content_from_line(message_id: str) -> bytes:
     url = f"https://api-data.line.me/v2/bot/message/{message_id}/content"
     headers = {"Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"}
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.get(url, headers=headers)
-        response.raise_for_status()
-        return response.content
+    response = await http_request(LINE_DATA_API, "GET", url, headers=headers, timeout=30.0)
+    response.raise_for_status()
+    return response.content
 
 async def reply_line(reply_token: str, message: Union[str, Dict, List], with_sticker: bool = False) -> None:
     """Reply to LINE with text message, dict, list of messages, and optionally a sticker"""
@@ -82,11 +87,15 @@ async def reply_line(reply_token: str, message: Union[str, Dict, List], with_sti
         
         payload = {"replyToken": reply_token, "messages": messages}
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            if response.status_code != 200:
-                logger.error(f"LINE API error: {response.status_code} - {response.text}")
-            response.raise_for_status()
+        response = await http_request(LINE_API, "POST", url, headers=headers, json=payload, timeout=30.0)
+        fallback_user = reply_fallback_user.get()
+        if response.status_code != 200 and fallback_user:
+            logger.warning(f"Reply failed ({response.status_code}) for redelivered event — pushing instead")
+            await push_line(fallback_user, message, with_sticker=with_sticker)
+            return
+        if response.status_code != 200:
+            logger.error(f"LINE API error: {response.status_code} - {response.text}")
+        response.raise_for_status()
         logger.info("Reply sent to LINE")
     except Exception as e:
         logger.error(f"Error sending LINE reply: {e}", exc_info=True)
@@ -99,7 +108,9 @@ async def push_line(user_id: str, message: Union[str, Dict, List], with_sticker:
         url = "https://api.line.me/v2/bot/message/push"
         headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
+            "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
+            # retry ของ push (429/5xx) ใช้ key เดิม → LINE ไม่ส่งซ้ำถ้ารอบแรกสำเร็จไปแล้ว
+            "X-Line-Retry-Key": str(uuid.uuid4()),
         }
 
         # Build messages array (same logic as reply_line)
@@ -140,15 +151,14 @@ async def push_line(user_id: str, message: Union[str, Dict, List], with_sticker:
                 alt_text = alt_text[:50]
             logger.info(f"  Message {i+1}: type={msg_type}, altText={alt_text}")
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
+        response = await http_request(LINE_API, "POST", url, headers=headers, json=payload, timeout=30.0, idempotent=True)
 
-            # Log error details if not successful
-            if response.status_code != 200:
-                logger.error(f"LINE API error: {response.status_code}")
-                logger.error(f"LINE API response: {response.text}")
+        # Log error details if not successful
+        if response.status_code != 200:
+            logger.error(f"LINE API error: {response.status_code}")
+            logger.error(f"LINE API response: {response.text}")
 
-            response.raise_for_status()
+        response.raise_for_status()
         logger.info("Push message sent to LINE")
     except Exception as e:
         logger.error(f"Error sending LINE push message: {e}", exc_info=True)
@@ -158,8 +168,8 @@ async def push_line(user_id: str, message: Union[str, Dict, List], with_sticker:
                 "to": user_id,
                 "messages": [{"type": "text", "text": "ขออภัยค่ะ เกิดข้อผิดพลาดในการส่งข้อความ กรุณาลองใหม่อีกครั้ง 🙏"}]
             }
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                await client.post(url, headers=headers, json=simple_payload)
+            fallback_headers = {**headers, "X-Line-Retry-Key": str(uuid.uuid4())}
+            await http_request(LINE_API, "POST", url, headers=fallback_headers, json=simple_payload, timeout=10.0, idempotent=True)
         except Exception:
             pass  # Silent fail for fallback
 
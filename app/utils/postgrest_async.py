@@ -0,0 +1,114 @@
+"""
+Native async PostgREST execution for supabase-py query builders
+
+aexecute เดิม: asyncio.to_thread(builder.execute) → sync httpx ใน default executor
+(THREAD_POOL_SIZE=50) = DB calls พร้อมกันได้สูงสุด 50 ต่อ worker + thread switch ทุก query
+
+ตอนนี้: builder ของ supabase-py (table().select().eq()..., rpc()) เป็นแค่ state — ยังไม่มี I/O จนกว่า execute
+→ execute_async() อ่าน method / path / params / headers / json จาก builder แล้วส่งผ่าน
+  pooled httpx.AsyncClient (HTTPClientRegistry, host ของ Supabase) บน event loop โดยตรง
+- pool ของ host Supabase ใช้ POSTGREST_MAX_CONNECTIONS / POSTGREST_MAX_KEEPALIVE (แยกจาก HTTP_MAX_* ของ LINE / FB)
+- call sites ไม่ต้องแก้: ยังสร้าง query ด้วย supabase_client แบบเดิม แล้ว await aexecute(query)
+- ผลลัพธ์ / error เหมือน builder.execute() ทุกแบบ (APIResponse, SingleAPIResponse, maybe_single → None, APIError)
+- reads (GET/HEAD) retry ตาม HTTP_RETRIES; writes / RPC ไม่ retry (อาจถูก apply ไปแล้ว)
+- POSTGREST_ASYNC=0 → กลับไปใช้ to_thread
+"""
+from json import JSONDecodeError
+from typing import Any
+
+import httpx
+from postgrest import APIError, APIResponse
+from postgrest.base_request_builder import SingleAPIResponse
+from postgrest.exceptions import generate_default_error_message
+from postgrest._sync.request_builder import (
+    SyncMaybeSingleRequestBuilder,
+    SyncQueryRequestBuilder,
+    SyncSingleRequestBuilder,
+)
+from pydantic import ValidationError
+
+from app.config import POSTGREST_MAX_CONNECTIONS, POSTGREST_MAX_KEEPALIVE
+from app.utils import http_clients
+
+_READ_METHODS = ("GET", "HEAD")
+
+
+def is_postgrest_builder(query_builder: Any) -> bool:
+    """True for real supabase-py builders (mocks and other objects keep the to_thread path)."""
+    return isinstance(query_builder, (SyncQueryRequestBuilder, SyncSingleRequestBuilder)) \
+        and isinstance(getattr(query_builder, "session", None), httpx.Client)
+
+
+def _parse_query(query_builder: SyncQueryRequestBuilder, r: httpx.Response) -> Any:
+    # mirrors SyncQueryRequestBuilder.execute
+    try:
+        if r.is_success:
+            if query_builder.http_method != "HEAD":
+                accept = query_builder.headers.get("Accept")
+                if accept == "text/csv":
+                    return r.text
+                if accept and "application/vnd.pgrst.plan" in accept and "+json" not in accept:
+                    return r.text
+            return APIResponse.from_http_request_response(r)
+        raise APIError(r.json())
+    except ValidationError as e:
+        raise APIError(r.json()) from e
+    except JSONDecodeError:
+        raise APIError(generate_default_error_message(r))
+
+
+def _parse_single(r: httpx.Response) -> Any:
+    # mirrors SyncSingleRequestBuilder.execute
+    try:
+        if 200 <= r.status_code <= 299:
+            return SingleAPIResponse.from_http_request_response(r)
+        raise APIError(r.json())
+    except ValidationError as e:
+        raise APIError(r.json()) from e
+    except JSONDecodeError:
+        raise APIError(generate_default_error_message(r))
+
+
+def _pool_host(session: httpx.Client) -> str:
+    """Supabase host, with its own pool limits registered before the first request."""
+    host = session.base_url.host
+    registry = http_clients.http_clients
+    if registry.limits_for(host) is registry.limits:
+        registry.set_host_limits(host, POSTGREST_MAX_CONNECTIONS, POSTGREST_MAX_KEEPALIVE)
+    return host
+
+
+async def execute_async(query_builder: Any) -> Any:
+    """Await a supabase-py builder on the shared async pool; same result/raise as .execute()."""
+    session: httpx.Client = query_builder.session
+    headers = httpx.Headers(session.headers)
+    headers.update(query_builder.headers)
+    method = query_builder.http_method
+    r = await http_clients.http_request(
+        _pool_host(session),
+        method,
+        str(session.base_url).rstrip("/") + query_builder.path,
+        json=query_builder.json,
+        params=query_builder.params,
+        headers=headers,
+        timeout=session.timeout,
+        retries=None if method in _READ_METHODS else 0,
+    )
+
+    if not isinstance(query_builder, SyncSingleRequestBuilder):
+        return _parse_query(query_builder, r)
+    if not isinstance(query_builder, SyncMaybeSingleRequestBuilder):
+        return _parse_single(r)
+
+    # mirrors SyncMaybeSingleRequestBuilder.execute
+    try:
+        return _parse_single(r)
+    except APIError as e:
+        if e.details and "The result contains 0 rows" in e.details:
+            return None
+        raise APIError({
+            "message": "Missing response",
+            "code": "204",
+            "hint": "Please check traceback of the code",
+            "details": "Postgrest couldn't retrieve response, please check traceback of the code.",
+        })
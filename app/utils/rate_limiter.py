@@ -9,16 +9,25 @@ Priority:
 - check_user_rate_limit(user_id) - ตรวจสอบ rate limit
 - check_image_cooldown(user_id) - ตรวจสอบ cooldown ระหว่างส่งรูป
 - get_rate_limit_status(user_id) - ดูสถานะ rate limit
+- acquire_analysis_slot() / release_analysis_slot(lease_id) - จำกัด image analysis พร้อมกัน
+
+Algorithm เดียวกันทั้ง 2 backend:
+- Rate limit = sliding-window log (Redis: sorted set + Lua, Memory: deque ต่อ user)
+- Analysis slots = lease semaphore บน Redis (holder หมด lease เองถ้าไม่ release)
+  Memory mode ไม่จำกัด (นับแยกต่อ process ไม่ได้สะท้อนทั้ง instance)
 """
 import time
 import logging
-from typing import Tuple
+import uuid
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
 
 from app.config import (
     USER_RATE_LIMIT,
     USER_RATE_WINDOW,
     IMAGE_COOLDOWN,
     MAX_CONCURRENT_ANALYSIS,
+    ANALYSIS_SLOT_LEASE,
     USE_REDIS_CACHE
 )
 
@@ -50,6 +59,50 @@ if not _use_redis:
 from app.services.cache import get_from_memory_cache, set_to_memory_cache
 
 
+# ============================================================================
+# In-Memory Backend (same semantics as the Redis sliding-window script)
+# ============================================================================
+
+class SlidingWindowLimiter:
+    """Sliding-window log per key — in-process twin of redis_cache._SLIDING_WINDOW_LUA"""
+
+    def __init__(self):
+        self._windows: Dict[str, Deque[float]] = {}
+
+    def _trim(self, key: str, window: float, now: float) -> Deque[float]:
+        hits = self._windows.setdefault(key, deque())
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        return hits
+
+    def hit(self, key: str, limit: int, window: float, now: Optional[float] = None) -> Tuple[bool, int, float]:
+        """Check + record one request → (allowed, remaining, retry_after_seconds)"""
+        now = time.time() if now is None else now
+        hits = self._trim(key, window, now)
+        if len(hits) >= limit:
+            return False, 0, hits[0] + window - now
+        hits.append(now)
+        return True, limit - len(hits), 0.0
+
+    def count(self, key: str, window: float, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        return sum(1 for t in self._windows.get(key, ()) if t > now - window)
+
+    def clear(self, key: str) -> bool:
+        return self._windows.pop(key, None) is not None
+
+    def prune(self, window: float, now: Optional[float] = None) -> int:
+        """Drop keys with no hits left in the window — returns keys removed"""
+        now = time.time() if now is None else now
+        stale = [k for k in self._windows if not self._trim(k, window, now)]
+        for key in stale:
+            del self._windows[key]
+        return len(stale)
+
+
+_memory_limiter = SlidingWindowLimiter()
+
+
 # ============================================================================
 # Rate Limit Functions
 # ============================================================================
@@ -65,7 +118,7 @@ async def check_user_rate_limit(user_id: str) -> bool:
     """
     if _use_redis and _redis_module:
         # Use Redis (supports scale-out)
-        is_allowed, remaining = _redis_module.check_rate_limit_redis(
+        is_allowed, remaining = await _redis_module.check_rate_limit_redis_async(
             user_id,
             limit=USER_RATE_LIMIT,
             window=USER_RATE_WINDOW
@@ -77,37 +130,14 @@ async def check_user_rate_limit(user_id: str) -> bool:
 
 
 async def _check_rate_limit_memory(user_id: str) -> bool:
-    """Rate limit check using In-Memory Cache (fallback)"""
-    current_time = time.time()
-    cache_key = f"ratelimit:{user_id}"
-
-    # Get current timestamps from L1 memory cache
-    timestamps = get_from_memory_cache(cache_key)
-
-    if not timestamps:
-        timestamps = []
-
-    # Remove old timestamps outside the window
-    valid_timestamps = [
-        ts for ts in timestamps
-        if current_time - ts < USER_RATE_WINDOW
-    ]
-
-    # Check if exceeded limit
-    if len(valid_timestamps) >= USER_RATE_LIMIT:
+    """Rate limit check using in-process sliding window (fallback)"""
+    allowed, _, retry_after = _memory_limiter.hit(f"ratelimit:{user_id}", USER_RATE_LIMIT, USER_RATE_WINDOW)
+    if not allowed:
         logger.warning(
             f"⛔ Rate limit exceeded: {user_id[:8]}... "
-            f"({len(valid_timestamps)}/{USER_RATE_LIMIT})"
+            f"({USER_RATE_LIMIT}/{USER_RATE_LIMIT}, retry in {retry_after:.1f}s)"
         )
-        return False
-
-    # Add current request
-    valid_timestamps.append(current_time)
-
-    # Save back to memory cache with TTL
-    set_to_memory_cache(cache_key, valid_timestamps, ttl=USER_RATE_WINDOW)
-
-    return True
+    return allowed
 
 
 # ============================================================================
@@ -129,7 +159,7 @@ async def check_image_cooldown(user_id: str, cooldown: int = None) -> Tuple[bool
         cooldown = IMAGE_COOLDOWN
 
     if _use_redis and _redis_module:
-        return _redis_module.check_image_cooldown_redis(user_id, cooldown)
+        return await _redis_module.check_image_cooldown_redis_async(user_id, cooldown)
 
     # Fallback: In-Memory Cache
     return await _check_image_cooldown_memory(user_id, cooldown)
@@ -156,26 +186,27 @@ async def _check_image_cooldown_memory(user_id: str, cooldown: int) -> Tuple[boo
 # Concurrent Analysis Limiter
 # ============================================================================
 
-async def acquire_analysis_slot() -> bool:
+async def acquire_analysis_slot() -> Optional[str]:
     """
-    Try to acquire a slot for image analysis
+    Try to acquire a slot (lease) for image analysis
 
-    Limits concurrent image analyses to prevent overload
+    Limits concurrent image analyses to prevent overload.
+    Lease หมดอายุเองหลัง ANALYSIS_SLOT_LEASE วินาที — worker crash ไม่ทำให้ slot ค้าง
 
     Returns:
-        True if slot acquired, False if at capacity
+        Lease id if acquired (pass to release_analysis_slot), None if at capacity
     """
     if _use_redis and _redis_module:
-        return _redis_module.acquire_analysis_slot(MAX_CONCURRENT_ANALYSIS)
+        return await _redis_module.acquire_analysis_slot_async(MAX_CONCURRENT_ANALYSIS, ANALYSIS_SLOT_LEASE)
 
     # Fallback: No limit for single instance (memory-based counting is unreliable)
-    return True
+    return uuid.uuid4().hex
 
 
-async def release_analysis_slot():
+async def release_analysis_slot(lease_id: Optional[str]):
     """Release analysis slot after completion"""
     if _use_redis and _redis_module:
-        _redis_module.release_analysis_slot()
+        await _redis_module.release_analysis_slot_async(lease_id)
 
 
 # ============================================================================
@@ -185,7 +216,7 @@ async def release_analysis_slot():
 def get_rate_limit_status(user_id: str) -> dict:
     """Get current rate limit status for a user"""
     if _use_redis and _redis_module:
-        status = _redis_module.get_rate_limit_status_redis(user_id, USER_RATE_LIMIT)
+        status = _redis_module.get_rate_limit_status_redis(user_id, USER_RATE_LIMIT, USER_RATE_WINDOW)
         status["backend"] = "redis"
         return status
 
@@ -194,33 +225,15 @@ def get_rate_limit_status(user_id: str) -> dict:
 
 
 def _get_rate_limit_status_memory(user_id: str) -> dict:
-    """Get rate limit status from In-Memory Cache"""
-    current_time = time.time()
-    cache_key = f"ratelimit:{user_id}"
-
-    timestamps = get_from_memory_cache(cache_key)
-
-    if not timestamps:
-        return {
-            "user_id": user_id[:8] + "...",
-            "requests_in_window": 0,
-            "limit": USER_RATE_LIMIT,
-            "window_seconds": USER_RATE_WINDOW,
-            "remaining": USER_RATE_LIMIT,
-            "backend": "memory"
-        }
-
-    valid_timestamps = [
-        ts for ts in timestamps
-        if current_time - ts < USER_RATE_WINDOW
-    ]
+    """Get rate limit status from the in-process sliding window"""
+    used = _memory_limiter.count(f"ratelimit:{user_id}", USER_RATE_WINDOW)
 
     return {
         "user_id": user_id[:8] + "...",
-        "requests_in_window": len(valid_timestamps),
+        "requests_in_window": used,
         "limit": USER_RATE_LIMIT,
         "window_seconds": USER_RATE_WINDOW,
-        "remaining": max(0, USER_RATE_LIMIT - len(valid_timestamps)),
+        "remaining": max(0, USER_RATE_LIMIT - used),
         "backend": "memory"
     }
 
@@ -244,10 +257,12 @@ async def cleanup_rate_limit_data():
     """
     Clean up old rate limit data.
 
-    With TTL-based caching (both Redis and Memory), this is handled automatically.
-    Kept for compatibility with existing imports.
+    Redis keys expire by themselves (PEXPIRE in the Lua scripts);
+    the in-memory sliding windows drop users with no requests left in the window.
     """
-    pass
+    removed = _memory_limiter.prune(USER_RATE_WINDOW)
+    if removed:
+        logger.debug(f"Rate limiter: pruned {removed} idle windows")
 
 
 # ============================================================================
@@ -259,8 +274,7 @@ def clear_user_rate_limit(user_id: str) -> bool:
     if _use_redis and _redis_module:
         return _redis_module.clear_user_rate_limit(user_id)
 
-    # Memory cache doesn't support targeted deletion easily
-    return False
+    return _memory_limiter.clear(f"ratelimit:{user_id}")
 
 
 def clear_user_cooldown(user_id: str) -> bool:
@@ -514,14 +514,15 @@ def resolve_symptom_to_pathogens(query: str) -> List[str]:
         list ของชื่อโรคที่เป็นไปได้ (deduplicated)
         เช่น "กิ่งแห้ง" → ["ฟิวซาเรียม", "แอนแทรคโนส", "ราสีชมพู"]
     """
+    from app.services.chat.lexicon import analyze_query  # lazy — lexicon imports this module
+
     result = []
     seen = set()
 
-    for symptom, pathogens in SYMPTOM_PATHOGEN_MAP.items():
-        if symptom in query:
-            for p in pathogens:
-                if p not in seen:
-                    seen.add(p)
-                    result.append(p)
+    for symptom in analyze_query(query).symptoms:
+        for p in SYMPTOM_PATHOGEN_MAP[symptom]:
+            if p not in seen:
+                seen.add(p)
+                result.append(p)
 
     return result
@@ -0,0 +1,113 @@
+-- =============================================================================
+-- admin_inbox — รายการแชทของ admin chat แบบ incremental (1 แถวต่อ user)
+-- =============================================================================
+-- เดิม /api/admin/conversations: SELECT ทุก user + memory 7 วัน (≤3000 แถว) ทุก poll
+-- ตอนนี้: memory write buffer flush → admin_inbox_apply() 1 RPC ต่อ flush
+--         handoff create → UPSERT has_handoff / handoff_id (สร้างแถวได้ถ้า flush แรกยังไม่มา), resolve → clear
+--         อ่านทีละหน้าด้วย keyset (last_activity DESC, user_id DESC) บน index ด้านล่าง
+-- day_counts: {'YYYY-MM-DD' (UTC): จำนวนข้อความ} เก็บแค่ 8 วันล่าสุด → message_count 7 วัน = ผลรวมตอนอ่าน
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS admin_inbox (
+    user_id       TEXT         PRIMARY KEY,
+    platform      TEXT         NOT NULL DEFAULT 'line',   -- 'line' | 'facebook'
+    last_message  TEXT         NOT NULL DEFAULT '',       -- preview ≤100 ตัวอักษร
+    last_role     TEXT         NOT NULL DEFAULT '',
+    last_activity TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+    day_counts    JSONB        NOT NULL DEFAULT '{}',
+    has_handoff   BOOLEAN      NOT NULL DEFAULT FALSE,
+    handoff_id    BIGINT,
+    updated_at    TIMESTAMPTZ  NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_admin_inbox_page
+    ON admin_inbox (has_handoff, last_activity DESC, user_id DESC);
+
+
+-- -----------------------------------------------------------------------------
+-- admin_inbox_apply(p_rows) — merge per-user deltas จาก 1 memory flush
+-- p_rows: [{user_id, platform, last_message, last_role, last_activity, day_counts}]
+-- ข้อความล่าสุดชนะ (flush ของ worker อื่นอาจมาช้ากว่า), day_counts บวกกัน แล้วตัดวันที่เก่ากว่า 7 วัน
+-- -----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION admin_inbox_apply(p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_count INTEGER;
+    v_cutoff TEXT := to_char((NOW() AT TIME ZONE 'UTC') - INTERVAL '7 days', 'YYYY-MM-DD');
+BEGIN
+    INSERT INTO admin_inbox AS i (user_id, platform, last_message, last_role, last_activity, day_counts, updated_at)
+    SELECT r.user_id, r.platform, r.last_message, r.last_role, r.last_activity, r.day_counts, NOW()
+    FROM jsonb_to_recordset(p_rows) AS r(
+        user_id TEXT, platform TEXT, last_message TEXT, last_role TEXT,
+        last_activity TIMESTAMPTZ, day_counts JSONB
+    )
+    ON CONFLICT (user_id) DO UPDATE SET
+        -- last_role = '' → แถวยังไม่มีข้อความ (สร้างโดย handoff upsert ก่อน flush แรก / ถูก reset)
+        last_message  = CASE WHEN EXCLUDED.last_activity >= i.last_activity OR i.last_role = ''
+                             THEN EXCLUDED.last_message ELSE i.last_message END,
+        last_role     = CASE WHEN EXCLUDED.last_activity >= i.last_activity OR i.last_role = ''
+                             THEN EXCLUDED.last_role ELSE i.last_role END,
+        last_activity = GREATEST(i.last_activity, EXCLUDED.last_activity),
+        day_counts    = (
+            SELECT COALESCE(jsonb_object_agg(d.key, d.n), '{}')
+            FROM (
+                SELECT key, SUM(value::INTEGER) AS n
+                FROM (
+                    SELECT * FROM jsonb_each_text(i.day_counts)
+                    UNION ALL
+                    SELECT * FROM jsonb_each_text(EXCLUDED.day_counts)
+                ) AS merged
+                WHERE key >= v_cutoff
+                GROUP BY key
+            ) AS d
+        ),
+        updated_at    = NOW();
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+
+-- -----------------------------------------------------------------------------
+-- Backfill: ทุก user ใน user_ladda + ข้อความล่าสุด / จำนวน 7 วันจาก memory + handoff ที่ค้างอยู่
+-- (ตาราง memory = MEMORY_TABLE ใน app/config.py; ค่าเริ่มต้น memory_chatladda)
+-- -----------------------------------------------------------------------------
+INSERT INTO admin_inbox (user_id, platform, last_message, last_role, last_activity, day_counts)
+SELECT
+    u.line_user_id,
+    CASE WHEN u.line_user_id LIKE 'fb:%' THEN 'facebook' ELSE 'line' END,
+    COALESCE(LEFT(m.content, 100), ''),
+    COALESCE(m.role, ''),
+    COALESCE(m.created_at, u.updated_at, NOW()),
+    COALESCE(c.day_counts, '{}')
+FROM "user_ladda(LINE,FACE)" u
+LEFT JOIN LATERAL (
+    SELECT content, role, created_at
+    FROM memory_chatladda
+    WHERE user_id = u.line_user_id
+    ORDER BY created_at DESC
+    LIMIT 1
+) m ON TRUE
+LEFT JOIN LATERAL (
+    SELECT jsonb_object_agg(day, n) AS day_counts
+    FROM (
+        SELECT to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD') AS day, COUNT(*) AS n
+        FROM memory_chatladda
+        WHERE user_id = u.line_user_id AND created_at >= NOW() - INTERVAL '7 days'
+        GROUP BY 1
+    ) AS per_day
+) c ON TRUE
+ON CONFLICT (user_id) DO NOTHING;
+
+UPDATE admin_inbox i
+SET has_handoff = TRUE, handoff_id = h.id
+FROM (
+    SELECT DISTINCT ON (user_id) user_id, id
+    FROM admin_handoffs
+    WHERE status IN ('pending', 'active')
+    ORDER BY user_id, created_at DESC
+) h
+WHERE i.user_id = h.user_id;
@@ -0,0 +1,100 @@
+-- =============================================================================
+-- ladda_analytics_rollup — pre-aggregated analytics counters (per-minute / per-day)
+-- =============================================================================
+-- AnalyticsTracker นับ events เข้า buckets ใน memory แล้ว UPSERT ทุก ANALYTICS_ROLLUP_FLUSH_INTERVAL
+-- แต่ละ worker เป็นเจ้าของแถวของตัวเอง (worker_id) → dashboard merge แถวของทุก worker ตอนอ่าน
+-- bucket: 'YYYY-MM-DD' (day) หรือ 'YYYY-MM-DDTHH:MM' (minute, เก็บ 48 ชม.)
+-- =============================================================================
+
+CREATE TABLE IF NOT EXISTS ladda_analytics_rollup (
+    granularity     TEXT         NOT NULL,            -- 'minute' | 'day'
+    bucket          TEXT         NOT NULL,
+    worker_id       TEXT         NOT NULL,
+    events          INTEGER      NOT NULL DEFAULT 0,
+    questions       INTEGER      NOT NULL DEFAULT 0,
+    errors          INTEGER      NOT NULL DEFAULT 0,
+    recommendations INTEGER      NOT NULL DEFAULT 0,
+    latency_sum     BIGINT       NOT NULL DEFAULT 0,
+    latency_count   INTEGER      NOT NULL DEFAULT 0,
+    dims            JSONB        NOT NULL DEFAULT '{}',  -- latency_hist, intents, error_types, platforms, top_questions
+    hll             JSONB        NOT NULL DEFAULT '{}',  -- HyperLogLog registers (base64): all, line, facebook
+    updated_at      TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (granularity, bucket, worker_id)
+);
+
+
+-- -----------------------------------------------------------------------------
+-- Backfill: day buckets จาก ladda_analyst_event ที่เกิดก่อนมี rollup (worker_id = 'backfill')
+-- - เฉพาะวันที่ยังไม่มีแถว 'day' ใน rollup → ไม่นับซ้ำกับวันที่ workers นับเองแล้ว, รันซ้ำได้
+-- - วันแบ่งตาม TimeZone ของ session — ให้ตรงกับ TZ ของ app server ก่อนรัน
+--   (app bucket ด้วย datetime.now() ของ server เช่น SET TIME ZONE 'Asia/Bangkok';)
+-- - hll ว่าง → unique users ของวันที่ backfill = 0 (counters / dims ครบเหมือน RollupBucket.record)
+-- -----------------------------------------------------------------------------
+WITH ev AS (
+    SELECT
+        to_char(e.created_at, 'YYYY-MM-DD') AS day,
+        e.user_id, e.event_type, e.intent, e.error_type, e.question_text,
+        COALESCE(e.response_time_ms, 0) AS ms
+    FROM ladda_analyst_event e
+    WHERE NOT EXISTS (
+        SELECT 1 FROM ladda_analytics_rollup r
+        WHERE r.granularity = 'day' AND r.bucket = to_char(e.created_at, 'YYYY-MM-DD')
+    )
+),
+counters AS (
+    SELECT
+        day,
+        COUNT(*)                                                              AS events,
+        COUNT(*) FILTER (WHERE event_type = 'question')                       AS questions,
+        COUNT(*) FILTER (WHERE event_type = 'error')                          AS errors,
+        COUNT(*) FILTER (WHERE event_type = 'product_recommendation')         AS recommendations,
+        COALESCE(SUM(ms) FILTER (WHERE event_type = 'question' AND ms <> 0), 0) AS latency_sum,
+        COUNT(*) FILTER (WHERE event_type = 'question' AND ms <> 0)           AS latency_count
+    FROM ev
+    GROUP BY day
+),
+dim_counts AS (
+    -- ชื่อ bucket ต้องตรงกับ LATENCY_BUCKETS_MS ใน app/services/analytics_rollup.py
+    SELECT day, 'latency_hist' AS dim,
+           CASE WHEN ms <= 250 THEN 'le_250' WHEN ms <= 500 THEN 'le_500'
+                WHEN ms <= 1000 THEN 'le_1000' WHEN ms <= 2000 THEN 'le_2000'
+                WHEN ms <= 3000 THEN 'le_3000' WHEN ms <= 5000 THEN 'le_5000'
+                WHEN ms <= 10000 THEN 'le_10000' WHEN ms <= 20000 THEN 'le_20000'
+                ELSE 'inf' END AS key,
+           COUNT(*) AS n
+    FROM ev WHERE event_type = 'question' AND ms <> 0 GROUP BY 1, 3
+    UNION ALL
+    SELECT day, 'intents', intent, COUNT(*)
+    FROM ev WHERE event_type = 'question' AND COALESCE(intent, '') <> '' GROUP BY 1, 3
+    UNION ALL
+    SELECT day, 'error_types', COALESCE(NULLIF(error_type, ''), 'unknown'), COUNT(*)
+    FROM ev WHERE event_type = 'error' GROUP BY 1, 3
+    UNION ALL
+    SELECT day, 'platforms', CASE WHEN user_id LIKE 'fb:%' THEN 'facebook' ELSE 'line' END, COUNT(*)
+    FROM ev WHERE COALESCE(user_id, '') <> '' GROUP BY 1, 3
+    UNION ALL
+    SELECT day, 'top_questions', q, n FROM (
+        SELECT day, LEFT(question_text, 60) AS q, COUNT(*) AS n,
+               ROW_NUMBER() OVER (PARTITION BY day ORDER BY COUNT(*) DESC) AS rn
+        FROM ev WHERE event_type = 'question' AND COALESCE(question_text, '') <> ''
+        GROUP BY 1, 2
+    ) ranked WHERE rn <= 200
+),
+dims AS (
+    SELECT day, jsonb_object_agg(dim, kv) AS dims
+    FROM (
+        SELECT day, dim, jsonb_object_agg(key, n) AS kv
+        FROM dim_counts GROUP BY day, dim
+    ) per_dim
+    GROUP BY day
+)
+INSERT INTO ladda_analytics_rollup (
+    granularity, bucket, worker_id, events, questions, errors, recommendations,
+    latency_sum, latency_count, dims, hll
+)
+SELECT
+    'day', c.day, 'backfill', c.events, c.questions, c.errors, c.recommendations,
+    c.latency_sum, c.latency_count, COALESCE(d.dims, '{}'), '{}'
+FROM counters c
+LEFT JOIN dims d USING (day)
+ON CONFLICT (granularity, bucket, worker_id) DO NOTHING;
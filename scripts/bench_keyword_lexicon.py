@@ -0,0 +1,134 @@
+"""
+Microbenchmark: keyword classification CPU per message.
+
+before = the per-list scans handler + Stage 0 used to run for one message
+         (is_agriculture / is_product / non-agri / detect_problem_types ×2 / slang /
+          symptoms / disease patterns ×2 / usage regexes / follow-up markers)
+after  = the same helpers reading analyze_query() — cold (first call for the message,
+         compiled lexicon pass) and as run in the pipeline (every later call is a cache hit)
+
+Queries: farmer-style sentences built from the real keyword lists (with stray tone marks).
+
+Usage:
+  python scripts/bench_keyword_lexicon.py
+  python scripts/bench_keyword_lexicon.py --queries 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("ADMIN_PASSWORD", "bench-only")
+os.environ.setdefault("SECRET_KEY", "bench-only-secret-key-1234")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.chat import handler  # noqa: E402
+from app.services.chat.handler import (  # noqa: E402
+    AGRICULTURE_KEYWORDS, PRODUCT_KEYWORDS, _NON_AGRI_KEYWORDS, DISEASE_KEYWORDS, INSECT_KEYWORDS,
+    NUTRIENT_KEYWORDS, WEED_KEYWORDS, FARMER_SLANG_MAP, _FOLLOWUP_MARKERS, USAGE_QUESTION_PATTERNS,
+)
+from app.services.chat.lexicon import analyze_query  # noqa: E402
+from app.services.disease.constants import DISEASE_PATTERNS_SORTED  # noqa: E402
+from app.utils.text_processing import (  # noqa: E402
+    SYMPTOM_PATHOGEN_MAP, diacritics_match, resolve_symptom_to_pathogens,
+)
+
+_FILLER = ["ใช้ยาอะไรดีคะ", "ที่สวนหลังบ้าน", "ครับ", "ใช้ยังไง", "ผสมกี่ cc ต่อถัง", "5 ไร่ใช้เท่าไหร่", " ", "ตอนนี้"]
+_KEYWORDS = (AGRICULTURE_KEYWORDS + DISEASE_KEYWORDS + INSECT_KEYWORDS + NUTRIENT_KEYWORDS + WEED_KEYWORDS
+             + list(FARMER_SLANG_MAP) + list(SYMPTOM_PATHOGEN_MAP))
+
+
+def _queries(count: int, rng: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        parts = [rng.choice(_FILLER)]
+        for _ in range(rng.randint(1, 3)):
+            kw = rng.choice(_KEYWORDS)
+            if rng.random() < 0.2:
+                i = rng.randrange(len(kw) + 1)
+                kw = kw[:i] + rng.choice("่้") + kw[i:]
+            parts += [kw, rng.choice(_FILLER)]
+        queries.append("".join(parts))
+    return queries
+
+
+# --- before: the scans one message used to go through -------------------------
+
+def _legacy_problem_types(message: str) -> list:
+    low = message.lower()
+    counts = {
+        'nutrient': sum(1 for kw in NUTRIENT_KEYWORDS if diacritics_match(low, kw)),
+        'disease': sum(1 for kw in DISEASE_KEYWORDS if diacritics_match(low, kw)),
+        'insect': sum(1 for kw in INSECT_KEYWORDS if diacritics_match(low, kw)),
+        'weed': sum(1 for kw in WEED_KEYWORDS if diacritics_match(low, kw)),
+    }
+    return [t for t, c in sorted(counts.items(), key=lambda x: -x[1]) if c > 0]
+
+
+def _legacy_message(q: str) -> None:
+    low = q.lower()
+    any(kw in low for kw in AGRICULTURE_KEYWORDS)
+    any(kw in low for kw in PRODUCT_KEYWORDS)
+    any(kw in q.strip().lower() for kw in _NON_AGRI_KEYWORDS)
+    any(re.search(p, low) for p in USAGE_QUESTION_PATTERNS)
+    any(m in low for m in _FOLLOWUP_MARKERS)
+    _legacy_problem_types(q)  # handler
+    [s for s in FARMER_SLANG_MAP if s in low]
+    [s for s in SYMPTOM_PATHOGEN_MAP if s in q]
+    _legacy_problem_types(q)  # Stage 0
+    next((p for p in DISEASE_PATTERNS_SORTED if diacritics_match(q, p)), None)  # Stage 0
+    next((p for p in DISEASE_PATTERNS_SORTED if diacritics_match(q, p)), None)  # response generator
+
+
+# --- after: the same helpers on QueryFeatures ---------------------------------
+
+def _lexicon_message(q: str) -> None:
+    handler.is_agriculture_question(q)
+    handler.is_product_question(q)
+    handler._is_clearly_non_agriculture(q)
+    handler.is_usage_question(q)
+    handler._is_cacheable_message(q)
+    handler.detect_problem_types(q)
+    handler.resolve_farmer_slang(q)
+    resolve_symptom_to_pathogens(q)
+    handler.detect_problem_types(q)
+    analyze_query(q).disease_pattern
+    analyze_query(q).disease_pattern
+
+
+def _per_message_us(fn, queries, cold: bool = False) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        if cold:
+            analyze_query.cache_clear()
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    queries = _queries(args.queries, random.Random(args.seed))
+    analyze_query("warm-up")  # build the lexicon outside the timed loop
+
+    before = _per_message_us(_legacy_message, queries)
+    single = _per_message_us(analyze_query, queries, cold=True)
+    after = _per_message_us(_lexicon_message, queries, cold=True)
+    print(f"queries: {len(queries)}")
+    print(f"before  (per-list scans)          : {before:8.1f} µs / message")
+    print(f"after   (one analyze_query pass)  : {single:8.1f} µs / message")
+    print(f"after   (all helpers, one message): {after:8.1f} µs / message  ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
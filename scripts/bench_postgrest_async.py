@@ -0,0 +1,132 @@
+"""
+Benchmark: Supabase queries via asyncio.to_thread (old aexecute) vs native async (postgrest_async).
+
+Starts a local fake PostgREST (fixed latency + JSON rows) so results are repeatable,
+then fires N select queries at several concurrency levels through both paths and
+prints throughput and p50 / p99 latency.
+
+Usage:
+  python scripts/bench_postgrest_async.py
+  python scripts/bench_postgrest_async.py --requests 2000 --concurrency 10 50 200 --latency-ms 30 --rows 20
+  # against a real project (read-only select on --table):
+  python scripts/bench_postgrest_async.py --url $SUPABASE_URL --key $SUPABASE_KEY --table products3
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("ADMIN_PASSWORD", "bench-only")
+os.environ.setdefault("SECRET_KEY", "bench-only-secret-key-1234")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import uvicorn  # noqa: E402
+from postgrest import SyncPostgrestClient  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from app.utils import http_clients  # noqa: E402
+from app.utils.http_clients import HTTPClientRegistry  # noqa: E402
+from app.utils.postgrest_async import execute_async  # noqa: E402
+
+
+def _fake_postgrest(latency_ms: float, rows: int) -> Starlette:
+    payload = [{"id": i, "product_name": f"สินค้า {i}", "active_ingredient": "x" * 40} for i in range(rows)]
+
+    async def table(request):
+        await asyncio.sleep(latency_ms / 1000)
+        return JSONResponse(payload)
+
+    return Starlette(routes=[Route("/rest/v1/{table}", table)])
+
+
+def _serve(sock: socket.socket, latency_ms: float, rows: int) -> None:
+    app = _fake_postgrest(latency_ms, rows)
+    uvicorn.Server(uvicorn.Config(app, log_level="warning", backlog=4096)).run(sockets=[sock])
+
+
+def _start_server(latency_ms: float, rows: int) -> str:
+    """Fake PostgREST in its own process — sharing our GIL would skew both paths."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    multiprocessing.Process(target=_serve, args=(sock, latency_ms, rows), daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _run(label: str, execute, make_query, total: int, concurrency: int) -> None:
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with gate:
+            start = time.perf_counter()
+            await execute(make_query())
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(min(concurrency, 20))))  # warm pools
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {total / elapsed:>9.0f} req/s   p50 {_percentile(latencies, 0.50):>7.1f} ms"
+          f"   p99 {_percentile(latencies, 0.99):>7.1f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake server latency per query")
+    parser.add_argument("--rows", type=int, default=10, help="rows returned per query by the fake server")
+    parser.add_argument("--thread-pool", type=int, default=int(os.getenv("THREAD_POOL_SIZE", "50")))
+    parser.add_argument("--url", help="real Supabase URL (default: local fake PostgREST)")
+    parser.add_argument("--key", default=os.getenv("SUPABASE_KEY", ""))
+    parser.add_argument("--table", default="products3")
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/") if args.url else _start_server(args.latency_ms, args.rows)
+    headers = {"apikey": args.key, "Authorization": f"Bearer {args.key}"} if args.key else {}
+    client = SyncPostgrestClient(f"{base}/rest/v1", headers=headers)
+    make_query = lambda: client.from_(args.table).select("*").limit(args.rows)  # noqa: E731
+
+    # same shape as production: default executor = THREAD_POOL_SIZE, one pooled async client per host
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=args.thread_pool))
+    pool = max(args.concurrency)
+    http_clients.http_clients = HTTPClientRegistry(max_connections=pool, max_keepalive=pool, http2=False)
+
+    async def to_thread(query):
+        return await asyncio.to_thread(query.execute)
+
+    print(f"{args.requests} queries → {base} (thread pool {args.thread_pool})")
+    for concurrency in args.concurrency:
+        print(f"concurrency {concurrency}")
+        await _run("to_thread", to_thread, make_query, args.requests, concurrency)
+        await _run("native", execute_async, make_query, args.requests, concurrency)
+    await http_clients.http_clients.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
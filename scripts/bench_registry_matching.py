@@ -0,0 +1,158 @@
+"""
+Microbenchmark: ProductRegistry / PlantRegistry alias extraction, per-call cost.
+
+before = old per-call path: sort every alias by length, then `alias in text` one by one
+         (raw pass + diacritics-stripped pass; extract_all also blanks each matched span)
+after  = compiled Aho-Corasick automaton built once in _build_index (one pass per form)
+
+Synthetic catalogs (random Thai product names + the same auto-generated variants the
+registry builds) of growing size; queries are farmer-style sentences mentioning 0-2 products.
+
+Usage:
+  python scripts/bench_registry_matching.py
+  python scripts/bench_registry_matching.py --sizes 50 500 2000 5000 --queries 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("ADMIN_PASSWORD", "bench-only")
+os.environ.setdefault("SECRET_KEY", "bench-only-secret-key-1234")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.plant.registry import PlantRegistry  # noqa: E402
+from app.services.product.registry import ProductRegistry, _strip_diacritics  # noqa: E402
+
+_SYLLABLES = ["โม", "เดิน", "ไฮ", "ซีส", "แจ๊ส", "กะ", "รัต", "โท", "มา", "ฮอค", "พรี", "ดิคท์", "ไว", "ท์",
+              "แกน", "เตอร์", "อา", "ร์ดอน", "เบน", "ซา", "น่า", "คา", "ริส", "บอม", "ส์", "ไซ", "ม๊อก"]
+_FILLER = ["ใช้ยังไง", "ฉีดข้าวโพด", "พ่นทุเรียนได้ไหม", "ผสมกับ", "อัตราเท่าไหร่", "เพลี้ยไฟ", "ดีไหมครับ", " "]
+
+
+def _catalog(size: int, rng: random.Random) -> dict:
+    names = set()
+    while len(names) < size:
+        name = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.3:
+            name += f" {rng.choice([5, 10, 25, 50, 70, 285])}"
+        names.add(name)
+    return {name: [] for name in names}
+
+
+def _queries(products: dict, count: int, rng: random.Random) -> list:
+    names = list(products)
+    queries = []
+    for _ in range(count):
+        parts = [rng.choice(_FILLER)]
+        for _ in range(rng.randint(0, 2)):
+            parts.append(rng.choice(names))
+            parts.append(rng.choice(_FILLER))
+        queries.append("".join(parts))
+    return queries
+
+
+# --- before: the per-call scans the registries used to run -------------------
+
+def _legacy_extract(reg: ProductRegistry, question: str):
+    q = question.lower()
+    for alias in sorted(reg._alias_index.keys(), key=len, reverse=True):
+        if alias in q:
+            return reg._alias_index[alias]
+    qs = _strip_diacritics(q)
+    for alias in sorted(reg._stripped_index.keys(), key=len, reverse=True):
+        if alias in qs:
+            return reg._stripped_index[alias]
+    return None
+
+
+def _legacy_extract_all(reg: ProductRegistry, question: str):
+    remaining = question.lower()
+    found = []
+    for alias in sorted(reg._alias_index.keys(), key=len, reverse=True):
+        if alias in remaining:
+            found.append(reg._alias_index[alias])
+            remaining = remaining.replace(alias, " ", 1)
+    remaining = _strip_diacritics(remaining)
+    for alias in sorted(reg._stripped_index.keys(), key=len, reverse=True):
+        if alias in remaining:
+            found.append(reg._stripped_index[alias])
+            remaining = remaining.replace(alias, " ", 1)
+    for canonical in reg._canonical_list:  # family-expansion base scan
+        canonical.lower() in question.lower()
+    return found
+
+
+def _legacy_plant(reg: PlantRegistry, question: str):
+    q = question.lower()
+    for name in sorted(reg._lookup, key=len, reverse=True):
+        if name in q:
+            return reg._lookup[name]
+    return None
+
+
+# --- after: the registry methods ----------------------------------------------
+
+def _exact_extract(reg: ProductRegistry, question: str):
+    """extract_product_name steps 1-2 (fuzzy fallback is unchanged and excluded)."""
+    q = question.lower()
+    pid = reg._alias_matcher.first(q)
+    if pid is not None:
+        return reg._alias_index[reg._alias_matcher.patterns[pid]]
+    pid = reg._stripped_matcher.first(_strip_diacritics(q))
+    return None if pid is None else reg._stripped_index[reg._stripped_matcher.patterns[pid]]
+
+
+def _per_call_us(fn, reg, queries) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        fn(reg, q)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000, 5000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'products':>8} {'aliases':>8} {'build ms':>9}  "
+          f"{'extract':>20}  {'extract_all':>20}  {'plant.extract':>20}")
+    print(f"{'':>8} {'':>8} {'':>9}  {'before → after µs':>20}  {'before → after µs':>20}  {'before → after µs':>20}")
+    for size in args.sizes:
+        products = _catalog(size, rng)
+        queries = _queries(products, args.queries, rng)
+
+        reg = ProductRegistry()
+        start = time.perf_counter()
+        reg.load_from_dict(products)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        plants = PlantRegistry()
+        plants._build_index({name.split(" ")[0] for name in products})
+        plants._loaded = True
+
+        for q in queries:  # same answers before and after
+            assert _legacy_extract(reg, q) == _exact_extract(reg, q)
+            assert _legacy_plant(plants, q) == plants.extract(q)
+
+        cols = []
+        for before, after, r in (
+            (_legacy_extract, _exact_extract, reg),
+            (_legacy_extract_all, ProductRegistry.extract_all_product_names, reg),
+            (_legacy_plant, PlantRegistry.extract, plants),
+        ):
+            b, a = _per_call_us(before, r, queries), _per_call_us(after, r, queries)
+            cols.append(f"{b:>8.0f} → {a:>6.1f} ({b / a:>4.0f}x)")
+        print(f"{size:>8} {len(reg._alias_index):>8} {build_ms:>9.1f}  " + "  ".join(cols))
+
+
+if __name__ == "__main__":
+    main()
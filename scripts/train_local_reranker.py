@@ -0,0 +1,214 @@
+"""
+Train / benchmark the LocalReranker weights offline (no API calls at runtime).
+
+Training data:
+  1. LLM rerank logs — RERANK_LOG_PATH JSONL written by log_llm_ranking()
+     (each record = candidates + the LLM ordering → pairs "ranked above")
+  2. reports/capability_test_*.jsonl — every question names its product, so
+     that product should outrank the rest of the catalog (needs Supabase for rows)
+
+Model: pairwise logistic regression on feature differences (RankNet-style),
+plain numpy gradient descent.
+
+Usage:
+  python scripts/train_local_reranker.py train --logs rerank_log.jsonl [--capability reports/*.jsonl]
+  python scripts/train_local_reranker.py benchmark --logs rerank_log.jsonl [--weights data/reranker_weights.json]
+  # benchmark = agreement with the LLM ordering on a held-out 20% split (by query)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+os.environ.setdefault("ADMIN_PASSWORD", "offline-only")
+os.environ.setdefault("SECRET_KEY", "offline-only-secret-key-1234")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.config import RERANK_LOCAL_WEIGHTS_PATH
+from app.services.local_reranker import FEATURE_NAMES, DEFAULT_WEIGHTS, LocalReranker, load_weights
+
+
+# =============================================================================
+# Data
+# =============================================================================
+
+def load_log_records(paths: List[str]) -> List[dict]:
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    rec = json.loads(line)
+                    if rec.get("candidates") and rec.get("order"):
+                        records.append(rec)
+    return records
+
+
+def capability_records(paths: List[str], max_negatives: int = 20, seed: int = 0) -> List[dict]:
+    """One record per capability question: the named product ranked above sampled others."""
+    from app.config import PRODUCT_TABLE
+    from app.dependencies import supabase_client
+    from app.services.product.catalog import PRODUCT_COLUMNS
+
+    rows = supabase_client.table(PRODUCT_TABLE).select(PRODUCT_COLUMNS).execute().data or []
+    by_name = {r["product_name"]: r for r in rows}
+    rng = random.Random(seed)
+
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                target = by_name.get(entry.get("product"))
+                if not target:
+                    continue
+                others = [r for r in rows if r["product_name"] != target["product_name"]]
+                for cell in entry.get("cells", []):
+                    negatives = rng.sample(others, min(max_negatives, len(others)))
+                    candidates = [target] + negatives
+                    rng.shuffle(candidates)
+                    records.append({
+                        "query": cell["question"],
+                        "expected_category": None,
+                        "plant_type": "",
+                        "pest_terms": [],
+                        "candidates": [{**c, "similarity": 0.0} for c in candidates],
+                        # only "target above everything else" is known
+                        "order": [candidates.index(target)],
+                    })
+    return records
+
+
+def record_features(reranker: LocalReranker, rec: dict) -> np.ndarray:
+    return reranker.features(
+        rec["query"], rec["candidates"],
+        similarities=[c.get("similarity", 0.0) for c in rec["candidates"]],
+        expected_category=rec.get("expected_category"),
+        plant_type=rec.get("plant_type") or "",
+        pest_terms=rec.get("pest_terms") or [],
+    )
+
+
+def record_pairs(rec: dict) -> List[Tuple[int, int]]:
+    """(better, worse) index pairs implied by the ordering; unranked candidates sit below all ranked ones."""
+    order = list(dict.fromkeys(rec["order"]))
+    unranked = [i for i in range(len(rec["candidates"])) if i not in set(order)]
+    pairs = []
+    for pos, better in enumerate(order):
+        for worse in order[pos + 1:] + unranked:
+            pairs.append((better, worse))
+    return pairs
+
+
+def split_by_query(records: List[dict], holdout: float = 0.2, seed: int = 0):
+    queries = sorted({r["query"] for r in records})
+    random.Random(seed).shuffle(queries)
+    test_queries = set(queries[:int(len(queries) * holdout)])
+    train = [r for r in records if r["query"] not in test_queries]
+    test = [r for r in records if r["query"] in test_queries]
+    return train, test
+
+
+# =============================================================================
+# Train
+# =============================================================================
+
+def fit_pairwise(records: List[dict], epochs: int = 300, lr: float = 0.1, l2: float = 1e-3) -> dict:
+    reranker = LocalReranker()
+    diffs = []
+    for rec in records:
+        feats = record_features(reranker, rec)
+        for better, worse in record_pairs(rec):
+            diffs.append(feats[better] - feats[worse])
+    if not diffs:
+        raise SystemExit("No training pairs")
+    X = np.array(diffs)
+    w = np.array([DEFAULT_WEIGHTS[n] for n in FEATURE_NAMES], dtype=np.float64)
+    for _ in range(epochs):
+        margin = X @ w
+        # d/dw mean(log(1 + exp(-margin)))
+        grad = -(X * (1.0 / (1.0 + np.exp(margin)))[:, None]).mean(axis=0) + l2 * w
+        w -= lr * grad
+    accuracy = float(((X @ w) > 0).mean())
+    print(f"Trained on {len(records)} rankings / {len(X)} pairs — train pair accuracy {accuracy:.3f}")
+    return {name: round(float(v), 4) for name, v in zip(FEATURE_NAMES, w)}
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def benchmark(reranker: LocalReranker, records: List[dict]) -> dict:
+    pair_hits = pair_total = top1_hits = top3_overlap = 0
+    elapsed = 0.0
+    for rec in records:
+        started = time.perf_counter()
+        order, _ = reranker.rank(
+            rec["query"], rec["candidates"],
+            similarities=[c.get("similarity", 0.0) for c in rec["candidates"]],
+            expected_category=rec.get("expected_category"),
+            plant_type=rec.get("plant_type") or "",
+            pest_terms=rec.get("pest_terms") or [],
+        )
+        elapsed += time.perf_counter() - started
+        position = {idx: pos for pos, idx in enumerate(order)}
+        for better, worse in record_pairs(rec):
+            pair_total += 1
+            pair_hits += position[better] < position[worse]
+        llm_order = list(dict.fromkeys(rec["order"]))
+        top1_hits += order[0] == llm_order[0]
+        top3_overlap += len(set(order[:3]) & set(llm_order[:3])) / min(3, len(llm_order))
+    n = max(len(records), 1)
+    return {
+        "rankings": len(records),
+        "pairwise_agreement": round(pair_hits / max(pair_total, 1), 3),
+        "top1_agreement": round(top1_hits / n, 3),
+        "top3_overlap": round(top3_overlap / n, 3),
+        "avg_latency_us": round(elapsed / n * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["train", "benchmark"])
+    parser.add_argument("--logs", nargs="*", default=[], help="RERANK_LOG_PATH JSONL files")
+    parser.add_argument("--capability", nargs="*", default=[], help="reports/capability_test_*.jsonl")
+    parser.add_argument("--weights", default=RERANK_LOCAL_WEIGHTS_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    records = load_log_records(args.logs)
+    if args.capability:
+        records += capability_records(args.capability)
+    train, test = split_by_query(records, args.holdout)
+
+    if args.command == "train":
+        weights = fit_pairwise(train)
+        print(json.dumps(benchmark(LocalReranker(weights), test), indent=2))
+        Path(args.weights).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.weights, "w", encoding="utf-8") as f:
+            json.dump({"weights": weights, "trained_on": len(train)}, f, indent=2)
+        print(f"Saved {args.weights}")
+    else:
+        print("default weights:", json.dumps(benchmark(LocalReranker(), test)))
+        print("trained weights:", json.dumps(benchmark(LocalReranker(load_weights(args.weights)), test)))
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test-dummy")
 os.environ.setdefault("LINE_CHANNEL_SECRET", "test-dummy")
 os.environ.setdefault("SECRET_KEY", "ci-test-secret-key-min16")
 os.environ.setdefault("ADMIN_PASSWORD", "ci-test-password")
+os.environ.setdefault("WEBHOOK_QUEUE_PATH", "")  # no durable queue file under data/ during tests
 
 
 # ---------------------------------------------------------------------------
@@ -62,10 +63,12 @@ def mock_openai():
     choice.message.content = '{"intent": "greeting", "confidence": 0.9}'
     response = MagicMock(choices=[choice])
     client.chat.completions.create = AsyncMock(return_value=response)
-    # embeddings.create → fake embedding
-    embedding_data = MagicMock(embedding=[0.0] * 1536)
+    # embeddings.create → fake embedding (one per input — calls may be micro-batched)
     client.embeddings.create = AsyncMock(
-        return_value=MagicMock(data=[embedding_data])
+        side_effect=lambda **kw: MagicMock(data=[
+            MagicMock(index=i, embedding=[0.0] * 1536)
+            for i in range(len(kw["input"]) if isinstance(kw.get("input"), list) else 1)
+        ])
     )
     return client
 
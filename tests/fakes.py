@@ -0,0 +1,221 @@
+"""
+Shared test doubles — in-memory async Redis + pipeline
+
+Covers the commands the app's Redis tiers use (strings + TTL, lists, sorted sets).
+Every awaited command and every pipeline execute() counts as one round trip.
+Command `x` is implemented as `_x`; tests that need scripts (EVAL / EVALSHA)
+subclass FakeAsyncRedis and add `_eval` / `_evalsha`.
+
+UpstashRestBackend + upstash_async_client: the real upstash_redis.asyncio client
+(its own pipeline API) with its HTTP calls served by a FakeAsyncRedis.
+"""
+import json
+
+import httpx
+
+
+class FakeAsyncRedis:
+    """Async Redis double: `await redis.get(...)` and `redis.pipeline().get(...)` both run `_get`."""
+
+    def __init__(self):
+        self.kv = {}
+        self.ttls = {}
+        self.lists = {}
+        self.zsets = {}
+        self.round_trips = 0
+        self.mget_keys = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self, f"_{name}")
+
+        async def call(*args, **kwargs):
+            self.round_trips += 1
+            return method(*args, **kwargs)
+        return call
+
+    # ---- strings -------------------------------------------------------
+
+    def _get(self, key):
+        return self.kv.get(key)
+
+    def _set(self, key, value, ex=None, nx=False):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        if ex:
+            self.ttls[key] = ex
+        else:
+            self.ttls.pop(key, None)
+        return True
+
+    def _mget(self, *keys):
+        self.mget_keys += len(keys)
+        return [self.kv.get(k) for k in keys]
+
+    def _incr(self, key):
+        self.kv[key] = str(int(self.kv.get(key, 0)) + 1)
+        return int(self.kv[key])
+
+    def _decr(self, key):
+        self.kv[key] = str(int(self.kv.get(key, 0)) - 1)
+        return int(self.kv[key])
+
+    # ---- keys ----------------------------------------------------------
+
+    def _delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            found = False
+            for store in (self.kv, self.lists, self.zsets):
+                found = store.pop(key, None) is not None or found
+            self.ttls.pop(key, None)
+            deleted += int(found)
+        return deleted
+
+    def _exists(self, key):
+        return int(key in self.kv or key in self.lists or key in self.zsets)
+
+    def _expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return True
+
+    def _ttl(self, key):
+        if not self._exists(key):
+            return -2
+        return self.ttls.get(key, -1)
+
+    # ---- lists ---------------------------------------------------------
+
+    def _lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    def _rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+        return len(self.lists[key])
+
+    def _rpushx(self, key, *values):
+        if key not in self.lists:
+            return 0
+        self.lists[key].extend(values)
+        return len(self.lists[key])
+
+    def _ltrim(self, key, start, end):
+        if key in self.lists:
+            self.lists[key] = self._lrange(key, start, end) if start >= 0 else self.lists[key][start:]
+        return True
+
+    # ---- sorted sets ---------------------------------------------------
+
+    def _zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def _zrangebyscore(self, key, lo, hi):
+        lo, hi = float(lo), float(hi)
+        items = sorted(self.zsets.get(key, {}).items(), key=lambda kv: kv[1])
+        return [m for m, score in items if lo <= score <= hi]
+
+    def _zremrangebyscore(self, key, lo, hi):
+        lo, hi = float(lo), float(hi)
+        zset = self.zsets.get(key, {})
+        gone = [m for m, score in zset.items() if lo <= score <= hi]
+        for m in gone:
+            del zset[m]
+        return len(gone)
+
+
+class FakePipeline:
+    """Buffers commands; execute() applies them in one round trip."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, f"_{name}")
+        return lambda *args, **kwargs: self.commands.append((method, args, kwargs))
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [method(*args, **kwargs) for method, args, kwargs in self.commands]
+
+
+# ---------------------------------------------------------------------------
+# Upstash REST — the real upstash_redis.asyncio client over a mock HTTP layer
+# ---------------------------------------------------------------------------
+
+def _redis_reply(name, result):
+    """Raw REST reply for a FakeAsyncRedis result (SET → "OK" / nil, LTRIM → "OK", bools → 0/1)."""
+    if name in ("SET", "LTRIM"):
+        return "OK" if result else None
+    if isinstance(result, bool):
+        return int(result)
+    return result
+
+
+class UpstashRestBackend:
+    """Runs Upstash REST command arrays (["SET", "k", "v", "NX", "EX", 60]) against a FakeAsyncRedis."""
+
+    def __init__(self, redis=None):
+        self.redis = redis if redis is not None else FakeAsyncRedis()
+        self.requests = []  # one entry per HTTP call: list of commands
+
+    def run(self, command):
+        name, args = str(command[0]).upper(), list(command[1:])
+        r = self.redis
+        if name == "SET":
+            key, value, opts = args[0], args[1], [str(a).upper() for a in args[2:]]
+            ex = int(args[2 + opts.index("EX") + 1]) if "EX" in opts else None
+            result = r._set(key, value, ex=ex, nx="NX" in opts)
+        elif name in ("GET", "TTL", "INCR", "DECR"):
+            result = getattr(r, f"_{name.lower()}")(args[0])
+        elif name in ("MGET", "DEL", "EXISTS"):
+            method = {"MGET": r._mget, "DEL": r._delete, "EXISTS": r._exists}[name]
+            result = method(*args) if name != "EXISTS" else sum(r._exists(k) for k in args)
+        elif name == "EXPIRE":
+            result = r._expire(args[0], int(args[1]))
+        elif name in ("RPUSH", "RPUSHX"):
+            result = getattr(r, f"_{name.lower()}")(args[0], *args[1:])
+        elif name in ("LTRIM", "LRANGE"):
+            result = getattr(r, f"_{name.lower()}")(args[0], int(args[1]), int(args[2]))
+        elif name == "ZADD":
+            pairs = [a for a in args[1:] if str(a).upper() not in ("NX", "XX", "GT", "LT", "CH", "INCR")]
+            mapping = {pairs[i + 1]: float(pairs[i]) for i in range(0, len(pairs), 2)}
+            before = len(r.zsets.get(args[0], {}))
+            r._zadd(args[0], mapping)
+            result = len(r.zsets[args[0]]) - before
+        elif name in ("ZRANGEBYSCORE", "ZREMRANGEBYSCORE"):
+            result = getattr(r, f"_{name.lower()}")(args[0], args[1], args[2])
+        elif name in ("EVAL", "EVALSHA"):
+            result = getattr(r, f"_{name.lower()}")(args[0], int(args[1]), *args[2:])
+        else:
+            raise NotImplementedError(name)
+        return _redis_reply(name, result)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        pipeline = request.url.path.endswith("/pipeline")
+        commands = body if pipeline else [body]
+        self.requests.append(commands)
+        replies = []
+        for command in commands:
+            try:
+                replies.append({"result": self.run(command)})
+            except Exception as e:
+                replies.append({"error": f"ERR {e}"})
+        return httpx.Response(200, json=replies if pipeline else replies[0])
+
+
+def upstash_async_client(backend: UpstashRestBackend):
+    """Real upstash_redis.asyncio.Redis whose HTTP calls are served by `backend` (no network)."""
+    from upstash_redis.asyncio import Redis
+
+    client = Redis(url="https://fake.upstash.io", token="test", rest_encoding=None,
+                   rest_retries=0, allow_telemetry=False)
+    client._http._client = httpx.AsyncClient(transport=httpx.MockTransport(backend.handle))
+    return client
@@ -0,0 +1,125 @@
+"""
+Tests — AdminInbox (incremental admin chat conversation list)
+
+A memory flush must collapse into one delta per user (latest message wins),
+pages must be keyset-paginated with a stable cursor, and inbox failures must
+never fail the memory write they ride on.
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import memory
+from app.services.admin_inbox import (
+    AdminInbox, decode_cursor, encode_cursor, message_count, summarize_messages,
+)
+
+
+class _Query:
+    """Records a PostgREST builder chain; execute() returns the canned rows."""
+
+    def __init__(self, rows, calls):
+        self._rows = rows
+        self.calls = calls
+
+    def __getattr__(self, name):
+        def _call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return _call
+
+    def execute(self):
+        return MagicMock(data=self._rows)
+
+
+def _client(rows):
+    calls = []
+    client = MagicMock()
+    client.table.side_effect = lambda name: _Query(rows, calls)
+    return client, calls
+
+
+def test_summarize_collapses_flush_per_user_latest_message_wins():
+    rows = [
+        {"user_id": "Uaaa", "role": "user", "content": "ใบทุเรียนเป็นจุด", "created_at": "2026-10-15T23:59:00+00:00"},
+        {"user_id": "fb:42", "role": "user", "content": "สวัสดีค่ะ", "created_at": "2026-10-16T08:00:00+00:00"},
+        {"user_id": "Uaaa", "role": "assistant", "content": "x" * 300, "created_at": "2026-10-16T00:01:00+00:00"},
+        # flushed late (another worker) — older than the reply above, must not replace the preview
+        {"user_id": "Uaaa", "role": "user", "content": "ขอบคุณ", "created_at": "2026-10-16T00:00:30Z"},
+    ]
+    deltas = {d["user_id"]: d for d in summarize_messages(rows)}
+
+    assert deltas["Uaaa"]["last_role"] == "assistant"
+    assert deltas["Uaaa"]["last_message"] == "x" * 100
+    assert deltas["Uaaa"]["last_activity"] == "2026-10-16T00:01:00+00:00"
+    assert deltas["Uaaa"]["day_counts"] == {"2026-10-15": 1, "2026-10-16": 2}
+    assert deltas["fb:42"]["platform"] == "facebook" and deltas["Uaaa"]["platform"] == "line"
+
+
+def test_message_count_covers_seven_day_window():
+    now = datetime(2026, 10, 16, 12, tzinfo=timezone.utc)
+    counts = {"2026-10-16": 3, "2026-10-09": 2, "2026-10-08": 7}
+    assert message_count(counts, now) == 5
+    assert message_count({}, now) == 0
+
+
+@pytest.mark.asyncio
+async def test_page_uses_keyset_cursor():
+    rows = [
+        {"user_id": f"U{i}", "platform": "line", "last_message": "hi", "last_role": "user",
+         "last_activity": f"2026-10-16T10:0{9 - i}:00+00:00", "day_counts": {"2026-10-16": 1},
+         "has_handoff": False, "handoff_id": None}
+        for i in range(3)
+    ]
+    client, calls = _client(rows)
+    inbox = AdminInbox(client)
+
+    sessions, cursor = await inbox.page(has_handoff=False, limit=2)
+    assert [s["user_id"] for s in sessions] == ["U0", "U1"]
+    assert sessions[0]["message_count"] == 1
+    assert decode_cursor(cursor) == ("2026-10-16T10:08:00+00:00", "U1")
+    assert ("limit", (3,), {}) in calls
+    assert not any(name == "or_" for name, _, _ in calls)
+
+    client_last, calls = _client(rows[2:])
+    sessions, next_cursor = await AdminInbox(client_last).page(has_handoff=False, cursor=cursor, limit=2)
+    assert [s["user_id"] for s in sessions] == ["U2"] and next_cursor is None
+    (flt,) = [args[0] for name, args, _ in calls if name == "or_"]
+    assert flt == ('last_activity.lt."2026-10-16T10:08:00+00:00",'
+                   'and(last_activity.eq."2026-10-16T10:08:00+00:00",user_id.lt."U1")')
+
+
+def test_cursor_roundtrip_and_rejects_garbage():
+    cursor = encode_cursor("2026-10-16T10:00:00+00:00", "fb:123")
+    assert decode_cursor(cursor) == ("2026-10-16T10:00:00+00:00", "fb:123")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_memory_flush_updates_inbox_once_and_survives_inbox_failure():
+    inserted = []
+    db = MagicMock()
+    db.table.return_value.insert.side_effect = lambda rows: MagicMock(execute=lambda: inserted.append(rows))
+    db.rpc.side_effect = RuntimeError("admin_inbox_apply does not exist")
+    inbox = AdminInbox(db)
+    rows = [{"user_id": "Uaaa", "role": "user", "content": "hi", "created_at": "2026-10-16T10:00:00+00:00"}]
+
+    with patch.object(memory, "supabase_client", db), patch.object(memory, "get_admin_inbox", return_value=inbox):
+        await memory._insert_memory_rows(rows)  # must not raise → write buffer will not retry the rows
+
+    assert inserted == [rows]
+    assert db.rpc.call_count == 1
+    assert inbox.get_stats()["apply_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_handoff_before_first_flush_upserts_the_row():
+    client, calls = _client([])
+    await AdminInbox(client).set_handoff("fb:777", 12)
+
+    (row,) = [args[0] for name, args, _ in calls if name == "upsert"]
+    assert row == {"user_id": "fb:777", "platform": "facebook", "has_handoff": True, "handoff_id": 12}
+    assert [kw for name, _, kw in calls if name == "upsert"] == [{"on_conflict": "user_id"}]
@@ -0,0 +1,49 @@
+"""
+Tests — AhoCorasick matcher behind ProductRegistry / PlantRegistry extraction
+
+The automaton must report exactly what a naive `pattern in text` scan reports,
+and lowest-id-wins must reproduce the registries' longest-first precedence.
+"""
+
+import random
+
+from app.services.product.registry import ProductRegistry
+from app.utils.aho_corasick import AhoCorasick
+
+
+def test_matches_naive_scan_on_random_inputs():
+    rng = random.Random(0)
+    for _ in range(2000):
+        patterns = ["".join(rng.choice("ab่c") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = "".join(rng.choice("ab่c ") for _ in range(rng.randint(0, 20)))
+        matcher = AhoCorasick(patterns)
+
+        present = [pid for pid, p in enumerate(matcher.patterns) if p in text]
+        assert matcher.first(text) == (present[0] if present else None)
+
+        expected = sorted(
+            (start, start + len(p), pid)
+            for pid, p in enumerate(matcher.patterns)
+            for start in range(len(text))
+            if text.startswith(p, start)
+        )
+        assert sorted(matcher.find_all(text)) == expected
+
+
+def test_duplicates_and_empty_patterns_ignored():
+    matcher = AhoCorasick(["ข้าวโพด", "", "ข้าว", "ข้าวโพด"])
+    assert matcher.patterns == ["ข้าวโพด", "ข้าว"]
+    assert matcher.first("ปลูกข้าวโพด") == 0
+    assert matcher.first("") is None
+    assert AhoCorasick(()).find_all("อะไรก็ได้") == []
+
+
+def test_registry_longest_alias_wins_and_multi_product_claims():
+    registry = ProductRegistry()
+    registry.load_from_dict({"โมเดิน": [], "โมเดิน 50": [], "ไฮซีส": ["hysis"], "บอมส์ ไวท์": [], "บอมส์ แม็กซ์": []})
+
+    assert registry.extract_product_name("โมเดิน 50 ใช้ยังไง") == "โมเดิน 50"
+    assert registry.extract_product_name("HYSIS ผสมได้ไหม") == "ไฮซีส"
+    assert registry.extract_product_name("ไฮซี่ส ฉีดข้าว") == "ไฮซีส"  # diacritics-stripped pass
+    assert registry.extract_all_product_names("โมเดิน 50 กับ ไฮซีส") == ["โมเดิน 50", "ไฮซีส"]
+    assert registry.extract_all_product_names("ไวท์ กับ แม็กซ์ ต่างกันยังไง") == ["บอมส์ แม็กซ์", "บอมส์ ไวท์"]
@@ -0,0 +1,90 @@
+"""
+Tests — AnalyticsEventPipeline (batched, buffered ladda_analyst_event writes)
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.analytics_pipeline import AnalyticsEventPipeline
+
+
+class _Writer:
+    def __init__(self, fail_times: int = 0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, rows):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db down")
+        self.batches.append(list(rows))
+
+
+@pytest.mark.asyncio
+async def test_events_flushed_in_one_insert_after_interval():
+    writer = _Writer()
+    pipeline = AnalyticsEventPipeline(writer, batch_size=100, flush_interval_ms=10)
+    for i in range(5):
+        assert pipeline.submit({"user_id": f"u{i}", "event_type": "question"})
+    assert writer.batches == []  # nothing written on the request path
+
+    await asyncio.sleep(0.05)
+    assert len(writer.batches) == 1 and len(writer.batches[0]) == 5
+    assert all(r["created_at"] for r in writer.batches[0])
+    assert pipeline.get_stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_size_flushes_without_waiting_for_timer():
+    writer = _Writer()
+    pipeline = AnalyticsEventPipeline(writer, batch_size=3, flush_interval_ms=60_000)
+    for i in range(7):
+        pipeline.submit({"user_id": "u", "event_type": "error"})
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert [len(b) for b in writer.batches] == [3, 3, 1]  # backlog drained in batch_size chunks
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_instead_of_blocking():
+    pipeline = AnalyticsEventPipeline(_Writer(), batch_size=100, flush_interval_ms=60_000, queue_max=2)
+    results = [pipeline.submit({"event_type": "question"}) for _ in range(4)]
+    assert results == [True, True, False, False]
+    stats = pipeline.get_stats()
+    assert stats["dropped"] == 2 and stats["queue_depth"] == 2 and stats["max_depth"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_retried_once_then_counted_lost():
+    writer = _Writer(fail_times=1)
+    pipeline = AnalyticsEventPipeline(writer, flush_interval_ms=60_000)
+    pipeline.submit({"event_type": "question"})
+    assert await pipeline.drain() == 1
+    assert pipeline.get_stats()["write_errors"] == 1
+
+    writer.fail_times = 2
+    pipeline.submit({"event_type": "question"})
+    assert await pipeline.drain() == 0
+    assert pipeline.get_stats()["lost"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tracker_mixed_events_share_one_insert_with_uniform_columns():
+    from app.services.analytics import AnalyticsTracker
+
+    supabase = MagicMock()
+    tracker = AnalyticsTracker(supabase)
+    with patch("app.services.analytics.aexecute", AsyncMock()):
+        await tracker.track_question("u1", "เพลี้ยไฟทุเรียน", intent="pest", response_time_ms=812.4)
+        await tracker.track_product_recommendation("u1", "chat", ["โมเดิน 50", "แกนเตอร์"])
+        await tracker.track_error("u2", "timeout", "openai timeout")
+        supabase.table.return_value.insert.assert_not_called()
+        assert await tracker.flush() == 4
+
+    supabase.table.return_value.insert.assert_called_once()
+    rows = supabase.table.return_value.insert.call_args.args[0]
+    assert len({frozenset(r) for r in rows}) == 1
+    assert [r["event_type"] for r in rows] == ["question", "product_recommendation", "product_recommendation", "error"]
+    assert rows[0]["response_time_ms"] == 812 and rows[1]["question_text"] is None
@@ -0,0 +1,130 @@
+"""
+Tests — analytics rollups (per-minute/per-day counters, HyperLogLog, dashboard from rollups)
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.analytics_rollup import HyperLogLog, RollupBucket, RollupEngine
+
+
+class _RollupStore:
+    """In-memory ladda_analytics_rollup keyed by (granularity, bucket, worker_id)."""
+
+    def __init__(self):
+        self.rows = {}
+        self.reads = 0
+
+    async def write(self, rows):
+        for row in rows:
+            self.rows[(row["granularity"], row["bucket"], row["worker_id"])] = row
+
+    async def read(self, granularity, since):
+        self.reads += 1
+        return [r for (g, b, _), r in self.rows.items() if g == granularity and b >= since]
+
+
+def _event(user_id, event_type="question", created_at="2026-01-01T10:05:30", **fields):
+    return {"user_id": user_id, "event_type": event_type, "created_at": created_at, **fields}
+
+
+def test_hll_estimates_and_merges_within_error():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        a.add(f"U{i}")
+    for i in range(2000, 5000):
+        b.add(f"U{i}")
+    assert abs(a.count() - 3000) / 3000 < 0.06
+    a.merge(b)
+    assert abs(a.count() - 5000) / 5000 < 0.06
+
+    small = HyperLogLog()
+    for user in ["U1", "U2", "U2", "fb:U3"]:
+        small.add(user)
+    assert small.count() == 3
+    assert HyperLogLog.from_b64(small.to_b64()).count() == 3
+
+
+def test_bucket_counts_and_row_roundtrip():
+    bucket = RollupBucket("day", "2026-01-01")
+    bucket.record(_event("U1", intent="pest", response_time_ms=800, question_text="เพลี้ยไฟทุเรียน"))
+    bucket.record(_event("fb:U2", intent="pest", response_time_ms=4000, question_text="เพลี้ยไฟทุเรียน"))
+    bucket.record(_event("U1", "error", error_type="timeout"))
+    bucket.record(_event("U1", "product_recommendation", product_name="โมเดิน 50"))
+
+    restored = RollupBucket.from_row(bucket.to_row("w1"))
+    assert restored.counters == {"events": 4, "questions": 2, "errors": 1, "recommendations": 1,
+                                 "latency_sum": 4800, "latency_count": 2}
+    assert restored.dims["latency_hist"] == {"le_1000": 1, "le_5000": 1}
+    assert restored.dims["intents"] == {"pest": 2}
+    assert restored.dims["platforms"] == {"line": 3, "facebook": 1}
+    assert restored.dims["top_questions"] == {"เพลี้ยไฟทุเรียน": 2}
+    assert (restored.unique_users(), restored.unique_users("line"), restored.unique_users("facebook")) == (2, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_workers_upsert_own_rows_and_load_merges_them():
+    today = datetime.now()
+    yesterday = (today - timedelta(days=1)).isoformat()
+    store = _RollupStore()
+    worker_a = RollupEngine(store.write, store.read, flush_interval=60, worker_id="a")
+    worker_b = RollupEngine(store.write, store.read, flush_interval=60, worker_id="b")
+    worker_a.record(_event("U1", created_at=yesterday))
+    worker_a.record(_event("U2", created_at=today.isoformat()))
+    worker_b.record(_event("U1", "error", created_at=yesterday))
+
+    assert await worker_b.flush() == 2  # minute + day bucket
+    await worker_a.flush()
+    worker_a.record(_event("U3", created_at=yesterday))
+    await worker_a.flush()  # cumulative upsert — same row replaced, not added to
+    assert len(store.rows) == 6
+
+    daily = await worker_a.load("day", yesterday[:10])
+    assert list(daily) == [yesterday[:10], today.strftime("%Y-%m-%d")]
+    first = daily[yesterday[:10]]
+    assert first.counters["questions"] == 2 and first.counters["errors"] == 1
+    assert first.unique_users() == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_buckets_dirty():
+    store = _RollupStore()
+    writer = AsyncMock(side_effect=[RuntimeError("db down"), None])
+    engine = RollupEngine(writer, store.read, flush_interval=60, worker_id="a")
+    engine.record(_event("U1"))
+    assert await engine.flush() == 0
+    assert engine.get_stats()["dirty"] == 2
+    assert await engine.drain() == 2
+
+
+@pytest.mark.asyncio
+async def test_dashboard_reads_rollups_not_events():
+    from app.services.analytics import AnalyticsTracker
+
+    supabase = MagicMock()
+    users_query = supabase.table.return_value.select.return_value.order.return_value.limit.return_value
+    users_query.execute.return_value = MagicMock(data=[{"display_name": "สมชาย", "line_user_id": "U1"}], count=42)
+    store = _RollupStore()
+    tracker = AnalyticsTracker(supabase)
+    tracker.rollup = RollupEngine(store.write, store.read, flush_interval=60, worker_id="w")
+
+    with patch("app.services.analytics.aexecute", AsyncMock(side_effect=lambda q: q.execute())):
+        await tracker.track_question("U1", "เพลี้ยไฟ", intent="pest", response_time_ms=1000)
+        await tracker.track_question("fb:U2", "หนอนกอ", intent="pest", response_time_ms=3000)
+        await tracker.track_error("U1", "timeout", "openai timeout")
+        stats = await tracker.get_dashboard_stats(days=1)
+
+    assert store.reads == 1
+    assert stats["overview"] == {"unique_users": 2, "questions_asked": 2, "total_requests": 2, "errors": 1}
+    assert stats["performance"]["avg_response_time_ms"] == 2000
+    assert stats["performance"]["error_rate_percent"] == 50
+    assert stats["platform"]["facebook"] == {"users": 1, "messages": 1}
+    assert stats["top_intents"] == [{"name": "pest", "count": 2}]
+    assert stats["total_registered"] == 42
+    assert sum(stats["daily_activity"].values()) == 3
+    # days=1 = today only (day buckets cannot express a rolling 24 h)
+    assert stats["date_range"]["start"] == datetime.now().strftime("%Y-%m-%dT00:00:00")
+    # events table is never scanned on the rollup path (event inserts are still buffered)
+    assert "ladda_analyst_event" not in [c.args[0] for c in supabase.table.call_args_list]
@@ -0,0 +1,137 @@
+"""
+Tests — ConversationContextCache (pre-parsed per-user history for get_enhanced_context)
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.context_cache import ConversationContextCache
+from tests.fakes import FakeAsyncRedis, UpstashRestBackend, upstash_async_client
+
+
+def _msg(content, role="user"):
+    return {"role": role, "content": content, "created_at": "", "text": content, "products": [],
+            "product": "", "disease": "", "boundary": False}
+
+
+@pytest.mark.asyncio
+async def test_l1_cold_put_append_window():
+    cache = ConversationContextCache(window=3, ttl=60)
+    with patch("app.services.context_cache._get_redis", return_value=None):
+        assert await cache.get("u") is None
+        await cache.append("u", _msg("ignored while cold"))
+        assert await cache.get("u") is None
+
+        await cache.put("u", [_msg("a"), _msg("b")])
+        await cache.append("u", _msg("c"))
+        await cache.append("u", _msg("d"))
+        assert [m["content"] for m in await cache.get("u")] == ["b", "c", "d"]
+
+        await cache.invalidate("u")
+        assert await cache.get("u") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_shared_between_workers_and_never_created_by_append():
+    redis = FakeAsyncRedis()
+    worker_a = ConversationContextCache(window=3, ttl=60)
+    worker_b = ConversationContextCache(window=3, ttl=60)
+    with patch("app.services.context_cache._get_redis", return_value=redis):
+        await worker_a.append("u", _msg("x"))
+        assert redis.lists == {}  # RPUSHX: cold key stays cold
+
+        await worker_a.put("u", [_msg("a")])
+        await worker_b.append("u", _msg("b"))
+        await worker_b.append("u", _msg("c"))
+        await worker_b.append("u", _msg("d"))
+        assert [m["content"] for m in await worker_a.get("u")] == ["b", "c", "d"]
+
+    assert worker_a.get_stats()["redis_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_list_written_and_read_on_the_upstash_client():
+    backend = UpstashRestBackend()
+    worker_a = ConversationContextCache(window=3, ttl=60)
+    worker_b = ConversationContextCache(window=3, ttl=60)
+    with patch("app.services.context_cache._get_redis", return_value=upstash_async_client(backend)):
+        await worker_a.put("u", [_msg("a"), _msg("b")])
+        await worker_a.append("u", _msg("c"))
+        await worker_a.append("u", _msg("d"))
+        assert [m["content"] for m in await worker_b.get("u")] == ["b", "c", "d"]
+
+    assert worker_a.get_stats()["redis_errors"] == 0
+    assert worker_b.get_stats()["redis_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_enhanced_context_reads_db_only_on_cold_cache():
+    from app.services import memory
+    from app.services.memory_buffer import MemoryWriteBuffer
+
+    async def _writer(rows):
+        pass
+
+    supabase = MagicMock()
+    query = supabase.table.return_value.select.return_value.eq.return_value.order.return_value.limit.return_value
+    query.execute.return_value = MagicMock(data=[
+        {"role": "assistant", "content": "แนะนำโมเดิน 50 ค่ะ", "metadata": {}, "created_at": ""},
+        {"role": "user", "content": "เพลี้ยไฟทุเรียน", "metadata": {}, "created_at": ""},
+    ])
+
+    with patch.object(memory, "supabase_client", supabase), \
+            patch.object(memory, "_write_buffer", MemoryWriteBuffer(_writer, flush_interval_ms=60_000)), \
+            patch.object(memory, "_context_cache", ConversationContextCache()), \
+            patch("app.services.context_cache._get_redis", return_value=None):
+        first = await memory.get_enhanced_context("user-ctx")
+        await memory.add_to_memory("user-ctx", "user", "ใช้กี่ซีซี")
+        second = await memory.get_enhanced_context("user-ctx")
+
+    assert query.execute.call_count == 1
+    assert "ผู้ใช้: เพลี้ยไฟทุเรียน" in first
+    assert second.index("เพลี้ยไฟทุเรียน") < second.index("ใช้กี่ซีซี")
+
+
+@pytest.mark.asyncio
+async def test_enhanced_context_session_timeout_ignores_in_flight_message():
+    from datetime import datetime, timedelta, timezone
+    from app.services import memory
+    from app.services.memory_buffer import MemoryWriteBuffer
+
+    async def _writer(rows):
+        pass
+
+    stale = (datetime.now(timezone.utc) - timedelta(hours=10)).isoformat()
+    supabase = MagicMock()
+    query = supabase.table.return_value.select.return_value.eq.return_value.order.return_value.limit.return_value
+    query.execute.return_value = MagicMock(data=[
+        {"role": "assistant", "content": "แนะนำโมเดิน 50 ค่ะ", "metadata": {}, "created_at": stale},
+        {"role": "user", "content": "เพลี้ยไฟทุเรียน", "metadata": {}, "created_at": stale},
+    ])
+
+    with patch.object(memory, "supabase_client", supabase), \
+            patch.object(memory, "_write_buffer", MemoryWriteBuffer(_writer, flush_interval_ms=60_000)), \
+            patch.object(memory, "_context_cache", ConversationContextCache()), \
+            patch.object(memory, "MEMORY_SESSION_TIMEOUT_HOURS", 6), \
+            patch("app.services.context_cache._get_redis", return_value=None):
+        # handler order: add_to_memory(current message) runs alongside get_enhanced_context
+        await memory.add_to_memory("user-stale", "user", "ข้าวเป็นโรคไหม้")
+        assert await memory.get_enhanced_context("user-stale", current_query="ข้าวเป็นโรคไหม้") == ""
+        # warm cache (now holds the in-flight row too) must time out the same way
+        assert await memory.get_enhanced_context("user-stale", current_query="ข้าวเป็นโรคไหม้") == ""
+
+
+@pytest.mark.asyncio
+async def test_without_redis_l1_only_serves_the_current_turn(monkeypatch):
+    """No Redis: worker A's L1 must not hide turns handled by worker B (baseline read the DB each turn)."""
+    from app.services import context_cache
+
+    clock = [1000.0]
+    monkeypatch.setattr(context_cache.time, "time", lambda: clock[0])
+    worker_a = ConversationContextCache(window=3, ttl=3600, local_ttl=5)
+    with patch("app.services.context_cache._get_redis", return_value=None):
+        await worker_a.put("u", [_msg("a")])
+        assert await worker_a.get("u") is not None  # same turn (context + summary)
+        clock[0] += 30                              # next turn, possibly after worker B answered one
+        assert await worker_a.get("u") is None
@@ -0,0 +1,126 @@
+"""
+Tests — DurableQueue (SQLite WAL webhook queue: dedup, ack, lease expiry, crash recovery, dead-letter)
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.services.durable_queue import DurableQueue
+
+
+def _queue(tmp_path, **kwargs):
+    return DurableQueue(str(tmp_path / "queue.db"), **kwargs)
+
+
+def _line_event(user_id, event_id, text="สวัสดี"):
+    return {
+        "type": "message",
+        "webhookEventId": event_id,
+        "replyToken": f"rt-{event_id}",
+        "source": {"type": "user", "userId": user_id},
+        "message": {"type": "text", "text": text},
+    }
+
+
+@pytest.mark.asyncio
+async def test_enqueue_dedups_by_event_id_and_ack_removes_row(tmp_path):
+    queue = _queue(tmp_path)
+    items = [("U1", "ev1", {"n": 1}), ("U2", "ev2", {"n": 2})]
+    jobs = await queue.enqueue("line", items)
+    assert [(payload, redelivered) for _, payload, redelivered in jobs] == [({"n": 1}, False), ({"n": 2}, False)]
+
+    # LINE redelivery of the same webhookEventId → skipped; other channel namespace is separate
+    assert await queue.enqueue("line", [("U1", "ev1", {"n": 1})]) == []
+    assert len(await queue.enqueue("facebook", [("U1", "ev1", {"n": 1})])) == 1
+
+    await queue.ack(jobs[0][0])
+    await queue.ack(None)
+    stats = queue.get_stats()
+    assert (stats["enqueued"], stats["duplicates"], stats["acked"], stats["depth"]) == (3, 1, 1, 2)
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_redelivered_to_channel_handler(tmp_path):
+    queue = _queue(tmp_path, lease_seconds=0.05)
+    delivered = []
+
+    async def handler(job):
+        delivered.append(job)
+
+    queue.register("line", handler)
+    [job] = await queue.enqueue("line", [("U1", "ev1", {"text": "ใบไหม้"})])
+    assert await queue.sweep() == 0  # still leased to us
+
+    time.sleep(0.06)
+    assert await queue.sweep() == 1
+    assert delivered == [(job[0], {"text": "ใบไหม้"}, True)]
+    assert await queue.sweep() == 0  # re-leased on claim
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_rows_of_dead_worker_are_reclaimed_without_waiting_for_lease(tmp_path):
+    crashed = _queue(tmp_path)
+    crashed.owner = f"{crashed.host}:999999"  # pid ที่ไม่มีอยู่จริง = worker ที่ crash ไปแล้ว
+    await crashed.enqueue("facebook", [("psid1", "mid.1", {"mid": "mid.1"})])
+    crashed.close()
+
+    survivor = _queue(tmp_path)
+    delivered = []
+
+    async def handler(job):
+        delivered.append(job)
+        await survivor.ack(job[0])
+
+    survivor.register("facebook", handler)
+    with patch("app.services.durable_queue._pid_alive", return_value=False):
+        assert await survivor.sweep() == 1
+    assert delivered[0][1:] == ({"mid": "mid.1"}, True)
+    assert survivor.get_stats()["depth"] == 0
+    survivor.close()
+
+
+@pytest.mark.asyncio
+async def test_poison_event_dead_lettered_after_max_attempts(tmp_path):
+    queue = _queue(tmp_path, lease_seconds=0, max_attempts=2)
+    delivered = []
+
+    async def handler(job):
+        delivered.append(job[0])  # never acks
+
+    queue.register("line", handler)
+    await queue.enqueue("line", [("U1", "ev1", {"n": 1})])
+    for _ in range(3):
+        time.sleep(0.01)
+        await queue.sweep()
+
+    assert len(delivered) == 1  # attempt 2 redelivered, attempt 3 dead-lettered
+    stats = queue.get_stats()
+    assert (stats["redelivered"], stats["dead_lettered"], stats["depth"]) == (1, 1, 0)
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_line_webhook_persists_then_dispatches_and_acks(tmp_path):
+    from app.routers import webhook
+
+    queue = _queue(tmp_path)
+    processed = []
+
+    async def fake_process(event):
+        processed.append(event["webhookEventId"])
+        assert event["_queue_id"] is not None  # persisted before processing
+
+    events = [_line_event("U1", "ev1"), _line_event("U2", "ev2"), _line_event("U1", "ev1")]
+    with patch.object(webhook, "webhook_queue", queue), \
+         patch.object(webhook, "_process_webhook_event", fake_process):
+        await webhook._accept_webhook_events(events)
+        await webhook._dispatcher.drain()
+
+    assert sorted(processed) == ["ev1", "ev2"]
+    stats = queue.get_stats()
+    assert (stats["duplicates"], stats["acked"], stats["depth"]) == (1, 2, 0)
+    queue.close()
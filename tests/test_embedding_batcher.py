@@ -0,0 +1,88 @@
+"""
+Tests — EmbeddingBatcher (micro-batching of embeddings.create)
+
+Concurrent embed_text() calls inside the window must become one API call,
+identical texts share one slot, and API errors reach every waiter.
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.embedding_batcher import EmbeddingBatcher
+
+
+def _client(fail: bool = False):
+    client = AsyncMock()
+
+    async def create(**kwargs):
+        if fail:
+            raise RuntimeError("openai down")
+        # Return items out of order — results must be matched by .index
+        items = [MagicMock(index=i, embedding=[float(len(t))]) for i, t in enumerate(kwargs["input"])]
+        return MagicMock(data=list(reversed(items)))
+
+    client.embeddings.create = AsyncMock(side_effect=create)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_call():
+    batcher = EmbeddingBatcher(window_ms=5, max_batch=64)
+    client = _client()
+
+    texts = ["a", "bb", "ccc", "dddd"]
+    results = await asyncio.gather(*(batcher.embed(t, client) for t in texts))
+
+    assert results == [[1.0], [2.0], [3.0], [4.0]]
+    client.embeddings.create.assert_awaited_once()
+    assert client.embeddings.create.call_args.kwargs["input"] == texts
+
+
+@pytest.mark.asyncio
+async def test_identical_texts_deduped():
+    batcher = EmbeddingBatcher(window_ms=5, max_batch=64)
+    client = _client()
+
+    results = await asyncio.gather(*(batcher.embed("เพลี้ยไฟ", client) for _ in range(3)))
+
+    assert results == [[8.0]] * 3
+    assert client.embeddings.create.call_args.kwargs["input"] == ["เพลี้ยไฟ"]
+    stats = batcher.get_stats()
+    assert stats["requests"] == 3 and stats["deduped"] == 2 and stats["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_immediately():
+    batcher = EmbeddingBatcher(window_ms=10_000, max_batch=2)
+    client = _client()
+
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.embed("x", client), batcher.embed("yy", client)), timeout=1
+    )
+
+    assert results == [[1.0], [2.0]]
+    assert batcher.get_stats()["max_batch_size"] == 2
+
+
+@pytest.mark.asyncio
+async def test_api_error_propagates_to_all_waiters():
+    batcher = EmbeddingBatcher(window_ms=5, max_batch=64)
+    client = _client(fail=True)
+
+    results = await asyncio.gather(batcher.embed("a", client), batcher.embed("b", client),
+                                   return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert batcher.get_stats()["api_errors"] == 1
+    # Failed texts are not stuck in-flight — the next call retries
+    assert not batcher._inflight
+
+
+@pytest.mark.asyncio
+async def test_retrieval_agent_returns_empty_on_failure():
+    from app.services.rag.retrieval_agent import RetrievalAgent
+
+    agent = RetrievalAgent(supabase_client=MagicMock(), openai_client=_client(fail=True))
+    assert await agent._generate_embedding("batcher-failure-test") == []
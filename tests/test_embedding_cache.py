@@ -0,0 +1,114 @@
+"""
+Tests — EmbeddingCache (L1 LRU → disk mmap → Redis)
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from app.services.embedding_cache import EmbeddingCache, cache_key
+from tests.fakes import FakeAsyncRedis
+
+
+def _vec(seed: int, dim: int = 8) -> list:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+def test_key_normalizes_whitespace_and_includes_model():
+    assert cache_key("เพลี้ยไฟ  ทุเรียน ") == cache_key("เพลี้ยไฟ ทุเรียน")
+    assert cache_key("x", model="a") != cache_key("x", model="b")
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2, disk_path="")
+    with patch("app.services.embedding_cache._get_redis", return_value=None):
+        await cache.set("a", _vec(1))
+        await cache.set("b", _vec(2))
+        assert cache.get_local("a") is not None  # a becomes most recent
+        await cache.set("c", _vec(3))
+    assert cache.get_local("b") is None
+    assert cache.get_local("a") == pytest.approx(_vec(1))
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_shared_between_workers():
+    redis = FakeAsyncRedis()
+    worker_a = EmbeddingCache(disk_path="")
+    worker_b = EmbeddingCache(disk_path="")
+    with patch("app.services.embedding_cache._get_redis", return_value=redis):
+        await worker_a.set("โรคราสีชมพู", _vec(4))
+        assert worker_b.get_local("โรคราสีชมพู") is None
+        assert await worker_b.get("โรคราสีชมพู") == pytest.approx(_vec(4))
+        # promoted to L1
+        assert worker_b.get_local("โรคราสีชมพู") is not None
+        assert await worker_b.get("unknown") is None
+
+    stats = worker_b.get_stats()
+    assert stats["redis_hits"] == 1 and stats["l1_hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == pytest.approx(2 / 3, abs=1e-3)
+
+
+@pytest.mark.asyncio
+async def test_disk_warm_start(tmp_path):
+    path = str(tmp_path / "emb.npy")
+    with patch("app.services.embedding_cache._get_redis", return_value=None):
+        first = EmbeddingCache(disk_path=path)
+        await first.set("a", _vec(5))
+        await first.set("b", _vec(6))
+        assert first.save_to_disk() == 2
+
+        restarted = EmbeddingCache(disk_path=path)
+        assert restarted.load_from_disk() == 2
+        assert restarted.get_local("b") == pytest.approx(_vec(6))
+        assert restarted.get_stats()["disk_hits"] == 1
+
+        # New entries are merged with what is already on disk
+        await restarted.set("c", _vec(7))
+        assert restarted.save_to_disk() == 3
+
+
+def test_corrupt_disk_file_starts_cold(tmp_path):
+    path = tmp_path / "emb.npy"
+    path.write_bytes(b"not a numpy file")
+    cache = EmbeddingCache(disk_path=str(path))
+    assert cache.load_from_disk() == 0
+    assert cache.get_local("a") is None
+
+
+def test_truncated_disk_file_starts_cold(tmp_path):
+    path = str(tmp_path / "emb.bin")
+    cache = EmbeddingCache(disk_path=path)
+    cache._put_l1(cache_key("a"), np.asarray(_vec(8), dtype=np.float32))
+    assert cache.save_to_disk() == 1
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 4)
+    assert EmbeddingCache(disk_path=path).load_from_disk() == 0
+
+
+def test_concurrent_worker_saves_keep_keys_aligned_with_vectors(tmp_path):
+    """Shutdown: every worker saves at once — the result is one merged, consistent file."""
+    path = str(tmp_path / "emb.bin")
+    workers = []
+    for w in range(8):
+        cache = EmbeddingCache(disk_path=path)
+        for i in range(20):
+            cache._put_l1(cache_key(f"w{w}-q{i}"), np.asarray(_vec(w * 100 + i), dtype=np.float32))
+        workers.append(cache)
+
+    threads = [threading.Thread(target=c.save_to_disk) for c in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    restarted = EmbeddingCache(disk_path=path)
+    assert restarted.load_from_disk() == 160
+    for w in range(8):
+        for i in range(20):
+            assert restarted.get_local(f"w{w}-q{i}") == pytest.approx(_vec(w * 100 + i))
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
@@ -0,0 +1,151 @@
+"""
+Tests — KeyedEventDispatcher (LINE webhook: concurrent across users, FIFO per user)
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.services.event_dispatcher import KeyedEventDispatcher
+
+
+class _Handler:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.started = []
+        self.finished = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, event):
+        self.started.append(event["id"])
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        self.finished.append(event["id"])
+
+
+@pytest.mark.asyncio
+async def test_users_run_concurrently_and_each_user_stays_in_order():
+    handler = _Handler(delay=0.02)
+    dispatcher = KeyedEventDispatcher(handler, max_concurrent=10, max_queue_depth=10)
+    for i in range(3):
+        for user in ("a", "b", "c"):
+            dispatcher.submit(user, {"id": f"{user}{i}"})
+    await dispatcher.drain()
+
+    assert handler.max_running == 3  # one in flight per user, users in parallel
+    for user in ("a", "b", "c"):
+        assert [e for e in handler.finished if e[0] == user] == [f"{user}0", f"{user}1", f"{user}2"]
+    stats = dispatcher.get_stats()
+    assert stats["processed"] == 9 and stats["queue_depth"] == 0 and stats["active_keys"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_user_does_not_block_others():
+    done = []
+
+    async def handler(event):
+        await asyncio.sleep(0.2 if event["id"] == "slow" else 0)
+        done.append(event["id"])
+
+    dispatcher = KeyedEventDispatcher(handler, max_concurrent=5, max_queue_depth=5)
+    dispatcher.submit("u1", {"id": "slow"})
+    dispatcher.submit("u2", {"id": "fast"})
+    await asyncio.sleep(0.05)
+    assert done == ["fast"]
+    await dispatcher.drain()
+
+
+@pytest.mark.asyncio
+async def test_backlog_beyond_free_slots_is_rejected_per_event():
+    rejected = []
+
+    async def on_reject(event, reason):
+        rejected.append((event["id"], reason))
+
+    handler = _Handler(delay=0.05)
+    dispatcher = KeyedEventDispatcher(handler, max_concurrent=2, max_queue_depth=1, on_reject=on_reject)
+    accepted = [dispatcher.submit(f"u{i}", {"id": i}) for i in range(5)]
+    await dispatcher.drain()
+
+    assert accepted == [True, True, True, False, False]
+    assert rejected == [(3, "queue_full"), (4, "queue_full")]
+    assert handler.max_running == 2 and sorted(handler.finished) == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_event_waiting_past_timeout_gets_rejected():
+    rejected = []
+
+    async def on_reject(event, reason):
+        rejected.append((event["id"], reason))
+
+    dispatcher = KeyedEventDispatcher(_Handler(delay=0.1), max_concurrent=1, max_queue_depth=5,
+                                      queue_timeout=0.03, on_reject=on_reject)
+    dispatcher.submit("u1", {"id": "first"})
+    dispatcher.submit("u2", {"id": "late"})
+    await dispatcher.drain()
+    assert rejected == [("late", "timeout")]
+    assert dispatcher.get_stats()["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_webhook_batch_fans_out_per_user():
+    from app.routers import webhook
+
+    handler = _Handler(delay=0.02)
+    dispatcher = KeyedEventDispatcher(handler, max_concurrent=10, max_queue_depth=10)
+    events = [
+        {"id": "a1", "replyToken": "t1", "source": {"userId": "Ua"}},
+        {"id": "b1", "replyToken": "t2", "source": {"userId": "Ub"}},
+        {"id": "x", "source": {"userId": "Uc"}},  # no reply token → skipped
+        {"id": "a2", "replyToken": "t3", "source": {"userId": "Ua"}},
+    ]
+    with patch.object(webhook, "_dispatcher", dispatcher):
+        webhook._dispatch_webhook_events(events)
+        await dispatcher.drain()
+
+    assert handler.max_running == 2
+    assert handler.finished.index("a1") < handler.finished.index("a2")
+    assert "x" not in handler.started
+
+
+@pytest.mark.asyncio
+async def test_follow_up_behind_slow_message_of_same_user_is_not_expired():
+    rejected = []
+
+    async def on_reject(event, reason):
+        rejected.append((event["id"], reason))
+
+    handler = _Handler(delay=0.05)
+    dispatcher = KeyedEventDispatcher(handler, max_concurrent=5, max_queue_depth=5,
+                                      queue_timeout=0.03, on_reject=on_reject)
+    dispatcher.submit("u1", {"id": "first"})
+    dispatcher.submit("u1", {"id": "follow-up"})  # waits 50 ms behind "first", slots are free
+    await dispatcher.drain()
+
+    assert rejected == []
+    assert handler.finished == ["first", "follow-up"]
+
+
+@pytest.mark.asyncio
+async def test_stale_line_event_replies_with_push_fallback():
+    import time
+    from app.routers import webhook
+
+    seen = []
+
+    async def process(event):
+        seen.append(webhook.reply_fallback_user.get())
+
+    fresh = {"timestamp": time.time() * 1000, "source": {"userId": "Ua"}}
+    stale = {"timestamp": (time.time() - 45) * 1000, "source": {"userId": "Ub"}}
+    with patch.object(webhook, "_process_webhook_event", process), patch.object(webhook, "webhook_queue", None):
+        await webhook._handle_line_job(fresh)
+        await webhook._handle_line_job(stale)
+
+    assert seen == [None, "Ub"]
+    assert webhook.reply_fallback_user.get() is None
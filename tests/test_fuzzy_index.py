@@ -0,0 +1,75 @@
+"""
+Tests — FuzzyAliasIndex (indexed ProductRegistry.fuzzy_match)
+
+The index must pick exactly what the original SequenceMatcher scan picked
+(token × alias × sliding window, strict > on ties) — only faster.
+"""
+
+import random
+import re
+from difflib import SequenceMatcher
+
+from app.services.product.fuzzy_index import FuzzyAliasIndex
+from app.services.product.registry import ProductRegistry, _FALLBACK_PRODUCTS
+
+
+def _reference_fuzzy_match(alias_index: dict, text: str, threshold: float = 0.75):
+    """The pre-index fuzzy_match loop, verbatim."""
+    best_match, best_score = None, 0.0
+    for token in re.findall(r'[฀-๿]+|[a-zA-Z]+', text):
+        if len(token) < 4:
+            continue
+        token_lower = token.lower()
+        for alias, canonical in alias_index.items():
+            score = SequenceMatcher(None, token_lower, alias).ratio()
+            if score > best_score and score >= threshold:
+                best_score, best_match = score, canonical
+            alias_len = len(alias)
+            if len(token_lower) > alias_len + 1 and alias_len >= 3:
+                for i in range(len(token_lower) - alias_len + 2):
+                    sub = token_lower[i:min(i + alias_len + 1, len(token_lower))]
+                    if len(sub) < alias_len:
+                        continue
+                    score = SequenceMatcher(None, sub, alias).ratio()
+                    if score > best_score and score >= threshold:
+                        best_score, best_match = score, canonical
+    return best_match
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    chars = list(name)
+    i = rng.randrange(len(chars))
+    op = rng.randrange(3)
+    if op == 0:
+        del chars[i]
+    elif op == 1:
+        chars.insert(i, rng.choice("กคทาิเ่้"))
+    else:
+        chars[i] = rng.choice("กคทาิเ่้")
+    return "".join(chars)
+
+
+def test_same_result_as_sequence_matcher_scan():
+    registry = ProductRegistry()
+    registry.load_from_dict(_FALLBACK_PRODUCTS)
+    alias_index = registry._alias_index
+    aliases = list(alias_index)
+    rng = random.Random(11)
+
+    for _ in range(120):
+        question = rng.choice(["", "ใช้ยังไง ", "ฉีดทุเรียน"]) + _typo(rng.choice(aliases), rng) + rng.choice(["", " ได้ไหมคะ"])
+        assert registry.fuzzy_match(question) == _reference_fuzzy_match(alias_index, question), question
+
+
+def test_known_typos_and_misses():
+    registry = ProductRegistry()
+    registry.load_from_dict(_FALLBACK_PRODUCTS)
+
+    assert registry.fuzzy_match("แแกนเตอ") == "แกนเตอร์"
+    assert registry.fuzzy_match("ใช้ไซมอกซิเมทยังไง") == "ไซม๊อกซิเมท"
+    assert registry.fuzzy_match("อยากได้ยาฆ่าเพลี้ยไฟ") is None
+    assert registry.fuzzy_match("abc") is None  # tokens < 4 chars are ignored
+
+
+def test_empty_index():
+    assert FuzzyAliasIndex(()).match("โมเดิน") is None
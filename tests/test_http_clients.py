@@ -0,0 +1,122 @@
+"""
+Tests — HTTPClientRegistry (pooled per-host clients, retry with backoff, LINE send path)
+"""
+
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.utils import http_clients
+from app.utils.http_clients import HTTPClientRegistry
+
+
+def _registry(handler, **kwargs):
+    kwargs.setdefault("backoff_base_ms", 1)
+    return HTTPClientRegistry(transport=httpx.MockTransport(handler), http2=False, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_client_is_reused_per_host_and_recreated_after_close():
+    registry = _registry(lambda request: httpx.Response(200))
+    line = registry.get("api.line.me")
+    assert registry.get("api.line.me") is line
+    assert registry.get("graph.facebook.com") is not line
+
+    await registry.close()
+    assert line.is_closed
+    assert registry.get("api.line.me") is not line
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_retries_429_and_5xx_then_succeeds():
+    statuses = iter([429, 503, 200])
+    registry = _registry(lambda request: httpx.Response(next(statuses)), retries=2)
+
+    response = await registry.request(
+        "api.line.me", "POST", "https://api.line.me/v2/bot/message/push", json={}, idempotent=True
+    )
+    assert response.status_code == 200
+    stats = registry.get_stats()["api.line.me"]
+    assert stats["requests"] == 3 and stats["retries"] == 2 and stats["in_flight"] == 0
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried_and_last_response_returned():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400 if len(calls) == 1 else 500)
+
+    registry = _registry(handler, retries=3)
+    assert (await registry.request("h", "GET", "https://h/x")).status_code == 400
+    assert len(calls) == 1
+
+    calls.clear()
+    calls.append(None)  # every following call → 500
+    assert (await registry.request("h", "GET", "https://h/x", retries=1)).status_code == 500
+    assert len(calls) == 3
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_post_not_retried_once_the_server_may_have_processed_it():
+    """FB Send API: a 5xx / dropped connection after the request was sent must not resend the reply."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.RemoteProtocolError("server disconnected", request=request)
+        return httpx.Response(502)
+
+    registry = _registry(handler, retries=3)
+    with pytest.raises(httpx.RemoteProtocolError):
+        await registry.request("graph.facebook.com", "POST", "https://graph.facebook.com/v21.0/me/messages")
+    assert len(calls) == 1
+    assert (await registry.request("graph.facebook.com", "POST", "https://graph.facebook.com/v21.0/me/messages")).status_code == 502
+    assert len(calls) == 2
+
+    # connect failures and 429 never reached processing → still retried for POST
+    statuses = iter([429, 200])
+    registry429 = _registry(lambda request: httpx.Response(next(statuses)), retries=2)
+    assert (await registry429.request("graph.facebook.com", "POST", "https://graph.facebook.com/x")).status_code == 200
+    await registry.close()
+    await registry429.close()
+
+
+@pytest.mark.asyncio
+async def test_connect_error_retried_then_raised():
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    registry = _registry(handler, retries=1)
+    with pytest.raises(httpx.ConnectError):
+        await registry.request("h", "GET", "https://h/x")
+    assert registry.get_stats()["h"]["errors"] == 2
+    await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_push_line_uses_shared_pool_with_stable_retry_key():
+    from app.utils.line.helpers import push_line
+
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(500 if len(seen) == 1 else 200)
+
+    registry = _registry(handler, retries=2)
+    with patch.object(http_clients, "http_clients", registry):
+        await push_line("U123", "สวัสดีค่ะ")
+        await push_line("U123", "อีกข้อความ")
+
+    assert len(seen) == 3
+    assert seen[0].headers["X-Line-Retry-Key"] == seen[1].headers["X-Line-Retry-Key"]
+    assert seen[1].headers["X-Line-Retry-Key"] != seen[2].headers["X-Line-Retry-Key"]
+    assert list(registry._clients) == ["api.line.me"]
+    await registry.close()
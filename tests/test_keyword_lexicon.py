@@ -0,0 +1,88 @@
+"""
+Tests — compiled keyword lexicon (app.services.chat.lexicon)
+
+Every helper that now reads QueryFeatures must answer exactly what its old
+per-list `kw in query` / diacritics_match loop answered.
+"""
+
+import random
+import re
+
+from app.services.chat import handler
+from app.services.chat.handler import (
+    AGRICULTURE_KEYWORDS, PRODUCT_KEYWORDS, _NON_AGRI_KEYWORDS, DISEASE_KEYWORDS, INSECT_KEYWORDS,
+    NUTRIENT_KEYWORDS, WEED_KEYWORDS, FARMER_SLANG_MAP, _FOLLOWUP_MARKERS, USAGE_QUESTION_PATTERNS,
+)
+from app.services.chat.lexicon import analyze_query
+from app.services.disease.constants import DISEASE_PATTERNS_SORTED
+from app.utils.text_processing import SYMPTOM_PATHOGEN_MAP, diacritics_match, resolve_symptom_to_pathogens
+
+_FILLER = ["ใช้ยาอะไรดี", "ที่สวน", "ครับ", "ใช้ยังไง", "ผสมกี่ cc", "5 ไร่ใช้เท่าไหร่", " ", "อะไร", "ต่อไร่"]
+_ALL_KEYWORDS = (
+    AGRICULTURE_KEYWORDS + PRODUCT_KEYWORDS + _NON_AGRI_KEYWORDS + DISEASE_KEYWORDS + INSECT_KEYWORDS
+    + NUTRIENT_KEYWORDS + WEED_KEYWORDS + list(FARMER_SLANG_MAP) + list(SYMPTOM_PATHOGEN_MAP)
+    + DISEASE_PATTERNS_SORTED + _FOLLOWUP_MARKERS
+)
+
+
+def _queries(count: int, seed: int = 3):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = [rng.choice(_FILLER)]
+        for _ in range(rng.randint(0, 3)):
+            kw = rng.choice(_ALL_KEYWORDS)
+            if rng.random() < 0.3:  # farmers add/drop tone marks
+                i = rng.randrange(len(kw) + 1)
+                kw = kw[:i] + rng.choice("่้๊็์") + kw[i:]
+            parts += [kw.upper() if rng.random() < 0.1 else kw, rng.choice(_FILLER)]
+        yield "".join(parts)
+
+
+def _legacy_problem_types(message: str) -> list:
+    low = message.lower()
+    counts = {
+        'nutrient': sum(1 for kw in NUTRIENT_KEYWORDS if diacritics_match(low, kw)),
+        'disease': sum(1 for kw in DISEASE_KEYWORDS if diacritics_match(low, kw)),
+        'insect': sum(1 for kw in INSECT_KEYWORDS if diacritics_match(low, kw)),
+        'weed': sum(1 for kw in WEED_KEYWORDS if diacritics_match(low, kw)),
+    }
+    return [t for t, c in sorted(counts.items(), key=lambda x: -x[1]) if c > 0]
+
+
+def _legacy_symptoms(query: str) -> list:
+    result = []
+    for symptom, pathogens in SYMPTOM_PATHOGEN_MAP.items():
+        if symptom in query:
+            result += [p for p in pathogens if p not in result]
+    return result
+
+
+def test_features_match_legacy_scans():
+    for q in _queries(1500):
+        low = q.lower()
+        f = analyze_query(q)
+        assert handler.is_agriculture_question(q) == any(kw in low for kw in AGRICULTURE_KEYWORDS), q
+        assert handler.is_product_question(q) == any(kw in low for kw in PRODUCT_KEYWORDS), q
+        assert handler._is_clearly_non_agriculture(q) == (
+            len(q.strip().lower()) <= 20 and any(kw in q.strip().lower() for kw in _NON_AGRI_KEYWORDS)
+        ), q
+        assert handler.detect_problem_types(q) == _legacy_problem_types(q), q
+        assert handler.resolve_farmer_slang(q)["matched_slangs"] == [s for s in FARMER_SLANG_MAP if s in low], q
+        assert resolve_symptom_to_pathogens(q) == _legacy_symptoms(q), q
+        assert f.disease_pattern == next((p for p in DISEASE_PATTERNS_SORTED if diacritics_match(q, p)), None), q
+        assert handler.is_usage_question(q) == any(re.search(p, low) for p in USAGE_QUESTION_PATTERNS), q
+        assert bool(f.followup) == any(m in low for m in _FOLLOWUP_MARKERS), q
+
+
+def test_realistic_farmer_messages():
+    f = analyze_query("ทุเรียนใบเป็นจุด มีเพลี้ยไฟด้วย ใช้ยาอะไรดีคะ")
+    assert f.problem_types == ["insect", "disease"]  # เพลี้ย + เพลี้ยไฟ > เป็นจุด
+    assert f.disease_pattern == "ใบเป็นจุด"
+    assert resolve_symptom_to_pathogens("ทุเรียนใบเป็นจุด") == ["เซอโคสปอร่า", "แอนแทรคโนส"]
+
+    slang = handler.resolve_farmer_slang("ต้นเหลือง ใบหงิก ใช้ยาดูดตัวไหน")
+    assert slang["matched_slangs"] == ["ยาดูด", "ต้นเหลือง", "ใบหงิก"]
+    assert slang["problem_type"] == "nutrient"
+
+    assert analyze_query("ไฟทอ็ปในทุเรียน").disease_pattern == "ไฟท็อป"  # tone marks ignored, first longest wins
+    assert not analyze_query("สวัสดีค่ะ").problem_types
@@ -0,0 +1,165 @@
+"""
+Tests — LocalProductSearch (PRODUCT_SEARCH_BACKEND=local)
+
+Unit tests use a tiny synthetic catalog. The parity test compares against the
+hybrid_search_products3 RPC and needs real Supabase + OpenAI (integration only).
+"""
+
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.rag import QueryAnalysis, IntentType
+from app.services.product.catalog import ProductCatalog
+from app.services.product.local_search import LocalProductSearch
+
+
+_DIM = 16
+
+_ROWS = [
+    {"id": 1, "product_name": "โมเดิน 50", "product_category": "Insecticide",
+     "insecticides": "เพลี้ยไฟ", "applicable_crops": "มะม่วง", "row_hash": "h1"},
+    {"id": 2, "product_name": "คาริสมา", "product_category": "Fungicide",
+     "fungicides": "โรคใบไหม้, ราสีชมพู", "applicable_crops": "ทุเรียน", "row_hash": "h2"},
+    {"id": 3, "product_name": "แจ๊ส", "product_category": "Insecticide",
+     "insecticides": "เพลี้ยกระโดดสีน้ำตาล", "applicable_crops": "ข้าว", "row_hash": "h3"},
+]
+
+
+def _unit(seed: int) -> list:
+    vec = np.random.default_rng(seed).standard_normal(_DIM)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+_EMBEDDINGS = {str(r["id"]): _unit(r["id"]) for r in _ROWS}
+
+
+def _catalog():
+    cat = ProductCatalog()
+    cat.load_rows([dict(r) for r in _ROWS])
+    return cat
+
+
+def _supabase_with_embeddings():
+    supabase = MagicMock()
+    data = [{"id": int(i), "embedding": json.dumps(e)} for i, e in _EMBEDDINGS.items()]
+    supabase.table.return_value.select.return_value.in_.return_value.execute.return_value = MagicMock(data=data)
+    return supabase
+
+
+@pytest.fixture()
+def engine():
+    eng = LocalProductSearch()
+    asyncio.get_event_loop().run_until_complete(eng.sync(_supabase_with_embeddings(), _catalog()))
+    return eng
+
+
+class TestLocalSearch:
+
+    def test_sync_loads_all_embeddings(self, engine):
+        assert engine.loaded
+        assert engine._matrix.shape == (3, _DIM)
+
+    def test_exact_embedding_ranks_first(self, engine):
+        rows = engine.search_batch([_EMBEDDINGS["2"]], ["ยาอะไรดี"], match_count=3)[0]
+        assert rows[0]["product_name"] == "คาริสมา"
+        assert rows[0]["similarity"] == pytest.approx(0.6, abs=0.05)
+        assert [r["similarity"] for r in rows] == sorted((r["similarity"] for r in rows), reverse=True)
+
+    def test_keyword_breaks_vector_tie(self, engine):
+        neutral = np.zeros(_DIM)
+        neutral[0] = 1.0
+        # Same vector for both queries → only the keyword signal differs
+        with patch.object(engine, "_matrix", np.tile(neutral.astype(np.float32), (3, 1))):
+            top_pest = engine.search_batch([neutral.tolist()], ["เพลี้ยกระโดดสีน้ำตาล"], match_count=3)[0][0]
+            top_disease = engine.search_batch([neutral.tolist()], ["ราสีชมพู"], match_count=3)[0][0]
+        assert top_pest["product_name"] == "แจ๊ส"
+        assert top_disease["product_name"] == "คาริสมา"
+
+    def test_batch_matches_single_queries(self, engine):
+        queries = ["เพลี้ยไฟมะม่วง", "ราสีชมพูทุเรียน"]
+        embs = [_EMBEDDINGS["1"], _EMBEDDINGS["2"]]
+        batched = engine.search_batch(embs, queries, match_count=2)
+        for q, e, rows in zip(queries, embs, batched):
+            single = engine.search_batch([e], [q], match_count=2)[0]
+            assert [r["id"] for r in rows] == [r["id"] for r in single]
+            assert [r["similarity"] for r in rows] == pytest.approx([r["similarity"] for r in single])
+
+    @pytest.mark.asyncio
+    async def test_sync_fetches_only_changed_rows(self, engine):
+        cat = _catalog()
+        changed = dict(_ROWS[2], row_hash="h3-new")
+        cat.load_rows([dict(_ROWS[0]), dict(_ROWS[1]), changed])
+        supabase = _supabase_with_embeddings()
+
+        await engine.sync(supabase, cat)
+
+        supabase.table.return_value.select.return_value.in_.assert_called_once_with("id", [3])
+
+    @pytest.mark.asyncio
+    async def test_retrieval_agent_uses_local_backend(self, engine):
+        from app.services.rag.retrieval_agent import RetrievalAgent
+
+        openai_client = AsyncMock()
+        # Expanded queries are micro-batched → one item per input text
+        openai_client.embeddings.create = AsyncMock(
+            side_effect=lambda **kw: MagicMock(data=[MagicMock(index=i, embedding=_EMBEDDINGS["3"])
+                                                     for i in range(len(kw["input"]))])
+        )
+        supabase = MagicMock()
+        agent = RetrievalAgent(supabase_client=supabase, openai_client=openai_client)
+        qa = QueryAnalysis(original_query="เพลี้ยกระโดด local-test", intent=IntentType.PEST_CONTROL, confidence=0.9,
+                           expanded_queries=["เพลี้ยกระโดด local-test", "เพลี้ยกระโดดสีน้ำตาล ข้าว local-test"])
+
+        with patch("app.services.rag.retrieval_agent.PRODUCT_SEARCH_BACKEND", "local"), \
+                patch.object(LocalProductSearch, "_instance", engine):
+            docs = await agent._multi_source_retrieval(qa, top_k=5)
+
+        supabase.rpc.assert_not_called()
+        assert docs and docs[0].title == "แจ๊ส"
+
+
+# =============================================================================
+# Parity with the hybrid_search_products3 RPC (integration — needs real DB)
+# =============================================================================
+
+def _has_real_backends() -> bool:
+    url = os.environ.get("SUPABASE_URL", "")
+    key = os.environ.get("OPENAI_API_KEY", "")
+    return url.startswith("https://fwzdgzpuajcsigwlyojr") and key.startswith("sk-") and key != "sk-test-dummy"
+
+
+@pytest.mark.skipif(not _has_real_backends(), reason="Needs real Supabase + OpenAI (integration only)")
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query", [
+    "เพลี้ยไฟทุเรียน ใช้ยาอะไร",
+    "โรคราสีชมพูในทุเรียน",
+    "หญ้าในนาข้าว",
+    "หนอนกอข้าว",
+])
+async def test_parity_with_rpc(query):
+    from app.config import EMBEDDING_MODEL, PRODUCT_RPC
+    from app.dependencies import openai_client, supabase_client
+    from app.utils.async_db import aexecute
+
+    catalog = ProductCatalog()
+    await catalog.load_from_db(supabase_client)
+    engine = LocalProductSearch()
+    await engine.sync(supabase_client, catalog)
+
+    resp = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=query, encoding_format="float")
+    embedding = resp.data[0].embedding
+
+    rpc = await aexecute(supabase_client.rpc(PRODUCT_RPC, {
+        "query_embedding": embedding, "search_query": query,
+        "vector_weight": 0.6, "keyword_weight": 0.4, "match_count": 10,
+    }))
+    local = engine.search_batch([embedding], [query], match_count=10)[0]
+
+    rpc_top = {str(r["id"]) for r in rpc.data[:5]}
+    local_top = {str(r["id"]) for r in local[:5]}
+    assert len(rpc_top & local_top) >= 4, f"{query!r}: rpc={rpc_top} local={local_top}"
@@ -0,0 +1,125 @@
+"""
+Tests — LocalReranker (feature-based rerank, LLM only on low margin)
+"""
+
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.local_reranker import FEATURE_NAMES, LocalReranker, extract_features, log_llm_ranking
+from app.services.rag import IntentType, RetrievedDocument
+
+
+_PRODUCTS = [
+    {"product_name": "โมเดิน 50", "category": "Insecticide", "strategy": "Standard",
+     "insecticides": "เพลี้ยไฟ", "applicable_crops": "มะม่วง"},
+    {"product_name": "คาริสมา", "category": "Fungicide", "strategy": "Expand",
+     "fungicides": "โรคใบไหม้, ราสีชมพู", "applicable_crops": "ทุเรียน"},
+    {"product_name": "แจ๊ส", "category": "Insecticide", "strategy": "Skyrocket",
+     "insecticides": "เพลี้ยกระโดดสีน้ำตาล, เพลี้ยไฟ", "applicable_crops": "ข้าว, ทุเรียน"},
+]
+
+
+def test_feature_vector_shape_and_signals():
+    feats = extract_features("เพลี้ยไฟทุเรียน", _PRODUCTS[2], similarity=0.5, input_rank=1.0,
+                             expected_category="Insecticide", plant_type="ทุเรียน", pest_terms=["เพลี้ยไฟ"])
+    named = dict(zip(FEATURE_NAMES, feats))
+    assert len(feats) == len(FEATURE_NAMES)
+    assert named["crop_match"] == 1.0
+    assert named["category_match"] == 1.0
+    assert named["pest_entity_match"] == 1.0
+    assert named["priority_strategy"] == 1.0
+
+    wrong = dict(zip(FEATURE_NAMES, extract_features("เพลี้ยไฟทุเรียน", _PRODUCTS[1],
+                                                     expected_category="Insecticide", plant_type="ทุเรียน")))
+    assert wrong["category_match"] == -1.0
+
+
+def test_rank_prefers_category_crop_and_pest_match():
+    order, margin = LocalReranker().rank("เพลี้ยไฟ ทุเรียน", _PRODUCTS, similarities=[0.5, 0.5, 0.5],
+                                         expected_category="Insecticide", plant_type="ทุเรียน",
+                                         pest_terms=["เพลี้ยไฟ"])
+    assert order[0] == 2
+    assert order[-1] == 1
+    assert margin > 0
+
+
+def _docs():
+    return [RetrievedDocument(id=str(i), title=p["product_name"], content="", source="products",
+                              similarity_score=0.5, metadata=dict(p)) for i, p in enumerate(_PRODUCTS)]
+
+
+@pytest.mark.asyncio
+async def test_retrieval_local_backend_skips_llm_when_confident():
+    from app.services.rag.retrieval_agent import RetrievalAgent
+    openai_client = AsyncMock()
+    agent = RetrievalAgent(supabase_client=MagicMock(), openai_client=openai_client)
+
+    with patch("app.services.rag.retrieval_agent.RERANK_BACKEND", "local"), \
+            patch("app.services.rag.retrieval_agent.RERANK_LOCAL_MIN_MARGIN", 0.1):
+        ranked = await agent._rerank_with_llm("เพลี้ยไฟ ทุเรียน", _docs(), IntentType.PEST_CONTROL,
+                                              {"plant_type": "ทุเรียน", "pest_name": "เพลี้ยไฟ"})
+
+    openai_client.chat.completions.create.assert_not_called()
+    assert ranked[0].title == "แจ๊ส"
+    assert ranked[0].rerank_score == 1.0
+
+
+@pytest.mark.asyncio
+async def test_retrieval_local_backend_falls_back_to_llm_on_low_margin(tmp_path):
+    from app.services.rag.retrieval_agent import RetrievalAgent
+    openai_client = AsyncMock()
+    openai_client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="2,3,1"))])
+    )
+    agent = RetrievalAgent(supabase_client=MagicMock(), openai_client=openai_client)
+    log_path = tmp_path / "rerank.jsonl"
+
+    with patch("app.services.rag.retrieval_agent.RERANK_BACKEND", "local"), \
+            patch("app.services.rag.retrieval_agent.RERANK_LOCAL_MIN_MARGIN", 100.0), \
+            patch("app.services.local_reranker.RERANK_LOG_PATH", str(log_path)):
+        ranked = await agent._rerank_with_llm("โรคราสีชมพู", _docs(), IntentType.DISEASE_TREATMENT)
+
+    openai_client.chat.completions.create.assert_awaited_once()
+    assert [d.title for d in ranked] == ["คาริสมา", "แจ๊ส", "โมเดิน 50"]
+    record = json.loads(log_path.read_text(encoding="utf-8").strip())
+    assert record["order"] == [1, 2, 0]
+    assert record["expected_category"] == "Fungicide"
+    assert len(record["candidates"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_log_disabled_without_path(tmp_path):
+    with patch("app.services.local_reranker.RERANK_LOG_PATH", ""):
+        await log_llm_ranking("q", _PRODUCTS, [0, 1, 2])
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_concurrent_log_writes_keep_whole_records(tmp_path):
+    log_path = tmp_path / "rerank.jsonl"
+    with patch("app.services.local_reranker.RERANK_LOG_PATH", str(log_path)):
+        await asyncio.gather(*(log_llm_ranking(f"q{i}", _PRODUCTS, [2, 0, 1]) for i in range(20)))
+
+    records = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert sorted(r["query"] for r in records) == sorted(f"q{i}" for i in range(20))
+    assert all(r["order"] == [2, 0, 1] for r in records)
+
+
+def test_pairwise_training_recovers_llm_preference():
+    from scripts.train_local_reranker import benchmark, fit_pairwise
+
+    # Synthetic LLM logs: always prefers the category match regardless of input order
+    records = []
+    for shift in range(3):
+        candidates = [dict(p, similarity=0.5) for p in _PRODUCTS[shift:] + _PRODUCTS[:shift]]
+        order = sorted(range(3), key=lambda i: candidates[i]["category"] != "Fungicide")
+        records.append({"query": f"โรค {shift}", "expected_category": "Fungicide", "plant_type": "",
+                        "pest_terms": [], "candidates": candidates, "order": order[:1]})
+
+    weights = fit_pairwise(records, epochs=100)
+    result = benchmark(LocalReranker(weights), records)
+    assert result["top1_agreement"] == 1.0
+    assert result["pairwise_agreement"] == 1.0
@@ -91,3 +91,41 @@ class TestConversationSummaryExtraction:
         nutrient_kw = ["บำรุง", "ธาตุ", "ปุ๋ย", "ติดดอก", "ติดผล"]
 
         assert all(isinstance(k, str) for k in disease_kw + pest_kw + weed_kw + nutrient_kw)
+
+
+# ===========================================================================
+# trim_memory (TTL purge — one worker per interval)
+# ===========================================================================
+
+class _NxRedis:
+    """SET NX only — enough for the TTL purge lock."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+
+@pytest.mark.asyncio
+async def test_trim_memory_ttl_purge_runs_once_across_workers_without_returning_rows():
+    from unittest.mock import MagicMock, patch
+    from app.services import memory
+
+    db = MagicMock()
+    deletes = []
+    db.table.return_value.delete.side_effect = lambda **kw: deletes.append(kw) or db.table.return_value.delete.return_value
+    redis = _NxRedis()
+
+    with patch.object(memory, "supabase_client", db), \
+            patch.object(memory, "_get_redis", return_value=redis), \
+            patch.object(memory, "aexecute", side_effect=lambda q: MagicMock(data=None)), \
+            patch.object(memory, "cleanup_old_memory") as per_user:
+        await memory.trim_memory(["Uaaa"])   # worker 1
+        await memory.trim_memory(["Ubbb"])   # worker 2, same interval
+
+    assert deletes == [{"returning": "minimal"}]
+    assert [c.args for c in per_user.await_args_list] == [("Uaaa",), ("Ubbb",)]
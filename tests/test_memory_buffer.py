@@ -0,0 +1,140 @@
+"""
+Tests — MemoryWriteBuffer (write-behind conversation memory)
+"""
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.memory_buffer import MemoryWriteBuffer
+
+
+class _Writer:
+    def __init__(self, fail_times: int = 0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, rows):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db down")
+        self.batches.append(list(rows))
+
+
+def _row(user_id, content, role="user", created_at=None):
+    row = {"user_id": user_id, "role": role, "content": content, "metadata": {}}
+    if created_at:
+        row["created_at"] = created_at
+    return row
+
+
+@pytest.mark.asyncio
+async def test_append_is_buffered_then_flushed_in_one_insert():
+    writer = _Writer()
+    buf = MemoryWriteBuffer(writer, flush_interval_ms=10, flush_max_rows=100)
+    for i in range(5):
+        buf.append(_row(f"u{i % 2}", f"msg {i}"))
+    assert writer.batches == []  # nothing written on the request path
+
+    await asyncio.sleep(0.05)
+    assert len(writer.batches) == 1
+    assert [r["content"] for r in writer.batches[0]] == [f"msg {i}" for i in range(5)]
+    assert all(r["created_at"] for r in writer.batches[0])
+    assert buf.get_stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_size_threshold_flushes_without_waiting_for_timer():
+    writer = _Writer()
+    buf = MemoryWriteBuffer(writer, flush_interval_ms=60_000, flush_max_rows=3)
+    for i in range(3):
+        buf.append(_row("u", f"m{i}"))
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert sum(len(b) for b in writer.batches) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues_and_retries():
+    writer = _Writer(fail_times=1)
+    buf = MemoryWriteBuffer(writer, flush_interval_ms=60_000, flush_max_rows=100)
+    buf.append(_row("u", "a"))
+    buf.append(_row("u", "b"))
+
+    assert await buf.flush() == 0
+    assert buf.get_stats()["pending"] == 2
+    assert await buf.drain() == 2
+    assert [r["content"] for r in writer.batches[0]] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_pending_is_bounded_when_db_is_down():
+    writer = _Writer(fail_times=10)
+    buf = MemoryWriteBuffer(writer, flush_interval_ms=60_000, flush_max_rows=100, max_pending=3)
+    for i in range(5):
+        buf.append(_row("u", f"m{i}"))
+    await buf.flush()
+    stats = buf.get_stats()
+    assert stats["pending"] == 3 and stats["dropped"] == 2
+
+
+def test_merge_reads_own_writes_and_dedupes_flushed_rows():
+    buf = MemoryWriteBuffer(_Writer())
+    flushed = buf.append(_row("u", "old", created_at="2026-01-01T10:00:00+00:00"))
+    buf.append(_row("u", "new", role="assistant", created_at="2026-01-01T10:00:05+00:00"))
+    # DB already has the flushed row (different timestamp format)
+    db_rows = [
+        {**flushed, "created_at": "2026-01-01T10:00:00Z"},
+        _row("u", "older", created_at="2026-01-01T09:00:00+00:00"),
+    ]
+    merged = buf.merge("u", db_rows, limit=10)
+    assert [r["content"] for r in merged] == ["new", "old", "older"]
+    assert [r["content"] for r in buf.merge("u", db_rows, limit=2)] == ["new", "old"]
+    assert buf.merge("other", db_rows, limit=1) == db_rows[:1]
+
+
+@pytest.mark.asyncio
+async def test_trim_runs_in_batch_for_dirty_users_only():
+    trimmed = []
+
+    async def trimmer(users):
+        trimmed.append(users)
+
+    buf = MemoryWriteBuffer(_Writer(), trimmer=trimmer, flush_interval_ms=60_000, trim_interval=0)
+    buf.append(_row("u1", "a"))
+    buf.append(_row("u2", "b"))
+    buf.append(_row("u1", "c"))
+    await buf.flush()
+    await buf.flush()  # no new writes → no trim
+    assert trimmed == [["u1", "u2"]]
+
+
+@pytest.mark.asyncio
+async def test_discard_drops_unflushed_rows():
+    writer = _Writer()
+    buf = MemoryWriteBuffer(writer, flush_interval_ms=60_000)
+    buf.append(_row("u1", "secret"))
+    buf.append(_row("u2", "keep"))
+    await buf.discard("u1")
+    await buf.drain()
+    assert [r["content"] for r in writer.batches[0]] == ["keep"]
+    assert buf.recent("u1", 10) == []
+
+
+@pytest.mark.asyncio
+async def test_add_to_memory_is_visible_to_reader_before_flush():
+    from app.services import memory
+
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.order.return_value \
+        .limit.return_value.execute.return_value = MagicMock(data=[])
+    buf = MemoryWriteBuffer(_Writer(), flush_interval_ms=60_000)
+
+    with patch.object(memory, "supabase_client", supabase), patch.object(memory, "_write_buffer", buf):
+        await memory.add_to_memory("user-buffer", "user", "เพลี้ยไฟทุเรียน")
+        await memory.add_to_memory("user-buffer", "assistant", "แนะนำโมเดิน 50")
+        context = await memory.get_conversation_context("user-buffer")
+
+    supabase.table.return_value.insert.assert_not_called()
+    assert context.splitlines() == ["ผู้ใช้: เพลี้ยไฟทุเรียน", "น้องลัดดา: แนะนำโมเดิน 50"]
@@ -0,0 +1,126 @@
+"""
+Tests — native async PostgREST execution (same results as builder.execute(), no thread pool)
+"""
+
+import json
+import threading
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from postgrest import APIError, SyncPostgrestClient
+
+from app.utils import http_clients
+from app.utils.async_db import aexecute
+from app.utils.http_clients import HTTPClientRegistry
+from app.utils.postgrest_async import execute_async, is_postgrest_builder
+
+_ROWS = [{"id": 1, "product_name": "โมเดิน 50"}, {"id": 2, "product_name": "ไฮซีส"}]
+
+
+def _handler(calls):
+    def handler(request):
+        calls.append((request, threading.get_ident()))
+        if request.url.path.endswith("/rpc/flaky"):
+            return httpx.Response(503, json={"message": "unavailable"})
+        if request.url.path.endswith("/rpc/hybrid_search"):
+            return httpx.Response(200, json=[{"id": 1, "similarity": 0.91}])
+        if request.headers.get("accept") == "application/vnd.pgrst.object+json":
+            rows = [r for r in _ROWS if f"eq.{r['id']}" == request.url.params.get("id")]
+            if len(rows) != 1:
+                return httpx.Response(406, json={"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                                                 "details": "The result contains 0 rows", "hint": None})
+            return httpx.Response(200, json=rows[0])
+        return httpx.Response(200, json=_ROWS, headers={"content-range": "0-1/2"})
+    return handler
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """(async-path client, sync-path client, calls) over one mock PostgREST."""
+    calls = []
+    transport = httpx.MockTransport(_handler(calls))
+    monkeypatch.setattr(http_clients, "http_clients",
+                        HTTPClientRegistry(transport=transport, http2=False, backoff_base_ms=1, retries=1))
+    headers = {"apikey": "anon-key", "Authorization": "Bearer anon-key"}
+    native = SyncPostgrestClient("https://proj.supabase.co/rest/v1", headers=headers)
+    reference = SyncPostgrestClient("https://proj.supabase.co/rest/v1", headers=headers)
+    reference.session = httpx.Client(base_url=reference.session.base_url, headers=reference.session.headers,
+                                     transport=transport)
+    return native, reference, calls
+
+
+@pytest.mark.asyncio
+async def test_results_match_sync_execute(db):
+    native, reference, calls = db
+
+    def queries(client):
+        return [
+            client.from_("products3").select("id,product_name", count="exact").ilike("product_name", "%โม%").limit(5),
+            client.from_("products3").select("*").eq("id", 2).single(),
+            client.rpc("hybrid_search", {"query_text": "เพลี้ยไฟ", "match_count": 5}),
+        ]
+
+    expected = [q.execute() for q in queries(reference)]
+    sent_sync = [request for request, _ in calls]
+    calls.clear()
+    got = [await execute_async(q) for q in queries(native)]
+
+    assert [r.model_dump() for r in got] == [r.model_dump() for r in expected]
+    assert got[0].count == 2
+    for sync_req, (async_req, _) in zip(sent_sync, calls):
+        assert (async_req.method, async_req.url) == (sync_req.method, sync_req.url)
+        assert async_req.headers["apikey"] == "anon-key"
+        assert async_req.headers.get("prefer") == sync_req.headers.get("prefer")
+    assert json.loads(calls[2][0].content) == {"query_text": "เพลี้ยไฟ", "match_count": 5}
+
+
+@pytest.mark.asyncio
+async def test_single_errors_and_maybe_single_none(db):
+    native, _, _ = db
+    assert await execute_async(native.from_("products3").select("*").eq("id", 9).maybe_single()) is None
+    with pytest.raises(APIError) as exc:
+        await execute_async(native.from_("products3").select("*").eq("id", 9).single())
+    assert exc.value.code == "PGRST116"
+
+
+@pytest.mark.asyncio
+async def test_reads_retried_but_rpc_writes_are_not(db):
+    native, _, calls = db
+    with pytest.raises(APIError):
+        await execute_async(native.rpc("flaky", {}))
+    assert len(calls) == 1
+
+    calls.clear()
+    with pytest.raises(APIError):
+        await execute_async(native.rpc("flaky", {}, get=True))
+    assert len(calls) == 2  # GET → HTTP_RETRIES applies
+
+
+@pytest.mark.asyncio
+async def test_aexecute_runs_builders_on_loop_thread_and_mocks_in_thread_pool(db):
+    native, _, calls = db
+    response = await aexecute(native.from_("products3").select("*"))
+    assert response.data == _ROWS
+    assert calls[0][1] == threading.get_ident()  # MockTransport ran on the event-loop thread
+
+    mock_query = MagicMock()
+    mock_query.execute.side_effect = lambda: threading.get_ident()
+    assert not is_postgrest_builder(mock_query)
+    assert await aexecute(mock_query) != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_supabase_host_gets_its_own_pool_limits(db, monkeypatch):
+    from app.utils import postgrest_async
+
+    native, _, _ = db
+    monkeypatch.setattr(postgrest_async, "POSTGREST_MAX_CONNECTIONS", 120)
+    monkeypatch.setattr(postgrest_async, "POSTGREST_MAX_KEEPALIVE", 40)
+    await execute_async(native.from_("products3").select("*"))
+
+    registry = http_clients.http_clients
+    limits = registry.limits_for("proj.supabase.co")
+    assert (limits.max_connections, limits.max_keepalive_connections) == (120, 40)
+    assert registry.limits_for("api.line.me") is registry.limits
+    assert registry.get_stats()["proj.supabase.co"]["max_connections"] == 120
@@ -0,0 +1,134 @@
+"""
+Tests — ProductCatalog (in-memory products snapshot + column indexes)
+
+Retrieval fallbacks must give the same rows as the Supabase ilike/or_ queries
+they replace, without touching the DB once the catalog is loaded.
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.rag import QueryAnalysis, IntentType
+from app.services.product.catalog import ProductCatalog
+
+
+_ROWS = [
+    {"id": 3, "product_name": "แจ๊ส", "product_category": "Insecticide", "strategy": "Skyrocket",
+     "insecticides": "เพลี้ยไฟ, เพลี้ยกระโดดสีน้ำตาล", "applicable_crops": "ข้าว, ทุเรียน",
+     "physical_form": "น้ำ", "row_hash": "h3"},
+    {"id": 1, "product_name": "โมเดิน 50", "product_category": "Insecticide", "strategy": "Standard",
+     "insecticides": "เพลี้ยไฟ", "applicable_crops": "มะม่วง", "physical_form": "ผง", "row_hash": "h1"},
+    {"id": 2, "product_name": "คาริสมา", "product_category": "Fungicide", "strategy": "Expand",
+     "fungicides": "โรคใบไหม้, ราสีชมพู", "applicable_crops": "ทุเรียน", "physical_form": "น้ำ", "row_hash": "h2"},
+    {"id": 4, "product_name": "ทูโฟฟอส", "product_category": "Herbicide", "strategy": "Natural",
+     "herbicides": "วัชพืชใบกว้าง", "applicable_crops": "นาข้าว", "physical_form": "น้ำ", "row_hash": "h4"},
+    {"id": 5, "product_name": "บอมส์ ซิงค์", "product_category": "Fertilizer", "strategy": "Standard",
+     "fertilizer": "ขาดธาตุสังกะสี ใบเหลือง", "applicable_crops": "ทุกพืช", "physical_form": "น้ำ", "row_hash": "h5"},
+]
+
+
+@pytest.fixture()
+def catalog():
+    cat = ProductCatalog()
+    cat.load_rows([dict(r) for r in _ROWS])
+    return cat
+
+
+@pytest.fixture()
+def loaded_singleton(catalog):
+    prev = ProductCatalog._instance
+    ProductCatalog._instance = catalog
+    yield catalog
+    ProductCatalog._instance = prev
+
+
+def _agent():
+    from app.services.rag.retrieval_agent import RetrievalAgent
+    supabase = MagicMock()
+    supabase.table.side_effect = AssertionError("catalog loaded — DB must not be queried")
+    return RetrievalAgent(supabase_client=supabase, openai_client=AsyncMock())
+
+
+class TestIndexes:
+
+    def test_rows_in_id_order(self, catalog):
+        assert [r["id"] for r in catalog.rows()] == [1, 2, 3, 4, 5]
+        assert [r["id"] for r in catalog.rows(limit=2)] == [1, 2]
+
+    def test_substring_matches_ilike(self, catalog):
+        assert catalog.ids_containing("insecticides", "เพลี้ยไฟ") == {"1", "3"}
+        assert catalog.ids_containing("insecticides", "กระโดด") == {"3"}
+        assert catalog.ids_containing("insecticides", "หนอน") == set()
+        # Short keyword (< trigram) still works
+        assert catalog.ids_containing("applicable_crops", "ข้") == {"3", "4"}
+
+    def test_value_index_case_insensitive_substring(self, catalog):
+        assert catalog.ids_containing("product_category", "fungicide") == {"2"}
+        assert catalog.ids_in("strategy", ["Skyrocket", "Expand"]) == {"2", "3"}
+        assert catalog.ids_equal("product_category", "fertilizer") == set()
+
+    def test_containing_any_is_or(self, catalog):
+        ids = catalog.ids_containing_any(["insecticides", "fungicides"], ["ราสีชมพู", "กระโดด"])
+        assert ids == {"2", "3"}
+
+    @pytest.mark.asyncio
+    async def test_refresh_fetches_only_changed_rows(self, catalog):
+        supabase = MagicMock()
+        hashes = MagicMock(data=[{"id": r["id"], "row_hash": r["row_hash"]} for r in _ROWS if r["id"] != 4])
+        hashes.data[0]["row_hash"] = "h3-new"
+        changed = MagicMock(data=[dict(_ROWS[0], row_hash="h3-new", strategy="Expand")])
+        table = supabase.table.return_value
+        table.select.return_value.execute.return_value = hashes
+        table.select.return_value.in_.return_value.execute.return_value = changed
+
+        catalog._load_time = 0
+        assert await catalog.refresh_if_stale(supabase) is True
+
+        table.select.return_value.in_.assert_called_once_with("id", [3])
+        assert catalog.get(3)["strategy"] == "Expand"
+        assert catalog.get(4) is None
+        assert catalog.ids_in("strategy", ["Expand"]) == {"2", "3"}
+
+
+class TestRetrievalUsesCatalog:
+
+    @pytest.mark.asyncio
+    async def test_direct_lookup_exact_then_substring(self, loaded_singleton):
+        agent = _agent()
+        docs = await agent._direct_product_lookup("โมเดิน")
+        assert [d.title for d in docs] == ["โมเดิน 50"]
+        assert docs[0].rerank_score == 1.0
+
+    @pytest.mark.asyncio
+    async def test_pest_column_fallback(self, loaded_singleton):
+        agent = _agent()
+        qa = QueryAnalysis(original_query="เพลี้ยไฟ", intent=IntentType.PEST_CONTROL, confidence=0.9,
+                           entities={"pest_name": "เพลี้ยไฟ"})
+        docs = await agent._pest_column_fallback_search(qa, existing_docs=[])
+        assert [d.title for d in docs] == ["โมเดิน 50", "แจ๊ส"]
+
+    @pytest.mark.asyncio
+    async def test_supplementary_priority_filters_strategy_and_category(self, loaded_singleton):
+        agent = _agent()
+        qa = QueryAnalysis(original_query="ราสีชมพูทุเรียน", intent=IntentType.DISEASE_TREATMENT, confidence=0.9,
+                           entities={"disease_name": "ราสีชมพู", "plant_type": "ทุเรียน"})
+        docs = await agent._supplementary_priority_search(qa, existing_docs=[])
+        assert [d.title for d in docs] == ["คาริสมา"]
+
+    @pytest.mark.asyncio
+    async def test_symptom_fallback_narrows_by_crop(self, loaded_singleton):
+        agent = _agent()
+        qa = QueryAnalysis(original_query="ใบเหลือง", intent=IntentType.NUTRIENT_SUPPLEMENT, confidence=0.9,
+                           entities={"plant_type": "ทุก"})
+        docs = await agent._search_by_symptom_keywords("ใบเหลือง", qa)
+        assert [d.title for d in docs] == ["บอมส์ ซิงค์"]
+
+    @pytest.mark.asyncio
+    async def test_enrich_strategy_from_catalog(self, loaded_singleton):
+        from app.services.rag import RetrievedDocument
+        agent = _agent()
+        doc = RetrievedDocument(id="2", title="คาริสมา", content="", source="products",
+                                similarity_score=0.8, metadata={})
+        await agent._enrich_strategy([doc])
+        assert doc.metadata["strategy"] == "Expand"
+        assert doc.metadata["applicable_crops"] == "ทุเรียน"
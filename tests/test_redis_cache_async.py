@@ -0,0 +1,178 @@
+"""
+Tests — async Redis helpers (redis_cache.*_async): pipelined round trips,
+Lua sliding-window limiter + lease semaphore, and the in-memory fallbacks
+"""
+
+import pytest
+from unittest.mock import patch
+
+from app.services import redis_cache
+from app.utils import rate_limiter
+from app.utils.rate_limiter import SlidingWindowLimiter
+from tests.fakes import FakeAsyncRedis, UpstashRestBackend, upstash_async_client
+
+
+class _FakeAsyncRedis(FakeAsyncRedis):
+    """Shared Redis double + Lua scripts.
+
+    EVALSHA runs in-process equivalents of the Lua scripts (no Lua interpreter here),
+    so these tests cover key/arg wiring, ms units, NOSCRIPT fallback and round trips.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loaded_scripts = set()
+        self.evalsha_calls = []
+        self.windows = SlidingWindowLimiter()
+        self.semaphores = {}  # key → {holder: expires_at}
+
+    def _zrem(self, key, member):
+        self.semaphores.get(key, {}).pop(member, None)
+
+    def _evalsha(self, sha, numkeys, *keys_and_args):
+        self.evalsha_calls.append(sha)
+        if sha not in self.loaded_scripts:
+            raise Exception("NOSCRIPT No matching script. Please use EVAL.")
+        return self._run(sha, list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+
+    def _eval(self, source, numkeys, *keys_and_args):
+        sha = redis_cache._LuaScript(source).sha
+        self.loaded_scripts.add(sha)
+        return self._run(sha, list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+
+    def _run(self, sha, keys, args):
+        now = int(args[0]) / 1000
+        if sha == redis_cache.sliding_window_script.sha:
+            allowed, remaining, retry = self.windows.hit(keys[0], int(args[2]), int(args[1]) / 1000, now=now)
+            return [int(allowed), remaining, int(retry * 1000)]
+        leases = self.semaphores.setdefault(keys[0], {})
+        for holder in [h for h, expires in leases.items() if expires <= now]:
+            del leases[holder]
+        if len(leases) >= int(args[2]):
+            return [0, len(leases)]
+        leases[args[3]] = now + int(args[1]) / 1000
+        return [1, len(leases)]
+
+
+@pytest.fixture()
+def fake():
+    redis = _FakeAsyncRedis()
+    with patch.object(redis_cache, "async_redis_client", redis):
+        yield redis
+
+
+@pytest.mark.asyncio
+async def test_get_set_delete_roundtrip_json(fake):
+    assert await redis_cache.redis_set_async("k", {"a": 1, "th": "ทุเรียน"}, ttl=60)
+    assert await redis_cache.redis_get_async("k") == {"a": 1, "th": "ทุเรียน"}
+    assert await redis_cache.redis_delete_async("k")
+    assert await redis_cache.redis_get_async("k") is None
+
+
+@pytest.mark.asyncio
+async def test_get_with_ttl_is_one_round_trip(fake):
+    await redis_cache.redis_set_async("k", [1, 2], ttl=120)
+    fake.round_trips = 0
+    value, ttl = await redis_cache.redis_get_with_ttl_async("k")
+    assert value == [1, 2] and ttl == 120
+    assert fake.round_trips == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_counts_and_blocks(fake):
+    results = [await redis_cache.check_rate_limit_redis_async("user-1", limit=3, window=60) for _ in range(4)]
+    assert results == [(True, 2), (True, 1), (True, 0), (False, 0)]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_one_evalsha_per_check(fake):
+    await redis_cache.check_rate_limit_redis_async("user-2", limit=5, window=60)  # NOSCRIPT → EVAL
+    fake.round_trips = 0
+    fake.evalsha_calls.clear()
+    for _ in range(3):
+        await redis_cache.check_rate_limit_redis_async("user-2", limit=5, window=60)
+    assert fake.round_trips == 3
+    assert fake.evalsha_calls == [redis_cache.sliding_window_script.sha] * 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_burst_admits_exactly_limit(fake):
+    import asyncio
+    results = await asyncio.gather(*[
+        redis_cache.check_rate_limit_redis_async("user-burst", limit=10, window=60) for _ in range(50)
+    ])
+    assert sum(allowed for allowed, _ in results) == 10
+
+
+@pytest.mark.asyncio
+async def test_image_cooldown(fake):
+    assert await redis_cache.check_image_cooldown_redis_async("user-3", cooldown=10) == (True, 0)
+    assert await redis_cache.check_image_cooldown_redis_async("user-3", cooldown=10) == (False, 10)
+    assert fake.round_trips == 2
+
+
+@pytest.mark.asyncio
+async def test_analysis_lease_capacity_and_release(fake):
+    first = await redis_cache.acquire_analysis_slot_async(max_concurrent=2, timeout=300)
+    second = await redis_cache.acquire_analysis_slot_async(max_concurrent=2, timeout=300)
+    assert first and second and first != second
+    assert await redis_cache.acquire_analysis_slot_async(max_concurrent=2, timeout=300) is None
+
+    await redis_cache.release_analysis_slot_async(first)
+    assert await redis_cache.acquire_analysis_slot_async(max_concurrent=2, timeout=300)
+
+
+@pytest.mark.asyncio
+async def test_analysis_lease_expires_without_release(fake):
+    with patch.object(redis_cache, "_now_ms", return_value=1_000_000):
+        assert await redis_cache.acquire_analysis_slot_async(max_concurrent=1, timeout=10)
+        assert await redis_cache.acquire_analysis_slot_async(max_concurrent=1, timeout=10) is None
+    # holder crashed — lease gone after 10s
+    with patch.object(redis_cache, "_now_ms", return_value=1_010_001):
+        assert await redis_cache.acquire_analysis_slot_async(max_concurrent=1, timeout=10)
+
+
+@pytest.mark.asyncio
+async def test_pipelines_work_on_the_upstash_client():
+    """Upstash AsyncPipeline: execute(cmd) only queues, exec() sends — apipeline() must hide that."""
+    backend = UpstashRestBackend()
+    with patch.object(redis_cache, "async_redis_client", upstash_async_client(backend)):
+        assert await redis_cache.redis_set_async("k", {"th": "ทุเรียน"}, ttl=120)
+        backend.requests.clear()
+        assert await redis_cache.redis_get_with_ttl_async("k") == ({"th": "ทุเรียน"}, 120)
+        assert backend.requests == [[["GET", "k"], ["TTL", "k"]]]  # one HTTP round trip
+
+        assert await redis_cache.check_image_cooldown_redis_async("user-4", cooldown=10) == (True, 0)
+        assert await redis_cache.check_image_cooldown_redis_async("user-4", cooldown=10) == (False, 10)
+
+
+@pytest.mark.asyncio
+async def test_helpers_fall_back_without_redis():
+    with patch.object(redis_cache, "async_redis_client", None):
+        assert await redis_cache.redis_get_async("k") is None
+        assert await redis_cache.redis_get_with_ttl_async("k") == (None, -2)
+        assert await redis_cache.check_rate_limit_redis_async("u", limit=7) == (True, 7)
+        assert await redis_cache.check_image_cooldown_redis_async("u") == (True, 0)
+        assert await redis_cache.acquire_analysis_slot_async()
+
+
+# =============================================================================
+# In-memory fallbacks (rate_limiter)
+# =============================================================================
+
+def test_sliding_window_memory_slides():
+    limiter = SlidingWindowLimiter()
+    assert [limiter.hit("u", 2, 10, now=t)[0] for t in (0, 1, 2)] == [True, True, False]
+    allowed, remaining, retry = limiter.hit("u", 2, 10, now=5)
+    assert not allowed and retry == pytest.approx(5)
+    assert limiter.hit("u", 2, 10, now=10.5) == (True, 0, 0.0)  # t=0 left the window
+    assert limiter.prune(10, now=100) == 1
+
+
+@pytest.mark.asyncio
+async def test_analysis_slots_unlimited_in_memory_mode():
+    with patch.object(rate_limiter, "_use_redis", False):
+        leases = [await rate_limiter.acquire_analysis_slot() for _ in range(rate_limiter.MAX_CONCURRENT_ANALYSIS + 5)]
+        assert all(leases)
+        await rate_limiter.release_analysis_slot(leases[0])
+        assert rate_limiter.get_analysis_queue_status()["backend"] == "memory"
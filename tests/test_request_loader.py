@@ -0,0 +1,149 @@
+"""
+Tests — request-scoped DB loader (in-flight dedupe, memo, point-lookup batching, round-trip count)
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from postgrest import SyncPostgrestClient
+
+from app.utils import http_clients
+from app.utils.async_db import aexecute, get_request_loader_stats, request_scope
+from app.utils.http_clients import HTTPClientRegistry
+
+_ROWS = {1: {"id": 1, "name": "โมเดิน"}, 2: {"id": 2, "name": "ไฮซีส"}, 3: {"id": 3, "name": "พรีดิก"}}
+
+
+@pytest.fixture
+def _registry(monkeypatch):
+    """Route aexecute's native async path to the same in-memory table."""
+    def install(handler):
+        registry = HTTPClientRegistry(transport=httpx.MockTransport(handler), http2=False, backoff_base_ms=1)
+        monkeypatch.setattr(http_clients, "http_clients", registry)
+    return install
+
+
+@pytest.fixture
+def _client(_registry):
+    """Real postgrest query builders over an in-memory table `products`."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if request.method != "GET":
+            return httpx.Response(200, json=[])
+        criteria = request.url.params.get("id", "")
+        if criteria.startswith("eq."):
+            ids = [int(criteria[3:])]
+        elif criteria.startswith("in."):
+            ids = [int(v) for v in criteria[4:-1].split(",")]
+        else:
+            ids = list(_ROWS)
+        return httpx.Response(200, json=[_ROWS[i] for i in ids if i in _ROWS])
+
+    _registry(handler)
+    return SyncPostgrestClient("http://db.test"), calls
+
+
+@pytest.mark.asyncio
+async def test_identical_reads_coalesce_and_memoize_with_private_copies(_client):
+    client, calls = _client
+    query = lambda: client.from_("products").select("*").eq("id", 1).limit(1)  # noqa: E731
+
+    async with request_scope() as loader:
+        first, second = await asyncio.gather(aexecute(query()), aexecute(query()))
+        first.data[0]["name"] = "mutated by caller"
+        third = await aexecute(query())
+
+    assert len(calls) == 1
+    assert second.data == third.data == [_ROWS[1]]
+    assert (loader.queries, loader.round_trips, loader.coalesced, loader.memo_hits) == (3, 1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_point_lookups_batch_into_one_in_query(_client):
+    client, calls = _client
+
+    async def lookup(product_id):
+        return await aexecute(client.from_("products").select("id,name").eq("id", product_id))
+
+    async with request_scope() as loader:
+        results = await asyncio.gather(*(lookup(i) for i in (1, 2, 9, 3)))
+
+    assert len(calls) == 1 and calls[0].url.params["id"] == "in.(1,2,9,3)"
+    assert [r.data for r in results] == [[_ROWS[1]], [_ROWS[2]], [], [_ROWS[3]]]
+    assert loader.round_trips == 1 and loader.batched == 4
+
+
+@pytest.mark.asyncio
+async def test_write_drops_table_memo_and_rpc_is_not_memoized(_client):
+    client, calls = _client
+    read = lambda: client.from_("products").select("*").eq("id", 2)  # noqa: E731
+
+    async with request_scope() as loader:
+        await aexecute(read())
+        await aexecute(read())
+        await aexecute(client.from_("products").update({"name": "x"}).eq("id", 2))
+        await aexecute(read())
+        await aexecute(client.rpc("hybrid_search", {"q": "เพลี้ย"}))
+        await aexecute(client.rpc("hybrid_search", {"q": "เพลี้ย"}))
+
+    assert [c.method for c in calls] == ["GET", "PATCH", "GET", "POST", "POST"]
+    assert loader.round_trips == 5 and loader.memo_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_outside_scope_and_after_scope_go_direct_and_stats_recorded(_client):
+    client, calls = _client
+    before = get_request_loader_stats()["requests"]
+    query = lambda: client.from_("products").select("*")  # noqa: E731
+
+    gate = asyncio.Event()
+
+    async def background():  # spawned inside the scope, runs after it ended
+        await gate.wait()
+        return await aexecute(query())
+
+    await aexecute(query())
+    await aexecute(query())
+    async with request_scope() as loader:
+        await aexecute(query())
+        leaked = asyncio.create_task(background())
+    gate.set()
+    await leaked
+    await aexecute(query())  # context restored → direct
+
+    assert len(calls) == 5
+    assert loader.closed and loader.queries == 1
+    stats = get_request_loader_stats()
+    assert stats["requests"] == before + 1 and stats["max_round_trips"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_conversation_state_read_once_per_message_until_saved():
+    from app.services import cache
+
+    store = {"conv_state:U1": {"active_product": "โมเดิน"}}
+    redis_get = AsyncMock(side_effect=lambda key: json.loads(json.dumps(store.get(key))))
+
+    async def redis_set(key, value, ttl):
+        store[key] = value
+
+    with patch.object(cache, "is_redis_available", return_value=True), \
+         patch.object(cache, "redis_get_async", redis_get), \
+         patch.object(cache, "redis_set_async", redis_set):
+        async with request_scope():
+            state = await cache.get_conversation_state("U1")
+            state["active_product"] = "local edit"
+            assert (await cache.get_conversation_state("U1"))["active_product"] == "โมเดิน"
+            assert redis_get.await_count == 1
+
+            await cache.save_conversation_state("U1", {"active_product": "ไฮซีส"})
+            assert (await cache.get_conversation_state("U1"))["active_product"] == "ไฮซีส"
+            assert redis_get.await_count == 2
+
+        await cache.get_conversation_state("U1")
+        assert redis_get.await_count == 3
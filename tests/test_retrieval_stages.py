@@ -0,0 +1,134 @@
+"""
+Tests — RetrievalAgent.retrieve stage executor
+
+Independent fallback stages are launched concurrently, applied in the original
+stage order, and cancelled when their trigger condition turns out false.
+Conditional fallbacks only start up front when speculation is on (catalog loaded
+or RETRIEVAL_SPECULATIVE_FALLBACKS); otherwise they start only when triggered.
+"""
+
+import asyncio
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.rag import QueryAnalysis, IntentType, RetrievedDocument
+
+
+def _doc(doc_id: str, title: str, **metadata) -> RetrievedDocument:
+    return RetrievedDocument(id=doc_id, title=title, content=title, source="products",
+                             similarity_score=0.6, metadata={"strategy": "Standard", "selling_point": "x",
+                                                             **metadata})
+
+
+def _agent(speculative: bool = True):
+    from app.services.rag.retrieval_agent import RetrievalAgent
+    agent = RetrievalAgent(supabase_client=MagicMock(), openai_client=None)
+    # speculation follows the in-memory catalog (no DB cost) unless RETRIEVAL_SPECULATIVE_FALLBACKS
+    agent._catalog = lambda: MagicMock() if speculative else None
+    return agent
+
+
+def _slow(result, delay=0.1, calls=None, name=None):
+    async def _run(*args, **kwargs):
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        return list(result)
+    return _run
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_run_concurrently():
+    agent = _agent()
+    qa = QueryAnalysis(original_query="ใบเหลือง ปุ๋ยน้ำ", intent=IntentType.NUTRIENT_SUPPLEMENT, confidence=0.9,
+                       entities={"pest_name": ""})
+    delay = 0.1
+    with patch.object(agent, "_multi_source_retrieval", _slow([], delay)), \
+            patch.object(agent, "_search_by_symptom_keywords", _slow([_doc("1", "A")], delay)), \
+            patch.object(agent, "_fallback_keyword_search", _slow([_doc("2", "B")], delay)), \
+            patch.object(agent, "_supplementary_priority_search", _slow([_doc("3", "C")], delay)), \
+            patch.object(agent, "_fertilizer_form_search", _slow([_doc("4", "D")], delay)), \
+            patch.object(agent, "_enrich_strategy", AsyncMock()):
+        started = time.perf_counter()
+        result = await agent.retrieve(qa, top_k=10, skip_rerank=True)
+        elapsed = time.perf_counter() - started
+
+    # 5 stages × 100ms sequentially; concurrently ≈ the slowest one
+    assert elapsed < delay * 3
+    assert {"multi_source", "symptom_fallback", "keyword_fallback",
+            "supplementary_priority", "fertilizer_form_fallback"} <= set(result.stage_timings)
+    assert {d.id for d in result.documents} == {"1", "2", "3", "4"}
+
+
+@pytest.mark.asyncio
+async def test_speculative_stages_cancelled_when_not_triggered():
+    agent = _agent()
+    qa = QueryAnalysis(original_query="เพลี้ยไฟ", intent=IntentType.PEST_CONTROL, confidence=0.9,
+                       entities={"pest_name": "เพลี้ยไฟ", "product_name": "แจ๊ส"})
+    # Enough docs that already mention the pest → keyword / pest-column fallbacks not needed,
+    # direct lookup hit → supplementary priority search not needed
+    found = [_doc(str(i), f"P{i}", insecticides="เพลี้ยไฟ") for i in range(3)]
+    with patch.object(agent, "_direct_product_lookup", _slow([_doc("9", "แจ๊ส")], 0.01)), \
+            patch.object(agent, "_multi_source_retrieval", _slow(found, 0.01)), \
+            patch.object(agent, "_fallback_keyword_search", _slow([_doc("k", "K")], 1.0)), \
+            patch.object(agent, "_supplementary_priority_search", _slow([_doc("s", "S")], 1.0)), \
+            patch.object(agent, "_pest_column_fallback_search", _slow([_doc("p", "P")], 1.0)), \
+            patch.object(agent, "_enrich_strategy", AsyncMock()):
+        started = time.perf_counter()
+        result = await agent.retrieve(qa, top_k=10, skip_rerank=True)
+        elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5
+    ids = {d.id for d in result.documents}
+    assert not ids & {"k", "s", "p"}
+    assert "keyword_fallback" not in result.stage_timings
+
+
+@pytest.mark.asyncio
+async def test_fallback_results_exclude_docs_from_earlier_stages():
+    agent = _agent()
+    qa = QueryAnalysis(original_query="หญ้าในนาข้าว", intent=IntentType.WEED_CONTROL, confidence=0.9,
+                       entities={"weed_type": "หญ้า"})
+    herbicides = [_doc("1", "H1", category="Herbicide"), _doc("2", "H2", category="Herbicide")]
+    with patch.object(agent, "_multi_source_retrieval", _slow(herbicides[:1], 0.01)), \
+            patch.object(agent, "_fallback_keyword_search", _slow([], 0.01)), \
+            patch.object(agent, "_supplementary_priority_search", _slow([], 0.01)), \
+            patch.object(agent, "_weed_category_fallback_search", _slow(herbicides, 0.01)), \
+            patch.object(agent, "_enrich_strategy", AsyncMock()):
+        result = await agent.retrieve(qa, top_k=10, skip_rerank=True)
+
+    assert sorted(d.id for d in result.documents) == ["1", "2"]
+    assert result.total_retrieved == 2
+
+
+@pytest.mark.asyncio
+async def test_conditional_fallbacks_not_started_without_catalog():
+    agent = _agent(speculative=False)
+    qa = QueryAnalysis(original_query="เพลี้ยไฟ", intent=IntentType.PEST_CONTROL, confidence=0.9,
+                       entities={"pest_name": "เพลี้ยไฟ", "product_name": "แจ๊ส"})
+    found = [_doc(str(i), f"P{i}", insecticides="เพลี้ยไฟ") for i in range(3)]
+    calls = []
+    with patch("app.services.rag.retrieval_agent.RETRIEVAL_SPECULATIVE_FALLBACKS", False), \
+            patch.object(agent, "_direct_product_lookup", _slow([_doc("9", "แจ๊ส")], 0.01)), \
+            patch.object(agent, "_multi_source_retrieval", _slow(found, 0.01)), \
+            patch.object(agent, "_fallback_keyword_search", _slow([], 0.01, calls, "keyword")), \
+            patch.object(agent, "_supplementary_priority_search", _slow([], 0.01, calls, "supplementary")), \
+            patch.object(agent, "_pest_column_fallback_search", _slow([], 0.01, calls, "pest_column")), \
+            patch.object(agent, "_enrich_strategy", AsyncMock()):
+        await agent.retrieve(qa, top_k=10, skip_rerank=True)
+    assert calls == []
+
+    # too few docs → the keyword fallback is triggered and started at apply time
+    with patch("app.services.rag.retrieval_agent.RETRIEVAL_SPECULATIVE_FALLBACKS", False), \
+            patch.object(agent, "_multi_source_retrieval", _slow([], 0.01)), \
+            patch.object(agent, "_fallback_keyword_search", _slow([_doc("k", "K")], 0.01, calls, "keyword")), \
+            patch.object(agent, "_supplementary_priority_search", _slow([], 0.01, calls, "supplementary")), \
+            patch.object(agent, "_pest_column_fallback_search", _slow([], 0.01, calls, "pest_column")), \
+            patch.object(agent, "_search_by_symptom_keywords", _slow([], 0.01)), \
+            patch.object(agent, "_enrich_strategy", AsyncMock()):
+        qa = QueryAnalysis(original_query="ยาเพลี้ย", intent=IntentType.GENERAL_AGRICULTURE, confidence=0.9,
+                           entities={})
+        result = await agent.retrieve(qa, top_k=10, skip_rerank=True)
+    assert "keyword" in calls and "k" in {d.id for d in result.documents}
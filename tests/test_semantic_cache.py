@@ -1,10 +1,12 @@
-"""Unit tests for Semantic Cache — 9 test cases."""
+"""Unit tests for Semantic Cache — 15 test cases."""
 import asyncio
 import time
 import math
 import pytest
 from unittest.mock import patch
 
+from tests.fakes import FakeAsyncRedis, UpstashRestBackend, upstash_async_client
+
 
 # Helper: create a fake embedding vector
 def _make_embedding(seed: float, dims: int = 1536) -> list:
@@ -102,14 +104,15 @@ async def test_below_threshold():
 @pytest.mark.asyncio
 async def test_expired_entry():
     """Expired entry (TTL passed) → miss (Layer 3 protection)."""
-    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache, _semantic_cache
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache
 
     emb = _make_embedding(5.0)
     await store_semantic_cache("เพลี้ยไฟทุเรียน", emb, "ใช้อิมิดาโกลด์ค่ะ", "ทุเรียน")
 
-    # Manually expire the entry
-    with patch("app.services.semantic_cache.SEMANTIC_CACHE_TTL", 0):
-        _semantic_cache[0]["created_at"] = time.time() - 10
+    # Move the clock past the entry's TTL
+    with patch("app.services.semantic_cache.SEMANTIC_CACHE_TTL", 0), \
+            patch("app.services.semantic_cache.time") as mock_time:
+        mock_time.time.return_value = time.time() + 10
         result = await search_semantic_cache(emb, "ทุเรียน")
         assert result is None
 
@@ -167,3 +170,204 @@ async def test_no_plant_both_empty():
     result = await search_semantic_cache(emb, "")
     assert result is not None
     assert result["similarity"] > 0.99
+
+
+@pytest.mark.asyncio
+async def test_no_plant_query_searches_all_plants():
+    """Query without plant → searches every plant partition."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache
+
+    emb = _make_embedding(11.0)
+    await store_semantic_cache("หนอนกอข้าว", _make_embedding(12.0), "answer_rice", "ข้าว")
+    await store_semantic_cache("เพลี้ยไฟทุเรียน", emb, "answer_durian", "ทุเรียน")
+
+    result = await search_semantic_cache(emb, "")
+    assert result is not None
+    assert result["response"] == "answer_durian"
+    assert result["plant_type"] == "ทุเรียน"
+
+
+@pytest.mark.asyncio
+async def test_eviction_keeps_newest():
+    """Swap-remove eviction drops the oldest entries and keeps newer ones searchable."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache
+
+    embs = [_make_embedding(200.0 + i) for i in range(6)]
+    with patch("app.services.semantic_cache.SEMANTIC_CACHE_MAX_ENTRIES", 3):
+        for i, emb in enumerate(embs):
+            await store_semantic_cache(f"query_{i}", emb, f"answer_{i}", "ทุเรียน")
+
+    assert await search_semantic_cache(embs[0], "ทุเรียน") is None
+    for i in (3, 4, 5):
+        result = await search_semantic_cache(embs[i], "ทุเรียน")
+        assert result is not None
+        assert result["response"] == f"answer_{i}"
+
+
+@pytest.mark.asyncio
+async def test_ivf_index_finds_near_duplicate():
+    """Partition above the IVF threshold still finds a near-duplicate query."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache, _semantic_cache
+
+    dims = 64
+    embs = [_make_embedding(300.0 + i, dims) for i in range(40)]
+    with patch("app.services.semantic_cache.SEMANTIC_CACHE_IVF_MIN_ENTRIES", 16), \
+            patch("app.services.semantic_cache.SEMANTIC_CACHE_IVF_NPROBE", 2):
+        for i, emb in enumerate(embs):
+            await store_semantic_cache(f"query_{i}", emb, f"answer_{i}", "ทุเรียน")
+
+        assert _semantic_cache._partitions["ทุเรียน"].centroids is not None
+        for i in (0, 17, 39):
+            result = await search_semantic_cache(_make_similar_embedding(embs[i], 0.97), "ทุเรียน")
+            assert result is not None
+            assert result["response"] == f"answer_{i}"
+
+
+@pytest.mark.asyncio
+async def test_ivf_training_runs_outside_the_index_lock():
+    """k-means trains on a snapshot in a thread; entries stored meanwhile are assigned on install."""
+    import threading
+    from app.services import semantic_cache as sc
+
+    dims = 32
+    embs = [_make_embedding(500.0 + i, dims) for i in range(20)]
+    trained_on = []
+    real_train = sc._train_ivf
+
+    def train(data):
+        trained_on.append((len(data), sc._lock.locked(), threading.current_thread() is threading.main_thread()))
+        # a concurrent store lands while training — must not wait for k-means
+        with sc._lock:
+            sc._semantic_cache.add("late", embs[-1], "late_answer", "ทุเรียน", time.time())
+        return real_train(data)
+
+    with patch("app.services.semantic_cache.SEMANTIC_CACHE_IVF_MIN_ENTRIES", 16), \
+            patch("app.services.semantic_cache.SEMANTIC_CACHE_IVF_NPROBE", 2), \
+            patch.object(sc, "_train_ivf", train):
+        for i, emb in enumerate(embs[:16]):
+            await sc.store_semantic_cache(f"query_{i}", emb, f"answer_{i}", "ทุเรียน")
+
+        partition = sc._semantic_cache._partitions["ทุเรียน"]
+        assert trained_on == [(16, False, False)]
+        assert partition.centroids is not None and not partition.training
+        assert partition.size == 17 and (partition.assign[:partition.size] >= 0).all()
+
+
+def _forget_local():
+    """Drop L1 + sync state only, simulating a different worker."""
+    from app.services import semantic_cache as sc
+    with sc._lock:
+        sc._semantic_cache.clear()
+        sc._seen_ids.clear()
+        sc._sync_cursors.clear()
+
+
+@pytest.mark.asyncio
+async def test_redis_entries_stored_per_key():
+    """Each store writes its own entry key; workers don't overwrite each other."""
+    from app.services.semantic_cache import store_semantic_cache
+
+    fake = FakeAsyncRedis()
+    with patch("app.services.semantic_cache._get_redis", return_value=fake):
+        await store_semantic_cache("เพลี้ยไฟทุเรียน", _make_embedding(400.0), "answer_a", "ทุเรียน")
+        _forget_local()
+        await store_semantic_cache("หนอนกอข้าว", _make_embedding(401.0), "answer_b", "ข้าว")
+
+    entry_keys = [k for k in fake.kv if k.startswith("semantic_cache:entry:")]
+    assert len(entry_keys) == 2
+    assert len(fake.zsets["semantic_cache:index"]) == 2
+    assert len(fake.zsets["semantic_cache:plant:ทุเรียน"]) == 1
+    assert len(fake.zsets["semantic_cache:plant:ข้าว"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_sync_pulls_other_worker_entries():
+    """L1 miss pulls entries stored by another worker from Redis."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache
+
+    fake = FakeAsyncRedis()
+    emb = _make_embedding(402.0)
+    with patch("app.services.semantic_cache._get_redis", return_value=fake):
+        await store_semantic_cache("เพลี้ยไฟทุเรียน", emb, "answer_remote", "ทุเรียน")
+        _forget_local()
+
+        result = await search_semantic_cache(_make_similar_embedding(emb, 0.97), "ทุเรียน")
+
+    assert result is not None
+    assert result["response"] == "answer_remote"
+    assert result["similarity"] > 0.95
+
+
+@pytest.mark.asyncio
+async def test_redis_sync_respects_max_entries():
+    """Entries pulled from Redis are evicted like local stores — L1 stays within MAX_ENTRIES."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache, _semantic_cache
+
+    fake = FakeAsyncRedis()
+    embs = [_make_embedding(700.0 + i) for i in range(6)]
+    with patch("app.services.semantic_cache._get_redis", return_value=fake):
+        for i, emb in enumerate(embs):
+            await store_semantic_cache(f"query_{i}", emb, f"answer_{i}", "ทุเรียน")
+        _forget_local()
+
+        with patch("app.services.semantic_cache.SEMANTIC_CACHE_MAX_ENTRIES", 3):
+            result = await search_semantic_cache(embs[5], "ทุเรียน")
+
+    assert result is not None and result["response"] == "answer_5"
+    assert len(_semantic_cache) == 3
+
+
+@pytest.mark.asyncio
+async def test_redis_sync_is_incremental():
+    """Repeated misses only fetch entries the worker hasn't seen yet."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache
+
+    fake = FakeAsyncRedis()
+    with patch("app.services.semantic_cache._get_redis", return_value=fake):
+        for i in range(3):
+            await store_semantic_cache(f"query_{i}", _make_embedding(410.0 + i), f"answer_{i}", "ทุเรียน")
+        _forget_local()
+
+        await search_semantic_cache(_make_embedding(499.0), "ทุเรียน")
+        assert fake.mget_keys == 3
+
+        await search_semantic_cache(_make_embedding(498.0), "ทุเรียน")
+        assert fake.mget_keys == 3
+
+
+@pytest.mark.asyncio
+async def test_redis_round_trips_are_pipelined():
+    """Store = 1 pipeline (SET + index updates); sync = ZRANGEBYSCORE + 1 pipelined MGET batch."""
+    from app.services import semantic_cache as sc
+
+    fake = FakeAsyncRedis()
+    with patch("app.services.semantic_cache._get_redis", return_value=fake), \
+            patch.object(sc, "_MGET_CHUNK", 2):
+        for i in range(5):
+            await sc.store_semantic_cache(f"query_{i}", _make_embedding(420.0 + i), f"answer_{i}", "ทุเรียน")
+        assert fake.round_trips == 5
+        _forget_local()
+
+        fake.round_trips = 0
+        await sc.search_semantic_cache(_make_embedding(497.0), "ทุเรียน")
+
+    assert fake.mget_keys == 5
+    assert fake.round_trips == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_store_and_sync_on_the_upstash_client():
+    """Per-key store + incremental sync through the real Upstash async client (exec()-style pipeline)."""
+    from app.services.semantic_cache import store_semantic_cache, search_semantic_cache
+
+    backend = UpstashRestBackend()
+    emb = _make_embedding(802.0)
+    with patch("app.services.semantic_cache._get_redis", return_value=upstash_async_client(backend)):
+        await store_semantic_cache("เพลี้ยไฟทุเรียน", emb, "answer_upstash", "ทุเรียน")
+        assert len([k for k in backend.redis.kv if k.startswith("semantic_cache:entry:")]) == 1
+        assert len(backend.redis.zsets["semantic_cache:plant:ทุเรียน"]) == 1
+        _forget_local()
+
+        result = await search_semantic_cache(_make_similar_embedding(emb, 0.97), "ทุเรียน")
+
+    assert result is not None and result["response"] == "answer_upstash"
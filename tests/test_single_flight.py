@@ -0,0 +1,153 @@
+"""
+Tests — SingleFlight (identical concurrent RAG requests share one pipeline run)
+
+Concurrent requests with the same key must run the handler body once, error
+answers must not be shared, and a second worker must pick up the leader's
+answer through Redis instead of computing it again.
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.services import redis_cache
+from app.services.single_flight import SingleFlight
+from tests.fakes import FakeAsyncRedis, UpstashRestBackend, upstash_async_client
+
+
+class _FakeAsyncRedis(FakeAsyncRedis):
+    def _eval(self, script, numkeys, key, token):
+        # compare-and-delete lock release (the only script SingleFlight runs)
+        return self._delete(key) if self.kv.get(key) == token else 0
+
+
+def _handler(flight: SingleFlight, calls: list, answer: str = "ใช้โมเดิน 50 พ่นเพลี้ยไฟ", delay: float = 0.05):
+    @flight.scoped(exclude=("ERROR",))
+    async def handle(user_id: str, key: str) -> str:
+        shared = await flight.join(key)
+        if shared:
+            return shared
+        calls.append(user_id)
+        await asyncio.sleep(delay)
+        return answer
+    return handle
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_compute_once():
+    flight = SingleFlight(use_redis=False, wait=5)
+    calls = []
+    handle = _handler(flight, calls)
+
+    answers = await asyncio.gather(*(handle(f"u{i}", "k1") for i in range(5)))
+
+    assert answers == ["ใช้โมเดิน 50 พ่นเพลี้ยไฟ"] * 5
+    assert calls == ["u0"]
+    stats = flight.get_stats()
+    assert stats["leaders"] == 1 and stats["followers"] == 4 and stats["shared"] == 4
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_and_unscoped_calls_do_not_wait():
+    flight = SingleFlight(use_redis=False, wait=5)
+    calls = []
+    handle = _handler(flight, calls)
+
+    await asyncio.gather(handle("u1", "k1"), handle("u2", "k2"))
+    assert sorted(calls) == ["u1", "u2"]
+    assert await flight.join("k1") is None  # outside a scope → always lead
+
+
+@pytest.mark.asyncio
+async def test_error_answer_not_shared_followers_compute_themselves():
+    flight = SingleFlight(use_redis=False, wait=5)
+    calls = []
+    handle = _handler(flight, calls, answer="ERROR")
+
+    answers = await asyncio.gather(*(handle(f"u{i}", "k1") for i in range(3)))
+
+    assert answers == ["ERROR"] * 3
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_leader_exception_releases_followers():
+    flight = SingleFlight(use_redis=False, wait=5)
+
+    @flight.scoped()
+    async def boom(key):
+        await flight.join(key)
+        await asyncio.sleep(0.02)
+        raise RuntimeError("rag down")
+
+    @flight.scoped()
+    async def follow(key):
+        await asyncio.sleep(0.005)
+        return await flight.join(key)
+
+    results = await asyncio.gather(boom("k1"), follow("k1"), return_exceptions=True)
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] is None
+    assert flight.get_stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_second_worker_gets_answer_through_redis():
+    redis = _FakeAsyncRedis()
+    worker_a = SingleFlight(use_redis=True, wait=5, poll_ms=5)
+    worker_b = SingleFlight(use_redis=True, wait=5, poll_ms=5)
+    calls = []
+
+    with patch.object(redis_cache, "async_redis_client", redis):
+        leader = asyncio.create_task(_handler(worker_a, calls, delay=0.05)("u1", "k1"))
+        await asyncio.sleep(0.01)
+        follower = await _handler(worker_b, calls)("u2", "k1")
+
+        assert await leader == follower == "ใช้โมเดิน 50 พ่นเพลี้ยไฟ"
+        assert calls == ["u1"]
+        assert worker_b.get_stats()["remote_followers"] == 1
+        assert not any(k.startswith("ragflight:lock:") for k in redis.kv)
+
+        # late arrival on another worker within the result TTL → no recompute
+        assert await _handler(SingleFlight(use_redis=True, wait=5), calls)("u3", "k1") == follower
+        assert calls == ["u1"]
+
+
+@pytest.mark.asyncio
+async def test_leader_does_not_release_a_lock_taken_over_after_expiry():
+    redis = _FakeAsyncRedis()
+    worker = SingleFlight(use_redis=True, wait=5, poll_ms=5)
+
+    @worker.scoped()
+    async def slow_leader(key):
+        assert await worker.join(key) is None
+        # lock expired while the leader was still running; another worker now holds it
+        redis.kv["ragflight:lock:k1"] = "other-worker-token"
+        return "ใช้โมเดิน 50 พ่นเพลี้ยไฟ"
+
+    with patch.object(redis_cache, "async_redis_client", redis):
+        await slow_leader("k1")
+
+    assert redis.kv["ragflight:lock:k1"] == "other-worker-token"
+    assert redis.kv["ragflight:result:k1"] == "ใช้โมเดิน 50 พ่นเพลี้ยไฟ"
+
+
+@pytest.mark.asyncio
+async def test_cross_worker_flight_on_the_upstash_client():
+    backend = UpstashRestBackend(_FakeAsyncRedis())
+    worker_a = SingleFlight(use_redis=True, wait=5, poll_ms=5)
+    worker_b = SingleFlight(use_redis=True, wait=5, poll_ms=5)
+    calls = []
+
+    with patch.object(redis_cache, "async_redis_client", upstash_async_client(backend)):
+        leader = asyncio.create_task(_handler(worker_a, calls, delay=0.05)("u1", "k1"))
+        await asyncio.sleep(0.01)
+        follower = await _handler(worker_b, calls)("u2", "k1")
+
+        assert await leader == follower == "ใช้โมเดิน 50 พ่นเพลี้ยไฟ"
+    assert calls == ["u1"]
+    assert worker_a.get_stats()["redis_errors"] == worker_b.get_stats()["redis_errors"] == 0
+    assert "ragflight:lock:k1" not in backend.redis.kv  # released by the compare-and-delete EVAL
+    assert any(cmd[0] == "EVAL" for batch in backend.requests for cmd in batch)
@@ -0,0 +1,107 @@
+"""
+Tests — UserProfileCache (shared known-user / display-name cache + batched refresher)
+
+Known users must not touch the profile API or DB, fallback names must be fixed
+with one bulk UPSERT per batch, and failed fetches must be negative-cached.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from app.services import redis_cache, user_service
+from app.services.user_profile_cache import UserProfileCache
+from tests.fakes import FakeAsyncRedis
+
+
+def _cache(names: dict, fetched: list, written: list, fail_write: bool = False) -> UserProfileCache:
+    async def fetcher(uid):
+        fetched.append(uid)
+        return names.get(uid)
+
+    async def writer(rows):
+        if fail_write:
+            raise RuntimeError("db down")
+        written.append(rows)
+
+    return UserProfileCache(fetcher=fetcher, writer=writer, refresh_delay_ms=0)
+
+
+@pytest.mark.asyncio
+async def test_refresh_batches_fixes_into_one_upsert_and_negative_caches_failures():
+    fetched, written = [], []
+    cache = _cache({"Uaaaa1111": "สมชาย"}, fetched, written)
+    with patch.object(redis_cache, "async_redis_client", None):
+        cache.schedule_refresh_many([
+            ("Uaaaa1111", "User_Uaaaa111"),   # LINE fallback → real name
+            ("fb:123456789", "User_fb:1234"),  # legacy ugly name, FB fetch fails → cleaned
+            ("fb:55550000", "FB User #0000"),  # FB fetch fails, already clean → no row
+        ])
+        assert await cache.refresh_pending() == 1
+
+        assert sorted(fetched) == ["Uaaaa1111", "fb:123456789", "fb:55550000"]
+        assert written == [[
+            {"line_user_id": "Uaaaa1111", "display_name": "สมชาย"},
+            {"line_user_id": "fb:123456789", "display_name": "FB User #6789"},
+        ]]
+        assert (await cache.get("Uaaaa1111"))["fallback"] is False
+        # negative-cached → not queued again until USER_PROFILE_NEGATIVE_TTL passes
+        assert cache.schedule_refresh("fb:55550000") is False
+        assert cache.schedule_refresh("Uaaaa1111") is False
+        assert cache.get_stats()["refresh_failed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_bulk_write_keeps_old_name_and_backs_off():
+    fetched, written = [], []
+    cache = _cache({"Ubbbb2222": "สมหญิง"}, fetched, written, fail_write=True)
+    with patch.object(redis_cache, "async_redis_client", None):
+        cache.schedule_refresh("Ubbbb2222", "User_Ubbbb222")
+        assert await cache.refresh_pending() == 0
+        entry = await cache.get("Ubbbb2222")
+        assert entry["name"] == "User_Ubbbb222" and entry["fallback"] and entry["retry_at"] > 0
+        assert cache.schedule_refresh("Ubbbb2222") is False
+
+
+@pytest.mark.asyncio
+async def test_entry_fixed_by_another_worker_is_skipped():
+    redis = FakeAsyncRedis()
+    fetched, written = [], []
+    worker_a = _cache({}, fetched, written)
+    worker_b = _cache({}, fetched, written)
+    with patch.object(redis_cache, "async_redis_client", redis):
+        worker_a.schedule_refresh("Ucccc3333", "User_Ucccc333")
+        await worker_b.put("Ucccc3333", "มานี")  # e.g. manual refresh on another worker
+        await worker_a.refresh_pending()
+    assert fetched == [] and written == []
+
+
+@pytest.mark.asyncio
+async def test_ensure_user_exists_known_user_does_no_profile_or_db_io(monkeypatch):
+    redis = FakeAsyncRedis()
+    calls = []
+
+    async def fetch(uid):
+        calls.append(("fetch", uid))
+        return None
+
+    async def register(uid, name=None):
+        calls.append(("register", uid))
+        return "FB User #4321"
+
+    monkeypatch.setattr(user_service, "_fetch_display_name", fetch)
+    monkeypatch.setattr(user_service, "_register_user_ladda", register)
+    cache = UserProfileCache(fetcher=fetch, writer=lambda rows: None, refresh_delay_ms=60_000)
+    monkeypatch.setattr(user_service, "profile_cache", cache)
+
+    with patch.object(redis_cache, "async_redis_client", redis):
+        assert await user_service.ensure_user_exists("fb:87654321") is True
+        assert calls == [("fetch", "fb:87654321"), ("register", "fb:87654321")]
+
+        # second message (this or any other worker sharing Redis) → cache hit only
+        other_worker = UserProfileCache(fetcher=fetch, writer=lambda rows: None, refresh_delay_ms=60_000)
+        monkeypatch.setattr(user_service, "profile_cache", other_worker)
+        for _ in range(3):
+            assert await user_service.ensure_user_exists("fb:87654321") is True
+    assert len(calls) == 2
+    assert other_worker.get_stats()["pending_refresh"] == 0  # fallback name is negative-cached